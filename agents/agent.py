@@ -1,13 +1,58 @@
-# agents/agent.py
 from agents.logging_utils import log_manager
-from agents.db import get_db
-import threading, time, json, traceback
+from agents.db import get_writer, save_prompt
+from agents.metrics import get_metrics
+from agents.prewarm import get_timeline
+from agents.llm_gateway import LLMGateway, LLMRetriesExhausted
+from agents.backends import normalize_response
+from agents.streaming import StreamCollector
+from agents.context import ConversationContext
+from agents.tools import TASK_COMPLETED, conversation_calls, merge_call_info
+from agents.config import CONTEXT_TOKEN_BUDGET
+import itertools, time, json, traceback
+
+# Statements agents queue on the DB writer. Worker processes can only forward these (socket_bus.STATEMENTS)
+AGENT_RUNNING = "UPDATE agents SET status='running', started_at=COALESCE(started_at, CURRENT_TIMESTAMP), finished_at=NULL, exit_reason=NULL WHERE id=?"
+AGENT_TASKS = "UPDATE agents SET assigned_subtask=? WHERE id=?"
+AGENT_TASK_INDEX = "UPDATE agents SET task_index=? WHERE id=?"
+AGENT_COMPLETED = "UPDATE agents SET status='completed', exit_reason='completed', finished_at=CURRENT_TIMESTAMP WHERE id=?"
+AGENT_STOPPED = "UPDATE agents SET status='stopped', exit_reason='stopped', finished_at=CURRENT_TIMESTAMP WHERE id=?"
+AGENT_FAILED = "UPDATE agents SET status='failed', exit_reason=?, finished_at=CURRENT_TIMESTAMP WHERE id=?"
+ITERATION_INSERT = ("INSERT INTO agent_iterations (agent_id, iteration, prompt_ids, response, duration, tokens_used, error, tags, parent_iteration_id, ttft, tokens_per_second, "
+                    "prompt_tokens, completion_tokens, prompt_eval_duration, eval_duration, token_source, task_index) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)")
+
+SYSTEM_PROMPT = (
+    "You are an AI assistant designed to iteratively build and execute Python functions using tools provided to you. "
+    "Your task is to complete the requested task by creating and using tools in a loop until the task is fully done. "
+    "Do not ask for user input until you find it absolutely necessary."
+)
+# Appended when an iteration has nothing new to add after the last response
+CONTINUE_PROMPT = "Continue with the task, building on your previous results above."
+
+
+class LLMCallFailed(Exception):
+    """Raised when an LLM call gives up; the manager has already been told why."""
+
+
+class _Iteration:
+    # One iteration in progress: its prompt, the call_info saved as its tags, and its result so far
+    __slots__ = ('task_idx', 'iteration', 'messages', 'call_info', 't0', 'result', 'completed', 'error')
+
+    def __init__(self, task_idx, iteration, messages, call_info, result):
+        self.task_idx = task_idx
+        self.iteration = iteration
+        self.messages = messages
+        self.call_info = call_info
+        self.t0 = time.time()
+        self.result = result  # the previous iteration's result until this one has a reply
+        self.completed = False
+        self.error = None
+
 
 class Agent:
 
-    def __init__(self, name, task, color, emoji, model_name, ollama, colors, bus, verbose, max_iterations):
+    def __init__(self, name, task, color, emoji, model_name, ollama, colors, bus, verbose, max_iterations, stop_event=None, gateway=None, db_agent_id=None, stream=False, context_budget=CONTEXT_TOKEN_BUDGET, client_id=None, scheduler=None, resume=None, tools=None, control=None):
         self.name = name
-        self.tasks = task if isinstance(task, list) else [task]
+        self.tasks = list(task) if isinstance(task, list) else [task]
         self.color = color
         self.emoji = emoji
         self.model_name = model_name
@@ -16,118 +61,421 @@ class Agent:
         self.bus = bus
         self.verbose = verbose
         self.max_iterations = max_iterations
+        self.stop_event = stop_event
+        # Shared gateway (concurrency limit, fair queueing, backoff); a private one if not given
+        self.gateway = gateway if gateway is not None else LLMGateway(ollama)
+        self.db_agent_id = db_agent_id
+        # Name for the gateway's fair queueing and token ledger; unique across runs sharing a gateway
+        self.client_id = client_id or name
+        # Stream responses token by token (see agents/streaming.py)
+        self.stream = stream
+        # Per-task conversation history, rebuilt at each task's first iteration
+        self.context_budget = context_budget
+        self.context = None
+        # With a SubtaskScheduler (agents/scheduler.py) the agent pulls ready subtasks instead of working through `task`
+        self.scheduler = scheduler
+        self.subtask = None
+        # Position restored from the DB by Manager.resume_run: 'task_index', and for a task
+        # left half done its next 'iteration', saved 'messages' and 'prev_result'
+        self.resume = resume
+        # ToolExecutor (agents/tools.py) that runs the model's tool calls; None: no tools are offered
+        self.tools = tools
+        self.tool_calls = []  # calls of the last response still to execute
+        self._tool_call_ids = itertools.count(1)
+        # AgentControl (agents/control.py): the manager's advance / stop / pause commands for this agent
+        self.control = control
+        self.task_idx = None
+        # Seconds per phase of the current iteration (agents/metrics.py), saved in its tags
+        self.spans = {}
         self.progress = []
+        self.agent_prefix = f"{self.color}{self.emoji} {self.name}{self.colors.ENDC} "
+
+    def stopped(self):
+        return (self.stop_event is not None and self.stop_event.is_set()) or (self.control is not None and self.control.stopped)
+
+    def task_approved(self):
+        # The manager has approved the task this agent is working on
+        return self.control is not None and self.control.is_approved(self.task_idx)
+
+    def cancelled(self):
+        """True when whatever the agent is generating will not be used: it was stopped, or its task approved."""
+        return self.stopped() or self.task_approved()
+
+    def wait_if_paused(self):
+        if self.control is not None:
+            self.control.wait_while_paused()
+
+    def count(self, name, n=1):
+        # Work skipped on the manager's command, for the run summary
+        if self.control is not None:
+            self.control.count(name, n)
+
+    def leave_task(self, task_idx, iteration):
+        """Checked before each iteration: True if the agent was stopped, or the manager already approved the task."""
+        if self.stopped():
+            return True
+        if not self.task_approved():
+            return False
+        self.count('tasks_advanced')
+        self.count('iterations_skipped', self.max_iterations - iteration)
+        self.log(f"{self.colors.OKGREEN}Task {task_idx+1} approved by the manager; skipping its remaining {self.max_iterations - iteration} iteration(s).{self.colors.ENDC}", level="SUCCESS")
+        return True
+
+    def log(self, message, level="INFO", sample=None):
+        log_manager(message, colors=self.colors, level=level, prefix=f"[AGENT] {self.agent_prefix}", sample=sample, extra={'agent': self.name})
 
     def run(self):
-        lock = threading.Lock()
-        agent_prefix = f"{self.color}{self.emoji} {self.name}{self.colors.ENDC} "
+        # AsyncAgent.arun is the same loop with the pause, LLM calls and tools awaited
         agent_results = []
-        last_msg_time = 0
-        for task_idx, task in enumerate(self.tasks):
-            log_manager(f"{agent_prefix}{self.colors.OKBLUE}Assigned task {task_idx+1}/{len(self.tasks)}: {task}{self.colors.ENDC}", colors=self.colors, level="INFO", prefix="[AGENT] ")
-            prev_result = None
-            for iteration in range(self.max_iterations):
-                log_manager(f"{agent_prefix}{self.colors.HEADER}{self.colors.BOLD}Iteration {iteration + 1} of {self.max_iterations} for task {task_idx+1}{self.colors.ENDC}", colors=self.colors, level="BOLD", prefix="[AGENT] ")
-                messages = [{
-                    "role": "system",
-                    "content": (
-                        "You are an AI assistant designed to iteratively build and execute Python functions using tools provided to you. "
-                        "Your task is to complete the requested task by creating and using tools in a loop until the task is fully done. "
-                        "Do not ask for user input until you find it absolutely necessary."
-                    )
-                }, {"role": "user", "content": task}]
-                if prev_result:
-                    messages.append({"role": "user", "content": f"Previous result: {prev_result}"})
-                tags = json.dumps({})
-                error = None
-                t0 = time.time()
+        task_idx = self.start_run()
+        while (task := self.next_task(task_idx)) is not None:
+            first_iteration, prev_result = self.start_task(task_idx, task)
+            for iteration in range(first_iteration, self.max_iterations):
+                self.wait_if_paused()
+                step = self.begin_iteration(task_idx, task, iteration, prev_result)
+                if step is None:
+                    break
                 try:
-                    # Check for new messages from other agents
-                    new_msgs = self.bus.receive(self.name, since=last_msg_time)
-                    if new_msgs:
-                        for msg in new_msgs:
-                            if self.verbose:
-                                log_manager(f"{agent_prefix}{self.colors.WARNING}Received message from {msg['sender']}: {msg['content']}{self.colors.ENDC}", colors=self.colors, level="WARNING", prefix="[AGENT] ")
-                        last_msg_time = max(msg['timestamp'] for msg in new_msgs)
-                        for msg in new_msgs:
-                            messages.append({"role": "user", "content": f"[Message from {msg['sender']}]: {msg['content']}"})
-                    with lock:
-                        for attempt in range(3):
-                            try:
-                                response = self.ollama.chat(model=self.model_name, messages=messages)
-                                break
-                            except Exception as e:
-                                if hasattr(e, 'response') and hasattr(e.response, 'status_code') and e.response.status_code == 500:
-                                    self.bus.send(self.name, "manager", f"{self.emoji} {self.name} encountered a server error (500) from Ollama. Retrying in 5 seconds...")
-                                    time.sleep(5)
-                                    continue
-                                else:
-                                    self.bus.send(self.name, "manager", f"{self.emoji} {self.name} failed: {e}")
-                                    break
-                        else:
-                            self.bus.send(self.name, "manager", f"{self.emoji} {self.name} failed after 3 attempts due to Ollama server errors.")
-                            continue
-                        if hasattr(response, 'message'):
-                            response_message = response.message
-                        elif isinstance(response, dict) and 'message' in response:
-                            response_message = response['message']
-                        else:
-                            response_message = str(response)
-                        if not isinstance(response_message, dict):
-                            try:
-                                response_message = json.loads(response_message)
-                            except Exception:
-                                response_message = {'content': str(response_message)}
-                        if response_message.get('content') and self.verbose:
-                            log_manager(f"{agent_prefix}{self.colors.OKCYAN}{self.colors.BOLD}LLM Response:{self.colors.ENDC}\n{response_message['content']}\n", colors=self.colors, level="INFO", prefix="[AGENT] ")
-                        role = response_message.get('role', 'assistant')
-                        content = response_message.get('content', '')
-                        messages.append({'role': role, 'content': content})
-                        agent_results.append(content)
-                        prev_result = content
-                        if response_message.get('content'):
-                            content = response_message['content']
-                            if content.strip().startswith('@'):
-                                try:
-                                    first_colon = content.find(':')
-                                    if first_colon > 1:
-                                        recipient = content[1:first_colon].strip()
-                                        msg_body = content[first_colon+1:].strip()
-                                        self.bus.send(self.name, recipient, msg_body)
-                                        if self.verbose:
-                                            log_manager(f"{agent_prefix}{self.colors.OKGREEN}Sent message to {recipient}: {msg_body}{self.colors.ENDC}", colors=self.colors, level="SUCCESS", prefix="[AGENT] ")
-                                except Exception as e:
-                                    if self.verbose:
-                                        log_manager(f"{agent_prefix}{self.colors.FAIL}Failed to parse/send agent message: {e}{self.colors.ENDC}", colors=self.colors, level="ERROR", prefix="[AGENT] ")
-                        if response_message.get('tool_calls') and self.verbose:
-                            log_manager(f"{agent_prefix}{self.colors.OKBLUE}{self.colors.BOLD}Tool calls detected:{self.colors.ENDC} {len(response_message['tool_calls'])}", colors=self.colors, level="INFO", prefix="[AGENT] ")
-                            for tool_call in response_message['tool_calls']:
-                                log_manager(f"{agent_prefix}{self.colors.OKBLUE}{self.colors.BOLD}Calling tool:{self.colors.ENDC} {tool_call['function']['name']} with args: {tool_call['function']['arguments']}", colors=self.colors, level="INFO", prefix="[AGENT] ")
-                                function_name = tool_call['function']['name']
-                                args = json.loads(tool_call['function']['arguments'])
-                                # Placeholder: implement tool call logic if needed
-                            if 'task_completed' in [tc['function']['name'] for tc in response_message['tool_calls']]:
-                                log_manager(f"{agent_prefix}{self.colors.OKGREEN}{self.colors.BOLD}Task completed.{self.colors.ENDC}", colors=self.colors, level="SUCCESS", prefix="[AGENT] ")
-                                break
+                    try:
+                        with get_metrics().span('llm_request', self.spans):
+                            response = self.chat_with_retries(step.messages, step.call_info)
+                    except LLMCallFailed:
+                        continue
+                    if not self.take_reply(step, response, agent_results):
+                        break
+                    if self.tool_calls and not step.completed:
+                        self.run_tools(step, agent_results)
                 except Exception as e:
-                    error = str(e)
-                    if self.verbose:
-                        log_manager(f"{agent_prefix}{self.colors.FAIL}{self.colors.BOLD}Error:{self.colors.ENDC} Error in agent loop: {e}", colors=self.colors, level="ERROR", prefix="[AGENT] ")
-                    traceback.print_exc()
-                t1 = time.time()
-                try:
-                    if hasattr(self, 'db_agent_id'):
-                        with get_db() as conn:
-                            c = conn.cursor()
-                            c.execute(
-                                "INSERT INTO agent_iterations (agent_id, iteration, prompt, response, duration, tokens_used, error, tags, parent_iteration_id) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
-                                (self.db_agent_id, iteration, json.dumps(messages), prev_result, t1-t0, len(str(prev_result).split()), error, tags, None)
-                            )
-                            conn.commit()
-                except Exception:
-                    pass
-                log_manager(f"{agent_prefix}{self.colors.OKGREEN}Completed iteration {iteration+1} for task {task_idx+1}{self.colors.ENDC}", colors=self.colors, level="SUCCESS", prefix="[AGENT] ")
-                time.sleep(0.1)
-            log_manager(f"{agent_prefix}{self.colors.OKGREEN}Completed task {task_idx+1}/{len(self.tasks)}: {task}{self.colors.ENDC}", colors=self.colors, level="SUCCESS", prefix="[AGENT] ")
-        log_manager(f"{agent_prefix}{self.colors.BOLD}{self.colors.OKGREEN}All assigned tasks and iterations complete!{self.colors.ENDC}", colors=self.colors, level="SUCCESS", prefix="[AGENT] ")
+                    step.error = self.handle_error(e)
+                prev_result = step.result
+                if self.end_iteration(step):
+                    break
+            if self.finish_task(task_idx, prev_result):
+                break
+            task_idx += 1
+        self.finish_run(agent_results)
+
+    # --- Iteration steps, shared with AsyncAgent ---
+
+    def start_run(self):
+        """Mark the agent running in the DB. Returns the index of the first task to work on."""
+        self.update_status(AGENT_RUNNING)
+        if self.resume is None:
+            return 0
+        self.log(f"{self.colors.OKBLUE}Resuming at task {self.resume['task_index']+1}, iteration {self.resume.get('iteration', 0)+1}{self.colors.ENDC}")
+        return self.resume['task_index']
+
+    def start_task(self, task_idx, task):
+        """Log the task assignment. Returns (first iteration, prev_result), see `resume_point`."""
+        self.log(f"{self.colors.OKBLUE}Assigned task {task_idx+1}/{len(self.tasks)}: {self.tasks[task_idx]}{self.colors.ENDC}")
+        self.task_idx = task_idx
+        return self.resume_point(task_idx, task)
+
+    def resume_point(self, task_idx, task):
+        """
+        (first iteration, prev_result) for a task. A task that was left half
+        done continues after its last saved iteration, with its conversation
+        restored from that iteration's prompt and reply.
+        """
+        resume, self.resume = self.resume, None
+        if resume is None or resume['task_index'] != task_idx or not resume.get('iteration'):
+            return 0, None
+        if resume['iteration'] >= self.max_iterations:
+            return resume['iteration'], resume.get('prev_result')
+        if resume.get('messages'):
+            self.context = ConversationContext.restore(resume['messages'], self.context_budget)
+        else:
+            self.context = ConversationContext(SYSTEM_PROMPT, task, self.context_budget)
+        return resume['iteration'], resume.get('prev_result')
+
+    def update_status(self, sql, *params):
+        # agents.status / started_at / finished_at / task_index, through the shared DB writer
+        if self.db_agent_id is not None:
+            get_writer().submit(sql, params + (self.db_agent_id,))
+
+    def next_task(self, task_idx):
+        """Prompt text of the next task, or None when there is none. With a scheduler, blocks until a subtask is ready."""
+        if self.scheduler is None:
+            return self.tasks[task_idx] if task_idx < len(self.tasks) else None
+        if self.stopped():
+            return None
+        if self.resume is not None and 'subtask_id' in self.resume:
+            return self.resume_subtask()
+        return self.assign_subtask(self.scheduler.take(self.name))
+
+    def resume_subtask(self):
+        """The subtask this agent was part way through before a restart (already in `tasks` and claimed in the scheduler)."""
+        self.subtask = self.scheduler.subtasks[self.resume['subtask_id']]
+        return self.scheduler.prompt_for(self.subtask)
+
+    def assign_subtask(self, subtask):
+        """Take on a subtask pulled from the scheduler and record it in the agents table."""
+        if subtask is None:
+            return None
+        self.subtask = subtask
+        self.tasks.append(subtask['task'])
+        if self.db_agent_id is not None:
+            get_writer().submit(AGENT_TASKS, (json.dumps(self.tasks), self.db_agent_id))
+        return self.scheduler.prompt_for(subtask)
+
+    def begin_iteration(self, task_idx, task, iteration, prev_result):
+        """After any pause: None if the agent should leave the task, else the _Iteration with its prompt built."""
+        if self.leave_task(task_idx, iteration):
+            return None
+        messages = self.start_iteration(task_idx, task, iteration)
+        return _Iteration(task_idx, iteration, messages, {'context_tokens': self.context.tokens, 'spans': self.spans}, prev_result)
+
+    def take_reply(self, step, response, agent_results):
+        """
+        Parse the iteration's reply into `step.result` / `step.completed`.
+        Returns False, without parsing, if the agent was stopped or its task
+        approved while the call ran: the iteration is saved as cancelled and
+        the reply is neither relayed nor acted on.
+        """
+        if self.cancelled():
+            step.call_info['cancelled'] = True
+            self.save_iteration(step.task_idx, step.iteration, step.messages, step.result, time.time() - step.t0, None, step.call_info)
+            self.leave_task(step.task_idx, step.iteration + 1)
+            return False
+        with get_metrics().span('parse', self.spans):
+            step.result, step.completed = self.handle_response(response, step.messages, agent_results)
+        return True
+
+    def end_iteration(self, step):
+        """Save the iteration and log its end. Returns True if it completed the task, so the task's loop ends."""
+        if step.completed and step.error is None:
+            if 'tools' in step.call_info:
+                # Keep the record of the tool calls that led to completion
+                self.save_iteration(step.task_idx, step.iteration, step.messages, step.result, time.time() - step.t0, None, step.call_info)
+            return True
+        self.save_iteration(step.task_idx, step.iteration, step.messages, step.result, time.time() - step.t0, step.error, step.call_info)
+        self.finish_iteration(step.task_idx, step.iteration)
+        return False
+
+    def start_iteration(self, task_idx, task, iteration):
+        """
+        Log the iteration banner and build its prompt: the task's conversation
+        so far plus new bus messages, appended so the prompt prefix stays stable.
+        """
+        self.log(f"{self.colors.HEADER}{self.colors.BOLD}Iteration {iteration + 1} of {self.max_iterations} for task {task_idx+1}{self.colors.ENDC}", level="BOLD", sample="iteration")
+        if iteration == 0 or self.context is None:
+            self.context = ConversationContext(SYSTEM_PROMPT, task, self.context_budget)
+        self.spans = {}
+        # Check for new messages from other agents
+        # Partial output streamed by other agents is skipped; the complete message follows
+        with get_metrics().span('bus_receive', self.spans):
+            new_msgs = [msg for msg in self.bus.receive(self.name) if msg.get('kind') != 'chunk']
+        for msg in new_msgs:
+            if self.verbose:
+                self.log(f"{self.colors.WARNING}Received message from {msg['sender']}: {msg['content']}{self.colors.ENDC}", level="WARNING")
+        for msg in new_msgs:
+            self.context.add("user", f"[Message from {msg['sender']}]: {msg['content']}")
+        if self.context.last_role == "assistant":
+            self.context.add("user", CONTINUE_PROMPT)
+        return self.context.messages()
+
+    def chat_with_retries(self, messages, call_info):
+        try:
+            if self.stream:
+                return self.stream_chat(messages, call_info)
+            return self.gateway.chat(self.model_name, messages, client_id=self.client_id, on_retry=self.report_retry, call_info=call_info, **self.chat_options())
+        except LLMRetriesExhausted:
+            self.report_gave_up()
+        except Exception as e:
+            self.report_failure(e)
+            raise
+
+    def stream_chat(self, messages, call_info):
+        """Stream the response, forwarding it as it arrives; stops early on a task_completed tool call."""
+        collector = StreamCollector(self)
+        chunks = self.gateway.stream(self.model_name, messages, client_id=self.client_id, on_retry=self.report_retry, call_info=call_info, **self.chat_options())
+        try:
+            for chunk in chunks:
+                if collector.feed(chunk):
+                    break
+        finally:
+            chunks.close()
+        return collector.finish(call_info)
+
+    def chat_options(self):
+        # Extra chat arguments: the tool definitions, when tools are enabled
+        return {'tools': self.tools.schemas()} if self.tools is not None else {}
+
+    def run_tools(self, step, agent_results):
+        """
+        Execute the last response's tool calls and give the model their
+        results in the same iteration, for up to `tools.max_rounds` rounds.
+        Calls made in the last round are still executed; the model sees
+        their results next iteration, as after a failed follow-up call.
+        Leaves the final reply in `step.result` / `step.completed`.
+        """
+        metrics = get_metrics()
+        for _ in range(self.tools.max_rounds):
+            if self.skip_tool_round():
+                break
+            with metrics.span('tools', self.spans):
+                self.execute_tools(step.messages, step.call_info, self.tools.execute(self.tool_calls))
+            followup = {}
+            try:
+                with metrics.span('llm_request', self.spans):
+                    response = self.chat_with_retries(step.messages, followup)
+            except LLMCallFailed:
+                break
+            finally:
+                merge_call_info(step.call_info, followup)
+            if not self.take_followup(step, response, agent_results):
+                break
+        else:
+            if self.tool_calls:
+                with metrics.span('tools', self.spans):
+                    self.execute_tools(step.messages, step.call_info, self.tools.execute(self.tool_calls))
+        self.tool_calls = []
+
+    def skip_tool_round(self):
+        # The manager approved the task: its pending tool calls are not worth running
+        if not self.task_approved():
+            return False
+        self.count('tool_rounds_skipped')
+        return True
+
+    def take_followup(self, step, response, agent_results):
+        """Parse a follow-up reply to tool results. Returns True if it asks for another round of tools."""
+        if self.cancelled():
+            return False
+        with get_metrics().span('parse', self.spans):
+            step.result, step.completed = self.handle_response(response, step.messages, agent_results)
+        return not step.completed and bool(self.tool_calls)
+
+    def execute_tools(self, messages, call_info, results):
+        """Append the tool results (from `tools.execute(self.tool_calls)`) to the prompt and record their timings in `call_info['tools']`."""
+        records = call_info.setdefault('tools', [])
+        for call, result in zip(self.tool_calls, results):
+            message = {'role': 'tool', 'content': result['content'], 'tool_name': call['function']['name'], 'tool_call_id': call['id']}
+            messages.append(message)
+            self.context.add(**message)
+            record = {'name': call['function']['name'], 'ok': result['ok'], 'duration': round(result['duration'], 4)}
+            for flag in ('truncated', 'timeout', 'crashed'):
+                if result.get(flag):
+                    record[flag] = result[flag]
+            records.append(record)
+            get_metrics().observe('tool_call', result['duration'])
+            if self.verbose:
+                level = "INFO" if result['ok'] else "WARNING"
+                self.log(f"{self.colors.OKBLUE}Tool {call['function']['name']} {'returned' if result['ok'] else 'failed'} in {result['duration']:.2f}s{self.colors.ENDC}", level=level)
+        self.tool_calls = []
+
+    def report_retry(self, e, attempt, delay):
+        status = getattr(getattr(e, 'response', None), 'status_code', None) or getattr(e, 'status_code', None)
+        reason = f"a server error ({status})" if status else f"an error ({e})"
+        self.bus.send(self.name, "manager", f"{self.emoji} {self.name} encountered {reason} from Ollama. Retrying in {delay:.1f} seconds...")
+
+    def report_failure(self, e):
+        self.bus.send(self.name, "manager", f"{self.emoji} {self.name} failed: {e}")
+
+    def report_gave_up(self):
+        self.bus.send(self.name, "manager", f"{self.emoji} {self.name} failed after {self.gateway.max_attempts} attempts due to Ollama server errors.")
+        raise LLMCallFailed(f"failed after {self.gateway.max_attempts} attempts")
+
+    def handle_response(self, response, messages, agent_results):
+        """
+        Parse an LLM response, relay any @recipient: message and log tool calls.
+        With tools enabled, the calls to execute are left in `tool_calls`.
+        Returns (content, task_completed).
+        """
+        response_message = normalize_response(response)['message']
+        get_timeline().mark('first_response')
+        # Streamed responses were already logged line by line
+        if response_message.get('content') and self.verbose and not self.stream:
+            self.log(f"{self.colors.OKCYAN}{self.colors.BOLD}LLM Response:{self.colors.ENDC}\n{response_message['content']}\n")
+        role = response_message.get('role', 'assistant')
+        content = response_message.get('content', '')
+        fields = {}
+        self.tool_calls = []
+        if response_message.get('tool_calls') and self.tools is not None:
+            # Kept on the assistant turn, so the tool results that follow refer to it
+            fields['tool_calls'] = conversation_calls(response_message['tool_calls'], self._tool_call_ids)
+            self.tool_calls = [call for call in fields['tool_calls'] if call['function']['name'] != TASK_COMPLETED]
+        messages.append(dict(fields, role=role, content=content))
+        if self.context is not None:
+            self.context.add(role, content, **fields)
+        agent_results.append(content)
+        if content:
+            self.relay_directive(content)
+        task_completed = False
+        if response_message.get('tool_calls'):
+            if self.verbose:
+                self.log(f"{self.colors.OKBLUE}{self.colors.BOLD}Tool calls detected:{self.colors.ENDC} {len(response_message['tool_calls'])}")
+                for tool_call in response_message['tool_calls']:
+                    self.log(f"{self.colors.OKBLUE}{self.colors.BOLD}Calling tool:{self.colors.ENDC} {tool_call['function']['name']} with args: {tool_call['function']['arguments']}")
+            # Detected whether or not the calls are logged
+            if TASK_COMPLETED in [tc['function']['name'] for tc in response_message['tool_calls']]:
+                self.log(f"{self.colors.OKGREEN}{self.colors.BOLD}Task completed.{self.colors.ENDC}", level="SUCCESS")
+                task_completed = True
+        return content, task_completed
+
+    def relay_directive(self, content):
+        """Forward a response of the form '@recipient: body' over the bus."""
+        if not content.strip().startswith('@'):
+            return
+        try:
+            first_colon = content.find(':')
+            if first_colon > 1:
+                recipient = content[1:first_colon].strip()
+                msg_body = content[first_colon+1:].strip()
+                self.bus.send(self.name, recipient, msg_body, task=self.task_idx)
+                if self.verbose:
+                    self.log(f"{self.colors.OKGREEN}Sent message to {recipient}: {msg_body}{self.colors.ENDC}", level="SUCCESS")
+        except Exception as e:
+            if self.verbose:
+                self.log(f"{self.colors.FAIL}Failed to parse/send agent message: {e}{self.colors.ENDC}", level="ERROR")
+
+    def handle_error(self, e):
+        if self.verbose:
+            self.log(f"{self.colors.FAIL}{self.colors.BOLD}Error:{self.colors.ENDC} Error in agent loop: {e}", level="ERROR")
+        traceback.print_exc()
+        return str(e)
+
+    def save_iteration(self, task_idx, iteration, messages, prev_result, duration, error, call_info):
+        # Queued for the shared DB writer; committed in batches off this thread
+        if self.db_agent_id is None:
+            return
+        # Prompt + completion tokens of this iteration's LLM call (None if the call failed)
+        tokens_used = call_info['prompt_tokens'] + call_info['completion_tokens'] if 'prompt_tokens' in call_info else None
+        # Serializing the prompt is most of the cost on the agent's side; only messages not stored yet are compressed and queued
+        with get_metrics().span('db_write'):
+            writer = get_writer()
+            writer.submit(
+                ITERATION_INSERT,
+                (self.db_agent_id, iteration, save_prompt(messages, writer), prev_result, duration, tokens_used, error, json.dumps(call_info), None, call_info.get('ttft'), call_info.get('tokens_per_second'),
+                 call_info.get('prompt_tokens'), call_info.get('completion_tokens'), call_info.get('prompt_eval_duration'), call_info.get('eval_duration'), call_info.get('token_source'), task_idx)
+            )
+
+    def finish_iteration(self, task_idx, iteration):
+        self.log(f"{self.colors.OKGREEN}Completed iteration {iteration+1} for task {task_idx+1}{self.colors.ENDC}", level="SUCCESS", sample="iteration_done")
+
+    def finish_task(self, task_idx, result):
+        """Log the end of a task and hand its result to the scheduler. Returns True if the agent was stopped and should exit."""
+        task = self.tasks[task_idx]
+        stopped = self.stopped()
+        if self.subtask is not None:
+            if stopped:
+                # Interrupted, not done: its dependents must not start from a partial result
+                self.scheduler.release(self.subtask['id'])
+            else:
+                self.scheduler.complete(self.subtask['id'], result)
+            self.subtask = None
+        if stopped:
+            # Not counted as finished, so a resumed run picks this task up again
+            self.log(f"{self.colors.WARNING}Stopped by manager during task {task_idx+1}/{len(self.tasks)}.{self.colors.ENDC}", level="WARNING")
+            return True
+        self.update_status(AGENT_TASK_INDEX, task_idx + 1)
+        self.log(f"{self.colors.OKGREEN}Completed task {task_idx+1}/{len(self.tasks)}: {task}{self.colors.ENDC}", level="SUCCESS")
+        return False
+
+    def finish_run(self, agent_results):
+        if not self.stopped():
+            self.log(f"{self.colors.BOLD}{self.colors.OKGREEN}All assigned tasks and iterations complete!{self.colors.ENDC}", level="SUCCESS")
+            self.update_status(AGENT_COMPLETED)
+        else:
+            self.update_status(AGENT_STOPPED)
         self.progress = agent_results
@@ -1,9 +1,14 @@
 # agents/agent_service.py
-import threading
-from agents.agent import Agent
+import asyncio, threading
+from agents.agent import Agent, AGENT_FAILED
+from agents.async_agent import AsyncAgent
+from agents.llm_gateway import LLMGateway
+from agents.config import CONTEXT_TOKEN_BUDGET
 
 class AgentService:
-    def __init__(self, agent_colors, agent_emojis, model_name, ollama, colors, bus, verbose, num_iterations):
+    agent_class = Agent
+
+    def __init__(self, agent_colors, agent_emojis, model_name, ollama, colors, bus, verbose, num_iterations, stop_event=None, gateway=None, db_agent_ids=None, stream=False, context_budget=CONTEXT_TOKEN_BUDGET, client_prefix='', scheduler=None, resume=None, tools=None, controls=None):
         self.agent_colors = agent_colors
         self.agent_emojis = agent_emojis
         self.model_name = model_name
@@ -12,18 +17,46 @@ class AgentService:
         self.bus = bus
         self.verbose = verbose
         self.num_iterations = num_iterations
+        self.stop_event = stop_event
+        self.gateway = gateway
+        self.db_agent_ids = db_agent_ids or {}
+        self.stream = stream
+        self.context_budget = context_budget
+        # Prepended to agent names for the gateway's client ids (runs sharing one gateway)
+        self.client_prefix = client_prefix
+        # Shared SubtaskScheduler: agents start without subtasks and pull ready ones
+        self.scheduler = scheduler
+        # Manager.resume_run: agent name -> position to continue from; agents marked 'done' are not started
+        self.resume = resume or {}
+        # Shared ToolExecutor (agents/tools.py); None: agents are not offered tools
+        self.tools = tools
+        # AgentControls (agents/control.py) the manager sends advance / stop / pause commands through; None: no control channel
+        self.controls = controls
         self.agents = []
         self.agent_names = []
 
-    def create_agents(self, agent_subtasks):
+    def create_agents(self, agent_subtasks, indices=None):
         self.agent_names = []
         self.agents = []
-        for idx, agent_task in enumerate(agent_subtasks):
-            agent_name = f"agent_{idx+1}"
+        for agent_name, agent in self._build_agents(agent_subtasks, indices):
             self.agent_names.append(agent_name)
+            t = threading.Thread(target=self._run_agent, args=(agent,), name=agent_name)
+            self.agents.append(t)
+            t.start()
+        return self.agent_names, self.agents
+
+    def _build_agents(self, agent_subtasks, indices=None):
+        if self.gateway is None:
+            # One gateway for all agents, so the concurrency limit is shared
+            self.gateway = LLMGateway(self.ollama)
+        # `indices`: the run-wide agent number of each entry, when a worker process hosts only some of the agents
+        for idx, agent_task in zip(indices if indices is not None else range(len(agent_subtasks)), agent_subtasks):
+            agent_name = f"agent_{idx+1}"
+            if self.resume.get(agent_name, {}).get('done'):
+                continue
             color = self.agent_colors[idx % len(self.agent_colors)]
             emoji = self.agent_emojis[idx % len(self.agent_emojis)]
-            agent = Agent(
+            agent = self.agent_class(
                 name=agent_name,
                 task=agent_task,
                 color=color,
@@ -33,9 +66,53 @@ class AgentService:
                 colors=self.colors,
                 bus=self.bus,
                 verbose=self.verbose,
-                max_iterations=self.num_iterations
+                max_iterations=self.num_iterations,
+                stop_event=self.stop_event,
+                gateway=self.gateway,
+                db_agent_id=self.db_agent_ids.get(agent_name),
+                stream=self.stream,
+                context_budget=self.context_budget,
+                client_id=f"{self.client_prefix}{agent_name}",
+                scheduler=self.scheduler,
+                resume=self.resume.get(agent_name),
+                tools=self.tools,
+                control=self.controls.get(agent_name) if self.controls is not None else None
             )
-            t = threading.Thread(target=agent.run)
-            self.agents.append(t)
-            t.start()
+            yield agent_name, agent
+
+    def _run_agent(self, agent):
+        try:
+            agent.run()
+        except Exception as e:
+            agent.update_status(AGENT_FAILED, str(e))
+            raise
+        finally:
+            # Let the manager notice the exit without polling
+            self.bus.wake()
+
+
+class AsyncAgentService(AgentService):
+    """
+    Runs every agent as an asyncio task on the current event loop instead of
+    one OS thread each. `ollama` must be an `ollama.AsyncClient`, shared by all
+    agents, and `gateway` (if given) must wrap an async client as well.
+    `create_agents` must be called from inside the running loop.
+    """
+    agent_class = AsyncAgent
+
+    def create_agents(self, agent_subtasks, indices=None):
+        self.agent_names = []
+        self.agents = []
+        for agent_name, agent in self._build_agents(agent_subtasks, indices):
+            self.agent_names.append(agent_name)
+            task = asyncio.create_task(self._arun_agent(agent), name=agent_name)
+            task.add_done_callback(lambda _task: self.bus.wake())
+            self.agents.append(task)
         return self.agent_names, self.agents
+
+    async def _arun_agent(self, agent):
+        try:
+            await agent.arun()
+        except Exception as e:
+            agent.update_status(AGENT_FAILED, str(e))
+            raise
@@ -0,0 +1,108 @@
+# agents/async_agent.py
+from agents.agent import Agent, LLMCallFailed
+from agents.llm_gateway import LLMRetriesExhausted
+from agents.metrics import get_metrics
+from agents.streaming import StreamCollector
+from agents.tools import merge_call_info
+
+
+class AsyncAgent(Agent):
+    """
+    Agent that runs as a coroutine on a shared event loop.
+
+    `ollama` must be an `ollama.AsyncClient` (or anything with an awaitable
+    `chat`), and a shared `gateway` must wrap the same kind of client.
+    Prompt building, response parsing, control checks, bus traffic and DB
+    writes (queued to the shared writer) are `Agent`'s own steps; `arun`
+    and `arun_tools` only await the pause, the LLM calls and the tools.
+    """
+
+    async def arun(self):
+        # Agent.run with the pause, LLM calls and tools awaited; every other step is shared
+        agent_results = []
+        task_idx = self.start_run()
+        while (task := await self.anext_task(task_idx)) is not None:
+            first_iteration, prev_result = self.start_task(task_idx, task)
+            for iteration in range(first_iteration, self.max_iterations):
+                await self.await_if_paused()
+                step = self.begin_iteration(task_idx, task, iteration, prev_result)
+                if step is None:
+                    break
+                try:
+                    try:
+                        with get_metrics().span('llm_request', self.spans):
+                            response = await self.achat_with_retries(step.messages, step.call_info)
+                    except LLMCallFailed:
+                        continue
+                    if not self.take_reply(step, response, agent_results):
+                        break
+                    if self.tool_calls and not step.completed:
+                        await self.arun_tools(step, agent_results)
+                except Exception as e:
+                    step.error = self.handle_error(e)
+                prev_result = step.result
+                if self.end_iteration(step):
+                    break
+            if self.finish_task(task_idx, prev_result):
+                break
+            task_idx += 1
+        self.finish_run(agent_results)
+
+    async def await_if_paused(self):
+        if self.control is not None:
+            await self.control.await_while_paused()
+
+    async def anext_task(self, task_idx):
+        if self.scheduler is None:
+            return self.next_task(task_idx)
+        if self.stopped():
+            return None
+        if self.resume is not None and 'subtask_id' in self.resume:
+            return self.resume_subtask()
+        return self.assign_subtask(await self.scheduler.take_async(self.name))
+
+    async def achat_with_retries(self, messages, call_info):
+        try:
+            if self.stream:
+                return await self.astream_chat(messages, call_info)
+            return await self.gateway.achat(self.model_name, messages, client_id=self.client_id, on_retry=self.report_retry, call_info=call_info, **self.chat_options())
+        except LLMRetriesExhausted:
+            self.report_gave_up()
+        except Exception as e:
+            self.report_failure(e)
+            raise
+
+    async def astream_chat(self, messages, call_info):
+        collector = StreamCollector(self)
+        chunks = self.gateway.astream(self.model_name, messages, client_id=self.client_id, on_retry=self.report_retry, call_info=call_info, **self.chat_options())
+        try:
+            async for chunk in chunks:
+                if collector.feed(chunk):
+                    break
+        finally:
+            await chunks.aclose()
+        return collector.finish(call_info)
+
+    async def arun_tools(self, step, agent_results):
+        """`Agent.run_tools` with the tool calls and follow-up LLM calls awaited."""
+        metrics = get_metrics()
+        for _ in range(self.tools.max_rounds):
+            if self.skip_tool_round():
+                break
+            with metrics.span('tools', self.spans):
+                self.execute_tools(step.messages, step.call_info, await self.tools.aexecute(self.tool_calls))
+            followup = {}
+            try:
+                with metrics.span('llm_request', self.spans):
+                    response = await self.achat_with_retries(step.messages, followup)
+            except LLMCallFailed:
+                break
+            finally:
+                merge_call_info(step.call_info, followup)
+            if not self.take_followup(step, response, agent_results):
+                break
+        else:
+            if self.tool_calls:
+                with metrics.span('tools', self.spans):
+                    self.execute_tools(step.messages, step.call_info, await self.tools.aexecute(self.tool_calls))
+        self.tool_calls = []
@@ -0,0 +1,707 @@
+# agents/backends.py
+from agents.llm_gateway import is_retryable
+from agents.logging_utils import log_manager
+from agents.config import LLM_MAX_CONCURRENCY, LLM_EJECT_AFTER, LLM_EJECT_SECONDS, LLM_HEALTH_INTERVAL, LLM_KEEP_ALIVE
+import asyncio, importlib.util, json, os, threading, time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def normalize_response(response):
+    """
+    Any backend's chat response or stream chunk as one plain dict, in
+    Ollama's shape: {'message': {'role', 'content'[, 'tool_calls']}, 'done',
+    and the usage counts present (prompt_eval_count, eval_count, ...)}.
+    Accepts ollama's pydantic objects, dicts, and bare strings (a JSON
+    message or plain text).
+    """
+    if hasattr(response, 'model_dump'):
+        response = response.model_dump(exclude_none=True)
+    if isinstance(response, dict) and 'message' in response:
+        message = response['message']
+    elif hasattr(response, 'message'):
+        message, response = response.message, {}
+    else:
+        message, response = str(response), {}
+    if hasattr(message, 'model_dump'):
+        message = message.model_dump(exclude_none=True)
+    if not isinstance(message, dict):
+        try:
+            parsed = json.loads(message)
+        except Exception:
+            parsed = None
+        message = parsed if isinstance(parsed, dict) else {'content': str(message)}
+    message = dict(message)
+    message.setdefault('role', 'assistant')
+    if message.get('content') is None:
+        message['content'] = ''
+    return dict(response, message=message)
+
+
+def _normalized(chunks):
+    try:
+        for chunk in chunks:
+            yield normalize_response(chunk)
+    finally:
+        close = getattr(chunks, 'close', None)
+        if close:
+            close()
+
+
+async def _anormalized(chunks):
+    try:
+        async for chunk in chunks:
+            yield normalize_response(chunk)
+    finally:
+        aclose = getattr(chunks, 'aclose', None)
+        if aclose:
+            await aclose()
+
+
+def _pool_limits(max_connections):
+    # Keep as many idle connections as there can be concurrent calls, so a burst does not reconnect
+    import httpx
+    return httpx.Limits(max_connections=None, max_keepalive_connections=max_connections, keepalive_expiry=60.0)
+
+
+class OllamaBackend:
+    """
+    Ollama's /api/chat through one long-lived ollama.Client, whose HTTP
+    connections are kept alive and reused across calls and threads.
+    `host` defaults to OLLAMA_HOST. Responses are normalized dicts
+    (normalize_response); with stream=True, an iterator of them.
+    Every request asks the server to keep the model loaded for
+    `keep_alive` after it. The ollama package (the slowest import at
+    startup) is imported when the client is first needed, e.g. by a
+    preload in the background.
+    """
+    kind = 'ollama'
+
+    def __init__(self, host=None, max_connections=LLM_MAX_CONCURRENCY, timeout=None, keep_alive=LLM_KEEP_ALIVE):
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.keep_alive = keep_alive
+        self._host = host
+        self._client = None
+        self._client_lock = threading.Lock()
+        # What a worker process needs to build the same backend; no host: its own OLLAMA_HOST
+        self.spec = {'kind': self.kind, 'hosts': [host] if host else []}
+        self._probe = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    import ollama
+                    self._client = ollama.Client(host=self._host, timeout=self.timeout, limits=_pool_limits(self.max_connections))
+        return self._client
+
+    @property
+    def host(self):
+        return str(self.client._client.base_url).rstrip('/')
+
+    def chat(self, model, messages, stream=False, **kwargs):
+        kwargs.setdefault('keep_alive', self.keep_alive)
+        response = self.client.chat(model=model, messages=messages, stream=stream, **kwargs)
+        return _normalized(response) if stream else normalize_response(response)
+
+    def preload(self, model, keep_alive=None):
+        """
+        Load `model` into the server's memory without generating (an empty
+        /api/generate), kept for `keep_alive` (default: the backend's)
+        after the last request. Returns the seconds the server spent
+        loading it (0 if it was loaded already).
+        """
+        response = self.client.generate(model=model, prompt='', keep_alive=keep_alive or self.keep_alive)
+        return (getattr(response, 'load_duration', None) or 0) / 1e9
+
+    def health(self, timeout=2.0):
+        """True if the server answers /api/version within `timeout` seconds."""
+        return _probe(self, '/api/version', timeout)
+
+    def asynchronous(self):
+        """An AsyncOllamaBackend for the same host, for the current event loop."""
+        return AsyncOllamaBackend(self.host, self.max_connections, self.timeout, self.keep_alive)
+
+
+class AsyncOllamaBackend:
+    kind = 'ollama'
+
+    def __init__(self, host=None, max_connections=LLM_MAX_CONCURRENCY, timeout=None, keep_alive=LLM_KEEP_ALIVE):
+        import ollama
+        self.client = ollama.AsyncClient(host=host, timeout=timeout, limits=_pool_limits(max_connections))
+        self.host = str(self.client._client.base_url).rstrip('/')
+        self.keep_alive = keep_alive
+
+    async def chat(self, model, messages, stream=False, **kwargs):
+        kwargs.setdefault('keep_alive', self.keep_alive)
+        response = await self.client.chat(model=model, messages=messages, stream=stream, **kwargs)
+        return _anormalized(response) if stream else normalize_response(response)
+
+
+def openai_request(model, messages, stream, kwargs):
+    """Body of an OpenAI /chat/completions request for an Ollama-style chat call."""
+    body = {'model': model, 'messages': [_openai_message(m) for m in messages], 'stream': stream}
+    if stream:
+        body['stream_options'] = {'include_usage': True}
+    fmt = kwargs.get('format')
+    if fmt == 'json':
+        body['response_format'] = {'type': 'json_object'}
+    elif fmt:
+        body['response_format'] = {'type': 'json_schema', 'json_schema': {'name': 'response', 'schema': fmt}}
+    if kwargs.get('tools'):
+        body['tools'] = kwargs['tools']
+    options = kwargs.get('options') or {}
+    for ollama_name, openai_name in (('temperature', 'temperature'), ('top_p', 'top_p'), ('seed', 'seed'), ('num_predict', 'max_tokens'), ('stop', 'stop')):
+        if options.get(ollama_name) is not None:
+            body[openai_name] = options[ollama_name]
+    return body
+
+
+def _openai_message(message):
+    # Ollama-style tool turns (agents/tools.py) in OpenAI's shape: the assistant's
+    # calls carry an id and JSON-string arguments, tool results a tool_call_id
+    if message.get('tool_calls'):
+        calls = [{'id': call.get('id') or f"call_{i}", 'type': 'function',
+                  'function': {'name': call['function']['name'], 'arguments': json.dumps(call['function'].get('arguments') or {})
+                               if not isinstance(call['function'].get('arguments'), str) else call['function']['arguments']}}
+                 for i, call in enumerate(message['tool_calls'])]
+        return {'role': message['role'], 'content': message.get('content') or None, 'tool_calls': calls}
+    if message.get('role') == 'tool':
+        return {'role': 'tool', 'content': message.get('content') or '', 'tool_call_id': message.get('tool_call_id') or ''}
+    return message
+
+
+def _openai_function(function):
+    # Ollama gives tool call arguments as a dict, OpenAI as a JSON string
+    arguments = function.get('arguments') or '{}'
+    try:
+        arguments = json.loads(arguments) if isinstance(arguments, str) else arguments
+    except ValueError:
+        pass
+    return {'name': function.get('name'), 'arguments': arguments}
+
+
+def _openai_usage(usage):
+    if not usage:
+        return {}
+    return {'prompt_eval_count': usage.get('prompt_tokens', 0), 'eval_count': usage.get('completion_tokens', 0)}
+
+
+def from_openai(completion):
+    """A non-streamed OpenAI chat completion as a normalized response."""
+    choice = (completion.get('choices') or [{}])[0]
+    message = choice.get('message') or {}
+    normalized = {'role': message.get('role') or 'assistant', 'content': message.get('content') or ''}
+    if message.get('tool_calls'):
+        normalized['tool_calls'] = [{'id': call.get('id'), 'function': _openai_function(call['function'])} for call in message['tool_calls']]
+    return dict(_openai_usage(completion.get('usage')), model=completion.get('model'), message=normalized,
+                done=True, done_reason=choice.get('finish_reason'))
+
+
+class _OpenAIStream:
+    # Server-sent events -> normalized chunks. Tool call fragments are joined and
+    # emitted whole when the choice finishes; usage comes with the last chunk.
+
+    def __init__(self):
+        self.tool_calls = {}
+        self.usage = {}
+
+    def feed(self, line):
+        """Normalized chunks for one SSE line; None once the stream is over."""
+        if not line.startswith('data:'):
+            return []
+        data = line[len('data:'):].strip()
+        if data == '[DONE]':
+            return None
+        event = json.loads(data)
+        if event.get('usage'):
+            self.usage = _openai_usage(event['usage'])
+        chunks = []
+        for choice in event.get('choices') or ():
+            delta = choice.get('delta') or {}
+            if delta.get('content'):
+                chunks.append({'message': {'role': delta.get('role') or 'assistant', 'content': delta['content']}, 'done': False})
+            for call in delta.get('tool_calls') or ():
+                function = self.tool_calls.setdefault(call.get('index', 0), {'id': None, 'name': '', 'arguments': ''})
+                function['id'] = call.get('id') or function['id']
+                function['name'] += (call.get('function') or {}).get('name') or ''
+                function['arguments'] += (call.get('function') or {}).get('arguments') or ''
+            if choice.get('finish_reason') and self.tool_calls:
+                calls = [{'id': self.tool_calls[i]['id'], 'function': _openai_function(self.tool_calls[i])} for i in sorted(self.tool_calls)]
+                self.tool_calls = {}
+                chunks.append({'message': {'role': 'assistant', 'content': '', 'tool_calls': calls}, 'done': False})
+        return chunks
+
+    def done(self):
+        return dict(self.usage, message={'role': 'assistant', 'content': ''}, done=True)
+
+
+class OpenAIBackend:
+    """
+    Any OpenAI-compatible /v1/chat/completions server (vLLM, llama.cpp,
+    LM Studio, Ollama's /v1, hosted APIs) through one pooled httpx.Client.
+    `base_url` defaults to OPENAI_BASE_URL and `api_key` to OPENAI_API_KEY.
+    Takes Ollama-style arguments (`format`, `options`, `tools`) and returns
+    normalized responses with the server's token counts.
+    """
+    kind = 'openai'
+
+    def __init__(self, base_url=None, api_key=None, max_connections=LLM_MAX_CONCURRENCY, timeout=600.0):
+        import httpx
+        self.host = (base_url or os.environ.get('OPENAI_BASE_URL') or 'https://api.openai.com/v1').rstrip('/')
+        self.api_key = api_key if api_key is not None else os.environ.get('OPENAI_API_KEY', '')
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.spec = {'kind': self.kind, 'hosts': [base_url] if base_url else []}
+        self.client = self._client_class(httpx)(base_url=self.host, headers=self._headers(), timeout=timeout, limits=_pool_limits(max_connections))
+        self._probe = None
+
+    @staticmethod
+    def _client_class(httpx):
+        return httpx.Client
+
+    def _headers(self):
+        return {'Authorization': f"Bearer {self.api_key}"} if self.api_key else {}
+
+    def chat(self, model, messages, stream=False, **kwargs):
+        body = openai_request(model, messages, stream, kwargs)
+        if stream:
+            return self._stream(body)
+        response = self.client.post('/chat/completions', json=body)
+        response.raise_for_status()
+        return from_openai(response.json())
+
+    def _stream(self, body):
+        parser = _OpenAIStream()
+        with self.client.stream('POST', '/chat/completions', json=body) as response:
+            if response.is_error:
+                response.read()
+                response.raise_for_status()
+            for line in response.iter_lines():
+                chunks = parser.feed(line)
+                if chunks is None:
+                    break
+                yield from chunks
+        yield parser.done()
+
+    def health(self, timeout=2.0):
+        """True if the server answers /models within `timeout` seconds."""
+        return _probe(self, '/models', timeout)
+
+    def asynchronous(self):
+        return AsyncOpenAIBackend(self.host, self.api_key, self.max_connections, self.timeout)
+
+
+class AsyncOpenAIBackend(OpenAIBackend):
+
+    @staticmethod
+    def _client_class(httpx):
+        return httpx.AsyncClient
+
+    async def chat(self, model, messages, stream=False, **kwargs):
+        body = openai_request(model, messages, stream, kwargs)
+        if stream:
+            return self._astream(body)
+        response = await self.client.post('/chat/completions', json=body)
+        response.raise_for_status()
+        return from_openai(response.json())
+
+    async def _astream(self, body):
+        parser = _OpenAIStream()
+        async with self.client.stream('POST', '/chat/completions', json=body) as response:
+            if response.is_error:
+                await response.aread()
+                response.raise_for_status()
+            async for line in response.aiter_lines():
+                chunks = parser.feed(line)
+                if chunks is None:
+                    break
+                for chunk in chunks:
+                    yield chunk
+        yield parser.done()
+
+
+def _probe(backend, path, timeout):
+    # Health checks use their own short-timeout client, so a hung server cannot hold a pooled connection
+    import httpx
+    if backend._probe is None:
+        backend._probe = httpx.Client(base_url=backend.host, timeout=timeout, headers=getattr(backend, '_headers', dict)())
+    try:
+        return backend._probe.get(path).status_code < 500
+    except httpx.HTTPError:
+        return False
+
+
+def load_qwen3_agent(model_name=None):
+    """A Qwen3Agent from mlx/qwen3_agent.py (loaded by path: the directory shadows the mlx package)."""
+    spec = importlib.util.spec_from_file_location('qwen3_agent', os.path.join(ROOT, 'mlx', 'qwen3_agent.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.Qwen3Agent(model_name or module.MODEL_NAME)
+
+
+class MLXBackend:
+    """
+    In-process generation with mlx-lm on Apple silicon, through a
+    Qwen3Agent (mlx/qwen3_agent.py). The model is loaded once, on the first
+    call or `preload`; calls are serialized, since one model generates one
+    sequence at a time. `format` and `tools` are not supported and are
+    ignored; `options['num_predict']` caps the reply length.
+    """
+    kind = 'mlx'
+
+    def __init__(self, model_name=None, agent=None, max_tokens=1024):
+        self.model_name = model_name
+        self._agent = agent
+        self.host = f"mlx:{model_name or 'default'}"
+        self.spec = {'kind': self.kind, 'hosts': [model_name] if model_name else []}
+        self.max_tokens = max_tokens
+        self.lock = threading.Lock()
+        self._load_lock = threading.Lock()
+
+    @property
+    def agent(self):
+        if self._agent is None:
+            with self._load_lock:
+                if self._agent is None:
+                    self._agent = load_qwen3_agent(self.model_name)
+        return self._agent
+
+    def preload(self, model=None, keep_alive=None):
+        """Load the model now instead of on the first call. Returns the seconds it took (0 if loaded already)."""
+        t0 = time.perf_counter()
+        loaded = self._agent is not None
+        self.agent
+        return 0.0 if loaded else time.perf_counter() - t0
+
+    def chat(self, model, messages, stream=False, **kwargs):
+        max_tokens = (kwargs.get('options') or {}).get('num_predict') or self.max_tokens
+        if stream:
+            return self._stream(messages, max_tokens)
+        with self.lock:
+            t0 = time.perf_counter_ns()
+            text = self.agent.chat_messages(messages, max_tokens=max_tokens)
+            duration = time.perf_counter_ns() - t0
+        return {'message': {'role': 'assistant', 'content': text}, 'done': True,
+                'prompt_eval_count': self.agent.count_tokens(messages), 'eval_count': self.agent.count_tokens(text), 'eval_duration': duration}
+
+    def _stream(self, messages, max_tokens):
+        with self.lock:
+            t0 = time.perf_counter_ns()
+            parts = []
+            for text in self.agent.stream_messages(messages, max_tokens=max_tokens):
+                parts.append(text)
+                yield {'message': {'role': 'assistant', 'content': text}, 'done': False}
+            duration = time.perf_counter_ns() - t0
+        yield {'message': {'role': 'assistant', 'content': ''}, 'done': True,
+               'prompt_eval_count': self.agent.count_tokens(messages), 'eval_count': self.agent.count_tokens(''.join(parts)), 'eval_duration': duration}
+
+    def health(self, timeout=2.0):
+        return True
+
+    def asynchronous(self):
+        return ThreadedAsyncBackend(self)
+
+
+class ThreadedAsyncBackend:
+    """Awaitable `chat` for a blocking backend: each call (and each streamed chunk) runs in a worker thread."""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.host = getattr(backend, 'host', None)
+
+    async def chat(self, model, messages, stream=False, **kwargs):
+        result = await asyncio.to_thread(self.backend.chat, model=model, messages=messages, stream=stream, **kwargs)
+        return self._astream(iter(result)) if stream else normalize_response(result)
+
+    @staticmethod
+    async def _astream(chunks):
+        done = object()
+        try:
+            while (chunk := await asyncio.to_thread(next, chunks, done)) is not done:
+                yield normalize_response(chunk)
+        finally:
+            close = getattr(chunks, 'close', None)
+            if close:
+                close()
+
+
+def async_backend(backend):
+    """
+    The awaitable counterpart of a backend, for --async mode: its
+    `asynchronous()`, an ollama.AsyncClient for the ollama module, or a
+    ThreadedAsyncBackend for anything else with a blocking `chat`.
+    """
+    if hasattr(backend, 'asynchronous'):
+        return backend.asynchronous()
+    if hasattr(backend, 'AsyncClient'):
+        return backend.AsyncClient()
+    return ThreadedAsyncBackend(backend)
+
+
+class _Endpoint:
+    __slots__ = ('backend', 'host', 'outstanding', 'failures', 'ejected_until', 'ejected', 'requests', 'errors', 'ejections')
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.host = getattr(backend, 'host', repr(backend))
+        self.outstanding = 0
+        self.failures = 0         # consecutive retryable failures
+        self.ejected_until = 0.0  # monotonic time; 0 when in rotation
+        self.ejected = False
+        self.requests = 0
+        self.errors = 0
+        self.ejections = 0
+
+
+class BackendRouter:
+    """
+    Balances chat calls over several backends, e.g. one OllamaBackend per host.
+
+    Each call goes to the endpoint in rotation with the fewest outstanding
+    requests (ties taken in turn), so a slow or busy host gets less of the
+    load. A call that fails with a retryable error (connection refused,
+    timeout, 5xx) before any output is tried again at once on another
+    endpoint; only when every endpoint has failed does the error reach the
+    caller (and the LLMGateway's backoff). `eject_after` consecutive
+    failures, or a failed health check (every `health_interval` seconds,
+    0 to disable), take an endpoint out of rotation for `eject_seconds`;
+    after that it gets traffic again unless the next health check fails.
+    If every endpoint is out, the one due back first is used anyway.
+    """
+
+    def __init__(self, backends, eject_after=LLM_EJECT_AFTER, eject_seconds=LLM_EJECT_SECONDS, health_interval=LLM_HEALTH_INTERVAL):
+        if not backends:
+            raise ValueError("BackendRouter needs at least one backend")
+        self.endpoints = [_Endpoint(backend) for backend in backends]
+        self.eject_after = eject_after
+        self.eject_seconds = eject_seconds
+        self.health_interval = health_interval
+        self.lock = threading.Lock()
+        self.host = ','.join(endpoint.host for endpoint in self.endpoints)
+        kinds = {getattr(backend, 'spec', {}).get('kind') for backend in backends}
+        self.spec = {'kind': kinds.pop(), 'hosts': [endpoint.host for endpoint in self.endpoints]} if len(kinds) == 1 and None not in kinds else None
+        self._turn = 0
+        self._closed = threading.Event()
+        if health_interval:
+            threading.Thread(target=self._check_health, name="backend-health", daemon=True).start()
+
+    def chat(self, model, messages, stream=False, **kwargs):
+        if stream:
+            return self._stream(model, messages, kwargs)
+        tried = set()
+        while True:
+            endpoint = self._pick(tried)
+            try:
+                response = endpoint.backend.chat(model, messages, **kwargs)
+            except Exception as e:
+                self._release(endpoint, e)
+                if not self._failover(e, tried):
+                    raise
+                continue
+            except BaseException:
+                self._release(endpoint, None)
+                raise
+            self._release(endpoint, None)
+            return response
+
+    def _stream(self, model, messages, kwargs):
+        tried = set()
+        while True:
+            endpoint = self._pick(tried)
+            started = False
+            chunks = None
+            try:
+                chunks = endpoint.backend.chat(model, messages, stream=True, **kwargs)
+                for chunk in chunks:
+                    started = True
+                    yield chunk
+            except Exception as e:
+                self._release(endpoint, e)
+                if started or not self._failover(e, tried):
+                    raise
+                continue
+            except BaseException:
+                # Closed early by the consumer
+                self._release(endpoint, None)
+                raise
+            finally:
+                close = getattr(chunks, 'close', None)
+                if close:
+                    close()
+            self._release(endpoint, None)
+            return
+
+    def asynchronous(self):
+        """An awaitable router over the endpoints' async backends, sharing this router's load and health state."""
+        return AsyncBackendRouter(self)
+
+    def preload(self, model, keep_alive=None):
+        """Preload `model` on every host at once (see OllamaBackend.preload). Returns the longest load (None if no host can preload); raises only if every host failed."""
+        backends = [endpoint.backend for endpoint in self.endpoints if hasattr(endpoint.backend, 'preload')]
+        if not backends:
+            return None
+        loads, errors = [], []
+
+        def load(backend):
+            try:
+                loads.append(backend.preload(model, keep_alive))
+            except Exception as e:
+                errors.append(e)
+                log_manager(f"Preloading {model} on {backend.host} failed: {e}", level="WARNING", prefix="[LLM] ")
+
+        threads = [threading.Thread(target=load, args=(backend,), name="backend-preload", daemon=True) for backend in backends]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if errors and not loads:
+            raise errors[0]
+        return max(loads, default=0.0)
+
+    def health(self, timeout=2.0):
+        return any(endpoint.backend.health(timeout) for endpoint in self.endpoints)
+
+    def stats(self):
+        """Per endpoint: host, outstanding, requests, errors, ejections and whether it is ejected now."""
+        now = time.monotonic()
+        with self.lock:
+            return [{'host': e.host, 'outstanding': e.outstanding, 'requests': e.requests, 'errors': e.errors,
+                     'ejections': e.ejections, 'ejected': e.ejected_until > now} for e in self.endpoints]
+
+    def close(self):
+        self._closed.set()
+
+    def _pick(self, tried):
+        now = time.monotonic()
+        with self.lock:
+            candidates = [i for i, e in enumerate(self.endpoints) if i not in tried and e.ejected_until <= now]
+            if not candidates:
+                candidates = [min((i for i in range(len(self.endpoints)) if i not in tried), key=lambda i: self.endpoints[i].ejected_until)]
+            # Least outstanding; ties broken by a rotating start so equal hosts share the load
+            n = len(self.endpoints)
+            index = min(candidates, key=lambda i: (self.endpoints[i].outstanding, (i - self._turn) % n))
+            self._turn = (index + 1) % n
+            endpoint = self.endpoints[index]
+            if endpoint.ejected and endpoint.ejected_until <= now:
+                endpoint.ejected = False
+                log_manager(f"LLM host {endpoint.host} back in rotation", level="INFO", prefix="[LLM] ")
+            endpoint.outstanding += 1
+            endpoint.requests += 1
+            tried.add(index)
+            return endpoint
+
+    def _release(self, endpoint, error):
+        with self.lock:
+            endpoint.outstanding -= 1
+            if error is None:
+                endpoint.failures = 0
+                return
+            if not is_retryable(error):
+                return
+            endpoint.errors += 1
+            endpoint.failures += 1
+            if endpoint.failures >= self.eject_after:
+                self._eject(endpoint, f"{endpoint.failures} failures in a row ({error})")
+
+    def _failover(self, error, tried):
+        # Another endpoint is worth a try only for errors of this one
+        return is_retryable(error) and len(tried) < len(self.endpoints)
+
+    def _eject(self, endpoint, reason):
+        # Lock held
+        if endpoint.ejected_until <= time.monotonic():
+            endpoint.ejections += 1
+            log_manager(f"LLM host {endpoint.host} out of rotation for {self.eject_seconds:.0f}s: {reason}", level="WARNING", prefix="[LLM] ")
+        endpoint.ejected = True
+        endpoint.ejected_until = time.monotonic() + self.eject_seconds
+        endpoint.failures = 0
+
+    def _check_health(self):
+        while not self._closed.wait(self.health_interval):
+            for endpoint in self.endpoints:
+                if not endpoint.backend.health():
+                    with self.lock:
+                        self._eject(endpoint, "health check failed")
+
+
+class AsyncBackendRouter:
+    """BackendRouter for --async mode: the same endpoints, load counts and ejections, with awaitable calls."""
+
+    def __init__(self, router):
+        self.router = router
+        self.host = router.host
+        self.backends = {id(endpoint): async_backend(endpoint.backend) for endpoint in router.endpoints}
+
+    async def chat(self, model, messages, stream=False, **kwargs):
+        if stream:
+            return self._astream(model, messages, kwargs)
+        router, tried = self.router, set()
+        while True:
+            endpoint = router._pick(tried)
+            try:
+                response = await self.backends[id(endpoint)].chat(model, messages, **kwargs)
+            except Exception as e:
+                router._release(endpoint, e)
+                if not router._failover(e, tried):
+                    raise
+                continue
+            except BaseException:
+                # Cancelled mid-call
+                router._release(endpoint, None)
+                raise
+            router._release(endpoint, None)
+            return response
+
+    async def _astream(self, model, messages, kwargs):
+        router, tried = self.router, set()
+        while True:
+            endpoint = router._pick(tried)
+            started = False
+            chunks = None
+            try:
+                chunks = await self.backends[id(endpoint)].chat(model, messages, stream=True, **kwargs)
+                async for chunk in chunks:
+                    started = True
+                    yield chunk
+            except Exception as e:
+                router._release(endpoint, e)
+                if started or not router._failover(e, tried):
+                    raise
+                continue
+            except BaseException:
+                router._release(endpoint, None)
+                raise
+            finally:
+                aclose = getattr(chunks, 'aclose', None)
+                if aclose:
+                    await aclose()
+            router._release(endpoint, None)
+            return
+
+
+BACKENDS = {'ollama': OllamaBackend, 'openai': OpenAIBackend, 'mlx': MLXBackend}
+
+
+def make_backend(kind='ollama', hosts=None, max_connections=LLM_MAX_CONCURRENCY, **kwargs):
+    """
+    A backend of `kind` ('ollama', 'openai' or 'mlx') for each of `hosts`
+    (URLs; for mlx, model names), behind a BackendRouter when there is more
+    than one. No hosts: the kind's default (OLLAMA_HOST, OPENAI_BASE_URL).
+    'replay' (a ReplayBackend's spec, for worker processes) takes one
+    'RUN_ID:TIMING' host and the recording's `db_path`.
+    """
+    if kind == 'replay':
+        from agents.replay import ReplayBackend
+        run_id, _, timing = str(hosts[0]).partition(':')
+        return ReplayBackend(int(run_id), timing or 'original', db_path=kwargs.get('db_path'))
+    if kind not in BACKENDS:
+        raise ValueError(f"Unknown LLM backend {kind!r}; expected one of {', '.join(BACKENDS)}")
+    hosts = list(hosts or [None])
+    if kind == 'mlx':
+        backends = [MLXBackend(host, **kwargs) for host in hosts]
+    else:
+        backends = [BACKENDS[kind](host, max_connections=max_connections, **kwargs) for host in hosts]
+    return backends[0] if len(backends) == 1 else BackendRouter(backends)
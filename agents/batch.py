@@ -0,0 +1,185 @@
+# agents/batch.py
+from agents.logging_utils import log_manager
+from agents.manager import Manager
+from agents.llm_gateway import LLMGateway
+from agents.llm_cache import LLMCache
+from agents.metrics import get_metrics
+from agents.db import init_db
+from agents.config import LLM_INITIAL_CONCURRENCY, LLM_MAX_CONCURRENCY, LLM_CACHE_MEMORY_ENTRIES, LLM_CACHE_TTL, LLM_CACHE_MAX_ROWS, BATCH_WORKERS
+import json, sys, threading, time
+
+
+class WorkerBudget:
+    """Agent slots shared by all runs of a batch. A run takes one slot per agent, at most the whole budget."""
+
+    def __init__(self, size):
+        self.size = size
+        self.free = size
+        self._cond = threading.Condition()
+
+    def acquire(self, n):
+        n = max(1, min(n, self.size))
+        with self._cond:
+            self._cond.wait_for(lambda: self.free >= n)
+            self.free -= n
+        return n
+
+    def release(self, n):
+        with self._cond:
+            self.free += n
+            self._cond.notify_all()
+
+
+def read_tasks(lines):
+    """
+    Parse JSONL task specs, one per line:
+    {"task": "...", "agents": 2, "iterations": 3, "subtasks": [...], "id": "..."}
+    Only `task` is required; `subtasks` skips planning. Yields (spec, error).
+    """
+    for line_no, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        try:
+            spec = json.loads(line)
+            if isinstance(spec, str):
+                spec = {'task': spec}
+            if not isinstance(spec, dict) or not isinstance(spec.get('task'), str) or not spec['task'].strip():
+                raise ValueError("expected an object with a non-empty \"task\" string")
+            spec.setdefault('id', line_no)
+            spec['agents'] = max(1, int(spec.get('agents', 1)))
+            spec['iterations'] = max(1, int(spec.get('iterations', 1)))
+        except (ValueError, TypeError) as e:
+            yield {'id': line_no, 'task': line}, f"line {line_no}: {e}"
+            continue
+        yield spec, None
+
+
+class BatchRunner:
+    """
+    Runs many top-level tasks without prompting, several at a time.
+
+    Each task gets its own Manager (bus, agents, DB run) via
+    `Manager.run_task`, but all of them share one LLMGateway (so one
+    adaptive concurrency limit, cache and token ledger) and the
+    process-wide DB writer. `workers` caps the agents running at once
+    across all runs; tasks start in input order as slots free up. One
+    JSON result line per task is written to `output` as runs finish.
+    """
+
+    def __init__(self, model_name, ollama, colors, agent_colors, agent_emojis, workers=BATCH_WORKERS, output=None,
+                 max_concurrency=LLM_MAX_CONCURRENCY, use_cache=False, metrics_port=None, metrics_json=None, **manager_kwargs):
+        self.model_name = model_name
+        self.ollama = ollama
+        self.colors = colors
+        self.agent_colors = agent_colors
+        self.agent_emojis = agent_emojis
+        self.budget = WorkerBudget(workers)
+        self.output = output or sys.stdout
+        self.manager_kwargs = manager_kwargs
+        self.metrics_json = metrics_json
+        cache = LLMCache(LLM_CACHE_MEMORY_ENTRIES, LLM_CACHE_TTL, LLM_CACHE_MAX_ROWS) if use_cache else None
+        self.gateway = LLMGateway(ollama, cache=cache, initial_limit=min(LLM_INITIAL_CONCURRENCY, max_concurrency), max_limit=max_concurrency)
+        if metrics_port is not None:
+            get_metrics().serve(metrics_port)
+        self.results = []
+        self._active = {}  # task id -> Manager
+        self._lock = threading.Lock()
+
+    def run(self, lines):
+        """Run every task in `lines` (an iterable of JSONL strings). Returns the throughput report."""
+        # Once up front, so the runs' own init_db calls find the schema complete
+        init_db()
+        start = time.time()
+        threads = []
+        try:
+            for spec, error in read_tasks(lines):
+                if error:
+                    self._write(self._result(spec, 'error', error=error))
+                    continue
+                slots = self.budget.acquire(spec['agents'])
+                t = threading.Thread(target=self._run_one, args=(spec, slots, time.time()), name=f"batch-{spec['id']}")
+                t.start()
+                threads = [thread for thread in threads if thread.is_alive()] + [t]
+        except KeyboardInterrupt:
+            log_manager("Batch interrupted, stopping running tasks...", colors=self.colors, level="WARNING")
+            with self._lock:
+                managers = list(self._active.values())
+            for manager in managers:
+                manager.request_stop()
+        for t in threads:
+            t.join()
+        report = self.report(time.time() - start)
+        if self.metrics_json:
+            get_metrics().dump(self.metrics_json)
+        return report
+
+    def _run_one(self, spec, slots, started):
+        manager = None
+        try:
+            manager = Manager(self.model_name, self.ollama, self.colors, self.agent_colors, self.agent_emojis,
+                              gateway=self.gateway, name=f"task{spec['id']}", **self.manager_kwargs)
+            with self._lock:
+                self._active[spec['id']] = manager
+            run_id = manager.run_task(spec['task'], spec['agents'], spec['iterations'], agent_list=spec.get('subtasks'))
+            status = 'completed' if len(manager.completed) == len(manager.agent_names) else 'incomplete'
+            result = self._result(spec, status, manager, run_id, started)
+        except Exception as e:
+            log_manager(f"Batch task {spec['id']} failed: {e}", colors=self.colors, level="ERROR")
+            result = self._result(spec, 'error', manager, getattr(manager, '_db_run_id', None), started, error=str(e))
+        finally:
+            with self._lock:
+                self._active.pop(spec['id'], None)
+            self.budget.release(slots)
+        self._write(result)
+
+    def _result(self, spec, status, manager=None, run_id=None, started=None, error=None):
+        result = {'id': spec['id'], 'task': spec['task'], 'status': status, 'run_id': run_id,
+                  'agents': spec.get('agents'), 'iterations': spec.get('iterations')}
+        if started is not None:
+            result['latency'] = time.time() - started
+        if manager is not None:
+            result['completed_agents'] = len(manager.completed)
+            result['results'] = dict(manager.progress)
+            if manager.plan_stats:
+                result['plan_latency'] = manager.plan_stats['latency']
+                result['plan_attempts'] = manager.plan_stats['attempts']
+            if manager.token_usage:
+                result['prompt_tokens'] = manager.token_usage['prompt_tokens']
+                result['completion_tokens'] = manager.token_usage['completion_tokens']
+        if error:
+            result['error'] = error
+        return result
+
+    def _write(self, result):
+        with self._lock:
+            self.results.append(result)
+            self.output.write(json.dumps(result) + '\n')
+            self.output.flush()
+
+    def report(self, wall):
+        """Log and return tasks/hour and p50/p95 run latency."""
+        latencies = sorted(r['latency'] for r in self.results if 'latency' in r)
+        statuses = [r['status'] for r in self.results]
+        tokens = self.gateway.tokens.totals()
+        report = {
+            'tasks': len(self.results),
+            'completed': statuses.count('completed'),
+            'incomplete': statuses.count('incomplete'),
+            'failed': statuses.count('error'),
+            'wall': wall,
+            'tasks_per_hour': len(self.results) / wall * 3600 if wall else 0.0,
+            'latency_p50': _percentile(latencies, 0.50),
+            'latency_p95': _percentile(latencies, 0.95),
+            'llm_calls': tokens['calls'],
+            'total_tokens': tokens['total_tokens'],
+        }
+        log_manager(f"Batch: {report['tasks']} tasks ({report['completed']} completed, {report['incomplete']} incomplete, {report['failed']} failed) in {wall:.1f}s", colors=self.colors, level="BOLD")
+        log_manager(f"Throughput: {report['tasks_per_hour']:.0f} tasks/hour, run latency p50 {report['latency_p50']:.2f}s / p95 {report['latency_p95']:.2f}s, {report['llm_calls']} LLM calls, {report['total_tokens']} tokens", colors=self.colors, level="INFO")
+        return report
+
+
+def _percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
@@ -15,3 +15,70 @@ AGENT_COLORS = [Colors.OKBLUE, Colors.OKCYAN, Colors.OKGREEN, Colors.WARNING, Co
 AGENT_EMOJIS = ["🤖", "🦾", "🧠", "🚀", "🦉", "🐍", "🦾", "🦾", "🦾"]
 
 MODEL_NAME = 'gpt-oss:120b-cloud'
+
+# LLM gateway: adaptive concurrency limit per backend (see agents/llm_gateway.py)
+LLM_INITIAL_CONCURRENCY = 4
+LLM_MAX_CONCURRENCY = 32
+
+# LLM backend (see agents/backends.py): 'ollama', 'openai' (any OpenAI-compatible server) or 'mlx';
+# several hosts are balanced by least outstanding requests, and failing ones taken out of rotation
+LLM_BACKEND = 'ollama'
+LLM_HOSTS = []  # e.g. ['http://gpu1:11434', 'http://gpu2:11434']; empty: OLLAMA_HOST / OPENAI_BASE_URL
+LLM_EJECT_AFTER = 3  # consecutive failures
+LLM_EJECT_SECONDS = 30.0
+LLM_HEALTH_INTERVAL = 5.0  # seconds between health checks of each host (0: none)
+
+# Model prewarming (see agents/prewarm.py): each model is loaded on the server in the background, while the
+# task is being typed and again before agents start, and kept loaded for LLM_KEEP_ALIVE after its last request
+PREWARM_MODELS = True
+LLM_KEEP_ALIVE = '30m'
+PREWARM_TIMEOUT = 600.0  # seconds agents wait for a model still loading before they start anyway
+
+# LLM response cache (opt-in with --cache, see agents/llm_cache.py)
+LLM_CACHE_MEMORY_ENTRIES = 1024
+LLM_CACHE_TTL = 7 * 24 * 3600  # seconds
+LLM_CACHE_MAX_ROWS = 10000
+
+# Agent conversation context: token budget before the oldest turns are summarized (see agents/context.py)
+CONTEXT_TOKEN_BUDGET = 8192
+
+# Price per 1000 tokens, for runs.cost (0 for local models; set for hosted/cloud models)
+LLM_COST_PER_1K_PROMPT_TOKENS = 0.0
+LLM_COST_PER_1K_COMPLETION_TOKENS = 0.0
+
+# Planning (see agents/planner.py): Ollama structured output with the plan's JSON schema, candidate plans raced per attempt
+PLAN_STRUCTURED_OUTPUT = True
+PLAN_CANDIDATES = 1
+PLAN_MAX_ATTEMPTS = 3
+
+# Batch mode (--batch, see agents/batch.py): agents running at once across all tasks of the batch
+BATCH_WORKERS = 8
+
+# Tool calls (opt-in with --tools, see agents/tools.py): independent calls of one response run
+# concurrently in a pool of worker processes, each call with a timeout, memory cap and result size cap
+TOOL_WORKERS = 4
+TOOL_TIMEOUT = 30.0  # seconds per call
+TOOL_MEMORY_MB = 512  # address space per tool process (0: no limit)
+TOOL_MAX_RESULT_CHARS = 8000
+TOOL_MAX_ROUNDS = 3  # rounds of (execute, call the LLM with the results) per iteration; 0: results wait for the next iteration
+
+# Message bus (see agents/message_bus.py): messages every consumer has read are dropped from memory;
+# with BUS_SPILL every message is also written to the bus_messages table, so transcripts stay available
+BUS_PRUNE_READ = True
+BUS_SPILL = False
+BUS_HIGH_WATER = 10000  # messages held for one recipient before streamed chunks are dropped
+BUS_OVERFLOW = 'drop'  # 'block': past the high-water mark, senders also wait for the recipient to catch up
+BUS_BLOCK_TIMEOUT = 5.0  # seconds a blocked sender waits before delivering anyway
+
+# Manager -> agent control (see agents/control.py): approving a task makes its agent move on at once,
+# aborting a response it is streaming, instead of using up its remaining iterations
+CANCEL_APPROVED_TASKS = True
+
+# Replaying a recorded run (see agents/replay.py): 'original' waits as long as each recorded LLM call took, 'zero' answers at once
+REPLAY_TIMING = 'original'
+
+# Logging (see agents/logging_utils.py): lowest level shown, optional JSON-lines file,
+# and console lines per second per sample key for repetitive lines (0 = no limit)
+LOG_LEVEL = "INFO"
+LOG_JSON_PATH = None
+LOG_RATE_LIMIT = 10
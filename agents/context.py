@@ -0,0 +1,107 @@
+# agents/context.py
+from agents.tokens import count_message_tokens
+
+
+class ConversationContext:
+    """
+    Conversation history for one agent task, kept append-only so that each
+    prompt starts with the previous one and the server can reuse its cached
+    prompt prefix (KV cache) instead of re-evaluating it.
+
+    The first messages (system prompt and task) are pinned. When the history
+    grows past `max_tokens`, the oldest turns after the pinned prefix are
+    replaced by one summary message, trimming down to `trim_to` x
+    `max_tokens` so that trims (which invalidate the cached prefix) stay
+    rare. `summarize(dropped_messages, previous_summary)` can replace the
+    default summary, which keeps the first line of each dropped turn.
+    """
+
+    def __init__(self, system_prompt, task, max_tokens=8192, trim_to=0.5, summarize=None):
+        self.max_tokens = max_tokens
+        self.trim_to = trim_to
+        self.summarize = summarize or _first_lines
+        self.summary = None
+        self.trims = 0
+        self._pinned = [{'role': 'system', 'content': system_prompt}, {'role': 'user', 'content': task}]
+        self._pinned_tokens = sum(count_message_tokens(m) for m in self._pinned)
+        self._summary_tokens = 0
+        self._turns = []   # (message, tokens)
+        self._turn_tokens = 0
+
+    @classmethod
+    def restore(cls, messages, max_tokens=8192, **kwargs):
+        """Rebuild a context from a saved prompt (the output of `messages()`, plus any reply appended to it)."""
+        context = cls(messages[0]['content'], messages[1]['content'], max_tokens, **kwargs)
+        turns = messages[2:]
+        if turns and turns[0]['role'] == 'user' and (turns[0]['content'] or '').startswith(SUMMARY_HEADER):
+            context.summary = turns[0]['content']
+            context._summary_tokens = count_message_tokens({'content': context.summary})
+            turns = turns[1:]
+        for message in turns:
+            context._turns.append((dict(message), count_message_tokens(message)))
+            context._turn_tokens += context._turns[-1][1]
+        return context
+
+    @property
+    def tokens(self):
+        """Estimated prompt size in tokens."""
+        return self._pinned_tokens + self._summary_tokens + self._turn_tokens
+
+    @property
+    def last_role(self):
+        return self._turns[-1][0]['role'] if self._turns else self._pinned[-1]['role']
+
+    def add(self, role, content, **fields):
+        """Append a turn; `fields` are extra message keys (an assistant's 'tool_calls', a tool result's 'tool_name')."""
+        message = dict(fields, role=role, content=content)
+        tokens = count_message_tokens(message)
+        self._turns.append((message, tokens))
+        self._turn_tokens += tokens
+        if self.tokens > self.max_tokens:
+            self._trim()
+
+    def messages(self):
+        """The prompt: pinned prefix, summary of trimmed turns (if any), then the turns in order."""
+        messages = list(self._pinned)
+        if self.summary:
+            messages.append({'role': 'user', 'content': self.summary})
+        messages.extend(message for message, _ in self._turns)
+        return messages
+
+    def _trim(self):
+        target = self.max_tokens * self.trim_to
+        dropped = []
+        # The summary is rebuilt below, so leave it out while trimming.
+        # Keep at least the newest turn, however large. Tool results go with
+        # the assistant turn that called them (APIs reject them on their own).
+        summary_tokens, self._summary_tokens = self._summary_tokens, 0
+        while len(self._turns) > 1 and (self.tokens > target or self._turns[0][0]['role'] == 'tool'):
+            message, tokens = self._turns.pop(0)
+            self._turn_tokens -= tokens
+            dropped.append(message)
+        if not dropped:
+            self._summary_tokens = summary_tokens
+            return
+        self.summary = self.summarize(dropped, self.summary)
+        self._summary_tokens = count_message_tokens({'content': self.summary}) if self.summary else 0
+        self.trims += 1
+
+
+SUMMARY_HEADER = "[Earlier conversation, trimmed to fit the context budget]"
+
+
+def _first_lines(dropped, previous_summary, line_chars=200, max_chars=2000):
+    lines = previous_summary.split('\n')[1:] if previous_summary else []
+    for message in dropped:
+        first = (message['content'] or '').strip().split('\n', 1)[0]
+        if len(first) > line_chars:
+            first = first[:line_chars] + '...'
+        lines.append(f"- {message['role']}: {first}")
+    # Newest lines win when the summary itself gets too long
+    kept, size = [], len(SUMMARY_HEADER)
+    for line in reversed(lines):
+        size += len(line) + 1
+        if size > max_chars:
+            break
+        kept.append(line)
+    return '\n'.join([SUMMARY_HEADER] + kept[::-1])
@@ -0,0 +1,144 @@
+# agents/control.py
+import asyncio, collections, threading
+
+# What AgentControl.counts tracks, for the run summary
+COUNTERS = ('tasks_advanced', 'iterations_skipped', 'streams_aborted', 'tool_rounds_skipped', 'pauses')
+
+
+class AgentControl:
+    """
+    Commands from the manager to one agent. The agent checks them before
+    each LLM call and between the chunks of a streamed response:
+
+    - `advance(tasks)`: the manager has approved the agent's first `tasks`
+      tasks; the agent drops whichever of them it is still working on and
+      moves to the next one instead of using up its iterations.
+    - `stop()`: the agent exits after the current iteration.
+    - `pause()` / `resume()`: the agent holds before its next LLM call
+      until resumed (or stopped).
+
+    `counts` records the work skipped this way (see COUNTERS).
+    """
+
+    def __init__(self):
+        self.approved = 0
+        self.stopped = False
+        self.paused = False
+        self.counts = collections.Counter()
+        self._cond = threading.Condition()
+        self._async_waiters = []  # (loop, future) of agents awaiting resume
+
+    def advance(self, tasks):
+        with self._cond:
+            self.approved = max(self.approved, tasks)
+
+    def stop(self):
+        with self._cond:
+            self.stopped = True
+            self._notify()
+
+    def pause(self):
+        with self._cond:
+            self.paused = True
+
+    def resume(self):
+        with self._cond:
+            self.paused = False
+            self._notify()
+
+    def is_approved(self, task_idx):
+        return task_idx < self.approved
+
+    def wait_while_paused(self):
+        with self._cond:
+            if self.paused and not self.stopped:
+                self.counts['pauses'] += 1
+                self._cond.wait_for(lambda: not self.paused or self.stopped)
+
+    async def await_while_paused(self):
+        loop = asyncio.get_running_loop()
+        counted = False
+        while True:
+            with self._cond:
+                if not self.paused or self.stopped:
+                    return
+                if not counted:
+                    self.counts['pauses'] += 1
+                    counted = True
+                future = loop.create_future()
+                self._async_waiters.append((loop, future))
+            await future
+
+    def count(self, name, n=1):
+        with self._cond:
+            self.counts[name] += n
+
+    def stats(self):
+        with self._cond:
+            return dict(self.counts)
+
+    def _notify(self):
+        # Called with the lock held
+        self._cond.notify_all()
+        for loop, future in self._async_waiters:
+            loop.call_soon_threadsafe(_resolve, future)
+        self._async_waiters.clear()
+
+
+class AgentControls:
+    """
+    The AgentControl of each agent in this process, by name. The manager
+    (or a worker process relaying its commands) addresses agents through
+    it; `name=None` means every agent.
+    """
+
+    def __init__(self):
+        self.controls = {}
+        self.lock = threading.Lock()
+
+    def get(self, name):
+        with self.lock:
+            control = self.controls.get(name)
+            if control is None:
+                control = self.controls[name] = AgentControl()
+            return control
+
+    def advance(self, name, tasks):
+        self.get(name).advance(tasks)
+
+    def stop(self, name=None):
+        for control in self._select(name):
+            control.stop()
+
+    def pause(self, name=None):
+        for control in self._select(name):
+            control.pause()
+
+    def resume(self, name=None):
+        for control in self._select(name):
+            control.resume()
+
+    def apply(self, name, action, **fields):
+        """Run a command received as data, e.g. ('agent_2', 'advance', tasks=1) from a WorkerPool."""
+        if action == 'advance':
+            self.advance(name, fields['tasks'])
+        elif action in ('stop', 'pause', 'resume'):
+            getattr(self, action)(name)
+
+    def stats(self):
+        """Counters summed over the agents."""
+        totals = collections.Counter()
+        for control in self._select(None):
+            totals.update(control.stats())
+        return {name: totals.get(name, 0) for name in COUNTERS}
+
+    def _select(self, name):
+        if name is not None:
+            return [self.get(name)]
+        with self.lock:
+            return list(self.controls.values())
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(True)
@@ -1,11 +1,20 @@
 # agents/db.py
-import sqlite3
+import atexit, copy, hashlib, json, queue, sqlite3, threading, time, weakref, zlib
 from contextlib import contextmanager
+from agents.logging_utils import log_manager
+from agents.metrics import get_metrics
 
 DB_PATH = 'babyagi.db'
+# Seconds a connection waits on a lock held by another writer before failing
+BUSY_TIMEOUT = 30
+# Rows the DBWriter queues before `submit` blocks, so a producer that outruns SQLite
+# (e.g. a spilling MessageBus) is held back instead of growing the queue without bound
+WRITER_MAX_PENDING = 20000
 
 def init_db():
-    conn = sqlite3.connect(DB_PATH)
+    conn = sqlite3.connect(DB_PATH, timeout=BUSY_TIMEOUT)
+    # WAL lets readers proceed while the writer commits, and makes commits cheaper
+    conn.execute("PRAGMA journal_mode=WAL")
     c = conn.cursor()
     # Main task and run summary
     c.execute('''CREATE TABLE IF NOT EXISTS runs (
@@ -47,13 +56,414 @@ def init_db():
         created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
         FOREIGN KEY(agent_id) REFERENCES agents(id)
     )''')
+    # Persistent tier of the LLM response cache (agents/llm_cache.py)
+    c.execute('''CREATE TABLE IF NOT EXISTS llm_cache (
+        key TEXT PRIMARY KEY,
+        model TEXT,
+        response TEXT,
+        created_at REAL,
+        last_used REAL
+    )''')
+    _migrate(c)
     conn.commit()
     conn.close()
 
+def _columns_v1(c):
+    # Columns added after the first release
+    _add_missing_columns(c, 'runs', {'llm_stats': 'TEXT'})
+    _add_missing_columns(c, 'agent_iterations', {
+        'ttft': 'REAL', 'tokens_per_second': 'REAL',
+        # Token accounting (agents/tokens.py); durations in seconds
+        'prompt_tokens': 'INTEGER', 'completion_tokens': 'INTEGER',
+        'prompt_eval_duration': 'REAL', 'eval_duration': 'REAL', 'token_source': 'TEXT',
+    })
+    # Per-agent and per-run rollups, written by ManagerAnalytics at the end of a run
+    _add_missing_columns(c, 'agents', {'prompt_tokens': 'INTEGER', 'completion_tokens': 'INTEGER', 'eval_duration': 'REAL', 'tokens_per_second': 'REAL'})
+    _add_missing_columns(c, 'runs', {'prompt_tokens': 'INTEGER', 'completion_tokens': 'INTEGER', 'tokens_per_second': 'REAL', 'cost': 'REAL'})
+    # Resume (Manager.resume_run): tasks each agent has finished, and which task an iteration belongs to
+    _add_missing_columns(c, 'agents', {'task_index': 'INTEGER'})
+    _add_missing_columns(c, 'agent_iterations', {'task_index': 'INTEGER'})
+
+def _indexes_v2(c):
+    # Iterations of an agent (joins, resume, rollups); agents of a run, by name; runs of a model
+    c.execute("CREATE INDEX IF NOT EXISTS idx_agent_iterations_agent ON agent_iterations (agent_id, task_index, iteration)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_agents_run ON agents (run_id, agent_name)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_runs_model ON runs (model_name)")
+    # Covers the analytics query (ManagerAnalytics.query) for the agents' own iterations, so it never
+    # reads the prompt/response payloads; durations come out sorted per agent
+    c.execute("CREATE INDEX IF NOT EXISTS idx_agent_iterations_stats ON agent_iterations "
+              "(agent_id, duration, error IS NOT NULL, prompt_tokens, completion_tokens, eval_duration, token_source) WHERE prompt IS NOT NULL")
+
+def _bus_messages_v3(c):
+    # Bus history spilled by MessageBus(spill=True): one row per message, read back by bus and recipient
+    c.execute('''CREATE TABLE IF NOT EXISTS bus_messages (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        bus TEXT,
+        run_id INTEGER,
+        seq INTEGER,
+        sender TEXT,
+        recipient TEXT,
+        content TEXT,
+        kind TEXT,
+        timestamp REAL,
+        task INTEGER
+    )''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_bus_messages_recipient ON bus_messages (bus, recipient, seq)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_bus_messages_run ON bus_messages (run_id, seq)")
+
+def _prompt_blobs_v4(c):
+    # Content-addressed prompts: each distinct message once, zlib-compressed unless short; iterations list
+    # their keys in prompt_ids. Blobs are appended in rowid order; only the key index takes random inserts
+    c.execute('''CREATE TABLE IF NOT EXISTS prompt_blobs (
+        id INTEGER PRIMARY KEY,
+        key TEXT UNIQUE,
+        data BLOB
+    )''')
+    _add_missing_columns(c, 'agent_iterations', {'prompt_ids': 'TEXT'})
+    pending = c.execute("SELECT COUNT(*) FROM agent_iterations WHERE prompt IS NOT NULL AND prompt_ids IS NULL").fetchone()[0]
+    if pending:
+        log_manager(f"DB: moving {pending} stored prompts to prompt_blobs (this can take a while)...", level="INFO")
+    last_id, stored = 0, set()
+    while True:
+        rows = c.execute("SELECT id, prompt FROM agent_iterations WHERE id > ? AND prompt IS NOT NULL AND prompt_ids IS NULL ORDER BY id LIMIT 1000",
+                         (last_id,)).fetchall()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        blobs, updates = {}, []
+        for row_id, prompt in rows:
+            try:
+                messages = json.loads(prompt)
+            except ValueError:
+                continue  # not a saved message list; left in `prompt`
+            keys = []
+            for message in messages:
+                text = json.dumps(message)
+                key = prompt_key(text)
+                if key not in stored:
+                    blobs[key] = _blob_data(text)
+                    stored.add(key)
+                keys.append(key)
+            updates.append((json.dumps(keys), row_id))
+        c.executemany("INSERT OR IGNORE INTO prompt_blobs (key, data) VALUES (?, ?)", blobs.items())
+        c.executemany("UPDATE agent_iterations SET prompt_ids=?, prompt=NULL WHERE id=?", updates)
+    # Agent iterations are now the rows with prompt_ids
+    c.execute("DROP INDEX IF EXISTS idx_agent_iterations_stats")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_agent_iterations_stats ON agent_iterations "
+              "(agent_id, duration, error IS NOT NULL, prompt_tokens, completion_tokens, eval_duration, token_source) WHERE prompt_ids IS NOT NULL")
+    if pending:
+        log_manager("DB: prompts moved; VACUUM the database to return the freed space", level="INFO")
+
+# Schema migrations, applied in order to databases whose PRAGMA user_version is older.
+# Each must be safe to re-run: a concurrent init_db may have applied it first.
+MIGRATIONS = [
+    (1, _columns_v1),
+    (2, _indexes_v2),
+    (3, _bus_messages_v3),
+    (4, _prompt_blobs_v4),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+def _migrate(c):
+    version = c.execute("PRAGMA user_version").fetchone()[0]
+    for target, migration in MIGRATIONS:
+        if target > version:
+            migration(c)
+            c.execute(f"PRAGMA user_version = {target}")
+
+def _add_missing_columns(c, table, columns):
+    existing = {row[1] for row in c.execute(f"PRAGMA table_info({table})")}
+    for name, decl in columns.items():
+        if name not in existing:
+            try:
+                c.execute(f"ALTER TABLE {table} ADD COLUMN {name} {decl}")
+            except sqlite3.OperationalError as e:
+                # Added meanwhile by another init_db (concurrent runs or processes)
+                if 'duplicate column' not in str(e):
+                    raise
+
+# Messages shorter than this (in JSON characters) are stored as text: zlib saves little on them
+PROMPT_COMPRESS_MIN = 128
+
+def prompt_key(text):
+    """Key of one message's JSON text in prompt_blobs."""
+    return hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
+
+def _blob_data(text):
+    return zlib.compress(text.encode()) if len(text) >= PROMPT_COMPRESS_MIN else text
+
+# Keys each writer has already been given, so a message repeated in every prompt is compressed and
+# queued once per process; INSERT OR IGNORE covers other processes writing the same message.
+# A key whose row the writer drops is forgotten again (forget_prompt_key), so the next prompt re-queues it
+BLOB_INSERT = "INSERT OR IGNORE INTO prompt_blobs (key, data) VALUES (?, ?)"
+_stored_keys = weakref.WeakKeyDictionary()
+_stored_lock = threading.Lock()
+STORED_KEYS_MAX = 100000
+# Key of each recent message by its items. An agent's context sends the same message objects every
+# iteration, and their strings cache their hashes, so a repeated message is found without serializing it
+_message_keys = {}
+MESSAGE_KEYS_MAX = 10000
+
+def save_prompt(messages, writer=None):
+    """
+    Queue the messages of a prompt that are not stored yet to prompt_blobs
+    and return the value of agent_iterations.prompt_ids: the JSON list of
+    their keys, in order. `load_prompt` turns it back into the messages.
+    """
+    writer = writer or get_writer()
+    with _stored_lock:
+        known = _stored_keys.get(writer)
+        if known is None or len(known) > STORED_KEYS_MAX:
+            known = _stored_keys[writer] = set()
+    keys = []
+    for message in messages:
+        text = None
+        try:
+            items = tuple(message.items())
+            key = _message_keys.get(items)
+        except TypeError:
+            items = key = None  # unhashable values, e.g. tool calls
+        if key is None:
+            text = json.dumps(message)
+            key = prompt_key(text)
+            if items is not None:
+                if len(_message_keys) >= MESSAGE_KEYS_MAX:
+                    _message_keys.clear()
+                _message_keys[items] = key
+        if key not in known:
+            text = text or json.dumps(message)
+            writer.submit(BLOB_INSERT, (key, _blob_data(text)))
+            known.add(key)
+        keys.append(key)
+    # json.dumps(keys), built directly: keys are hex
+    return '["' + '", "'.join(keys) + '"]' if keys else '[]'
+
+def forget_prompt_key(key):
+    """Called when a prompt_blobs row was not written: no writer counts `key` as stored any more."""
+    with _stored_lock:
+        for known in _stored_keys.values():
+            known.discard(key)
+
+# Decoded blobs, (message, JSON text, has nested values) by key. A key always names the same content, so entries
+# stay valid for any connection or database; cleared when full. Shared by threads without a lock: readers use
+# .get() and treat None as a miss, so another thread clearing it costs only a re-read
+_blob_cache = {}
+BLOB_CACHE_MAX = 10000
+# Stands in for a message whose blob row was never written (dropped by the writer), so one lost row
+# does not make a whole run unreadable
+MISSING_MESSAGE = {'role': 'system', 'content': '[message missing from prompt_blobs]'}
+_MISSING_BLOB = (MISSING_MESSAGE, json.dumps(MISSING_MESSAGE), False)
+
+def _load_blobs(conn, keys):
+    blobs, missing = {}, []
+    for key in keys:
+        blob = _blob_cache.get(key)
+        if blob is None:
+            missing.append(key)
+        else:
+            blobs[key] = blob
+    if len(_blob_cache) + len(missing) > BLOB_CACHE_MAX:
+        _blob_cache.clear()
+    for start in range(0, len(missing), 500):
+        chunk = missing[start:start + 500]
+        for key, data in conn.execute(f"SELECT key, data FROM prompt_blobs WHERE key IN ({','.join('?' * len(chunk))})", chunk):
+            text = zlib.decompress(data).decode() if isinstance(data, bytes) else data
+            message = json.loads(text)
+            blobs[key] = _blob_cache[key] = (message, text, any(isinstance(value, (dict, list)) for value in message.values()))
+    return blobs
+
+def load_prompts(conn, prompt_ids, as_text=False):
+    """
+    Rebuild stored prompts from their agent_iterations.prompt_ids values,
+    each as a list of messages (None where `prompt_ids` is None). With
+    `as_text`, each is the JSON text the row used to store in `prompt`.
+    Each distinct message is read, decompressed and parsed once, and kept
+    in a cache shared by later calls. A message whose blob row is missing
+    comes back as MISSING_MESSAGE, with a warning.
+    """
+    key_lists = [json.loads(ids) if ids is not None else None for ids in prompt_ids]
+    wanted = list({key for keys in key_lists if keys for key in keys})
+    blobs = _load_blobs(conn, wanted)
+    if len(blobs) < len(wanted):
+        missing = [key for key in wanted if key not in blobs]
+        log_manager(f"DB: {len(missing)} stored prompt message(s) missing from prompt_blobs (e.g. {missing[0]}); shown as placeholders", level="WARNING")
+        blobs.update(dict.fromkeys(missing, _MISSING_BLOB))
+    prompts = []
+    for keys in key_lists:
+        if keys is None:
+            prompts.append(None)
+        elif as_text:
+            prompts.append('[' + ', '.join(blobs[key][1] for key in keys) + ']')
+        else:
+            # Callers get their own messages; nested values (tool calls) are copied too
+            prompts.append([copy.deepcopy(message) if nested else message.copy() for message, _, nested in map(blobs.__getitem__, keys)])
+    return prompts
+
+def load_prompt(conn, prompt_ids, as_text=False):
+    """One prompt from its agent_iterations.prompt_ids; see `load_prompts`."""
+    return load_prompts(conn, [prompt_ids], as_text)[0]
+
 @contextmanager
 def get_db():
-    conn = sqlite3.connect(DB_PATH)
+    conn = sqlite3.connect(DB_PATH, timeout=BUSY_TIMEOUT)
     try:
         yield conn
     finally:
         conn.close()
+
+
+class DBWriter:
+    """
+    Single write-behind writer for high-volume inserts.
+
+    Any thread can `submit` a statement; a background thread owns one
+    long-lived WAL connection and commits queued statements in batches of up
+    to `batch_size` rows or every `flush_interval` seconds, using
+    `executemany` for runs of the same statement. `flush` blocks until
+    everything submitted so far is committed; `close` flushes and stops.
+    `submit` blocks only while `max_pending` rows are waiting. A row that
+    cannot be written is dropped and logged; if the thread stops anyway,
+    `submit` and `flush` raise RuntimeError instead of waiting for it.
+    """
+
+    def __init__(self, path=None, batch_size=500, flush_interval=0.2, max_pending=WRITER_MAX_PENDING):
+        self.path = path or DB_PATH
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.rows_written = 0
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, sql, params):
+        if self._closed:
+            raise RuntimeError("DBWriter is closed")
+        self._put((sql, params))
+
+    def flush(self, timeout=None):
+        done = threading.Event()
+        self._put(done)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        # Wait in slices so a writer thread that died does not leave the caller waiting forever
+        while not done.wait(0.5 if deadline is None else max(0, min(0.5, deadline - time.monotonic()))):
+            self._check_alive()
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+        return True
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        if self._thread.is_alive():
+            self._queue.put(None)
+        self._thread.join()
+
+    def _check_alive(self):
+        if not self._thread.is_alive():
+            raise RuntimeError("DB writer thread has stopped; queued rows were not written")
+
+    def _put(self, item):
+        self._check_alive()
+        while True:
+            try:
+                self._queue.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                self._check_alive()
+
+    def _run(self):
+        conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        # Safe with WAL: a crash can lose the last commits but not corrupt the DB
+        conn.execute("PRAGMA synchronous=NORMAL")
+        try:
+            running = True
+            while running:
+                item = self._queue.get()
+                batch, waiters = [], []
+                deadline = time.monotonic() + self.flush_interval
+                while True:
+                    if item is None:
+                        running = False
+                        break
+                    if isinstance(item, threading.Event):
+                        waiters.append(item)
+                        break
+                    batch.append(item)
+                    if len(batch) >= self.batch_size:
+                        break
+                    remaining = deadline - time.monotonic()
+                    try:
+                        item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                self._write(conn, batch)
+                for waiter in waiters:
+                    waiter.set()
+        except Exception as e:
+            log_manager(f"DB writer stopped: {e!r}", level="ERROR")
+        finally:
+            conn.close()
+
+    def _write(self, conn, batch):
+        if not batch:
+            return
+        t0 = time.perf_counter()
+        try:
+            # Group consecutive rows for the same statement into one executemany
+            start = 0
+            for i in range(1, len(batch) + 1):
+                if i == len(batch) or batch[i][0] != batch[start][0]:
+                    conn.executemany(batch[start][0], [params for _, params in batch[start:i]])
+                    start = i
+            conn.commit()
+            self.rows_written += len(batch)
+            get_metrics().observe('db_commit', time.perf_counter() - t0)
+        except Exception as e:
+            # Not only sqlite3.Error: a value SQLite cannot bind (an int over 64 bits, a lone surrogate) raises
+            # OverflowError or UnicodeEncodeError
+            conn.rollback()
+            log_manager(f"DB writer: batch of {len(batch)} rows failed ({e}), retrying row by row", level="WARNING")
+            for sql, params in batch:
+                try:
+                    conn.execute(sql, params)
+                    conn.commit()
+                    self.rows_written += 1
+                except Exception as row_error:
+                    conn.rollback()
+                    log_manager(f"DB writer: dropped row for '{sql.split('(')[0].strip()}': {row_error}", level="ERROR")
+                    if sql == BLOB_INSERT:
+                        forget_prompt_key(params[0])
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+def get_writer():
+    """Process-wide DBWriter for DB_PATH, started on first use and flushed at exit."""
+    global _writer
+    with _writer_lock:
+        if _writer is None or _writer.path != DB_PATH:
+            if _writer is not None:
+                _writer.close()
+            _writer = DBWriter(DB_PATH)
+        return _writer
+
+def set_writer(writer):
+    """Install `writer` as the process-wide writer (agents/worker.py forwards rows to the manager's)."""
+    global _writer
+    with _writer_lock:
+        if _writer is not None and _writer is not writer:
+            _writer.close()
+        _writer = writer
+
+def close_writer():
+    global _writer
+    with _writer_lock:
+        if _writer is not None:
+            _writer.close()
+            _writer = None
+
+atexit.register(close_writer)
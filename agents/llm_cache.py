@@ -0,0 +1,218 @@
+# agents/llm_cache.py
+import asyncio, collections, hashlib, json, sqlite3, threading, time
+from agents import db
+from agents.backends import normalize_response
+
+
+def cache_key(model, messages, options=None):
+    """Canonical hash of a chat request: same model, messages and options -> same key."""
+    payload = json.dumps({'model': model, 'messages': messages, 'options': options or {}}, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def to_cacheable(response):
+    """Plain-dict form of a chat response (ollama returns pydantic objects)."""
+    return normalize_response(response)
+
+
+class _Flight:
+    __slots__ = ('done', 'response', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.response = None
+        self.error = None
+
+
+class LLMCache:
+    """
+    Two-tier cache for chat responses, keyed on (model, messages, options).
+
+    Tier 1 is an in-memory LRU of `max_entries` responses. Tier 2 is the
+    `llm_cache` table in babyagi.db, which keeps responses for `ttl` seconds
+    and at most `max_rows` rows (least recently used rows are evicted).
+    Concurrent identical requests are de-duplicated (single flight): the
+    first caller checks the disk tier, then hits the backend, and the others
+    wait for its result. Disk reads use the cache's own connection, outside
+    `lock`; writes (stores, `last_used`, expiry and trimming) are queued to
+    the process-wide DB writer, so they never wait for the SQLite write lock.
+    """
+
+    def __init__(self, max_entries=1024, ttl=7 * 24 * 3600, max_rows=10000, persistent=True):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_rows = max_rows
+        self.persistent = persistent
+        self.lock = threading.Lock()
+        self._memory = collections.OrderedDict()  # key -> (created_at, response)
+        self._inflight = {}         # key -> _Flight, for threads
+        self._inflight_async = {}   # key -> asyncio.Future, for coroutines
+        self._conn = None
+        self._conn_path = None
+        self._disk_lock = threading.Lock()  # the read connection is shared by threads
+        self._stats = collections.Counter()
+
+    # --- Public API ---
+
+    def get_or_call(self, model, messages, options, call, call_info=None):
+        """Return a cached response, or run `call()` once for all concurrent identical requests."""
+        key = cache_key(model, messages, options)
+        with self.lock:
+            response = self._lookup(key, call_info)
+            if response is not None:
+                return response
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = _Flight()
+        if not leader:
+            self._count('shared', call_info)
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.response
+        try:
+            flight.response = self._disk_lookup(key, call_info)
+            if flight.response is None:
+                self._count('misses', call_info)
+                flight.response = call()
+                self.put(key, model, flight.response)
+            return flight.response
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self.lock:
+                del self._inflight[key]
+            flight.done.set()
+
+    async def aget_or_call(self, model, messages, options, call, call_info=None):
+        """`get_or_call` for coroutines; `call` returns an awaitable. The disk tier is read in a thread, off the event loop."""
+        key = cache_key(model, messages, options)
+        with self.lock:
+            response = self._lookup(key, call_info)
+        if response is not None:
+            return response
+        future = self._inflight_async.get(key)
+        if future is not None:
+            self._count('shared', call_info)
+            return await asyncio.shield(future)
+        future = self._inflight_async[key] = asyncio.get_running_loop().create_future()
+        try:
+            response = await asyncio.to_thread(self._disk_lookup, key, call_info) if self.persistent else None
+            if response is None:
+                self._count('misses', call_info)
+                response = await call()
+                self.put(key, model, response)
+            future.set_result(response)
+            return response
+        except BaseException as e:
+            future.set_exception(e)
+            # Followers re-raise it; mark it retrieved so asyncio does not warn
+            future.exception()
+            raise
+        finally:
+            del self._inflight_async[key]
+
+    def put(self, key, model, response):
+        entry = (time.time(), to_cacheable(response))
+        rows = []
+        with self.lock:
+            self._remember(key, entry)
+            if self.persistent:
+                rows = self._store_rows(key, model, entry)
+        # Submitted after releasing the lock: submit blocks while the writer's queue is full
+        writer = db.get_writer() if rows else None
+        for sql, params in rows:
+            writer.submit(sql, params)
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self._stats)
+        lookups = sum(stats.get(k, 0) for k in ('memory_hits', 'disk_hits', 'shared', 'misses'))
+        hits = lookups - stats.get('misses', 0)
+        stats['lookups'] = lookups
+        stats['hit_rate'] = round(hits / lookups, 4) if lookups else 0.0
+        return stats
+
+    def clear(self):
+        with self.lock:
+            self._memory.clear()
+        if self.persistent:
+            writer = db.get_writer()
+            writer.submit("DELETE FROM llm_cache", ())
+            writer.flush()
+
+    # --- Internals ---
+
+    def _lookup(self, key, call_info):
+        # Lock held: the memory tier only
+        entry = self._memory.get(key)
+        if entry is not None:
+            if time.time() - entry[0] <= self.ttl:
+                self._memory.move_to_end(key)
+                self._count('memory_hits', call_info, locked=True)
+                return entry[1]
+            del self._memory[key]
+        return None
+
+    def _disk_lookup(self, key, call_info):
+        # Lock not held: a disk read must not stall memory hits of other callers
+        if not self.persistent:
+            return None
+        now = time.time()
+        with self._disk_lock:
+            row = self._connection().execute("SELECT created_at, response FROM llm_cache WHERE key=?", (key,)).fetchone()
+        if row is None:
+            return None
+        writer = db.get_writer()
+        if now - row[0] > self.ttl:
+            writer.submit("DELETE FROM llm_cache WHERE key=?", (key,))
+            self._count('expired', None)
+            return None
+        writer.submit("UPDATE llm_cache SET last_used=? WHERE key=?", (now, key))
+        entry = (row[0], json.loads(row[1]))
+        with self.lock:
+            self._remember(key, entry)
+            self._count('disk_hits', call_info, locked=True)
+        return entry[1]
+
+    def _remember(self, key, entry):
+        # Lock held
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self._stats['memory_evictions'] += 1
+
+    def _store_rows(self, key, model, entry):
+        # Lock held; returns the statements for the writer, which the caller submits once the lock is released
+        rows = [(
+            "INSERT OR REPLACE INTO llm_cache (key, model, response, created_at, last_used) VALUES (?, ?, ?, ?, ?)",
+            (key, model, json.dumps(entry[1], default=str), entry[0], entry[0])
+        )]
+        self._stats['stores'] += 1
+        # Trim in chunks of 10% so eviction does not run on every insert
+        if self._stats['stores'] % max(1, self.max_rows // 10) == 0:
+            rows.append(("DELETE FROM llm_cache WHERE created_at < ?", (time.time() - self.ttl,)))
+            rows.append(("DELETE FROM llm_cache WHERE key IN (SELECT key FROM llm_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?)", (self.max_rows,)))
+            self._stats['disk_trims'] += 1
+        return rows
+
+    def _connection(self):
+        # _disk_lock held; reads only
+        if self._conn is None or self._conn_path != db.DB_PATH:
+            if self._conn is not None:
+                self._conn.close()
+            self._conn = sqlite3.connect(db.DB_PATH, timeout=db.BUSY_TIMEOUT, check_same_thread=False)
+            self._conn_path = db.DB_PATH
+        return self._conn
+
+    def _count(self, name, call_info, locked=False):
+        if call_info is not None:
+            call_info['cache'] = name
+        if locked:
+            self._stats[name] += 1
+        else:
+            with self.lock:
+                self._stats[name] += 1
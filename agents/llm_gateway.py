@@ -0,0 +1,467 @@
+# agents/llm_gateway.py
+import asyncio, collections, random, threading, time
+from agents.tokens import TokenLedger, account, message_text, usage
+from agents.metrics import get_metrics
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+class LLMRetriesExhausted(Exception):
+    """Raised when every attempt of an LLM call failed with a retryable error."""
+
+    def __init__(self, last_error, attempts):
+        super().__init__(f"failed after {attempts} attempts: {last_error}")
+        self.last_error = last_error
+        self.attempts = attempts
+
+
+def is_retryable(e):
+    """Server overload/5xx responses and connection failures are worth retrying."""
+    status = getattr(e, 'status_code', None)
+    if status is None and hasattr(e, 'response'):
+        status = getattr(e.response, 'status_code', None)
+    if status is not None:
+        return status in RETRYABLE_STATUS
+    return isinstance(e, (ConnectionError, TimeoutError)) or type(e).__name__ in ('ConnectError', 'ReadTimeout', 'ConnectTimeout', 'RemoteProtocolError')
+
+
+class _Waiter:
+    __slots__ = ('model', 'client_id', 'enqueued_at', 'event', 'loop', 'future')
+
+    def __init__(self, model, client_id, loop=None):
+        self.model = model
+        self.client_id = client_id
+        self.enqueued_at = time.monotonic()
+        self.loop = loop
+        if loop is None:
+            self.event = threading.Event()
+            self.future = None
+        else:
+            self.event = None
+            self.future = loop.create_future()
+
+    def grant(self):
+        if self.event is not None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(_resolve, self.future)
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(True)
+
+
+class LLMGateway:
+    """
+    Shared front door for every chat call to one LLM backend.
+
+    - Concurrency is capped by an AIMD limit: +1/limit per good call,
+      x`decrease_ratio` when calls fail with overload errors or when the
+      server is queueing: its smoothed wait before the first token drifts
+      past `latency_tolerance` x the shortest seen, and by more than
+      `latency_slack` seconds. That wait is a stream's time to first token,
+      or a call's latency without the generation and model load time the
+      backend reports, so long replies do not read as overload. Calls whose
+      backend reports no durations adjust the limit on errors only.
+      Until the first decrease the limit grows by 1 per good call (slow
+      start), so a fresh gateway ramps up quickly.
+    - Callers wait in a queue per model and are served round-robin across
+      models and across `client_id`s (agents), so one busy agent cannot
+      starve the others.
+    - Retryable failures back off exponentially with full jitter, so agents
+      that failed together do not retry together.
+
+    `backend` is anything with `chat(model=..., messages=..., **kwargs)`:
+    the `ollama` module or an `ollama.Client` for `chat`, an
+    `ollama.AsyncClient` for `achat`. With an optional `cache` (LLMCache),
+    repeated requests are answered without touching the limiter or backend.
+    Every call's token usage is recorded in `call_info` and in `self.tokens`
+    (a TokenLedger per client_id).
+    """
+
+    def __init__(self, backend, cache=None, initial_limit=4, min_limit=1, max_limit=32, max_attempts=3,
+                 base_delay=1.0, max_delay=30.0, latency_tolerance=3.0, latency_slack=0.25, decrease_ratio=0.7):
+        self.backend = backend
+        self.cache = cache
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.limit = float(max(min_limit, min(initial_limit, max_limit)))
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.latency_tolerance = latency_tolerance
+        self.latency_slack = latency_slack
+        self.decrease_ratio = decrease_ratio
+        self.lock = threading.Lock()
+        self._queues = collections.OrderedDict()  # model -> OrderedDict(client_id -> deque of waiters)
+        self._queued = 0
+        self._in_flight = 0
+        self._latency_floor = None
+        self._latency_avg = None
+        self._last_decrease = 0.0
+        self._slow_start = True
+        self._queue_waits = collections.deque(maxlen=1000)
+        self._counters = collections.Counter()
+        self.tokens = TokenLedger()
+
+    # --- Public API ---
+
+    def chat(self, model, messages, client_id=None, on_retry=None, call_info=None, **kwargs):
+        """
+        Blocking chat call through the cache and limiter, with retries.
+        `on_retry(error, attempt, delay)` is called before each backoff sleep.
+        `call_info`, if given, is filled with 'queue_wait' (seconds, summed
+        over attempts), 'attempts', the token usage from `agents.tokens.account`
+        and, with a cache, 'cache' (the tier that answered, or 'misses').
+        """
+        info = call_info if call_info is not None else {}
+        info['queue_wait'] = 0.0
+        info['attempts'] = 0
+        if self.cache is None:
+            response = self._chat(model, messages, client_id, on_retry, info, kwargs)
+        else:
+            response = self.cache.get_or_call(model, messages, kwargs, lambda: self._chat(model, messages, client_id, on_retry, info, kwargs), call_info=info)
+        self._account(client_id, messages, response, info)
+        return response
+
+    async def achat(self, model, messages, client_id=None, on_retry=None, call_info=None, **kwargs):
+        """Awaitable `chat` for an async backend (e.g. ollama.AsyncClient)."""
+        info = call_info if call_info is not None else {}
+        info['queue_wait'] = 0.0
+        info['attempts'] = 0
+        if self.cache is None:
+            response = await self._achat(model, messages, client_id, on_retry, info, kwargs)
+        else:
+            response = await self.cache.aget_or_call(model, messages, kwargs, lambda: self._achat(model, messages, client_id, on_retry, info, kwargs), call_info=info)
+        self._account(client_id, messages, response, info)
+        return response
+
+    def stream(self, model, messages, client_id=None, on_retry=None, call_info=None, **kwargs):
+        """
+        Streaming chat call through the limiter: a generator of response
+        chunks. The slot is held until the stream ends or is closed, so close
+        it when stopping early. Failures are retried only before the first
+        chunk. `call_info` also gets 'ttft' (seconds from request to first
+        chunk), which is the latency sample the limiter adapts on. Token
+        usage is recorded when the stream ends or is closed.
+        """
+        info = call_info if call_info is not None else {}
+        info['queue_wait'] = 0.0
+        info['attempts'] = 0
+        parts, last = [], None
+        chunks = self._stream(model, messages, client_id, on_retry, info, kwargs)
+        try:
+            for last in chunks:
+                parts.append(message_text(last))
+                yield last
+        finally:
+            # Releases the slot right away if the consumer stopped early
+            chunks.close()
+            if last is not None:
+                self._account_stream(client_id, messages, parts, last, info)
+
+    async def astream(self, model, messages, client_id=None, on_retry=None, call_info=None, **kwargs):
+        """Async generator version of `stream` for an async backend; `aclose()` it when stopping early."""
+        info = call_info if call_info is not None else {}
+        info['queue_wait'] = 0.0
+        info['attempts'] = 0
+        parts, last = [], None
+        chunks = self._astream(model, messages, client_id, on_retry, info, kwargs)
+        try:
+            async for last in chunks:
+                parts.append(message_text(last))
+                yield last
+        finally:
+            await chunks.aclose()
+            if last is not None:
+                self._account_stream(client_id, messages, parts, last, info)
+
+    def _stream(self, model, messages, client_id, on_retry, info, kwargs):
+        kwargs['stream'] = True
+        for attempt in range(1, self.max_attempts + 1):
+            info['attempts'] = attempt
+            info['queue_wait'] += self._acquire(model, client_id)
+            t0 = time.monotonic()
+            ttft = None
+            chunks = None
+            try:
+                chunks = self.backend.chat(model=model, messages=messages, **kwargs)
+                for chunk in chunks:
+                    if ttft is None:
+                        ttft = info['ttft'] = time.monotonic() - t0
+                    yield chunk
+            except Exception as e:
+                if ttft is not None:
+                    self._failed_mid_stream(e, ttft)
+                    raise
+                delay = self._failed(e, attempt)
+                if on_retry:
+                    on_retry(e, attempt, delay)
+                time.sleep(delay)
+                continue
+            except BaseException:
+                # Closed early by the consumer
+                self._release(ttft, overloaded=False, record=ttft is not None)
+                raise
+            finally:
+                close = getattr(chunks, 'close', None)
+                if close:
+                    close()
+            self._release(ttft, overloaded=False)
+            return
+
+    async def _astream(self, model, messages, client_id, on_retry, info, kwargs):
+        kwargs['stream'] = True
+        for attempt in range(1, self.max_attempts + 1):
+            info['attempts'] = attempt
+            info['queue_wait'] += await self._acquire_async(model, client_id)
+            t0 = time.monotonic()
+            ttft = None
+            chunks = None
+            try:
+                chunks = await self.backend.chat(model=model, messages=messages, **kwargs)
+                async for chunk in chunks:
+                    if ttft is None:
+                        ttft = info['ttft'] = time.monotonic() - t0
+                    yield chunk
+            except Exception as e:
+                if ttft is not None:
+                    self._failed_mid_stream(e, ttft)
+                    raise
+                delay = self._failed(e, attempt)
+                if on_retry:
+                    on_retry(e, attempt, delay)
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                # Closed early by the consumer, or cancelled
+                self._release(ttft, overloaded=False, record=ttft is not None)
+                raise
+            finally:
+                aclose = getattr(chunks, 'aclose', None)
+                if aclose:
+                    await aclose()
+            self._release(ttft, overloaded=False)
+            return
+
+    def _account(self, client_id, messages, response, info):
+        cached = info.get('cache') not in (None, 'misses')
+        info.update(account(messages, response, cached))
+        self.tokens.add(client_id, info)
+
+    def _account_stream(self, client_id, messages, parts, last, info):
+        # The final chunk carries Ollama's counts; a stream closed early only has its text
+        self._account(client_id, messages, dict(usage(last), message={'content': ''.join(parts)}), info)
+
+    def _chat(self, model, messages, client_id, on_retry, info, kwargs):
+        for attempt in range(1, self.max_attempts + 1):
+            info['attempts'] = attempt
+            info['queue_wait'] += self._acquire(model, client_id)
+            t0 = time.monotonic()
+            try:
+                response = self.backend.chat(model=model, messages=messages, **kwargs)
+            except Exception as e:
+                delay = self._failed(e, attempt)
+                if on_retry:
+                    on_retry(e, attempt, delay)
+                time.sleep(delay)
+                continue
+            except BaseException:
+                self._release(None, overloaded=False, record=False)
+                raise
+            self._release(_server_wait(response, time.monotonic() - t0), overloaded=False)
+            return response
+
+    async def _achat(self, model, messages, client_id, on_retry, info, kwargs):
+        for attempt in range(1, self.max_attempts + 1):
+            info['attempts'] = attempt
+            info['queue_wait'] += await self._acquire_async(model, client_id)
+            t0 = time.monotonic()
+            try:
+                response = await self.backend.chat(model=model, messages=messages, **kwargs)
+            except Exception as e:
+                delay = self._failed(e, attempt)
+                if on_retry:
+                    on_retry(e, attempt, delay)
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                # Cancelled mid-call
+                self._release(None, overloaded=False, record=False)
+                raise
+            self._release(_server_wait(response, time.monotonic() - t0), overloaded=False)
+            return response
+
+    def stats(self):
+        """Snapshot of the limiter state and queue-wait metrics (seconds)."""
+        with self.lock:
+            waits = sorted(self._queue_waits)
+            counters = dict(self._counters)
+            snapshot = {
+                'limit': round(self.limit, 2),
+                'in_flight': self._in_flight,
+                'queued': self._queued,
+                'latency_floor': self._latency_floor,
+                'latency_avg': self._latency_avg,
+            }
+        snapshot.update({
+            'calls': counters.get('calls', 0),
+            'retries': counters.get('retries', 0),
+            'errors': counters.get('errors', 0),
+            'queue_wait_total': counters.get('queue_wait_total', 0.0),
+            'queue_wait_p50': _percentile(waits, 0.50),
+            'queue_wait_p95': _percentile(waits, 0.95),
+            'queue_wait_max': waits[-1] if waits else 0.0,
+            'tokens': self.tokens.totals(),
+        })
+        return snapshot
+
+    # --- Limiter internals ---
+
+    def _acquire(self, model, client_id):
+        with self.lock:
+            waiter = self._enqueue(model, client_id, None)
+        waiter.event.wait()
+        return self._granted(waiter)
+
+    async def _acquire_async(self, model, client_id):
+        with self.lock:
+            waiter = self._enqueue(model, client_id, asyncio.get_running_loop())
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            with self.lock:
+                if not self._dequeue(waiter):
+                    # Already granted: give the slot back
+                    self._in_flight -= 1
+                    self._dispatch()
+            raise
+        return self._granted(waiter)
+
+    def _enqueue(self, model, client_id, loop):
+        # Lock held
+        waiter = _Waiter(model, client_id, loop)
+        clients = self._queues.setdefault(model, collections.OrderedDict())
+        clients.setdefault(client_id, collections.deque()).append(waiter)
+        self._queued += 1
+        self._dispatch()
+        return waiter
+
+    def _dequeue(self, waiter):
+        # Lock held. Returns False if the waiter was no longer queued.
+        clients = self._queues.get(waiter.model)
+        queue = clients.get(waiter.client_id) if clients else None
+        if not queue or waiter not in queue:
+            return False
+        queue.remove(waiter)
+        self._queued -= 1
+        if not queue:
+            del clients[waiter.client_id]
+            if not clients:
+                del self._queues[waiter.model]
+        return True
+
+    def _dispatch(self):
+        # Lock held. Grant slots round-robin: models first, then clients within a model.
+        while self._queued and self._in_flight < int(self.limit):
+            model, clients = next(iter(self._queues.items()))
+            self._queues.move_to_end(model)
+            client_id, queue = next(iter(clients.items()))
+            clients.move_to_end(client_id)
+            waiter = queue.popleft()
+            if not queue:
+                del clients[client_id]
+                if not clients:
+                    del self._queues[model]
+            self._queued -= 1
+            self._in_flight += 1
+            waiter.grant()
+
+    def _granted(self, waiter):
+        wait = time.monotonic() - waiter.enqueued_at
+        with self.lock:
+            self._queue_waits.append(wait)
+            self._counters['queue_wait_total'] += wait
+        get_metrics().observe('llm_queue_wait', wait)
+        return wait
+
+    def _failed(self, e, attempt):
+        """Release the slot for a failed call. Returns the backoff delay or re-raises."""
+        retryable = is_retryable(e)
+        # A non-retryable error (a bad request) says nothing about load: not a call, and no latency sample
+        self._release(None, overloaded=retryable, record=retryable)
+        with self.lock:
+            self._counters['errors'] += 1
+        if not retryable:
+            raise e
+        if attempt >= self.max_attempts:
+            raise LLMRetriesExhausted(e, attempt) from e
+        with self.lock:
+            self._counters['retries'] += 1
+        # Full jitter: uniform in [0, min(cap, base * 2^attempt)]
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def _failed_mid_stream(self, e, ttft):
+        # Chunks were already handed out, so the call cannot be retried
+        self._release(ttft, overloaded=is_retryable(e))
+        with self.lock:
+            self._counters['errors'] += 1
+
+    def _release(self, latency, overloaded, record=True):
+        with self.lock:
+            self._in_flight -= 1
+            if record:
+                self._counters['calls'] += 1
+                self._adapt(latency, overloaded)
+            self._dispatch()
+
+    def _adapt(self, wait, overloaded):
+        # Lock held. AIMD on errors, and on the server's wait before the first token (`wait`,
+        # None when the call gave no sample) relative to the shortest seen.
+        now = time.monotonic()
+        slow = False
+        if wait is not None and not overloaded:
+            if self._latency_floor is None or wait < self._latency_floor:
+                self._latency_floor = wait
+            else:
+                # Let the floor drift up slowly so it tracks model/prompt changes
+                self._latency_floor += 0.01 * (wait - self._latency_floor)
+            self._latency_avg = wait if self._latency_avg is None else self._latency_avg + 0.2 * (wait - self._latency_avg)
+            # Both relative and absolute, so jitter on a floor of a few milliseconds is not taken for queueing
+            slow = (self._latency_avg > self._latency_floor * self.latency_tolerance
+                    and self._latency_avg - self._latency_floor > self.latency_slack)
+        if overloaded or slow:
+            # At most one decrease per floor-latency window, so one burst of
+            # failures does not collapse the limit to the minimum
+            if now - self._last_decrease >= (self._latency_floor or 0.0):
+                self.limit = max(self.min_limit, self.limit * self.decrease_ratio)
+                self._last_decrease = now
+                self._slow_start = False
+        else:
+            step = 1.0 if self._slow_start else 1.0 / self.limit
+            self.limit = min(self.max_limit, self.limit + step)
+
+
+def _server_wait(response, latency):
+    """
+    Seconds the server kept a non-streamed call waiting before generating:
+    its latency without the reply's generation (`eval_duration`) and any
+    model load, the same measure as a stream's time to first token. How
+    long the reply is does not change it; queueing on the server does.
+    None when the backend does not report `eval_duration`.
+    """
+    durations = {}
+    for field in ('eval_duration', 'load_duration'):
+        value = response.get(field) if isinstance(response, dict) else getattr(response, field, None)
+        if value is not None:
+            durations[field] = value / 1e9
+    if 'eval_duration' not in durations:
+        return None
+    return max(0.0, latency - durations['eval_duration'] - durations.get('load_duration', 0.0))
+
+
+def _percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
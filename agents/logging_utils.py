@@ -1,29 +1,225 @@
 # agents/logging_utils.py
-def log_manager(message, colors=None, level="INFO", prefix="[MANAGER] ", end="\n", flush=True):
+from agents.config import LOG_LEVEL, LOG_JSON_PATH, LOG_RATE_LIMIT
+import atexit, json, queue, re, sys, threading, time
+
+# Severity of each log_manager level; SUCCESS and BOLD are INFO with another color
+LEVELS = {"DEBUG": 10, "INFO": 20, "SUCCESS": 20, "BOLD": 20, "WARNING": 30, "ERROR": 40}
+ANSI_ESCAPE = re.compile(r'\033\[[0-9;]*m')
+
+
+def level_color(colors, level):
+    if colors is None:
+        return "", ""
+    color = {
+        "INFO": colors.OKBLUE,
+        "SUCCESS": colors.OKGREEN,
+        "WARNING": colors.WARNING,
+        "ERROR": colors.FAIL,
+        "BOLD": colors.BOLD,
+    }.get(level, "")
+    return color, colors.ENDC
+
+
+def format_line(message, colors=None, level="INFO", prefix="[MANAGER] ", end="\n"):
+    color, endc = level_color(colors, level)
+    return f"{prefix}{color}{message}{endc}{end}"
+
+
+class LogWriter:
+    """
+    Single background writer behind log_manager.
+
+    Callers only filter by level and enqueue, so agent threads and the
+    manager loop never wait on the terminal. The writer thread formats the
+    queued records and writes them in batches of up to `batch_size` lines
+    or every `flush_interval` seconds: one write and one flush per batch
+    and stream, and each line is written whole, so lines from different
+    threads never interleave. The stream is the `sys.stdout` of the caller
+    at the time of the call, as with print().
+
+    With `json_path`, every record that passes the level filter is also
+    appended to that file as one JSON object per line (ANSI colors
+    stripped). Records logged with a `sample` key are rate limited on the
+    console to `rate_limit` lines per second per key (0: no limit); the
+    next line that gets through reports how many were suppressed. The JSON
+    file is not sampled.
+    """
+
+    def __init__(self, level=LOG_LEVEL, json_path=LOG_JSON_PATH, rate_limit=LOG_RATE_LIMIT, batch_size=512, flush_interval=0.05):
+        self.level = LEVELS[level.upper()]
+        self.json_path = json_path
+        self.rate_limit = rate_limit
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.stats = {'lines': 0, 'suppressed': 0, 'batches': 0}
+        # Per sample key: [tokens left, time of last refill, lines suppressed since the last one shown]
+        self._buckets = {}
+        self._json = open(json_path, 'a', encoding='utf-8') if json_path else None
+        self._queue = queue.SimpleQueue()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._thread.start()
+
+    def enabled(self, level):
+        return LEVELS.get(level, 20) >= self.level
+
+    def submit(self, message, colors=None, level="INFO", prefix="[MANAGER] ", end="\n", sample=None, extra=None):
+        if not self.enabled(level):
+            return
+        record = (time.time(), message, colors, level, prefix, end, sys.stdout, sample, extra)
+        if self._closed:
+            # After close (interpreter exit): write in the caller's thread
+            self._write([record])
+            return
+        self._queue.put(record)
+
+    def flush(self, timeout=None):
+        """Block until everything submitted so far is written."""
+        if self._closed:
+            return True
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+        if self._json is not None:
+            self._json.close()
+            self._json = None
+
+    def _run(self):
+        running = True
+        while running:
+            item = self._queue.get()
+            batch, waiters = [], []
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                if item is None:
+                    running = False
+                    break
+                if isinstance(item, threading.Event):
+                    waiters.append(item)
+                    break
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                remaining = deadline - time.monotonic()
+                try:
+                    item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            self._write(batch)
+            for waiter in waiters:
+                waiter.set()
+
+    def _write(self, batch):
+        if not batch:
+            return
+        # Consecutive lines for the same stream go out in one write
+        runs, json_lines = [], []
+        for ts, message, colors, level, prefix, end, stream, sample, extra in batch:
+            if self._json is not None:
+                record = {'ts': round(ts, 6), 'level': level, 'source': ANSI_ESCAPE.sub('', prefix).strip(), 'message': ANSI_ESCAPE.sub('', message)}
+                if extra:
+                    record.update(extra)
+                json_lines.append(json.dumps(record, ensure_ascii=False) + "\n")
+            if sample is not None:
+                suppressed = self._sample(sample, ts)
+                if suppressed is None:
+                    continue
+                if suppressed:
+                    message = f"{message} (+{suppressed} similar lines suppressed)"
+            line = format_line(message, colors, level, prefix, end)
+            if runs and runs[-1][0] is stream:
+                runs[-1][1].append(line)
+            else:
+                runs.append((stream, [line]))
+        for stream, lines in runs:
+            try:
+                stream.write(''.join(lines))
+                stream.flush()
+            except (OSError, ValueError):
+                # Closed or broken stream (e.g. output piped to `head`); keep serving the others
+                pass
+            self.stats['lines'] += len(lines)
+        if json_lines:
+            self._json.write(''.join(json_lines))
+            self._json.flush()
+        self.stats['batches'] += 1
+
+    def _sample(self, key, now):
+        """None if the line is suppressed, otherwise how many lines of `key` were suppressed before it."""
+        if not self.rate_limit:
+            return 0
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [float(self.rate_limit), now, 0]
+        # Token bucket: rate_limit lines per second, bursts of up to one second's worth
+        bucket[0] = min(float(self.rate_limit), bucket[0] + (now - bucket[1]) * self.rate_limit)
+        bucket[1] = now
+        if bucket[0] < 1:
+            bucket[2] += 1
+            self.stats['suppressed'] += 1
+            return None
+        bucket[0] -= 1
+        suppressed, bucket[2] = bucket[2], 0
+        return suppressed
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+def get_log_writer():
+    """Process-wide LogWriter, started on first use and flushed at exit."""
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = LogWriter()
+    return _writer
+
+def configure_logging(level=LOG_LEVEL, json_path=LOG_JSON_PATH, rate_limit=LOG_RATE_LIMIT):
+    """Replace the process-wide LogWriter (flushing the old one), e.g. from command-line options."""
+    global _writer
+    with _writer_lock:
+        if _writer is not None:
+            _writer.close()
+        _writer = LogWriter(level=level, json_path=json_path, rate_limit=rate_limit)
+    return _writer
+
+def flush_logs(timeout=None):
+    if _writer is not None:
+        _writer.flush(timeout)
+
+def close_logs():
+    if _writer is not None:
+        _writer.close()
+
+atexit.register(close_logs)
+
+
+def read_input(prompt):
+    """input(), after the log lines queued so far are on the screen."""
+    flush_logs()
+    return input(prompt)
+
+
+def log_manager(message, colors=None, level="INFO", prefix="[MANAGER] ", end="\n", flush=True, sample=None, extra=None):
     """
     Centralized logging for manager/agent system.
     Args:
         message (str): The message to print.
         colors (Colors, optional): Colors class for formatting. If None, no color.
-        level (str): One of INFO, SUCCESS, WARNING, ERROR, BOLD.
+        level (str): One of DEBUG, INFO, SUCCESS, WARNING, ERROR, BOLD.
         prefix (str): Prefix for the log line.
         end (str): End character for print.
-        flush (bool): Whether to flush output.
+        flush (bool): Kept for compatibility; lines are written by the background
+            LogWriter within its flush interval. Use flush_logs() to wait for them.
+        sample (str, optional): Rate-limit key for repetitive lines (console only).
+        extra (dict, optional): Additional fields for the JSON-lines log.
     """
-    if colors is None:
-        color = ""
-        endc = ""
-    else:
-        # color = colors.ENDC
-        if level == "INFO":
-            color = colors.OKBLUE
-        elif level == "SUCCESS":
-            color = colors.OKGREEN
-        elif level == "WARNING":
-            color = colors.WARNING
-        elif level == "ERROR":
-            color = colors.FAIL
-        elif level == "BOLD":
-            color = colors.BOLD
-        endc = colors.ENDC
-    print(f"{prefix}{color}{message}{endc}", end=end, flush=flush)
+    get_log_writer().submit(message, colors, level, prefix, end, sample, extra)
@@ -1,82 +1,158 @@
 # agents/manager.py
 from agents.message_bus import MessageBus
-from agents.agent_service import AgentService
+from agents.agent_service import AgentService, AsyncAgentService
 from agents.orchestration_service import OrchestrationService
 from agents.manager_analytics import ManagerAnalytics
-from agents.db import init_db, get_db
-from agents.logging_utils import log_manager
-import time, re, json
+from agents import db
+from agents.db import init_db, get_db, get_writer, load_prompt
+from agents.logging_utils import log_manager, read_input
+from agents.llm_gateway import LLMGateway
+from agents.backends import async_backend
+from agents.llm_cache import LLMCache
+from agents.metrics import get_metrics
+from agents.scheduler import SubtaskScheduler, normalize_plan
+from agents.worker_pool import WorkerPool
+from agents.control import AgentControls
+from agents.planner import Planner
+from agents.prewarm import get_prewarmer, get_timeline
+from agents.config import LLM_INITIAL_CONCURRENCY, LLM_MAX_CONCURRENCY, LLM_CACHE_MEMORY_ENTRIES, LLM_CACHE_TTL, LLM_CACHE_MAX_ROWS, CONTEXT_TOKEN_BUDGET, PLAN_CANDIDATES, PLAN_MAX_ATTEMPTS, PLAN_STRUCTURED_OUTPUT, CANCEL_APPROVED_TASKS, BUS_SPILL, BUS_OVERFLOW, PREWARM_MODELS, PREWARM_TIMEOUT
+import asyncio, threading, time, re, json
 
 class Manager:
-    def __init__(self, model_name, ollama, colors, agent_colors, agent_emojis, verbose=False):
+    def __init__(self, model_name, ollama, colors, agent_colors, agent_emojis, verbose=False, run_timeout=None, async_mode=False, max_concurrency=LLM_MAX_CONCURRENCY, use_cache=False, stream=False, context_budget=CONTEXT_TOKEN_BUDGET, metrics_port=None, metrics_json=None, gateway=None, name=None, dag=False, plan_candidates=PLAN_CANDIDATES, worker_procs=0, remote_workers=0, bus_address=None, tools=None, cancel_approved=CANCEL_APPROVED_TASKS, bus_spill=BUS_SPILL, prewarm=PREWARM_MODELS):
         self.model_name = model_name
         self.ollama = ollama
         self.colors = colors
         self.agent_colors = agent_colors
         self.agent_emojis = agent_emojis
-        self.bus = MessageBus()
+        # Read messages are pruned from memory; with bus_spill the whole history goes to bus_messages.
+        # Agents on the event loop cannot block in send without stalling the manager, so --async only drops chunks
+        self.bus = MessageBus(spill=bus_spill, overflow='drop' if async_mode else BUS_OVERFLOW)
         self.agents = []
         self.agent_names = []
         self.progress = {}
         self.completed = set()
+        self.orchestration = None
         self.verbose = verbose
+        self.run_timeout = run_timeout
+        self.async_mode = async_mode
+        self.max_concurrency = max_concurrency
+        self.stream = stream
+        self.context_budget = context_budget
+        # Batch mode (agents/batch.py) runs several managers on one shared gateway; `name`
+        # keeps their client ids apart for fair queueing and token accounting
+        self.client_prefix = f"{name}/" if name else ""
+        if gateway is not None:
+            self.cache = gateway.cache
+            self.gateway = gateway
+        else:
+            # One cache shared by the sync and async gateways, so planning and agent calls hit the same entries
+            self.cache = LLMCache(LLM_CACHE_MEMORY_ENTRIES, LLM_CACHE_TTL, LLM_CACHE_MAX_ROWS) if use_cache else None
+            self.gateway = self._make_gateway(ollama)
+        self.token_usage = None
+        # Plan subtasks with dependencies and let idle agents pull ready ones (agents/scheduler.py)
+        self.dag = dag
+        self.scheduler = None
+        # Agent positions when continuing a run (resume_run)
+        self.resume = {}
+        # Planning (agents/planner.py): schema-constrained output, optionally racing several candidate plans
+        self.plan_candidates = plan_candidates
+        self.plan_structured = PLAN_STRUCTURED_OUTPUT
+        self.plan_stats = None
+        # Agents in worker processes (agents/worker_pool.py): local ones spawned here, remote ones connecting to bus_address
+        self.worker_procs = worker_procs
+        self.remote_workers = remote_workers
+        self.bus_address = bus_address
+        self.worker_pool = None
+        if (worker_procs or remote_workers) and dag:
+            raise ValueError("--dag shares one in-process SubtaskScheduler between agents; it cannot be combined with worker processes")
+        # ToolExecutor (agents/tools.py) for the agents' tool calls, shared by all of them; None: no tools
+        self.tools = tools
+        # Per-agent advance / stop / pause commands (agents/control.py); with cancel_approved, approving
+        # a task tells its agent to move on instead of spending its remaining iterations on it
+        self.cancel_approved = cancel_approved
+        self.controls = AgentControls()
+        self.stop_event = threading.Event()
+        # Load the model on the LLM server in the background while the task is typed, and make
+        # sure it is loaded before agents start, so the first calls do not pay the cold load (agents/prewarm.py)
+        self.prewarm = prewarm
+        # Span histograms (agents/metrics.py): optional Prometheus endpoint, JSON dump at the end of a run
+        self.metrics_json = metrics_json
+        if metrics_port is not None:
+            get_metrics().serve(metrics_port)
+            log_manager(f"Metrics at http://127.0.0.1:{metrics_port}/metrics", colors=self.colors, level="INFO")
 
-    def estimate_agents(self, main_task):
-        """Use Ollama to estimate a list of subtasks/agents for the main task."""
-        base_prompt = (
-            "You are an expert project planner. Given a user task, break it down into 2-6 clear, actionable subtasks. "
-            "Return only a JSON list of strings, each string being a subtask. Do not include any explanation, markdown, or extra text. "
-            "Output ONLY a valid JSON array, e.g. [\"Subtask 1\", \"Subtask 2\"]"
-        )
-        for attempt in range(3):
-            prompt = base_prompt
-            if attempt > 0:
-                prompt += "\n\nPrevious output was not valid JSON. Please output ONLY a valid JSON array, no extra text."
-            messages = [
-                {"role": "system", "content": prompt},
-                {"role": "user", "content": main_task}
-            ]
-            try:
-                response = self.ollama.chat(model=self.model_name, messages=messages)
-            except Exception as e:
-                if 'hourly usage limit' in str(e) or 'status code: 402' in str(e):
-                    log_manager("Error Ollama: you've reached your hourly usage limit, please upgrade to continue", colors=self.colors, level="ERROR")
-                    exit(1)
-                else:
-                    raise
-            # Support both dict and object response, fallback to str if needed
-            if hasattr(response, 'message'):
-                content = response.message
-            elif isinstance(response, dict) and 'message' in response:
-                content = response['message']
+    def estimate_agents(self, main_task, dependencies=False):
+        """
+        Use Ollama to estimate a list of subtasks/agents for the main task.
+        With `dependencies`, returns a dependency graph instead: a list of
+        {'id', 'task', 'depends_on'} dicts (see agents/scheduler.py).
+        """
+        if dependencies:
+            base_prompt = (
+                "You are an expert project planner. Given a user task, break it down into 2-6 clear, actionable subtasks. "
+                "Return only a JSON array of objects, one per subtask, each with a \"task\" string and a \"depends_on\" list of the "
+                "0-based indices of earlier subtasks whose results it needs (empty if none). Subtasks without dependencies run in parallel, "
+                "so only add the dependencies that are really needed. Do not include any explanation, markdown, or extra text. "
+                "Output ONLY a valid JSON array, e.g. [{\"task\": \"Subtask 1\", \"depends_on\": []}, {\"task\": \"Subtask 2\", \"depends_on\": [0]}]"
+            )
+        else:
+            base_prompt = (
+                "You are an expert project planner. Given a user task, break it down into 2-6 clear, actionable subtasks. "
+                "Return only a JSON list of strings, each string being a subtask. Do not include any explanation, markdown, or extra text. "
+                "Output ONLY a valid JSON array, e.g. [\"Subtask 1\", \"Subtask 2\"]"
+            )
+        planner = Planner(self.gateway, self.model_name, client_id=f"{self.client_prefix}manager", candidates=self.plan_candidates,
+                          max_attempts=PLAN_MAX_ATTEMPTS, structured=self.plan_structured)
+        try:
+            agent_list, content, stats = planner.plan(base_prompt, main_task, dependencies)
+        except Exception as e:
+            if 'hourly usage limit' in str(e) or 'status code: 402' in str(e):
+                log_manager("Error Ollama: you've reached your hourly usage limit, please upgrade to continue", colors=self.colors, level="ERROR")
+                exit(1)
             else:
-                content = str(response)
-            # Ensure content is a string (handle pydantic Message or other objects)
-            if not isinstance(content, str):
-                content = str(getattr(content, 'content', content))
-            try:
-                agent_list = json.loads(content)
-                if isinstance(agent_list, list) and all(isinstance(x, str) for x in agent_list):
-                    return agent_list
-            except Exception as e:
-                log_manager(f"Attempt {attempt+1}: Could not parse JSON from LLM response. Error: {e}", colors=self.colors, level="WARNING")
-            # Fallback: try to extract from numbered/bulleted list
-            lines = content.splitlines()
-            extracted = []
-            for line in lines:
-                m = re.match(r'\s*(?:\d+\.|[-*])\s+(.*)', line)
-                if m:
-                    item = m.group(1).strip().strip('"').strip("'")
-                    if item:
-                        extracted.append(item)
-            # Final fallback: split into sentences if possible
-            sentences = re.split(r'(?<=[.!?])\s+', content.strip())
-            sentences = [s.strip() for s in sentences if len(s.strip()) > 10]
-            if len(sentences) > 1:
-                log_manager(f"LLM did not return a list, but split into {len(sentences)} subtasks using sentences. Raw response was:\n{content}", colors=self.colors, level="WARNING")
-                return sentences
-        log_manager(f"Could not parse agent list from LLM after 3 attempts and all fallbacks.\nRaw LLM response was:\n{content}", colors=self.colors, level="ERROR")
-        return [main_task]
+                raise
+        self.plan_stats = stats
+        if agent_list is not None:
+            stats['fallback'] = None
+            return self._plan(agent_list, dependencies)
+        log_manager(f"Could not parse a JSON plan from the LLM after {stats['attempts']} attempts.", colors=self.colors, level="WARNING")
+        # Fallback: try to extract from numbered/bulleted list
+        extracted = []
+        for line in content.splitlines():
+            m = re.match(r'\s*(?:\d+\.|[-*])\s+(.*)', line)
+            if m:
+                item = m.group(1).strip().strip('"').strip("'")
+                if item:
+                    extracted.append(item)
+        if len(extracted) > 1:
+            stats['fallback'] = 'list'
+            log_manager(f"Using the {len(extracted)} list items of the response as subtasks. Raw response was:\n{content}", colors=self.colors, level="WARNING")
+            return self._plan(extracted, dependencies)
+        # Final fallback: split into sentences if possible
+        sentences = re.split(r'(?<=[.!?])\s+', content.strip())
+        sentences = [s.strip() for s in sentences if len(s.strip()) > 10]
+        if len(sentences) > 1:
+            stats['fallback'] = 'sentences'
+            log_manager(f"LLM did not return a list, but split into {len(sentences)} subtasks using sentences. Raw response was:\n{content}", colors=self.colors, level="WARNING")
+            return self._plan(sentences, dependencies)
+        stats['fallback'] = 'task'
+        log_manager(f"Could not parse agent list from LLM after {stats['attempts']} attempts and all fallbacks.\nRaw LLM response was:\n{content}", colors=self.colors, level="ERROR")
+        return self._plan([main_task], dependencies)
+
+    @staticmethod
+    def _plan(agent_list, dependencies):
+        # Subtask strings, or the dependency graph when asked for one
+        if dependencies:
+            return normalize_plan(agent_list)
+        return [x['task'] if isinstance(x, dict) else x for x in agent_list]
+
+    @staticmethod
+    def _describe(subtask):
+        if isinstance(subtask, dict):
+            after = f" (after {', '.join(str(dep + 1) for dep in subtask['depends_on'])})" if subtask['depends_on'] else ""
+            return f"{subtask['task']}{after}"
+        return subtask
 
 
     def assign_tasks(self, agent_list):
@@ -94,24 +170,30 @@ class Manager:
         log_manager(f"  1. {example1}")
         log_manager(f"  2. {example2}")
         log_manager("  3. Enter your own task")
-        choice = input(f"{self.colors.OKBLUE}Select 1, 2, or type your own task:{self.colors.ENDC} ")
+        get_timeline().mark('prompt')
+        # Started last, so importing the client in the background does not hold up the prompt
+        self._start_prewarm()
+        choice = read_input(f"{self.colors.OKBLUE}Select 1, 2, or type your own task:{self.colors.ENDC} ")
         if choice.strip() == '1':
             main_task = example1
         elif choice.strip() == '2':
             main_task = example2
         elif choice.strip() == '3' or not choice.strip():
-            main_task = input(f"{self.colors.OKBLUE}Enter your custom task:{self.colors.ENDC} ")
+            main_task = read_input(f"{self.colors.OKBLUE}Enter your custom task:{self.colors.ENDC} ")
         else:
             main_task = choice.strip()
+        get_timeline().mark('task_entered')
         log_manager("Manager is analyzing the main task and creating minimal subtasks...", colors=self.colors, level="INFO")
-        agent_list = self.estimate_agents(main_task)
+        with get_metrics().span('plan'):
+            agent_list = self.estimate_agents(main_task, dependencies=self.dag)
+        get_timeline().mark('plan')
         log_manager(f"Manager created {len(agent_list)} minimal subtasks:", colors=self.colors, level="SUCCESS")
         for i, subtask in enumerate(agent_list):
-            log_manager(f"  {i+1}. {subtask}")
+            log_manager(f"  {i+1}. {self._describe(subtask)}")
 
         # Prompt for number of agents (default 1)
         while True:
-            num_agents = input(f"{self.colors.OKBLUE}How many agents do you want to use? (1-infinite, default 1): {self.colors.ENDC}")
+            num_agents = read_input(f"{self.colors.OKBLUE}How many agents do you want to use? (1-infinite, default 1): {self.colors.ENDC}")
             if not num_agents.strip():
                 num_agents = 1
                 break
@@ -120,23 +202,18 @@ class Manager:
                 if num_agents >= 1:
                     break
             except ValueError:
-                print(f"{self.colors.WARNING}Please enter a valid integer greater than or equal to 1.{self.colors.ENDC}")
+                log_manager("Please enter a valid integer greater than or equal to 1.", colors=self.colors, level="WARNING")
 
         # Assign subtasks to agents
-        if num_agents == 1:
-            agent_names = ["agent_1"]
-            agent_subtasks = [agent_list]
-        else:
-            agent_names = [f"agent_{i+1}" for i in range(num_agents)]
-            agent_subtasks = [[] for _ in range(num_agents)]
-            for idx, subtask in enumerate(agent_list):
-                agent_subtasks[idx % num_agents].append(subtask)
+        agent_names, agent_subtasks = self._split_subtasks(agent_list, num_agents)
 
         log_manager("\nAgent Assignments:", colors=self.colors, level="BOLD")
         for idx, name in enumerate(agent_names):
             emoji = self.agent_emojis[idx % len(self.agent_emojis)]
             # Show all subtasks for each agent
-            if num_agents == 1:
+            if self.dag:
+                log_manager(f"  {emoji} {name}: pulls the next ready subtask when idle")
+            elif num_agents == 1:
                 for j, subtask in enumerate(agent_list):
                     log_manager(f"  {emoji} {name}: {subtask}")
             else:
@@ -145,7 +222,7 @@ class Manager:
 
         # Prompt for number of iterations (default 1)
         while True:
-            num_iterations = input(f"{self.colors.OKBLUE}How many iterations per agent? (1-infinite, default 1): {self.colors.ENDC}")
+            num_iterations = read_input(f"{self.colors.OKBLUE}How many iterations per agent? (1-infinite, default 1): {self.colors.ENDC}")
             if not num_iterations.strip():
                 num_iterations = 1
                 break
@@ -157,89 +234,432 @@ class Manager:
                 pass
             log_manager("Please enter a valid integer >= 1 or leave blank for 1.", colors=self.colors, level="WARNING")
 
+        self.run_task(main_task, num_agents, num_iterations, agent_list=agent_list, interactive=True)
+
+    def run_task(self, main_task, num_agents=1, num_iterations=1, agent_list=None, interactive=False):
+        """
+        Run one task end to end without prompting: plan subtasks (unless
+        `agent_list` is given), run the agents, save the run summary.
+        With `interactive`, ask for feedback at the end like `orchestrate`.
+        Returns the run id.
+        """
+        init_db()
+        if agent_list is None:
+            self._start_prewarm()
+            with get_metrics().span('plan'):
+                agent_list = self.estimate_agents(main_task, dependencies=self.dag)
+            get_timeline().mark('plan')
         self.num_agents = num_agents
         self.num_iterations = num_iterations
-
-        # Assign subtasks to agents
-        if self.num_agents == 1:
-            agent_names = ["agent_1"]
-            agent_subtasks = [agent_list]
+        if self.dag:
+            # Agents start empty and pull subtasks; assigned_subtask is filled in as they do
+            agent_list = normalize_plan(agent_list)
+            self.scheduler = SubtaskScheduler(agent_list, self.stop_event)
+            agent_names, agent_subtasks = [f"agent_{i+1}" for i in range(num_agents)], [[] for _ in range(num_agents)]
         else:
-            agent_names = [f"agent_{i+1}" for i in range(self.num_agents)]
-            agent_subtasks = [[] for _ in range(self.num_agents)]
-            for idx, subtask in enumerate(agent_list):
-                agent_subtasks[idx % self.num_agents].append(subtask)
+            agent_names, agent_subtasks = self._split_subtasks(agent_list, num_agents)
 
-        # Save run and agent assignments to DB
+        # Save run and agent assignments to DB; agents.config has what resume_run needs to continue
+        config = json.dumps({'max_iterations': num_iterations, 'dag': self.dag})
         with get_db() as conn:
             c = conn.cursor()
-            c.execute("INSERT INTO runs (task, manager_subtasks) VALUES (?, ?)", (main_task, json.dumps(agent_list)))
+            c.execute("INSERT INTO runs (task, manager_subtasks, model_name) VALUES (?, ?, ?)", (main_task, json.dumps(agent_list), self.model_name))
             run_id = c.lastrowid
             agent_ids = {}
             for idx, agent_name in enumerate(agent_names):
-                c.execute("INSERT INTO agents (run_id, agent_name, assigned_subtask) VALUES (?, ?, ?)", (run_id, agent_name, json.dumps(agent_subtasks[idx])))
+                c.execute("INSERT INTO agents (run_id, agent_name, assigned_subtask, status, config, task_index) VALUES (?, ?, ?, 'pending', ?, 0)",
+                          (run_id, agent_name, json.dumps(agent_subtasks[idx]), config))
                 agent_ids[agent_name] = c.lastrowid
             conn.commit()
-        # Use AgentService for agent creation
-        agent_service = AgentService(
+        # Store for later DB updates
+        self._db_run_id = run_id
+        self._db_agent_ids = agent_ids
+        return self._execute(agent_subtasks, agent_list, interactive)
+
+    def resume_run(self, run_id, interactive=False):
+        """
+        Continue an interrupted run from babyagi.db instead of starting over.
+
+        Each agent's position comes from the DB: `agents.task_index` counts
+        its finished tasks, and its last saved iteration of the next task
+        gives the iteration to continue from, the conversation so far and
+        `prev_result`. Completed agents are not restarted. In --dag runs,
+        finished subtasks keep their results, a subtask an agent was part
+        way through goes back to that agent, and the rest are scheduled as
+        usual. Returns the run id.
+        """
+        init_db()
+        with get_db() as conn:
+            row = conn.execute("SELECT task, manager_subtasks FROM runs WHERE id=?", (run_id,)).fetchone()
+            if row is None:
+                raise ValueError(f"No run {run_id} in {db.DB_PATH}")
+            main_task, plan = row[0], json.loads(row[1] or '[]')
+            agents = conn.execute("SELECT id, agent_name, assigned_subtask, status, config, task_index FROM agents WHERE run_id=? ORDER BY id", (run_id,)).fetchall()
+            if not agents or agents[0][4] is None:
+                raise ValueError(f"Run {run_id} was not saved with resume information (it predates --resume)")
+            config = json.loads(agents[0][4])
+            self.dag = config.get('dag', False)
+            self.num_iterations = config['max_iterations']
+            self.num_agents = len(agents)
+            agent_subtasks, resume, done_results, claimed = [], {}, {}, {}
+            if self.dag:
+                plan = normalize_plan(plan)
+            for agent_id, name, assigned, status, _, task_index in agents:
+                tasks = json.loads(assigned or '[]')
+                task_index = task_index or 0
+                agent_subtasks.append(tasks)
+                if self.dag:
+                    # Subtasks this agent finished or was working on, matched back to the plan by text
+                    for idx in range(len(tasks)):
+                        subtask_id = next((s['id'] for s in plan if s['task'] == tasks[idx] and s['id'] not in done_results and s['id'] not in claimed), None)
+                        if subtask_id is None:
+                            continue
+                        if idx < task_index:
+                            done_results[subtask_id] = self._last_response(conn, agent_id, idx)
+                        else:
+                            claimed[subtask_id] = name
+                            resume[name] = dict(self._resume_point(conn, agent_id, idx), subtask_id=subtask_id)
+                    resume.setdefault(name, {'task_index': len(tasks)})
+                elif status == 'completed' or task_index >= len(tasks):
+                    resume[name] = {'done': True, 'prev_result': self._last_response(conn, agent_id, len(tasks) - 1)}
+                else:
+                    resume[name] = self._resume_point(conn, agent_id, task_index)
+        self._db_run_id = run_id
+        self._db_agent_ids = {name: agent_id for agent_id, name, *_ in agents}
+        self.resume = resume
+        if self.dag:
+            self.scheduler = SubtaskScheduler(plan, self.stop_event, results=done_results, claimed=claimed)
+        finished = [name for name, point in resume.items() if point.get('done')]
+        log_manager(f"Resuming run {run_id}: {main_task}", colors=self.colors, level="BOLD")
+        if finished:
+            log_manager(f"Already complete: {', '.join(finished)}", colors=self.colors, level="INFO")
+        if self.dag and done_results:
+            log_manager(f"Subtasks already done: {len(done_results)}/{len(plan)}", colors=self.colors, level="INFO")
+        if len(finished) == len(agents):
+            log_manager(f"Run {run_id} has no unfinished agents.", colors=self.colors, level="SUCCESS")
+            return run_id
+        return self._execute(agent_subtasks, plan, interactive)
+
+    @staticmethod
+    def _resume_point(conn, agent_id, task_index):
+        # The agent's last saved iteration of its current task (manager review rows have no prompt)
+        row = conn.execute(
+            "SELECT iteration, prompt_ids, response FROM agent_iterations WHERE agent_id=? AND task_index=? AND prompt_ids IS NOT NULL ORDER BY iteration DESC, id DESC LIMIT 1",
+            (agent_id, task_index)).fetchone()
+        if row is None:
+            return {'task_index': task_index}
+        return {'task_index': task_index, 'iteration': row[0] + 1, 'messages': load_prompt(conn, row[1]), 'prev_result': row[2]}
+
+    @staticmethod
+    def _last_response(conn, agent_id, task_index):
+        row = conn.execute(
+            "SELECT response FROM agent_iterations WHERE agent_id=? AND task_index=? AND prompt_ids IS NOT NULL ORDER BY iteration DESC, id DESC LIMIT 1",
+            (agent_id, task_index)).fetchone()
+        return row[0] if row else None
+
+    def _execute(self, agent_subtasks, agent_list, interactive):
+        # Run the agents of the run in self._db_run_id and save its summary
+        start_time = time.time()
+        token_count = 0
+        token_count_box = [token_count]  # mutable box for token_count
+        # Spilled bus rows carry the run id; agents count as readers before they start, so no broadcast is pruned before they see it
+        self.bus.run_id = self._db_run_id
+        self.bus.register("manager")
+        for idx in range(len(agent_subtasks)):
+            if not self.resume.get(f"agent_{idx+1}", {}).get('done'):
+                self.bus.register(f"agent_{idx+1}")
+        self._wait_prewarm()
+        get_timeline().mark('agents_started')
+        if self.async_mode:
+            try:
+                asyncio.run(self._run_agents_async(agent_subtasks, agent_list, token_count_box))
+            except KeyboardInterrupt:
+                log_manager("Interrupted, agent tasks cancelled.", colors=self.colors, level="WARNING")
+        elif self.worker_procs or self.remote_workers:
+            self._run_agents_on_workers(agent_subtasks, token_count_box)
+        else:
+            self._run_agents(agent_subtasks, agent_list, token_count_box)
+        stats = self.worker_stats if self.worker_pool is not None else self.agent_gateway.stats()
+        log_manager(f"LLM gateway: {stats['calls']} calls, {stats['retries']} retries, concurrency limit {stats['limit']}, queue wait p50 {stats['queue_wait_p50']:.3f}s / p95 {stats['queue_wait_p95']:.3f}s / max {stats['queue_wait_max']:.3f}s", colors=self.colors, level="INFO")
+        token_usage = self.token_usage = self._token_usage()
+        token_count_box[0] = token_usage['total_tokens']
+        tps = f", {token_usage['tokens_per_second']:.1f} tokens/s" if token_usage['tokens_per_second'] else ""
+        log_manager(f"LLM tokens: {token_usage['prompt_tokens']} prompt + {token_usage['completion_tokens']} completion over {token_usage['calls']} calls{tps}", colors=self.colors, level="INFO")
+        llm_stats = {'gateway': stats}
+        if hasattr(self.ollama, 'stats'):
+            # Several LLM hosts behind a BackendRouter
+            llm_stats['backends'] = hosts = self.ollama.stats()
+            for host in hosts:
+                ejected = ", out of rotation" if host['ejected'] else ""
+                log_manager(f"LLM host {host['host']}: {host['requests']} requests, {host['errors']} errors, ejected {host['ejections']} times{ejected}", colors=self.colors, level="INFO")
+        if self.plan_stats is not None:
+            llm_stats['plan'] = plan = self.plan_stats
+            first_token = f", first token {plan['first_token']:.3f}s" if plan['first_token'] is not None else ""
+            log_manager(f"Planning: {plan['latency']:.3f}s{first_token}, {plan['attempts']} attempt(s), {plan['requests']} request(s), {plan['cancelled']} cancelled", colors=self.colors, level="INFO")
+        if self.orchestration is not None:
+            llm_stats['manager'] = reaction = self.orchestration.reaction_stats()
+            log_manager(f"Manager reaction latency over {reaction['reviews']} reviews: p50 {reaction['reaction_p50']:.3f}s / p95 {reaction['reaction_p95']:.3f}s / max {reaction['reaction_max']:.3f}s", colors=self.colors, level="INFO")
+        llm_stats['bus'] = bus = self.bus.stats()
+        log_manager(f"Message bus: {bus['sent']} messages, {bus['pruned']} read and pruned, {bus['retained']} held in memory, {bus['dropped']} chunks dropped at the high-water mark, {bus['blocked']} sends blocked", colors=self.colors, level="INFO")
+        llm_stats['control'] = control = self.controls.stats()
+        if any(control.values()):
+            log_manager(f"Agent control: {control['tasks_advanced']} approved task(s) left early, up to {control['iterations_skipped'] + control['tool_rounds_skipped']} LLM calls saved ({control['iterations_skipped']} iterations, {control['tool_rounds_skipped']} tool rounds), {control['streams_aborted']} streamed responses aborted, {control['pauses']} pauses", colors=self.colors, level="INFO")
+        if self.tools is not None and self.worker_pool is None:
+            llm_stats['tools'] = tool_stats = self.tools.stats()
+            log_manager(f"Tools: {tool_stats['calls']} calls, {tool_stats['errors']} errors ({tool_stats['timeouts']} timed out, {tool_stats['crashes']} crashed), {tool_stats['truncated']} truncated, duration p50 {tool_stats['duration_p50']:.3f}s / p95 {tool_stats['duration_p95']:.3f}s / max {tool_stats['duration_max']:.3f}s", colors=self.colors, level="INFO")
+        llm_stats['spans'] = self._report_spans()
+        timeline = get_timeline()
+        if not timeline.reported:
+            # Once per process: later runs (batch mode) start warm
+            llm_stats['startup'] = timeline.report(get_prewarmer(), colors=self.colors)
+        if self.cache is not None:
+            llm_stats['cache'] = cache_stats = self.cache.stats()
+            log_manager(f"LLM cache: {cache_stats['lookups']} lookups, hit rate {cache_stats['hit_rate']:.0%} ({cache_stats.get('memory_hits', 0)} memory, {cache_stats.get('disk_hits', 0)} disk, {cache_stats.get('shared', 0)} shared)", colors=self.colors, level="INFO")
+
+        # Make sure every queued iteration row is committed before summarizing
+        get_writer().flush()
+        agent_names, progress, run_token_usage = self.agent_names, self.progress, token_usage
+        if self.resume:
+            # The summary covers the whole run: agents finished before the restart keep their last result,
+            # and token totals are summed from the DB since this process only saw part of the run
+            llm_stats['resumed'] = True
+            agent_names = list(self._db_agent_ids)
+            progress = {name: point.get('prev_result') for name, point in self.resume.items() if point.get('done')}
+            progress.update(self.progress)
+            run_token_usage = None
+            with get_db() as conn:
+                token_count_box[0] = conn.execute("SELECT COALESCE(SUM(i.tokens_used), 0) FROM agent_iterations i JOIN agents a ON i.agent_id = a.id WHERE a.run_id=?", (self._db_run_id,)).fetchone()[0]
+        # Summarize and log run using ManagerAnalytics
+        analytics = ManagerAnalytics(get_db, self.colors)
+        analytics.save_run_summary(
+            run_id=self._db_run_id,
+            agent_names=agent_names,
+            progress=progress,
+            start_time=start_time,
+            token_count=token_count_box[0],
+            llm_stats=llm_stats,
+            token_usage=run_token_usage,
+            interactive=interactive
+        )
+        return self._db_run_id
+
+    @staticmethod
+    def _split_subtasks(agent_list, num_agents):
+        # Round-robin the subtasks over the agents
+        agent_list = [Manager._describe(subtask) for subtask in agent_list]
+        if num_agents == 1:
+            return ["agent_1"], [agent_list]
+        agent_names = [f"agent_{i+1}" for i in range(num_agents)]
+        agent_subtasks = [[] for _ in range(num_agents)]
+        for idx, subtask in enumerate(agent_list):
+            agent_subtasks[idx % num_agents].append(subtask)
+        return agent_names, agent_subtasks
+
+
+    def _run_agents(self, agent_subtasks, agent_list, token_count_box):
+        # One OS thread per agent
+        self.agent_gateway = self.gateway
+        self.controls = AgentControls()
+        agent_service = self._agent_service(AgentService, self.ollama, self.agent_gateway)
+        self.agent_names, self.agents = agent_service.create_agents(agent_subtasks)
+        self._agents_started(agent_subtasks)
+        self.orchestration = self._orchestration_service()
+        try:
+            self.orchestration.run_orchestration(**self._orchestration_args(token_count_box))
+        except KeyboardInterrupt:
+            log_manager("Interrupted, waiting for agents to finish their current iteration...", colors=self.colors, level="WARNING")
+            self.shutdown()
+        if len(self.completed) < len(self.agent_names):
+            # Timed out or interrupted: stop the remaining agents cleanly
+            self.shutdown()
+        elif self.cancel_approved:
+            # Every task approved: the agents are leaving their last one, so wait and count their last calls too
+            for t in self.agents:
+                t.join()
+
+    def _run_agents_on_workers(self, agent_subtasks, token_count_box):
+        # Agents in worker processes; they reach self.bus through the pool's broker
+        if self.worker_pool is None:
+            self.worker_pool = WorkerPool(self.bus, procs=self.worker_procs, remote=self.remote_workers, address=self.bus_address, colors=self.colors).start()
+        self.agent_gateway = self.gateway
+        self.controls = self.worker_pool.controls
+        config = {
+            'model_name': self.model_name,
+            'verbose': self.verbose,
+            'num_iterations': self.num_iterations,
+            'stream': self.stream,
+            'context_budget': self.context_budget,
+            'client_prefix': self.client_prefix,
+            'async_mode': self.async_mode,
+            'max_concurrency': self.max_concurrency,
+            # Workers build the same backend, unless started with their own --llm-host
+            'backend': getattr(self.ollama, 'spec', None),
+            # Each worker runs the tool calls of its agents in a pool of its own
+            'tools': self.tools.spec if self.tools is not None else None,
+        }
+        self.agent_names, self.agents = self.worker_pool.start_run(self._db_run_id, config, agent_subtasks, self._db_agent_ids, self.resume)
+        self._agents_started(agent_subtasks)
+        self.orchestration = self._orchestration_service()
+        try:
+            self.orchestration.run_orchestration(**self._orchestration_args(token_count_box))
+        except KeyboardInterrupt:
+            log_manager("Interrupted, waiting for agents to finish their current iteration...", colors=self.colors, level="WARNING")
+            self.shutdown()
+        if len(self.completed) < len(self.agent_names):
+            self.shutdown()
+        self.worker_stats = self.worker_pool.finish_run()
+
+    async def _run_agents_async(self, agent_subtasks, agent_list, token_count_box):
+        # All agents as tasks on this event loop, sharing one async backend
+        client = async_backend(self.ollama)
+        self.agent_gateway = self._make_gateway(client)
+        self.controls = AgentControls()
+        agent_service = self._agent_service(AsyncAgentService, client, self.agent_gateway)
+        self.agent_names, self.agents = agent_service.create_agents(agent_subtasks)
+        self._agents_started(agent_subtasks)
+        self.orchestration = self._orchestration_service()
+        await self.orchestration.run_orchestration_async(**self._orchestration_args(token_count_box))
+        if len(self.completed) < len(self.agent_names):
+            self.request_stop()
+            await asyncio.gather(*self.agents, return_exceptions=True)
+        elif self.cancel_approved:
+            await asyncio.gather(*self.agents, return_exceptions=True)
+
+    def _report_spans(self):
+        # Where the time went, per phase; also saved with the run and optionally dumped to a file
+        spans = get_metrics().snapshot()
+        log_manager("Time per phase (count, p50 / p95 / max):", colors=self.colors, level="INFO")
+        for name, span in spans.items():
+            log_manager(f"  {name:<15} {span['count']:>6}  {span['p50']:.4f}s / {span['p95']:.4f}s / {span['max']:.4f}s", colors=self.colors, level="INFO")
+        if self.metrics_json:
+            get_metrics().dump(self.metrics_json)
+            log_manager(f"Metrics written to {self.metrics_json}", colors=self.colors, level="INFO")
+        return spans
+
+    def _token_usage(self):
+        # Planning calls go through self.gateway; in --async mode agents use a second gateway
+        others = [self.gateway.tokens] if self.agent_gateway is not self.gateway else []
+        if self.worker_pool is not None:
+            return self.worker_pool.tokens.totals(self.gateway.tokens, prefix=self.client_prefix)
+        return self.agent_gateway.tokens.totals(*others, prefix=self.client_prefix)
+
+    def _models(self):
+        # Every model this run calls: the planner and the agents all use model_name
+        return [self.model_name]
+
+    def _prewarm_backend(self):
+        # An in-process MLX model loaded here would be of no use to agents in worker processes
+        if not self.prewarm or (getattr(self.ollama, 'kind', None) == 'mlx' and (self.worker_procs or self.remote_workers)):
+            return None
+        return self.ollama
+
+    def _start_prewarm(self):
+        backend = self._prewarm_backend()
+        if backend is not None:
+            get_prewarmer().start(backend, self._models())
+
+    def _wait_prewarm(self):
+        # Each distinct model is loaded before agents start; a load still running after PREWARM_TIMEOUT is left to the first calls
+        backend = self._prewarm_backend()
+        if backend is not None and not get_prewarmer().wait(backend, self._models(), PREWARM_TIMEOUT):
+            log_manager(f"Models still loading after {PREWARM_TIMEOUT:.0f}s; starting agents anyway", colors=self.colors, level="WARNING")
+
+    def _make_gateway(self, backend):
+        return LLMGateway(backend, cache=self.cache, initial_limit=min(LLM_INITIAL_CONCURRENCY, self.max_concurrency), max_limit=self.max_concurrency)
+
+    def _agent_service(self, service_class, ollama, gateway):
+        return service_class(
             agent_colors=self.agent_colors,
             agent_emojis=self.agent_emojis,
             model_name=self.model_name,
-            ollama=self.ollama,
+            ollama=ollama,
             colors=self.colors,
             bus=self.bus,
             verbose=self.verbose,
-            num_iterations=self.num_iterations
+            num_iterations=self.num_iterations,
+            stop_event=self.stop_event,
+            gateway=gateway,
+            db_agent_ids=self._db_agent_ids,
+            stream=self.stream,
+            context_budget=self.context_budget,
+            client_prefix=self.client_prefix,
+            scheduler=self.scheduler,
+            resume=self.resume,
+            tools=self.tools,
+            controls=self.controls
         )
-        self.agent_names, self.agents = agent_service.create_agents(agent_subtasks)
+
+    def _agents_started(self, agent_subtasks):
         self.progress = {name: None for name in self.agent_names}
         self.completed = set()
-        start_time = time.time()
-        token_count = 0
-        # Store for later DB updates
-        self._db_run_id = run_id
-        self._db_agent_ids = agent_ids
         # Show agent assignments
         log_manager("\nAgent Assignments:", colors=self.colors, level="BOLD")
+        subtasks = {f"agent_{idx+1}": tasks for idx, tasks in enumerate(agent_subtasks)}
         for idx, name in enumerate(self.agent_names):
             emoji = self.agent_emojis[idx % len(self.agent_emojis)]
-            log_manager(f"  {emoji} {name}: {agent_list[idx]}")
+            log_manager(f"  {emoji} {name}: {subtasks[name] or 'pulls ready subtasks'}")
 
+    def _orchestration_service(self):
         # Use OrchestrationService for main review/approval loop
-        orchestration_service = OrchestrationService(
+        return OrchestrationService(
             bus=self.bus,
             agent_names=self.agent_names,
             db_run_id=self._db_run_id,
             db_agent_ids=self._db_agent_ids,
             colors=self.colors,
-            agent_emojis=self.agent_emojis
+            agent_emojis=self.agent_emojis,
+            agent_threads=self.agents,
+            token_ledger=self.worker_pool.tokens if self.worker_pool is not None else self.agent_gateway.tokens,
+            scheduler=self.scheduler,
+            start_positions={name: (point.get('task_index', 0), point.get('iteration', 0)) for name, point in self.resume.items()},
+            controls=self.controls if self.cancel_approved else None
         )
-        token_count_box = [token_count]  # mutable box for token_count
-        agent_task_progress, agent_task_summaries = orchestration_service.run_orchestration(
+
+    def _orchestration_args(self, token_count_box):
+        return dict(
             num_iterations=self.num_iterations,
             get_agent_tasks=self._get_agent_tasks,
             progress=self.progress,
             completed=self.completed,
             _get_db=get_db,
-            token_count=token_count_box
+            token_count=token_count_box,
+            timeout=self.run_timeout,
+            stop_event=self.stop_event
         )
 
-        # Summarize and log run using ManagerAnalytics
-        analytics = ManagerAnalytics(get_db, self.colors)
-        analytics.save_run_summary(
-            run_id=self._db_run_id,
-            agent_names=self.agent_names,
-            progress=self.progress,
-            start_time=start_time,
-            token_count=token_count_box[0]
-        )
+    def request_stop(self):
+        """Ask all agents to stop after their current iteration, waking any that are waiting."""
+        self.stop_event.set()
+        self.bus.wake()
+        # Also aborts responses being streamed and releases paused agents
+        self.controls.stop()
+        if self.worker_pool is not None:
+            self.worker_pool.stop()
+        if self.scheduler is not None:
+            self.scheduler.wake()
+
+    def pause_agents(self, name=None):
+        """Hold an agent (None: every agent) before its next LLM call until `resume_agents`."""
+        self.controls.pause(name)
+
+    def resume_agents(self, name=None):
+        self.controls.resume(name)
+
+    def stop_agent(self, name):
+        """Stop one agent after its current LLM call; a response it is streaming is aborted."""
+        self.controls.stop(name)
 
+    def shutdown(self):
+        """Ask all agents to stop after their current iteration and wait for them."""
+        self.request_stop()
+        for t in self.agents:
+            t.join()
 
     def _get_agent_tasks(self, name):
-        # Helper to get the list of tasks assigned to an agent from the DB
+        # Helper to get the list of tasks assigned to this run's agent from the DB (agent names repeat across runs)
         with get_db() as conn:
             c = conn.cursor()
-            c.execute("SELECT assigned_subtask FROM agents WHERE agent_name=? ORDER BY id DESC LIMIT 1", (name,))
+            c.execute("SELECT assigned_subtask FROM agents WHERE id=?", (self._db_agent_ids[name],))
             row = c.fetchone()
             if row:
                 try:
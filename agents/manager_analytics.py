@@ -1,13 +1,17 @@
 # agents/manager_analytics.py
-from agents.logging_utils import log_manager
-import time
+from agents.logging_utils import log_manager, read_input
+from agents.config import LLM_COST_PER_1K_PROMPT_TOKENS, LLM_COST_PER_1K_COMPLETION_TOKENS
+import argparse, itertools, time, json
+
+# Latency percentiles reported by ManagerAnalytics.query
+QUERY_PERCENTILES = (0.50, 0.95, 0.99)
 
 class ManagerAnalytics:
     def __init__(self, get_db, colors):
         self.get_db = get_db
         self.colors = colors
 
-    def save_run_summary(self, run_id, agent_names, progress, start_time, token_count):
+    def save_run_summary(self, run_id, agent_names, progress, start_time, token_count, llm_stats=None, token_usage=None, interactive=True):
         elapsed = time.time() - start_time
         manager_summary = []
         for name in agent_names:
@@ -15,12 +19,174 @@ class ManagerAnalytics:
         with self.get_db() as conn:
             c = conn.cursor()
             c.execute(
-                "UPDATE runs SET manager_summary=?, total_time=?, total_tokens=? WHERE id=?",
-                ("\n".join(manager_summary), elapsed, token_count, run_id)
+                "UPDATE runs SET manager_summary=?, total_time=?, total_tokens=?, llm_stats=? WHERE id=?",
+                ("\n".join(manager_summary), elapsed, token_count, json.dumps(llm_stats) if llm_stats else None, run_id)
             )
+            self.rollup_tokens(c, run_id, token_usage)
             conn.commit()
         log_manager(f"\n{self.colors.BOLD}{self.colors.OKGREEN}All tasks are complete!{self.colors.ENDC}", colors=self.colors, level="SUCCESS")
+        if not interactive:
+            return
         log_manager(f"\n{self.colors.BOLD}{self.colors.OKBLUE}Manager: Do you have any questions, suggestions, or would you like to start a new task?{self.colors.ENDC}", colors=self.colors, level="INFO")
-        user_input = input(f"{self.colors.BOLD}Enter your feedback or type a new task: {self.colors.ENDC}")
+        user_input = read_input(f"{self.colors.BOLD}Enter your feedback or type a new task: {self.colors.ENDC}")
         if user_input.strip():
             log_manager(f"{self.colors.OKCYAN}Manager received your input: {user_input}{self.colors.ENDC}", colors=self.colors, level="INFO")
+
+    def rollup_tokens(self, c, run_id, token_usage=None):
+        """
+        Sum agent_iterations token counts into the run's agents rows, and
+        write the run's prompt/completion totals, tokens/s and cost
+        (`total_tokens` comes from `token_count`). `token_usage` (LLMGateway
+        TokenLedger totals) also covers the manager's own planning calls;
+        without it the run totals are the sum over its agents.
+        """
+        c.execute(
+            """UPDATE agents SET
+                prompt_tokens = (SELECT SUM(prompt_tokens) FROM agent_iterations WHERE agent_id = agents.id),
+                completion_tokens = (SELECT SUM(completion_tokens) FROM agent_iterations WHERE agent_id = agents.id),
+                eval_duration = (SELECT SUM(eval_duration) FROM agent_iterations WHERE agent_id = agents.id),
+                tokens_per_second = (SELECT SUM(completion_tokens) * 1.0 / SUM(eval_duration) FROM agent_iterations
+                                     WHERE agent_id = agents.id AND token_source = 'backend' AND eval_duration > 0)
+            WHERE run_id = ?""",
+            (run_id,)
+        )
+        if token_usage is None:
+            prompt_tokens, completion_tokens, tokens_per_second = c.execute(
+                """SELECT SUM(i.prompt_tokens), SUM(i.completion_tokens),
+                    SUM(CASE WHEN i.token_source = 'backend' THEN i.completion_tokens END) * 1.0
+                        / SUM(CASE WHEN i.token_source = 'backend' THEN i.eval_duration END)
+                FROM agent_iterations i JOIN agents a ON i.agent_id = a.id WHERE a.run_id = ?""",
+                (run_id,)
+            ).fetchone()
+        else:
+            prompt_tokens = token_usage['prompt_tokens']
+            completion_tokens = token_usage['completion_tokens']
+            tokens_per_second = token_usage['tokens_per_second']
+        prompt_tokens = prompt_tokens or 0
+        completion_tokens = completion_tokens or 0
+        cost = (prompt_tokens * LLM_COST_PER_1K_PROMPT_TOKENS + completion_tokens * LLM_COST_PER_1K_COMPLETION_TOKENS) / 1000
+        c.execute(
+            "UPDATE runs SET prompt_tokens=?, completion_tokens=?, tokens_per_second=?, cost=? WHERE id=?",
+            (prompt_tokens, completion_tokens, tokens_per_second, cost, run_id)
+        )
+
+    def query(self, by='model', run_id=None, model=None):
+        """
+        Latency percentiles, error rate and token throughput of agent
+        iterations, grouped `by` 'model', 'run' or 'agent', optionally for
+        one run or model. Returns one dict per group: iterations, errors,
+        error_rate, latency mean/p50/p95/p99/max (seconds), prompt and
+        completion tokens, and tokens/s from the backend's eval times.
+
+        SQLite sums each agent's iterations straight from the covering
+        index idx_agent_iterations_stats, and streams the durations out of it
+        already sorted per agent. NumPy rolls agents up into groups and
+        picks the percentiles, so nothing loops over rows in Python.
+        """
+        # Imported here: only queries need numpy, and it is slow to import at startup
+        import numpy as np
+        if by not in ('model', 'run', 'agent'):
+            raise ValueError(f"by must be 'model', 'run' or 'agent', not {by!r}")
+        where, params = [], []
+        if run_id is not None:
+            where.append("a.run_id = ?")
+            params.append(run_id)
+        if model is not None:
+            where.append("r.model_name = ?")
+            params.append(model)
+        agent_filter = f"SELECT a.id FROM agents a JOIN runs r ON r.id = a.run_id WHERE {' AND '.join(where)}" if where else None
+        scope = f" AND agent_id IN ({agent_filter})" if agent_filter else ""
+        with self.get_db() as conn:
+            # One read transaction: the DB writer may commit between the three reads, and under WAL they then
+            # still see one snapshot, so the durations match the counts and every agent with sums is in `agents`
+            conn.execute("BEGIN")
+            agents = conn.execute(
+                f"SELECT a.id, a.run_id, a.agent_name, COALESCE(r.model_name, '(unknown)') FROM agents a JOIN runs r ON r.id = a.run_id"
+                f"{' WHERE ' + ' AND '.join(where) if where else ''} ORDER BY a.id", params).fetchall()
+            sums = conn.execute(
+                "SELECT agent_id, COUNT(*), COUNT(duration), SUM(error IS NOT NULL), SUM(duration), MAX(duration), "
+                "SUM(prompt_tokens), SUM(completion_tokens), "
+                "SUM(CASE WHEN token_source = 'backend' THEN completion_tokens END), SUM(CASE WHEN token_source = 'backend' THEN eval_duration END) "
+                f"FROM agent_iterations INDEXED BY idx_agent_iterations_stats WHERE prompt_ids IS NOT NULL{scope} GROUP BY agent_id ORDER BY agent_id",
+                params).fetchall()
+            cursor = conn.execute(
+                "SELECT duration FROM agent_iterations INDEXED BY idx_agent_iterations_stats "
+                f"WHERE prompt_ids IS NOT NULL AND duration IS NOT NULL{scope} ORDER BY agent_id, duration", params)
+            durations = np.fromiter(itertools.chain.from_iterable(cursor), dtype=float, count=sum(row[2] for row in sums))
+            conn.commit()
+        if not sums:
+            return []
+        # Group code of each agent that has iterations
+        info = {row[0]: row for row in agents}
+        keys = {'model': lambda a: a[3], 'run': lambda a: a[1], 'agent': lambda a: (a[1], a[2], a[0])}[by]
+        agent_keys = [keys(info[row[0]]) for row in sums]
+        group_keys = sorted(set(agent_keys), key=lambda k: (str(type(k)), k))
+        code_of = {key: code for code, key in enumerate(group_keys)}
+        codes = np.array([code_of[key] for key in agent_keys])
+        table = np.array([row[1:] for row in sums], dtype=float)  # NULL sums become nan
+        table = np.nan_to_num(table)
+        n_groups = len(group_keys)
+        totals = np.stack([np.bincount(codes, weights=table[:, col], minlength=n_groups) for col in range(table.shape[1])], axis=1)
+        maxima = np.full(n_groups, -np.inf)
+        np.maximum.at(maxima, codes, table[:, 4])
+        # Durations are sorted within each agent; sort by (group, duration) unless groups are agents
+        row_codes = np.repeat(codes, table[:, 1].astype(int))
+        if by != 'agent':
+            order = np.lexsort((durations, row_codes))
+            durations, row_codes = durations[order], row_codes[order]
+        counts = np.bincount(row_codes, minlength=n_groups)
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        percentiles = {}
+        for q in QUERY_PERCENTILES:
+            idx = starts + np.floor(q * np.maximum(counts - 1, 0)).astype(int)
+            percentiles[q] = np.where(counts > 0, durations[np.minimum(idx, len(durations) - 1)] if len(durations) else 0.0, 0.0)
+        results = []
+        for code, key in enumerate(group_keys):
+            iterations, timed, errors, duration_sum, _, prompt_tokens, completion_tokens, backend_tokens, eval_duration = totals[code]
+            result = {'model': key} if by == 'model' else {'run_id': key} if by == 'run' else {'run_id': key[0], 'agent': key[1], 'agent_id': key[2]}
+            result.update({
+                'iterations': int(iterations),
+                'errors': int(errors),
+                'error_rate': errors / iterations if iterations else 0.0,
+                'latency_mean': duration_sum / timed if timed else 0.0,
+                **{f"latency_p{int(q * 100)}": float(percentiles[q][code]) for q in QUERY_PERCENTILES},
+                'latency_max': float(maxima[code]) if timed else 0.0,
+                'prompt_tokens': int(prompt_tokens),
+                'completion_tokens': int(completion_tokens),
+                'tokens_per_second': backend_tokens / eval_duration if eval_duration else None,
+            })
+            results.append(result)
+        return results
+
+
+def format_query(results, by):
+    """Fixed-width table of `ManagerAnalytics.query` results."""
+    key_header = {'model': 'model', 'run': 'run', 'agent': 'run/agent'}[by]
+    lines = [f"{key_header:<24} {'iters':>9} {'err %':>6} {'mean s':>8} {'p50 s':>8} {'p95 s':>8} {'p99 s':>8} {'max s':>8} {'prompt tok':>11} {'compl tok':>10} {'tok/s':>7}"]
+    for r in results:
+        key = r['model'] if by == 'model' else str(r['run_id']) if by == 'run' else f"{r['run_id']}/{r['agent']}"
+        tps = f"{r['tokens_per_second']:>7.1f}" if r['tokens_per_second'] else f"{'-':>7}"
+        lines.append(f"{key[:24]:<24} {r['iterations']:>9} {r['error_rate'] * 100:>6.2f} {r['latency_mean']:>8.3f} {r['latency_p50']:>8.3f} {r['latency_p95']:>8.3f} "
+                     f"{r['latency_p99']:>8.3f} {r['latency_max']:>8.3f} {r['prompt_tokens']:>11} {r['completion_tokens']:>10} {tps}")
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    from agents import db
+    parser = argparse.ArgumentParser(prog='python -m agents.manager_analytics', description='Latency, error and token statistics over the run history in babyagi.db')
+    parser.add_argument('command', choices=['query'])
+    parser.add_argument('--by', choices=['model', 'run', 'agent'], default='model', help='Group iterations per model, run or agent (default: model)')
+    parser.add_argument('--run', type=int, default=None, help='Only this run')
+    parser.add_argument('--model', default=None, help='Only runs of this model')
+    parser.add_argument('--db', default=db.DB_PATH, help=f'Database file (default: {db.DB_PATH})')
+    parser.add_argument('--json', action='store_true', help='Print JSON instead of a table')
+    args = parser.parse_args(argv)
+    db.DB_PATH = args.db
+    # Brings older databases up to the current schema, including the index the query relies on
+    db.init_db()
+    results = ManagerAnalytics(db.get_db, None).query(by=args.by, run_id=args.run, model=args.model)
+    print(json.dumps(results, indent=2) if args.json else format_query(results, args.by))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,22 +1,385 @@
 # agents/message_bus.py
+import asyncio
+import itertools
+import sys
 import threading
 import time
+import uuid
+from collections.abc import Mapping
 
+from agents.config import BUS_PRUNE_READ, BUS_SPILL, BUS_HIGH_WATER, BUS_OVERFLOW, BUS_BLOCK_TIMEOUT
+
+# Read messages are pruned from the front of a log in batches of at least this many
+# (or at least half the log), so each pruned message costs O(1) amortized
+PRUNE_BATCH = 256
+SPILL_COLUMNS = "seq, sender, recipient, content, kind, timestamp, task"
+
+
+class Message(Mapping):
+    """
+    One bus message. Reads like the dict it replaces (`msg['content']`,
+    `msg.get('kind')`, `dict(msg)`), but keeps its fields in slots and
+    interns the sender, recipient and kind strings, which a long history
+    repeats millions of times. `task` is a key only when set.
+    """
+
+    __slots__ = ('seq', 'sender', 'recipient', 'content', 'kind', 'timestamp', 'task')
+    FIELDS = ('seq', 'sender', 'recipient', 'content', 'kind', 'timestamp')
+    _KEYS = frozenset(__slots__)
+
+    def __init__(self, seq, sender, recipient, content, kind, timestamp, task=None):
+        self.seq = seq
+        self.sender = sys.intern(sender)
+        self.recipient = sys.intern(recipient)
+        self.content = content
+        self.kind = sys.intern(kind)
+        self.timestamp = timestamp
+        self.task = task
+
+    def __getitem__(self, key):
+        if key in self._KEYS and (key != 'task' or self.task is not None):
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def __iter__(self):
+        yield from self.FIELDS
+        if self.task is not None:
+            yield 'task'
+
+    def __len__(self):
+        return len(self.FIELDS) + (self.task is not None)
+
+    def __repr__(self):
+        return f"Message({dict(self)!r})"
+
+
+class _Log:
+    # The retained messages of one recipient, or the broadcasts. Cursors are absolute
+    # positions: `base` messages were pruned from the front, so position p is messages[p - base].
+    __slots__ = ('messages', 'base', 'pruned_seq', 'readers')
 
-class MessageBus:
     def __init__(self):
         self.messages = []
+        self.base = 0
+        self.pruned_seq = 0  # seq of the last pruned message
+        self.readers = {}    # consumer -> cursor, for a recipient's log
+
+    @property
+    def end(self):
+        return self.base + len(self.messages)
+
+
+class MessageBus:
+    """
+    In-process message bus shared by the manager and its agents.
+
+    Messages are indexed per recipient, with a separate log for broadcasts
+    (recipient 'all'). Every message gets a monotonic sequence number, and
+    each consumer keeps, per recipient it reads, a cursor into that
+    recipient's log and the broadcasts, so `receive` only touches messages
+    that consumer has not seen yet.
+
+    Consumers can block in `wait` (or `await wait_async` from a coroutine)
+    until something arrives instead of polling; `wake` releases all waiters,
+    e.g. when an agent exits.
+
+    Memory stays bounded on long runs:
+    - With `prune`, messages every consumer of a log has received are
+      dropped from memory. A recipient's messages are kept until it reads
+      them; broadcasts until every consumer known to the bus has (`register`
+      consumers that start later, so they are counted).
+    - With `spill`, every message is also written to the `bus_messages`
+      table through the shared DB writer, so `messages`, `receive(since=...)`
+      and consumers that start late still get pruned messages.
+    - Past `high_water` messages held for one recipient, 'chunk' messages
+      (partial streamed output; the complete message follows) are dropped.
+      With `overflow='block'`, other senders wait up to `block_timeout`
+      seconds for the recipient to catch up; complete messages are never
+      dropped.
+    """
+
+    BROADCAST = 'all'
+    # Kinds dropped rather than queued past the high-water mark
+    DROPPABLE_KINDS = ('chunk',)
+
+    def __init__(self, prune=BUS_PRUNE_READ, spill=BUS_SPILL, high_water=BUS_HIGH_WATER, overflow=BUS_OVERFLOW, block_timeout=BUS_BLOCK_TIMEOUT):
+        if overflow not in ('drop', 'block'):
+            raise ValueError(f"overflow must be 'drop' or 'block', got {overflow!r}")
         self.lock = threading.Lock()
+        self._cond = threading.Condition(self.lock)
+        # Senders blocked at the high-water mark wait here for consumers to catch up
+        self._space = threading.Condition(self.lock)
+        self._wakeups = 0
+        self._async_waiters = []  # (loop, future) pairs from wait_async
+        self._seq = itertools.count(1)
+        self._queues = {}          # recipient -> _Log
+        self._broadcasts = _Log()  # messages sent to 'all'
+        self._cursors = {}         # (consumer, recipient) -> [direct position, broadcast position]
+        self.prune = prune
+        self.spill = spill
+        self.high_water = high_water
+        self.overflow = overflow
+        self.block_timeout = block_timeout
+        # Spilled rows are found by `bus_id`; `run_id` (set by the Manager) tags them with the run
+        self.bus_id = uuid.uuid4().hex
+        self.run_id = None
+        self._blocked = 0
+        self._broadcast_prune_at = PRUNE_BATCH
+        self.counts = {'sent': 0, 'pruned': 0, 'dropped': 0, 'blocked': 0, 'block_timeouts': 0, 'missed': 0}
+
+    @property
+    def messages(self):
+        """All messages sent, in send order. Pruned ones are included only if they were spilled."""
+        with self.lock:
+            merged = [msg for _, log in self._logs() for msg in log.messages]
+            pruned = [(recipient, log.pruned_seq) for recipient, log in self._logs() if log.pruned_seq]
+        if self.spill:
+            for recipient, pruned_seq in pruned:
+                merged.extend(self._load("recipient=? AND seq<=?", (recipient, pruned_seq)))
+        merged.sort(key=lambda msg: msg.seq)
+        return merged
 
-    def send(self, sender, recipient, content):
+    def send(self, sender, recipient, content, kind='message', task=None):
+        """
+        Deliver `content` to `recipient` ('all' for everyone). `kind` is
+        'message' for complete messages, or 'chunk' for partial output
+        streamed while an agent is still generating. `task` is the index of
+        the sender's task the message is about, if it has one; the manager
+        uses it to tell reports on an approved task from the current one.
+        Returns the message's seq, or None if it was dropped at the high-water mark.
+        """
         with self.lock:
-            self.messages.append({
-                'sender': sender,
-                'recipient': recipient,
-                'content': content,
-                'timestamp': time.time()
-            })
-
-    def receive(self, recipient, since=0):
+            log = self._broadcasts if recipient == self.BROADCAST else self._log(recipient)
+            if len(log.messages) >= self.high_water and not self._make_room(log, kind):
+                self.counts['dropped'] += 1
+                return None
+            msg = Message(next(self._seq), sender, recipient, content, kind, time.time(), task)
+            log.messages.append(msg)
+            self.counts['sent'] += 1
+            self._notify()
+        if self.spill:
+            self._spill(msg)
+        return msg.seq
+
+    def register(self, recipient, consumer=None):
+        """
+        Count `consumer` (default: the recipient) as a reader of `recipient`'s
+        messages and of the broadcasts before it first reads, so nothing it
+        has yet to receive is pruned. The manager does this for the agents it
+        is about to start.
+        """
         with self.lock:
-            return [msg for msg in self.messages if (msg['recipient'] == recipient or msg['recipient'] == 'all') and msg['timestamp'] > since]
+            self._cursor(recipient, consumer)
+
+    def receive(self, recipient, since=None, consumer=None):
+        """
+        Return messages for `recipient` (direct and broadcast) in seq order.
+
+        With `since=None` the consumer's cursor is used and advanced, so each
+        call returns only messages that consumer has not received before.
+        `consumer` defaults to the recipient. A consumer reading several
+        recipients has a cursor for each, so it gets each broadcast once per
+        recipient. Passing an explicit `since`
+        sequence number returns everything after it without touching the
+        cursor.
+        """
+        if since is not None:
+            return self._history(recipient, since)
+        gaps = []
+        with self.lock:
+            cursor = self._cursor(recipient, consumer)
+            log = self._queues.get(recipient)
+            direct = self._read(log, cursor, 0, recipient, gaps) if log is not None else []
+            broadcast = self._read(self._broadcasts, cursor, 1, self.BROADCAST, gaps)
+            if self.prune:
+                if direct:
+                    self._prune(log, min(c[0] for c in log.readers.values()))
+                if len(self._broadcasts.messages) >= self._broadcast_prune_at:
+                    # Every consumer's cursor counts, so attempts are spaced by the consumer count too
+                    self._prune(self._broadcasts, min(c[1] for c in self._cursors.values()))
+                    self._broadcast_prune_at = len(self._broadcasts.messages) + max(PRUNE_BATCH, len(self._cursors))
+                if self._blocked:
+                    self._space.notify_all()
+        for messages, name, start, count in gaps:
+            # Pruned before this consumer first read; back from the spill table
+            messages[:0] = self._load("recipient=?", (name,), limit=count, offset=start)
+        if not broadcast:
+            return direct
+        if not direct:
+            return broadcast
+        return sorted(direct + broadcast, key=lambda msg: msg.seq)
+
+    def wait(self, recipient, timeout=None, consumer=None):
+        """
+        Block until `recipient` has messages the consumer has not received,
+        `wake` is called, or `timeout` seconds pass.
+        Returns True if woken by a message or `wake`, False on timeout.
+        """
+        with self._cond:
+            ready = self._ready_check(recipient, consumer)
+            return self._cond.wait_for(ready, timeout)
+
+    async def wait_async(self, recipient, timeout=None, consumer=None):
+        """Awaitable version of `wait` for consumers running on an event loop."""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout if timeout is not None else None
+        with self.lock:
+            ready = self._ready_check(recipient, consumer)
+        while True:
+            with self.lock:
+                if ready():
+                    return True
+                future = loop.create_future()
+                waiter = (loop, future)
+                self._async_waiters.append(waiter)
+            try:
+                remaining = deadline - loop.time() if deadline is not None else None
+                if remaining is not None and remaining <= 0:
+                    return False
+                try:
+                    await asyncio.wait_for(future, remaining)
+                except asyncio.TimeoutError:
+                    return False
+            finally:
+                with self.lock:
+                    if waiter in self._async_waiters:
+                        self._async_waiters.remove(waiter)
+
+    def wake(self):
+        """Release everything blocked in `wait` or `wait_async`."""
+        with self._cond:
+            self._wakeups += 1
+            self._notify()
+
+    def stats(self):
+        """Counters (sent, pruned, dropped, blocked, ...) and the number of messages held in memory."""
+        with self.lock:
+            retained = sum(len(log.messages) for _, log in self._logs())
+            return dict(self.counts, retained=retained)
+
+    def _logs(self):
+        # Called with the lock held
+        yield self.BROADCAST, self._broadcasts
+        yield from self._queues.items()
+
+    def _log(self, recipient):
+        # Called with the lock held
+        log = self._queues.get(recipient)
+        if log is None:
+            log = self._queues[recipient] = _Log()
+        return log
+
+    def _cursor(self, recipient, consumer):
+        # Called with the lock held: the consumer's cursor for this recipient, counted as a reader of its log
+        consumer = consumer or recipient
+        cursor = self._cursors.get((consumer, recipient))
+        if cursor is None:
+            cursor = self._cursors[(consumer, recipient)] = [0, 0]
+            if recipient != self.BROADCAST:
+                self._log(recipient).readers[consumer] = cursor
+        return cursor
+
+    def _read(self, log, cursor, which, recipient, gaps):
+        # Called with the lock held: the log's messages after cursor[which], advancing it
+        start = cursor[which]
+        messages = log.messages[max(0, start - log.base):]
+        if start < log.base:
+            # A consumer that started after these were pruned
+            if self.spill:
+                gaps.append((messages, recipient, start, log.base - start))
+            else:
+                self.counts['missed'] += log.base - start
+        cursor[which] = log.end
+        return messages
+
+    def _prune(self, log, floor):
+        # Called with the lock held: drop the messages before position `floor`
+        count = floor - log.base
+        if count <= 0 or (count < PRUNE_BATCH and 2 * count < len(log.messages)):
+            return
+        log.pruned_seq = log.messages[count - 1].seq
+        del log.messages[:count]
+        log.base = floor
+        self.counts['pruned'] += count
+
+    def _make_room(self, log, kind):
+        # Called with the lock held, for a log at the high-water mark. Returns False to drop the message.
+        if kind in self.DROPPABLE_KINDS:
+            return False
+        if self.overflow == 'block' and (log.readers or log is self._broadcasts):
+            self.counts['blocked'] += 1
+            self._blocked += 1
+            try:
+                if not self._space.wait_for(lambda: len(log.messages) < self.high_water, self.block_timeout):
+                    self.counts['block_timeouts'] += 1
+            finally:
+                self._blocked -= 1
+        return True
+
+    def _history(self, recipient, since):
+        with self.lock:
+            logs = [(self.BROADCAST, self._broadcasts)]
+            if recipient in self._queues:
+                logs.append((recipient, self._queues[recipient]))
+            merged, pruned = [], []
+            for name, log in logs:
+                merged.extend(log.messages[self._index_after(log.messages, since):])
+                if log.pruned_seq > since:
+                    pruned.append((name, log.pruned_seq))
+        if self.spill:
+            for name, pruned_seq in pruned:
+                merged.extend(self._load("recipient=? AND seq>? AND seq<=?", (name, since, pruned_seq)))
+        merged.sort(key=lambda msg: msg.seq)
+        return merged
+
+    def _spill(self, msg):
+        # Queued for the shared DB writer, which commits in batches off this thread
+        from agents.db import get_writer
+        get_writer().submit(f"INSERT INTO bus_messages (bus, run_id, {SPILL_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                            (self.bus_id, self.run_id, msg.seq, msg.sender, msg.recipient, msg.content, msg.kind, msg.timestamp, msg.task))
+
+    def _load(self, where, params, limit=-1, offset=0):
+        # Spilled messages of this bus in seq order; rows still queued in the writer are committed first
+        from agents.db import get_db, get_writer
+        get_writer().flush()
+        with get_db() as conn:
+            rows = conn.execute(f"SELECT {SPILL_COLUMNS} FROM bus_messages WHERE bus=? AND {where} ORDER BY seq LIMIT ? OFFSET ?",
+                                (self.bus_id, *params, limit, offset)).fetchall()
+        return [Message(*row) for row in rows]
+
+    def _ready_check(self, recipient, consumer):
+        # Must be called and evaluated with the lock held
+        wakeups = self._wakeups
+        cursor = self._cursor(recipient, consumer)
+        log = self._queues.get(recipient)
+        broadcasts = self._broadcasts
+
+        def ready():
+            return (self._wakeups != wakeups
+                    or (log is not None and log.end > cursor[0])
+                    or broadcasts.end > cursor[1])
+        return ready
+
+    def _notify(self):
+        # Called with the lock held
+        self._cond.notify_all()
+        for loop, future in self._async_waiters:
+            loop.call_soon_threadsafe(_resolve, future)
+        self._async_waiters.clear()
+
+    @staticmethod
+    def _index_after(log, since):
+        # Logs are append-only in seq order, so binary search on the seq keys.
+        lo, hi = 0, len(log)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if log[mid].seq <= since:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(True)
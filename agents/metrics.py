@@ -0,0 +1,148 @@
+# agents/metrics.py
+import bisect, contextlib, json, threading, time
+
+# Upper bounds (seconds) of the span histogram buckets
+SPAN_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+class Histogram:
+    """Bucketed latency histogram (not thread-safe; `Metrics` holds the lock)."""
+
+    def __init__(self, buckets=SPAN_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q):
+        """Estimate from the buckets, interpolating linearly inside the bucket."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                low = self.buckets[i - 1] if i else 0.0
+                high = self.buckets[i] if i < len(self.buckets) else self.max
+                return min(self.max, low + (high - low) * (rank - seen) / n)
+            seen += n
+        return self.max
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'mean': self.sum / self.count if self.count else 0.0,
+            'p50': self.quantile(0.50),
+            'p95': self.quantile(0.95),
+            'p99': self.quantile(0.99),
+            'max': self.max,
+        }
+
+
+class Metrics:
+    """
+    Span timings for agent iterations and the manager loop.
+
+    Each span name ('bus_receive', 'llm_queue_wait', 'llm_request', 'parse',
+    'tools', 'tool_call', 'db_write', 'db_commit', 'review_latency',
+    'review_pass', 'plan') gets a histogram. `span(name)` times a block;
+    `observe(name, seconds)` records a duration measured elsewhere. Export
+    with `prometheus()` (text format, also served by `serve(port)`),
+    `snapshot()` or `dump(path)` (JSON).
+    """
+
+    METRIC_NAME = 'babyagi_span_seconds'
+
+    def __init__(self, buckets=SPAN_BUCKETS):
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        self._spans = {}  # name -> Histogram
+        self.server = None
+
+    def observe(self, name, seconds):
+        with self.lock:
+            histogram = self._spans.get(name)
+            if histogram is None:
+                histogram = self._spans[name] = Histogram(self.buckets)
+            histogram.observe(seconds)
+
+    @contextlib.contextmanager
+    def span(self, name, into=None):
+        """Time the block as `name`; with `into` (a dict), also add the seconds to `into[name]`."""
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - t0
+            self.observe(name, elapsed)
+            if into is not None:
+                into[name] = into.get(name, 0.0) + elapsed
+
+    def snapshot(self):
+        """{span: {count, sum, mean, p50, p95, p99, max}} in seconds."""
+        with self.lock:
+            return {name: histogram.summary() for name, histogram in sorted(self._spans.items())}
+
+    def prometheus(self):
+        """All spans in the Prometheus text exposition format, as one labelled histogram."""
+        lines = [
+            f"# HELP {self.METRIC_NAME} Time spent per phase of agent iterations and the manager loop.",
+            f"# TYPE {self.METRIC_NAME} histogram",
+        ]
+        with self.lock:
+            for name, histogram in sorted(self._spans.items()):
+                cumulative = 0
+                for bound, n in zip(list(histogram.buckets) + ['+Inf'], histogram.counts):
+                    cumulative += n
+                    lines.append(f'{self.METRIC_NAME}_bucket{{span="{name}",le="{bound}"}} {cumulative}')
+                lines.append(f'{self.METRIC_NAME}_sum{{span="{name}"}} {histogram.sum}')
+                lines.append(f'{self.METRIC_NAME}_count{{span="{name}"}} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+    def dump(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.snapshot(), f, indent=2)
+
+    def serve(self, port, host='127.0.0.1'):
+        """Serve GET /metrics from a daemon thread. Returns the HTTP server."""
+        # Imported here: most runs never serve metrics, and http.server is slow to import
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                if self.path == '/metrics':
+                    body, status, content_type = metrics.prometheus().encode(), 200, 'text/plain; version=0.0.4'
+                elif self.path == '/metrics.json':
+                    body, status, content_type = json.dumps(metrics.snapshot()).encode(), 200, 'application/json'
+                else:
+                    body, status, content_type = b'not found\n', 404, 'text/plain'
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, name="metrics-http", daemon=True).start()
+        return self.server
+
+
+_metrics = Metrics()
+
+def get_metrics():
+    """Process-wide Metrics shared by agents, the gateway, the DB writer and the manager."""
+    return _metrics
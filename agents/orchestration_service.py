@@ -1,86 +1,207 @@
 # agents/orchestration_service.py
 from agents.logging_utils import log_manager
-import time, json
+from agents.db import get_writer
+from agents.metrics import get_metrics
+import asyncio, time, json
+
+# Tail of streamed output kept per agent for live progress
+PARTIAL_OUTPUT_CHARS = 2000
 
 class OrchestrationService:
-    def __init__(self, bus, agent_names, db_run_id, db_agent_ids, colors, agent_emojis):
+    def __init__(self, bus, agent_names, db_run_id, db_agent_ids, colors, agent_emojis, agent_threads=None, token_ledger=None, scheduler=None, start_positions=None, controls=None):
         self.bus = bus
         self.agent_names = agent_names
+        self.agent_threads = dict(zip(agent_names, agent_threads)) if agent_threads else {}
         self._db_run_id = db_run_id
         self._db_agent_ids = db_agent_ids
         self.colors = colors
         self.agent_emojis = agent_emojis
+        # The agents' gateway TokenLedger; keeps token_count[0] at the run's real LLM token total
+        self.token_ledger = token_ledger
+        # With a SubtaskScheduler, agents pull subtasks as they go, so an agent
+        # is done when it exits rather than after a fixed number of approvals
+        self.scheduler = scheduler
+        # Resumed runs: agent name -> (task index, iteration) the agent continues from
+        self.start_positions = start_positions or {}
+        # AgentControls (agents/control.py): approving a task tells its agent to move on at once
+        self.controls = controls
 
-    def run_orchestration(self, num_iterations, get_agent_tasks, progress, completed, _get_db, token_count):
-        iteration_counters = {name: 0 for name in self.agent_names}
-        last_update_times = {name: None for name in self.agent_names}
-        agent_task_progress = {name: [] for name in self.agent_names}
-        agent_task_summaries = {name: [] for name in self.agent_names}
-        agent_current_task = {name: 0 for name in self.agent_names}
-        # Cache parsed agent tasks for each agent
-        agent_tasks_cache = {name: json.loads(get_agent_tasks(name)) for name in self.agent_names}
+    def run_orchestration(self, num_iterations, get_agent_tasks, progress, completed, _get_db, token_count, timeout=None, stop_event=None):
+        self._start(get_agent_tasks, timeout)
+        metrics = get_metrics()
         while True:
-            updated = False
-            for name in self.agent_names:
-                if name in completed:
-                    continue
-                now = time.time()
-                msgs = self.bus.receive("manager", since=0)
-                for msg in msgs:
-                    if msg['sender'] == name and progress[name] != msg['content']:
-                        prev_time = last_update_times[name] or now
-                        duration = now - prev_time
-                        last_update_times[name] = now
-                        progress[name] = msg['content']
-                        token_count[0] += len(msg['content'].split())
-                        # Save iteration to DB
-                        with _get_db() as conn:
-                            c = conn.cursor()
-                            c.execute(
-                                "INSERT INTO agent_iterations (agent_id, iteration, response, duration, tokens_used) VALUES (?, ?, ?, ?, ?)",
-                                (self._db_agent_ids[name], iteration_counters[name], msg['content'], duration, len(msg['content'].split()))
-                            )
-                        # Track progress for review
-                        agent_task_progress[name].append((agent_current_task[name], iteration_counters[name], msg['content']))
-                        # --- Manager review logic ---
-                        for review_attempt in range(3):
-                            try:
-                                log_manager(f"{self.colors.BOLD}{self.colors.WARNING}Manager reviewing {name} task {agent_current_task[name]+1} iteration {iteration_counters[name]+1}:{self.colors.ENDC}\n{msg['content']}", colors=self.colors, level="WARNING")
-                                content_lower = msg['content'].lower()
-                                if 'task completed' in content_lower or 'done' in content_lower:
-                                    approval = True
-                                    reason = "Task requirements met (contains 'task completed' or 'done')."
-                                else:
-                                    approval = False
-                                    reason = "Task requirements not met. Needs further iteration."
-                                if approval:
-                                    log_manager(f"{self.colors.OKGREEN}Manager APPROVED {name} task {agent_current_task[name]+1} iteration {iteration_counters[name]+1}: {reason}{self.colors.ENDC}", colors=self.colors, level="SUCCESS")
-                                    summary = f"Task {agent_current_task[name]+1} completed by {name}: {msg['content']}"
-                                    agent_task_summaries[name].append(summary)
-                                    agent_current_task[name] += 1
-                                    iteration_counters[name] = 0
-                                    break
-                                else:
-                                    log_manager(f"{self.colors.FAIL}Manager DISAPPROVED {name} task {agent_current_task[name]+1} iteration {iteration_counters[name]+1}: {reason}{self.colors.ENDC}", colors=self.colors, level="ERROR")
-                                    iteration_counters[name] += 1
-                                    break
-                            except Exception as e:
-                                log_manager(f"{self.colors.FAIL}Manager review error for {name} task {agent_current_task[name]+1} iteration {iteration_counters[name]+1}: {e}{self.colors.ENDC}", colors=self.colors, level="ERROR")
-                                if review_attempt < 2:
-                                    log_manager(f"{self.colors.WARNING}Manager review retrying ({review_attempt+1}/3)...{self.colors.ENDC}", colors=self.colors, level="WARNING")
-                                    time.sleep(1)
-                                else:
-                                    log_manager(f"{self.colors.FAIL}Manager review failed after 3 attempts. Skipping review for this iteration.{self.colors.ENDC}", colors=self.colors, level="ERROR")
-                        # If agent has completed all tasks, mark as done
-                        if agent_current_task[name] >= len(agent_tasks_cache[name]):
-                            completed.add(name)
-                        updated = True
-            if updated:
-                log_manager(f"{self.colors.BOLD}{self.colors.OKBLUE}Manager Progress Report:{self.colors.ENDC}", colors=self.colors, level="INFO")
-                for name in self.agent_names:
-                    status = progress[name] if progress[name] else "No update yet."
-                    log_manager(f"  {name}: {status}", colors=self.colors, level="INFO")
-            if len(completed) == len(self.agent_names):
+            with metrics.span('review_pass'):
+                rows = self._review_pass(progress, completed, token_count)
+                self._save_iterations(rows)
+            done, remaining = self._time_left(completed, stop_event)
+            if done:
+                break
+            # Sleep until a message for the manager arrives or an agent exits
+            self.bus.wait("manager", timeout=remaining)
+        return self.agent_task_progress, self.agent_task_summaries
+
+    async def run_orchestration_async(self, num_iterations, get_agent_tasks, progress, completed, _get_db, token_count, timeout=None, stop_event=None):
+        """Same loop as `run_orchestration`, for agents running as asyncio tasks."""
+        self._start(get_agent_tasks, timeout)
+        metrics = get_metrics()
+        while True:
+            with metrics.span('review_pass'):
+                rows = self._review_pass(progress, completed, token_count)
+                self._save_iterations(rows)
+            done, remaining = self._time_left(completed, stop_event)
+            if done:
                 break
-            time.sleep(0.1)
-        return agent_task_progress, agent_task_summaries
+            await self.bus.wait_async("manager", timeout=remaining)
+            # Let every agent that is already runnable finish its step first,
+            # so one review pass covers a whole batch of messages
+            await asyncio.sleep(0)
+        return self.agent_task_progress, self.agent_task_summaries
+
+    def _start(self, get_agent_tasks, timeout):
+        self.iteration_counters = {name: self.start_positions.get(name, (0, 0))[1] for name in self.agent_names}
+        self.last_update_times = {name: None for name in self.agent_names}
+        self.agent_task_progress = {name: [] for name in self.agent_names}
+        self.agent_task_summaries = {name: [] for name in self.agent_names}
+        self.agent_current_task = {name: self.start_positions.get(name, (0, 0))[0] for name in self.agent_names}
+        # Text streamed so far by each agent in its current iteration (--stream)
+        self.agent_partial_output = {name: '' for name in self.agent_names}
+        # Seconds from an agent sending a message to the manager reviewing it
+        self.review_latencies = []
+        # Messages about tasks already approved, not reviewed again
+        self.stale_messages = 0
+        # Cache parsed agent tasks for each agent
+        self.agent_tasks_cache = {name: json.loads(get_agent_tasks(name)) for name in self.agent_names}
+        self.timeout = timeout
+        self.deadline = time.time() + timeout if timeout else None
+
+    def _review_pass(self, progress, completed, token_count):
+        """Review every new manager message once. Returns the agent_iterations rows to save."""
+        iteration_counters = self.iteration_counters
+        last_update_times = self.last_update_times
+        agent_task_progress = self.agent_task_progress
+        agent_task_summaries = self.agent_task_summaries
+        agent_current_task = self.agent_current_task
+        agent_tasks_cache = self.agent_tasks_cache
+        metrics = get_metrics()
+        rows = []
+        updated = False
+        # Snapshot exited agents before draining, so their last messages are still reviewed
+        exited = [name for name, handle in self.agent_threads.items() if not _is_running(handle)]
+        # The bus keeps a cursor for the manager, so each pass only sees new messages
+        for msg in self.bus.receive("manager"):
+            name = msg['sender']
+            if name not in agent_tasks_cache or name in completed:
+                continue
+            if msg.get('kind') == 'chunk':
+                # Live progress only; the complete message is reviewed when it arrives
+                self.agent_partial_output[name] = (self.agent_partial_output[name] + msg['content'])[-PARTIAL_OUTPUT_CHARS:]
+                continue
+            self.agent_partial_output[name] = ''
+            task = msg.get('task')
+            if task is not None and task < agent_current_task[name]:
+                # Sent before the agent learned of the approval; approving it again would skip a task
+                self.stale_messages += 1
+                continue
+            if task is not None and task > agent_current_task[name]:
+                # The agent finished earlier tasks on its own (task_completed, or out of iterations)
+                agent_current_task[name] = task
+                iteration_counters[name] = 0
+            now = time.time()
+            self.review_latencies.append(now - msg['timestamp'])
+            metrics.observe('review_latency', now - msg['timestamp'])
+            prev_time = last_update_times[name] or now
+            duration = now - prev_time
+            last_update_times[name] = now
+            progress[name] = msg['content']
+            # Saved to DB by the caller in one batch per pass. Not an LLM call, so no token counts.
+            rows.append((self._db_agent_ids[name], iteration_counters[name], msg['content'], duration, None))
+            # Track progress for review
+            agent_task_progress[name].append((agent_current_task[name], iteration_counters[name], msg['content']))
+            # --- Manager review logic ---
+            for review_attempt in range(3):
+                try:
+                    log_manager(f"{self.colors.BOLD}{self.colors.WARNING}Manager reviewing {name} task {agent_current_task[name]+1} iteration {iteration_counters[name]+1}:{self.colors.ENDC}\n{msg['content']}", colors=self.colors, level="WARNING")
+                    content_lower = msg['content'].lower()
+                    if 'task completed' in content_lower or 'done' in content_lower:
+                        approval = True
+                        reason = "Task requirements met (contains 'task completed' or 'done')."
+                    else:
+                        approval = False
+                        reason = "Task requirements not met. Needs further iteration."
+                    if approval:
+                        log_manager(f"{self.colors.OKGREEN}Manager APPROVED {name} task {agent_current_task[name]+1} iteration {iteration_counters[name]+1}: {reason}{self.colors.ENDC}", colors=self.colors, level="SUCCESS")
+                        summary = f"Task {agent_current_task[name]+1} completed by {name}: {msg['content']}"
+                        agent_task_summaries[name].append(summary)
+                        agent_current_task[name] += 1
+                        iteration_counters[name] = 0
+                        if self.controls is not None:
+                            self.controls.advance(name, agent_current_task[name])
+                        break
+                    else:
+                        log_manager(f"{self.colors.FAIL}Manager DISAPPROVED {name} task {agent_current_task[name]+1} iteration {iteration_counters[name]+1}: {reason}{self.colors.ENDC}", colors=self.colors, level="ERROR")
+                        iteration_counters[name] += 1
+                        break
+                except Exception as e:
+                    log_manager(f"{self.colors.FAIL}Manager review error for {name} task {agent_current_task[name]+1} iteration {iteration_counters[name]+1}: {e}{self.colors.ENDC}", colors=self.colors, level="ERROR")
+                    if review_attempt < 2:
+                        log_manager(f"{self.colors.WARNING}Manager review retrying ({review_attempt+1}/3)...{self.colors.ENDC}", colors=self.colors, level="WARNING")
+                        time.sleep(1)
+                    else:
+                        log_manager(f"{self.colors.FAIL}Manager review failed after 3 attempts. Skipping review for this iteration.{self.colors.ENDC}", colors=self.colors, level="ERROR")
+            # If agent has completed all tasks, mark as done
+            if self.scheduler is None and agent_current_task[name] >= len(agent_tasks_cache[name]):
+                completed.add(name)
+            updated = True
+        for name in exited:
+            if name not in completed:
+                completed.add(name)
+                updated = True
+        if self.token_ledger is not None:
+            token_count[0] = self.token_ledger.totals()['total_tokens']
+        if updated:
+            log_manager(f"{self.colors.BOLD}{self.colors.OKBLUE}Manager Progress Report:{self.colors.ENDC}", colors=self.colors, level="INFO")
+            for name in self.agent_names:
+                status = progress[name] if progress[name] else "No update yet."
+                log_manager(f"  {name}: {status}", colors=self.colors, level="INFO")
+            if self.token_ledger is not None:
+                log_manager(f"  LLM tokens so far: {token_count[0]}", colors=self.colors, level="INFO")
+        return rows
+
+    def reaction_stats(self):
+        """Manager reaction latency: how long reviewed messages waited on the bus (seconds)."""
+        latencies = sorted(self.review_latencies)
+        if not latencies:
+            return {'reviews': 0, 'stale': self.stale_messages, 'reaction_p50': 0.0, 'reaction_p95': 0.0, 'reaction_max': 0.0}
+        return {
+            'reviews': len(latencies),
+            'stale': self.stale_messages,
+            'reaction_p50': latencies[int(0.50 * (len(latencies) - 1))],
+            'reaction_p95': latencies[int(0.95 * (len(latencies) - 1))],
+            'reaction_max': latencies[-1],
+        }
+
+    def _save_iterations(self, rows):
+        # Queued to the shared write-behind writer, so neither loop blocks on SQLite
+        writer = get_writer()
+        for row in rows:
+            writer.submit("INSERT INTO agent_iterations (agent_id, iteration, response, duration, tokens_used) VALUES (?, ?, ?, ?, ?)", row)
+
+    def _time_left(self, completed, stop_event):
+        """Returns (done, seconds until the deadline or None)."""
+        if len(completed) == len(self.agent_names):
+            return True, None
+        if stop_event is not None and stop_event.is_set():
+            log_manager(f"{self.colors.WARNING}Manager stopping orchestration: shutdown requested.{self.colors.ENDC}", colors=self.colors, level="WARNING")
+            return True, None
+        remaining = self.deadline - time.time() if self.deadline else None
+        if remaining is not None and remaining <= 0:
+            log_manager(f"{self.colors.WARNING}Manager stopping orchestration: timed out after {self.timeout}s with {len(self.agent_names) - len(completed)} agent(s) unfinished.{self.colors.ENDC}", colors=self.colors, level="WARNING")
+            return True, None
+        return False, remaining
+
+
+def _is_running(handle):
+    # Agent handles are threads, or asyncio tasks in async mode
+    if hasattr(handle, 'is_alive'):
+        return handle.is_alive()
+    return not handle.done()
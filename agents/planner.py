@@ -0,0 +1,147 @@
+# agents/planner.py
+from agents.tokens import message_text
+import json, threading, time
+
+# JSON schemas passed as Ollama's `format`, so the model can only emit a valid plan
+SUBTASK_LIST_SCHEMA = {
+    "type": "array",
+    "minItems": 1,
+    "items": {"type": "string", "minLength": 1},
+}
+SUBTASK_GRAPH_SCHEMA = {
+    "type": "array",
+    "minItems": 1,
+    "items": {
+        "type": "object",
+        "properties": {
+            "task": {"type": "string", "minLength": 1},
+            "depends_on": {"type": "array", "items": {"type": "integer", "minimum": 0}},
+        },
+        "required": ["task", "depends_on"],
+    },
+}
+
+RETRY_PROMPT = "\n\nPrevious output was not valid JSON. Please output ONLY a valid JSON array, no extra text."
+
+
+def plan_schema(dependencies):
+    return SUBTASK_GRAPH_SCHEMA if dependencies else SUBTASK_LIST_SCHEMA
+
+
+def parse_plan(content):
+    """The plan in `content` (a non-empty JSON array of strings or {"task": ...} objects), or None."""
+    try:
+        plan = json.loads(content)
+    except (TypeError, ValueError):
+        return None
+    if not isinstance(plan, list) or not plan:
+        return None
+    for item in plan:
+        if isinstance(item, dict):
+            if not isinstance(item.get('task'), str) or not item['task'].strip():
+                return None
+        elif not isinstance(item, str) or not item.strip():
+            return None
+    return plan
+
+
+class Planner:
+    """
+    Asks the model for a subtask plan and validates it.
+
+    With `structured`, the request carries the plan's JSON schema as
+    Ollama's `format`, so a well-behaved backend cannot answer with prose
+    and the retry round-trips mostly disappear. With `candidates` > 1,
+    each attempt streams that many plans at once (different seeds) and
+    takes the first one that validates; the others stop reading and close
+    their streams, which gives their gateway slots back. An attempt whose
+    candidates all fail validation is retried with a corrective prompt, up
+    to `max_attempts`.
+
+    `plan()` returns (plan or None, last raw content, stats). The stats
+    hold 'attempts', 'requests', 'cancelled', 'candidates', 'structured',
+    'latency' (seconds until a valid plan, or until giving up) and
+    'first_token' (seconds until the winning reply started, when streamed).
+    """
+
+    def __init__(self, gateway, model_name, client_id="manager", candidates=1, max_attempts=3, structured=True):
+        self.gateway = gateway
+        self.model_name = model_name
+        self.client_id = client_id
+        self.candidates = max(1, candidates)
+        self.max_attempts = max(1, max_attempts)
+        self.structured = structured
+
+    def plan(self, system_prompt, main_task, dependencies=False):
+        kwargs = {'format': plan_schema(dependencies)} if self.structured else {}
+        stats = {'attempts': 0, 'requests': 0, 'cancelled': 0, 'candidates': self.candidates,
+                 'structured': self.structured, 'latency': 0.0, 'first_token': None}
+        t0 = time.perf_counter()
+        content = ''
+        for attempt in range(self.max_attempts):
+            stats['attempts'] = attempt + 1
+            messages = [
+                {"role": "system", "content": system_prompt + (RETRY_PROMPT if attempt else "")},
+                {"role": "user", "content": main_task},
+            ]
+            if self.candidates == 1:
+                plan, content = self._single(messages, kwargs, stats)
+            else:
+                plan, content = self._race(messages, kwargs, stats, t0)
+            if plan is not None:
+                stats['latency'] = time.perf_counter() - t0
+                return plan, content, stats
+        stats['latency'] = time.perf_counter() - t0
+        return None, content, stats
+
+    def _single(self, messages, kwargs, stats):
+        stats['requests'] += 1
+        response = self.gateway.chat(self.model_name, messages, client_id=self.client_id, **kwargs)
+        content = message_text(response)
+        return parse_plan(content), content
+
+    def _race(self, messages, kwargs, stats, t0):
+        # First candidate to produce a valid plan wins; the rest see `won` and close their streams
+        won = threading.Event()
+        cond = threading.Condition()
+        state = {'plan': None, 'content': '', 'pending': self.candidates, 'errors': [], 'first_token': None}
+
+        def candidate(seed):
+            parts, plan, started = [], None, None
+            try:
+                chunks = self.gateway.stream(self.model_name, messages, client_id=self.client_id,
+                                             options={'seed': seed}, **kwargs)
+                try:
+                    for chunk in chunks:
+                        if won.is_set():
+                            return
+                        if started is None:
+                            started = time.perf_counter() - t0
+                        parts.append(message_text(chunk))
+                finally:
+                    chunks.close()
+                plan = parse_plan(''.join(parts))
+            except Exception as e:
+                with cond:
+                    state['errors'].append(e)
+            finally:
+                with cond:
+                    state['pending'] -= 1
+                    if plan is not None and state['plan'] is None:
+                        state['plan'], state['content'], state['first_token'] = plan, ''.join(parts), started
+                    elif parts and state['plan'] is None:
+                        state['content'] = ''.join(parts)
+                    cond.notify_all()
+
+        for seed in range(self.candidates):
+            threading.Thread(target=candidate, args=(seed,), name=f"plan-candidate-{seed}", daemon=True).start()
+        stats['requests'] += self.candidates
+        with cond:
+            cond.wait_for(lambda: state['plan'] is not None or state['pending'] == 0)
+            won.set()
+            stats['cancelled'] += state['pending']
+            if state['plan'] is None and len(state['errors']) == self.candidates:
+                raise state['errors'][0]
+            if state['plan'] is not None:
+                stats['first_token'] = state['first_token']
+            return state['plan'], state['content']
@@ -0,0 +1,137 @@
+# agents/prewarm.py
+from agents.logging_utils import log_manager
+from agents.config import PREWARM_TIMEOUT
+import threading, time
+
+# Startup milestones in the order they are reported
+MILESTONES = ('imports', 'prompt', 'task_entered', 'plan', 'agents_started', 'first_response')
+LABELS = {'imports': "imports done", 'prompt': "first prompt shown", 'task_entered': "task entered", 'plan': "first plan",
+          'agents_started': "agents started", 'first_response': "first agent response"}
+
+
+class StartupTimeline:
+    """
+    Seconds from process start (the import of this module, which main.py
+    imports first) to each startup milestone. Each milestone keeps its
+    first time, so calling `mark` again later is cheap and changes nothing.
+    """
+
+    def __init__(self, t0=None):
+        self.t0 = time.perf_counter() if t0 is None else t0
+        self.marks = {}
+        self.reported = False
+        self.lock = threading.Lock()
+
+    def mark(self, name):
+        if name in self.marks:
+            return
+        with self.lock:
+            self.marks.setdefault(name, time.perf_counter() - self.t0)
+
+    def summary(self, prewarmer=None):
+        """{'milestones': {name: seconds}, 'preloads': {model: {...}}}, the preloads from `prewarmer` if given."""
+        with self.lock:
+            milestones = {name: round(self.marks[name], 4) for name in MILESTONES if name in self.marks}
+        return {'milestones': milestones, 'preloads': prewarmer.stats() if prewarmer is not None else {}}
+
+    def report(self, prewarmer=None, colors=None):
+        """Log the milestones so far and the model preloads on one line. Returns `summary()`."""
+        summary = self.summary(prewarmer)
+        self.reported = True
+        parts = [f"{LABELS[name]} {seconds:.2f}s" for name, seconds in summary['milestones'].items()]
+        for model, load in summary['preloads'].items():
+            if load['error']:
+                parts.append(f"preload of {model} failed ({load['error']})")
+            elif load['seconds'] is None:
+                parts.append(f"preload of {model} running since {load['started']:.2f}s")
+            elif load['load'] is None:
+                parts.append(f"{model} cannot be preloaded")
+            else:
+                parts.append(f"preload of {model} {load['started']:.2f}s-{load['started'] + load['seconds']:.2f}s (model load {load['load']:.2f}s)")
+        log_manager(f"Startup: {', '.join(parts)}", colors=colors, level="INFO")
+        return summary
+
+
+class _Preload:
+    __slots__ = ('model', 'thread', 'started', 'seconds', 'load', 'error', 'done')
+
+    def __init__(self, model, started):
+        self.model = model
+        self.started = started
+        self.seconds = None  # wall time of the preload request
+        self.load = None     # seconds the server spent loading the model (0: it was loaded already)
+        self.error = None
+        self.done = threading.Event()
+
+
+class Prewarmer:
+    """
+    Loads models on the LLM server in the background, so the first real
+    call does not pay the cold-load time (seconds to minutes for a large
+    model). `start(backend, models)` issues one preload per model not
+    already loading or loaded through that backend, each in a daemon
+    thread: the backend's `preload(model, keep_alive)` (an empty
+    /api/generate for Ollama, loading the model in-process for MLX; see
+    agents/backends.py). Backends without `preload` are skipped.
+    `wait(backend, models, timeout)` blocks until those preloads finish.
+    Failures are logged, never raised: the real call will load the model,
+    or report the problem, anyway.
+    """
+
+    def __init__(self, keep_alive=None, timeline=None):
+        self.keep_alive = keep_alive  # None: the backend's own (LLM_KEEP_ALIVE)
+        self.t0 = timeline.t0 if timeline is not None else time.perf_counter()
+        self.lock = threading.Lock()
+        self._loads = {}  # (id(backend), model) -> _Preload
+
+    def start(self, backend, models):
+        """Preload each distinct model of `models` through `backend` in the background. Returns their _Preloads."""
+        loads = []
+        for model in dict.fromkeys(models):
+            with self.lock:
+                load = self._loads.get((id(backend), model))
+                if load is None:
+                    if not hasattr(backend, 'preload'):
+                        continue
+                    load = self._loads[(id(backend), model)] = _Preload(model, time.perf_counter() - self.t0)
+                    load.thread = threading.Thread(target=self._preload, args=(backend, load), name=f"prewarm-{model}", daemon=True)
+                    load.thread.start()
+            loads.append(load)
+        return loads
+
+    def wait(self, backend, models, timeout=PREWARM_TIMEOUT):
+        """Start any preload not started yet, then wait up to `timeout` seconds for all of them. Returns True if they all finished."""
+        deadline = time.monotonic() + timeout
+        return all(load.done.wait(max(0.0, deadline - time.monotonic())) for load in self.start(backend, models))
+
+    def stats(self):
+        """Per model: 'started' (seconds from process start), 'seconds' (the request), 'load' (the server's load time), 'error'."""
+        with self.lock:
+            loads = list(self._loads.values())
+        return {load.model: {'started': round(load.started, 4), 'seconds': round(load.seconds, 4) if load.seconds is not None else None,
+                             'load': round(load.load, 4) if load.load is not None else None, 'error': load.error} for load in loads}
+
+    def _preload(self, backend, load):
+        t0 = time.perf_counter()
+        try:
+            load.load = backend.preload(load.model, self.keep_alive)
+        except Exception as e:
+            load.error = str(e) or type(e).__name__
+            log_manager(f"Preloading {load.model} failed: {load.error}", level="WARNING", prefix="[LLM] ")
+        finally:
+            load.seconds = time.perf_counter() - t0
+            load.done.set()
+
+
+_timeline = StartupTimeline()
+_prewarmer = Prewarmer(timeline=_timeline)
+
+
+def get_timeline():
+    """Process-wide StartupTimeline, started when this module is first imported."""
+    return _timeline
+
+
+def get_prewarmer():
+    """Process-wide Prewarmer, so a model preloaded while the task is typed is not preloaded again before agents start."""
+    return _prewarmer
@@ -0,0 +1,265 @@
+# agents/replay.py
+from agents.manager import Manager
+from agents import db
+from agents.db import init_db, load_prompts
+from agents.logging_utils import log_manager
+from agents.tools import TASK_COMPLETED
+from agents.config import REPLAY_TIMING
+import asyncio, collections, contextlib, json, os, re, sqlite3, threading, time
+
+# Recorded prompts are decompressed this many rows at a time
+LOAD_BATCH = 1000
+# Streamed replies are cut into word-sized chunks like a model's tokens
+CHUNK_RE = re.compile(r'\s*\S+')
+
+
+def load_recording(run_id, db_path=None):
+    """
+    What a past run in babyagi.db (or `db_path`) needs to be re-run: its
+    task, plan, model, agent count, iterations per task and mode, and the
+    LLM calls it made.
+
+    'calls' maps each agent task, as the (system prompt, task prompt) pair
+    pinned at the start of its prompts, to its calls in order: one per
+    saved iteration, plus the follow-up calls of its tool rounds. Each call
+    is {'message', 'latency', 'ttft', 'prompt_eval_count', 'eval_count'},
+    with the latency the backend took (without the gateway's queue wait).
+    """
+    if db_path is None:
+        init_db()
+    path = db_path or db.DB_PATH
+    with contextlib.closing(sqlite3.connect(path, timeout=db.BUSY_TIMEOUT)) as conn:
+        row = conn.execute("SELECT task, manager_subtasks, model_name, total_time, llm_stats FROM runs WHERE id=?", (run_id,)).fetchone()
+        if row is None:
+            raise ValueError(f"No run {run_id} in {path}")
+        task, plan, model_name, total_time, llm_stats = row
+        agents = conn.execute("SELECT config FROM agents WHERE run_id=? ORDER BY id", (run_id,)).fetchall()
+        config = json.loads(agents[0][0]) if agents and agents[0][0] else {}
+        cursor = conn.execute(
+            "SELECT i.iteration, i.prompt_ids, i.response, i.duration, i.tags, i.ttft, i.prompt_tokens, i.completion_tokens "
+            "FROM agent_iterations i JOIN agents a ON i.agent_id = a.id WHERE a.run_id=? AND i.prompt_ids IS NOT NULL "
+            "ORDER BY a.id, i.task_index, i.iteration, i.id", (run_id,))
+        calls = collections.defaultdict(list)
+        max_iteration, streamed, tools = 0, False, False
+        while rows := cursor.fetchmany(LOAD_BATCH):
+            for messages, (iteration, _, _, duration, tags, ttft, prompt_tokens, completion_tokens) in zip(load_prompts(conn, [r[1] for r in rows]), rows):
+                tags = json.loads(tags) if tags else {}
+                max_iteration = max(max_iteration, iteration + 1)
+                streamed = streamed or ttft is not None
+                tools = tools or 'tools' in tags
+                calls[_task_key(messages)].extend(_row_calls(messages, duration, tags, ttft, prompt_tokens, completion_tokens))
+    llm_stats = json.loads(llm_stats) if llm_stats else {}
+    return {
+        'run_id': run_id,
+        'task': task,
+        'plan': json.loads(plan or '[]'),
+        'model_name': model_name,
+        'num_agents': max(1, len(agents)),
+        'max_iterations': config.get('max_iterations') or max(1, max_iteration),
+        'dag': config.get('dag', False),
+        'stream': streamed,
+        'tools': tools,
+        'total_time': total_time,
+        'plan_latency': (llm_stats.get('plan') or {}).get('latency') or 0.0,
+        'calls': dict(calls),
+    }
+
+
+def _task_key(messages):
+    # Agents pin the system prompt and their task at the start of every prompt (agents/context.py)
+    return tuple(m.get('content') or '' for m in messages[:2])
+
+
+def _row_calls(messages, duration, tags, ttft, prompt_tokens, completion_tokens):
+    """
+    The LLM calls of one saved iteration. The saved prompt ends with the
+    replies the agent appended: the last `llm_calls` assistant turns, with
+    the tool results between them. A reply dropped because the task was
+    approved meanwhile was never appended; it is replayed as empty.
+    """
+    count = tags.get('llm_calls', 1)
+    replies = []
+    i = len(messages)
+    # Results of calls in the last tool round, executed after the final reply
+    while i and messages[i - 1].get('role') == 'tool':
+        i -= 1
+    while i and len(replies) < count and messages[i - 1].get('role') == 'assistant':
+        replies.append(messages[i - 1])
+        i -= 1
+        while i and messages[i - 1].get('role') == 'tool':
+            i -= 1
+    replies.reverse()
+    while len(replies) < count:
+        replies.append({'role': 'assistant', 'content': ''})
+    spans = tags.get('spans') or {}
+    if 'llm_request' in spans:
+        latency = max(0.0, spans['llm_request'] - (tags.get('queue_wait') or 0.0))
+    else:
+        latency = duration or 0.0
+    calls = []
+    for n, reply in enumerate(replies):
+        message = {'role': 'assistant', 'content': reply.get('content') or ''}
+        if reply.get('tool_calls'):
+            message['tool_calls'] = [{'function': call['function']} for call in reply['tool_calls']]
+        last = n == count - 1
+        calls.append({'message': message, 'latency': latency / count, 'ttft': ttft if n == 0 else None,
+                      # Usage is summed over the iteration's calls; all of it goes with the last one
+                      'prompt_eval_count': prompt_tokens if last else None, 'eval_count': completion_tokens if last else None})
+    return calls
+
+
+class ReplayBackend:
+    """
+    A backend that answers from a recorded run instead of a model.
+
+    Each agent call is matched to the recording by its task (the pinned
+    system prompt and task prompt) and by how many calls that task has
+    already had, so agents get the replies of their recorded iterations in
+    order, whatever the interleaving. Planning calls for the run's task get
+    the recorded plan. With `timing` 'original' every reply takes as long
+    as the recorded call did (streamed: its first chunk after the recorded
+    time to first token); with 'zero' replies come back at once.
+
+    A call past the end of its task's recording (the agent's
+    `task_completed` reply, which is not saved as an iteration, or a run
+    that went another way) is answered with a `task_completed` tool call
+    and counted in `replay_stats()['misses']`.
+    """
+    kind = 'replay'
+
+    def __init__(self, run_id, timing=REPLAY_TIMING, recording=None, db_path=None):
+        if timing not in ('original', 'zero'):
+            raise ValueError(f"Unknown replay timing {timing!r}; expected 'original' or 'zero'")
+        self.recording = recording if recording is not None else load_recording(run_id, db_path)
+        self.timing = timing
+        self.host = f"replay:{run_id}"
+        # Worker processes on this host load the same recording from the same file
+        self.spec = {'kind': self.kind, 'hosts': [f"{run_id}:{timing}"], 'db_path': os.path.abspath(db_path or db.DB_PATH)}
+        self.lock = threading.Lock()
+        self._served = collections.Counter()  # task key -> calls answered
+        self._counts = collections.Counter()
+
+    def chat(self, model, messages, stream=False, **kwargs):
+        call = self._next(messages)
+        if stream:
+            return self._stream(call)
+        self._sleep(call['latency'])
+        return self._response(call)
+
+    def _stream(self, call):
+        for delay, chunk in self._chunks(call):
+            self._sleep(delay)
+            yield chunk
+
+    def health(self, timeout=2.0):
+        return True
+
+    def asynchronous(self):
+        return AsyncReplayBackend(self)
+
+    def replay_stats(self):
+        """Calls answered from the recording, plan replies, misses, and recorded calls never asked for."""
+        with self.lock:
+            unused = sum(max(0, len(calls) - self._served[key]) for key, calls in self.recording['calls'].items())
+            return {'replayed': self._counts['replayed'], 'plans': self._counts['plans'], 'misses': self._counts['misses'], 'unused': unused}
+
+    def _sleep(self, seconds):
+        if self.timing == 'original' and seconds > 0:
+            time.sleep(seconds)
+
+    def _next(self, messages):
+        key = _task_key(messages)
+        with self.lock:
+            calls = self.recording['calls'].get(key)
+            if calls is not None:
+                n = self._served[key]
+                self._served[key] += 1
+                if n < len(calls):
+                    self._counts['replayed'] += 1
+                    return calls[n]
+            elif messages and messages[-1].get('content') == self.recording['task']:
+                self._counts['plans'] += 1
+                return self._plan_call()
+            self._counts['misses'] += 1
+        return {'message': {'role': 'assistant', 'content': '', 'tool_calls': [{'function': {'name': TASK_COMPLETED, 'arguments': {}}}]},
+                'latency': 0.0, 'ttft': None, 'prompt_eval_count': None, 'eval_count': None}
+
+    def _plan_call(self):
+        # In the planner's output format: ids are implied by position
+        plan = [{'task': s['task'], 'depends_on': s.get('depends_on') or []} if isinstance(s, dict) else s for s in self.recording['plan']]
+        return {'message': {'role': 'assistant', 'content': json.dumps(plan)}, 'latency': self.recording['plan_latency'],
+                'ttft': None, 'prompt_eval_count': None, 'eval_count': None}
+
+    @staticmethod
+    def _usage(call):
+        usage = {}
+        if call['prompt_eval_count'] is not None:
+            usage['prompt_eval_count'] = call['prompt_eval_count']
+        if call['eval_count'] is not None:
+            usage['eval_count'] = call['eval_count']
+        return usage
+
+    def _response(self, call):
+        message = dict(call['message'])
+        if 'tool_calls' in message:
+            message['tool_calls'] = [dict(tool_call) for tool_call in message['tool_calls']]
+        return dict(self._usage(call), message=message, done=True)
+
+    def _chunks(self, call):
+        """(seconds to wait first, chunk) for a streamed reply: words, then the tool calls, then a final chunk with the usage."""
+        message = call['message']
+        chunks = [{'message': {'role': 'assistant', 'content': word}, 'done': False} for word in CHUNK_RE.findall(message['content'])]
+        if message.get('tool_calls'):
+            chunks.append({'message': {'role': 'assistant', 'content': '', 'tool_calls': [dict(c) for c in message['tool_calls']]}, 'done': False})
+        chunks.append(dict(self._usage(call), message={'role': 'assistant', 'content': ''}, done=True))
+        first = min(call['ttft'], call['latency']) if call['ttft'] is not None else 0.0
+        rest = (call['latency'] - first) / max(1, len(chunks) - 1)
+        return [(first if i == 0 else rest, chunk) for i, chunk in enumerate(chunks)]
+
+
+class AsyncReplayBackend:
+    """ReplayBackend for --async mode: the same recording and position, waiting with asyncio.sleep instead of a thread."""
+
+    def __init__(self, replay):
+        self.replay = replay
+        self.host = replay.host
+
+    async def chat(self, model, messages, stream=False, **kwargs):
+        call = self.replay._next(messages)
+        if stream:
+            return self._astream(call)
+        await self._sleep(call['latency'])
+        return self.replay._response(call)
+
+    async def _astream(self, call):
+        for delay, chunk in self.replay._chunks(call):
+            await self._sleep(delay)
+            yield chunk
+
+    async def _sleep(self, seconds):
+        if self.replay.timing == 'original' and seconds > 0:
+            await asyncio.sleep(seconds)
+
+
+def replay_run(run_id, colors, agent_colors, agent_emojis, timing=REPLAY_TIMING, stream=None, **manager_kwargs):
+    """
+    Re-run recorded run `run_id` through the real Manager, AgentService and
+    OrchestrationService, with a ReplayBackend in place of the model: same
+    task, plan, model name, agents, iterations and --dag / --stream mode
+    (`stream` overrides the recorded mode). The replay is saved as a new
+    run. Returns (new run id, stats): the backend's counters, the LLM calls
+    made, the replay's wall time and the recorded run's.
+    """
+    backend = ReplayBackend(run_id, timing)
+    recording = backend.recording
+    manager = Manager(recording['model_name'], backend, colors, agent_colors, agent_emojis,
+                      stream=recording['stream'] if stream is None else stream, dag=recording['dag'], **manager_kwargs)
+    log_manager(f"Replaying run {run_id} ({timing} timing): {recording['task']}", colors=colors, level="BOLD")
+    t0 = time.perf_counter()
+    new_run_id = manager.run_task(recording['task'], recording['num_agents'], recording['max_iterations'])
+    stats = dict(backend.replay_stats(), run_id=new_run_id, wall=time.perf_counter() - t0, recorded_wall=recording['total_time'],
+                 calls=manager.token_usage['calls'] if manager.token_usage else 0)
+    recorded = f" (recorded run: {stats['recorded_wall']:.2f}s)" if stats['recorded_wall'] is not None else ""
+    log_manager(f"Replay of run {run_id} saved as run {new_run_id}: {stats['wall']:.2f}s{recorded}, {stats['replayed']} recorded calls replayed, "
+                f"{stats['plans']} plan replies, {stats['misses']} calls past the recording, {stats['unused']} recorded calls not asked for", colors=colors, level="INFO")
+    return new_run_id, stats
@@ -0,0 +1,185 @@
+# agents/scheduler.py
+from agents.logging_utils import log_manager
+import asyncio, collections, threading
+
+# Characters of each predecessor's result passed on to the subtasks that depend on it
+PREDECESSOR_RESULT_CHARS = 1500
+
+
+def normalize_plan(plan):
+    """
+    A plan as a list of {'id', 'task', 'depends_on'} dicts. Accepts strings
+    (no dependencies) or dicts with `task` and optional `depends_on`
+    (0-based indices into the plan). Unknown and self references are dropped.
+    """
+    subtasks = []
+    for idx, item in enumerate(plan):
+        if isinstance(item, dict):
+            task = str(item.get('task', ''))
+            depends_on = item.get('depends_on') or []
+        else:
+            task, depends_on = str(item), []
+        if not isinstance(depends_on, list):
+            depends_on = [depends_on]
+        deps = []
+        for dep in depends_on:
+            try:
+                dep = int(dep)
+            except (TypeError, ValueError):
+                continue
+            if 0 <= dep < len(plan) and dep != idx and dep not in deps:
+                deps.append(dep)
+        subtasks.append({'id': idx, 'task': task, 'depends_on': deps})
+    _break_cycles(subtasks)
+    return subtasks
+
+
+def _break_cycles(subtasks):
+    # Kahn's algorithm; whatever is left sits on a cycle and loses its dependencies
+    remaining = {s['id']: len(s['depends_on']) for s in subtasks}
+    dependents = collections.defaultdict(list)
+    for s in subtasks:
+        for dep in s['depends_on']:
+            dependents[dep].append(s['id'])
+    ready = [i for i, n in remaining.items() if n == 0]
+    while ready:
+        for child in dependents[ready.pop()]:
+            remaining[child] -= 1
+            if remaining[child] == 0:
+                ready.append(child)
+    stuck = [i for i, n in remaining.items() if n > 0]
+    if stuck:
+        log_manager(f"Subtask plan has a dependency cycle; running subtasks {[i + 1 for i in stuck]} without their dependencies.", level="WARNING")
+        for i in stuck:
+            subtasks[i]['depends_on'] = []
+
+
+class SubtaskScheduler:
+    """
+    Hands out the subtasks of a plan to whichever agent asks next.
+
+    Subtasks whose dependencies are all complete wait in a FIFO ready
+    queue; an idle agent `take`s the next one instead of working through a
+    fixed list, so a slow agent never holds work another agent could do.
+    `complete` records the result and releases the subtasks that were
+    waiting on it; `release` puts back a subtask whose agent was stopped
+    part way, and releases nothing. `prompt_for` adds predecessor results
+    to a subtask's prompt. `take` returns None once nothing is left to hand out (or after
+    `wake` when `stop_event` is set). When resuming a run, `results`
+    pre-completes subtasks (id -> result) and `claimed` (id -> agent name)
+    marks subtasks already running on an agent, which never reach the
+    ready queue.
+    """
+
+    def __init__(self, plan, stop_event=None, results=None, claimed=None):
+        self.subtasks = normalize_plan(plan)
+        self.stop_event = stop_event
+        self.lock = threading.Lock()
+        self._cond = threading.Condition(self.lock)
+        self._async_waiters = []  # (loop, future) pairs from take_async
+        self._blocked = {s['id']: len(s['depends_on']) for s in self.subtasks}
+        self._dependents = collections.defaultdict(list)
+        for s in self.subtasks:
+            for dep in s['depends_on']:
+                self._dependents[dep].append(s['id'])
+        self.results = dict(results or {})  # subtask id -> result
+        for done in self.results:
+            for child in self._dependents[done]:
+                self._blocked[child] -= 1
+        self.assignments = dict(claimed or {})  # subtask id -> agent name
+        self._ready = collections.deque(s['id'] for s in self.subtasks
+                                        if self._blocked[s['id']] == 0 and s['id'] not in self.results and s['id'] not in self.assignments)
+        self._running = len(self.assignments)
+
+    def take(self, agent_name):
+        """Block until a subtask is ready and return it, or None when there is nothing left."""
+        with self._cond:
+            self._cond.wait_for(self._can_return)
+            return self._pop(agent_name)
+
+    async def take_async(self, agent_name):
+        """Awaitable version of `take` for agents running on an event loop."""
+        loop = asyncio.get_running_loop()
+        while True:
+            with self.lock:
+                if self._can_return():
+                    return self._pop(agent_name)
+                future = loop.create_future()
+                waiter = (loop, future)
+                self._async_waiters.append(waiter)
+            try:
+                await future
+            finally:
+                with self.lock:
+                    if waiter in self._async_waiters:
+                        self._async_waiters.remove(waiter)
+
+    def complete(self, subtask_id, result):
+        """Record a subtask's result and make its dependents ready when their last dependency finishes."""
+        with self._cond:
+            self.results[subtask_id] = result
+            self._running -= 1
+            for child in self._dependents[subtask_id]:
+                self._blocked[child] -= 1
+                if self._blocked[child] == 0:
+                    self._ready.append(child)
+            self._notify()
+
+    def release(self, subtask_id):
+        """Put back a subtask whose agent stopped before finishing it; the next idle agent takes it first."""
+        with self._cond:
+            if subtask_id in self.results or self.assignments.pop(subtask_id, None) is None:
+                return
+            self._running -= 1
+            self._ready.appendleft(subtask_id)
+            self._notify()
+
+    def prompt_for(self, subtask):
+        """The subtask's text, followed by the results of the subtasks it depends on."""
+        if not subtask['depends_on']:
+            return subtask['task']
+        lines = [subtask['task'], "", "Results of the subtasks this one builds on:"]
+        for dep in subtask['depends_on']:
+            result = (self.results.get(dep) or "(no result)").strip()
+            if len(result) > PREDECESSOR_RESULT_CHARS:
+                result = result[:PREDECESSOR_RESULT_CHARS] + '...'
+            lines.append(f"- {self.subtasks[dep]['task']}: {result}")
+        return "\n".join(lines)
+
+    def wake(self):
+        """Release agents blocked in `take` so they can see `stop_event`."""
+        with self._cond:
+            self._notify()
+
+    @property
+    def finished(self):
+        with self.lock:
+            return len(self.results) == len(self.subtasks)
+
+    def _can_return(self):
+        # Lock held. Nothing running and nothing ready means nothing will become ready.
+        return bool(self._ready) or self._running == 0 or self._stopped()
+
+    def _pop(self, agent_name):
+        # Lock held
+        if self._stopped() or not self._ready:
+            return None
+        subtask = self.subtasks[self._ready.popleft()]
+        self._running += 1
+        self.assignments[subtask['id']] = agent_name
+        return subtask
+
+    def _stopped(self):
+        return self.stop_event is not None and self.stop_event.is_set()
+
+    def _notify(self):
+        # Lock held
+        self._cond.notify_all()
+        for loop, future in self._async_waiters:
+            loop.call_soon_threadsafe(_resolve, future)
+        self._async_waiters.clear()
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(True)
@@ -0,0 +1,292 @@
+# agents/socket_bus.py
+from agents.message_bus import MessageBus
+from agents.agent import AGENT_RUNNING, AGENT_TASKS, AGENT_TASK_INDEX, AGENT_COMPLETED, AGENT_STOPPED, AGENT_FAILED, ITERATION_INSERT
+from agents.logging_utils import log_manager
+from agents import db
+import asyncio, base64, hmac, json, os, socket, socketserver, threading
+
+# Shared secret workers present when connecting; generated by WorkerPool when unset
+TOKEN_ENV = 'BABYAGI_BUS_TOKEN'
+
+# The only statements a worker can have the broker's DBWriter run, by id: clients send the id, never SQL
+STATEMENTS = {
+    'agent_running': AGENT_RUNNING,
+    'agent_tasks': AGENT_TASKS,
+    'agent_task_index': AGENT_TASK_INDEX,
+    'agent_completed': AGENT_COMPLETED,
+    'agent_stopped': AGENT_STOPPED,
+    'agent_failed': AGENT_FAILED,
+    'iteration': ITERATION_INSERT,
+    'prompt_blob': db.BLOB_INSERT,
+}
+_STATEMENT_IDS = {sql: statement for statement, sql in STATEMENTS.items()}
+
+
+def parse_address(address):
+    """'unix:/path/bus.sock' or 'tcp://host:port' -> (socket family, address)."""
+    if address.startswith('unix:'):
+        return socket.AF_UNIX, address[len('unix:'):]
+    if address.startswith('tcp://'):
+        host, _, port = address[len('tcp://'):].rpartition(':')
+        return socket.AF_INET, (host or '127.0.0.1', int(port))
+    raise ValueError(f"Bus address must be unix:PATH or tcp://HOST:PORT, got {address!r}")
+
+
+class _BrokerHandler(socketserver.StreamRequestHandler):
+    # One thread per client connection; requests and replies are JSON lines
+
+    def handle(self):
+        broker = self.server.broker
+        hello = self._read()
+        if hello is None or hello.get('op') != 'hello' or not hmac.compare_digest(str(hello.get('token', '')), broker.token):
+            self._reply({'error': 'authentication failed'})
+            return
+        self._reply({'ok': True})
+        while True:
+            request = self._read()
+            if request is None:
+                return
+            try:
+                reply = {'ok': broker.handle(request)}
+            except Exception as e:
+                reply = {'error': f"{type(e).__name__}: {e}"}
+            self._reply(reply)
+
+    def _read(self):
+        line = self.rfile.readline()
+        return json.loads(line) if line else None
+
+    def _reply(self, reply):
+        # Bus messages are Message mappings
+        self.wfile.write(json.dumps(reply, default=dict).encode() + b"\n")
+
+
+class _TCPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class _UnixServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+
+class BusBroker:
+    """
+    Serves an in-process MessageBus to other processes over a TCP or Unix socket.
+
+    The broker owns the bus: sequence numbers, per-recipient queues and
+    consumer cursors all live here, so `SocketMessageBus` clients get the
+    same send / receive / broadcast / wait semantics as threads sharing the
+    bus directly (the manager keeps using it in-process). Clients must
+    present `token` first. Rows submitted with `db_submit` go to this
+    process's DBWriter, so workers on other hosts need no database; they
+    name one of `STATEMENTS` by id, and the broker rejects anything else.
+    """
+
+    def __init__(self, bus, address, token):
+        self.bus = bus
+        self.token = token
+        family, addr = parse_address(address)
+        if family == socket.AF_UNIX:
+            if os.path.exists(addr):
+                os.unlink(addr)
+            self.server = _UnixServer(addr, _BrokerHandler)
+            self.address = f"unix:{addr}"
+        else:
+            self.server = _TCPServer(addr, _BrokerHandler)
+            self.address = f"tcp://{addr[0]}:{self.server.server_address[1]}"
+        self.server.broker = self
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, name="bus-broker", daemon=True)
+        self._thread.start()
+        return self
+
+    def handle(self, request):
+        op = request['op']
+        if op == 'send':
+            return self.bus.send(request['sender'], request['recipient'], request['content'], request.get('kind', 'message'), request.get('task'))
+        if op == 'receive':
+            return self.bus.receive(request['recipient'], request.get('since'), request.get('consumer'))
+        if op == 'wait':
+            return self.bus.wait(request['recipient'], request.get('timeout'), request.get('consumer'))
+        if op == 'wake':
+            return self.bus.wake()
+        if op == 'register':
+            return self.bus.register(request['recipient'], request.get('consumer'))
+        if op == 'messages':
+            return self.bus.messages
+        if op == 'db_submit':
+            # Checked as a whole first, so a batch with an unknown statement writes nothing
+            rows = [(STATEMENTS.get(statement), params) for statement, params in request['rows']]
+            for (sql, _), (statement, _) in zip(rows, request['rows']):
+                if sql is None:
+                    raise ValueError(f"statement {statement!r} is not allowed")
+            writer = db.get_writer()
+            for sql, params in rows:
+                writer.submit(sql, [base64.b64decode(p['bytes']) if isinstance(p, dict) else p for p in params])
+            return len(rows)
+        if op == 'db_flush':
+            return db.get_writer().flush(request.get('timeout'))
+        raise ValueError(f"unknown op {op!r}")
+
+    def shutdown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        # Release clients blocked in wait
+        self.bus.wake()
+        family, addr = parse_address(self.address)
+        if family == socket.AF_UNIX and os.path.exists(addr):
+            os.unlink(addr)
+
+
+class SocketMessageBus:
+    """
+    MessageBus client for agents in another process or on another host.
+
+    Same methods and semantics as MessageBus, served by a BusBroker. Each
+    thread gets its own connection, so a thread blocked in `wait` does not
+    hold up the others.
+    """
+
+    BROADCAST = MessageBus.BROADCAST
+
+    def __init__(self, address, token=None):
+        self.address = address
+        self.token = token if token is not None else os.environ.get(TOKEN_ENV, '')
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+
+    @property
+    def messages(self):
+        return self._call({'op': 'messages'})
+
+    def send(self, sender, recipient, content, kind='message', task=None):
+        return self._call({'op': 'send', 'sender': sender, 'recipient': recipient, 'content': content, 'kind': kind, 'task': task})
+
+    def receive(self, recipient, since=None, consumer=None):
+        return self._call({'op': 'receive', 'recipient': recipient, 'since': since, 'consumer': consumer})
+
+    def wait(self, recipient, timeout=None, consumer=None):
+        return self._call({'op': 'wait', 'recipient': recipient, 'timeout': timeout, 'consumer': consumer})
+
+    async def wait_async(self, recipient, timeout=None, consumer=None):
+        # Blocks a thread of the loop's default executor, which has its own connection
+        return await asyncio.get_running_loop().run_in_executor(None, self.wait, recipient, timeout, consumer)
+
+    def wake(self):
+        self._call({'op': 'wake'})
+
+    def register(self, recipient, consumer=None):
+        self._call({'op': 'register', 'recipient': recipient, 'consumer': consumer})
+
+    def close(self):
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for sock, stream in connections:
+            stream.close()
+            sock.close()
+
+    def _call(self, request):
+        stream = self._connection()
+        stream.write(json.dumps(request).encode() + b"\n")
+        stream.flush()
+        line = stream.readline()
+        if not line:
+            raise ConnectionError(f"Message bus broker at {self.address} closed the connection")
+        reply = json.loads(line)
+        if 'error' in reply:
+            raise RuntimeError(f"Message bus broker: {reply['error']}")
+        return reply['ok']
+
+    def _connection(self):
+        stream = getattr(self._local, 'stream', None)
+        if stream is None:
+            family, addr = parse_address(self.address)
+            sock = socket.socket(family, socket.SOCK_STREAM)
+            sock.connect(addr)
+            if family == socket.AF_INET:
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            stream = sock.makefile('rwb')
+            self._local.stream = stream
+            with self._lock:
+                self._connections.append((sock, stream))
+            self._call({'op': 'hello', 'token': self.token})
+        return stream
+
+
+class RemoteDBWriter:
+    """
+    DBWriter stand-in for worker processes: rows are forwarded to the
+    broker's DBWriter in the manager process. Install with db.set_writer().
+
+    `submit` only buffers the row, as its statement id from `STATEMENTS`
+    (any other SQL raises ValueError). A background thread sends the
+    buffer in one `db_submit` every `flush_interval` seconds, or as soon
+    as `batch_size` rows are waiting, so agents do not wait on a network
+    round trip per row. `flush` sends what is buffered and waits for the
+    manager's writer to commit it. If the broker cannot be reached, the
+    rows are logged as lost: the manager is gone, so they cannot be saved.
+    """
+
+    def __init__(self, bus, batch_size=500, flush_interval=0.2):
+        self.bus = bus
+        self.path = db.DB_PATH
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.rows_written = 0
+        self._rows = []
+        self._cond = threading.Condition()
+        self._send_lock = threading.Lock()  # batches leave in submission order
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="remote-db-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, sql, params):
+        statement = _STATEMENT_IDS.get(sql)
+        if statement is None:
+            raise ValueError(f"Workers cannot forward this statement to the manager: {sql!r}")
+        # BLOB parameters (compressed prompt messages) travel as base64
+        params = [{'bytes': base64.b64encode(p).decode()} if isinstance(p, bytes) else p for p in params]
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("RemoteDBWriter is closed")
+            self._rows.append([statement, params])
+            if len(self._rows) >= self.batch_size:
+                self._cond.notify()
+
+    def flush(self, timeout=None):
+        self._send()
+        return self.bus._call({'op': 'db_flush', 'timeout': timeout})
+
+    def close(self):
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify()
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._closed and len(self._rows) < self.batch_size:
+                    self._cond.wait(self.flush_interval)
+                closed = self._closed
+            self._send()
+            if closed:
+                return
+
+    def _send(self):
+        with self._send_lock:
+            with self._cond:
+                rows, self._rows = self._rows, []
+            if not rows:
+                return
+            try:
+                self.bus._call({'op': 'db_submit', 'rows': rows})
+                self.rows_written += len(rows)
+            except (ConnectionError, OSError) as e:
+                log_manager(f"Lost {len(rows)} DB row(s): message bus broker unreachable ({e})", level="WARNING", prefix="[WORKER] ")
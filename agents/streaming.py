@@ -0,0 +1,134 @@
+# agents/streaming.py
+import json, time
+from agents.tokens import usage
+
+
+def _field(obj, name):
+    # Chunks are ollama pydantic objects, or plain dicts from other backends
+    if isinstance(obj, dict):
+        return obj.get(name)
+    return getattr(obj, name, None)
+
+
+class StreamCollector:
+    """
+    Assembles a streamed chat response while forwarding it as it arrives.
+
+    Text is sent over the bus to the manager as 'chunk' messages (at most
+    every `flush_interval` seconds or at a newline), so the manager sees
+    progress during long generations. Once the response has an
+    '@recipient:' prefix the recipient is known, and later chunks go to it as
+    well. With `verbose`, complete lines are logged as they arrive.
+    `feed` returns True when a `task_completed` tool call shows up, or
+    when the agent is cancelled (stopped, or its task approved by the
+    manager), so the caller can close the stream without waiting for the rest.
+    """
+
+    def __init__(self, agent, flush_interval=0.25):
+        self.agent = agent
+        self.flush_interval = flush_interval
+        self.role = 'assistant'
+        self.parts = []
+        self.tool_calls = []
+        self.chunks = 0
+        self.first_token_at = None
+        self.eval_count = None
+        self.eval_duration = None
+        self.usage = {}
+        self.recipient = None
+        self.completed = False
+        self.cancelled = False
+        self._prefix_done = False
+        self._pending = ''
+        self._line = ''
+        # First text is forwarded immediately, then at most every flush_interval
+        self._last_flush = 0.0
+
+    def feed(self, chunk):
+        """Take one chunk. Returns True once generation can stop early."""
+        if self.agent.cancelled():
+            self.cancelled = True
+            return True
+        message = _field(chunk, 'message') or {}
+        self.role = _field(message, 'role') or self.role
+        text = _field(message, 'content') or ''
+        if text:
+            if self.first_token_at is None:
+                self.first_token_at = time.monotonic()
+            self.chunks += 1
+            self.parts.append(text)
+            self._pending += text
+            if not self._prefix_done:
+                self._detect_directive()
+            if '\n' in text or time.monotonic() - self._last_flush >= self.flush_interval:
+                self.flush()
+        for call in _field(message, 'tool_calls') or ():
+            function = _field(call, 'function') or {}
+            name = _field(function, 'name')
+            args = _field(function, 'arguments') or {}
+            self.tool_calls.append({'id': _field(call, 'id'), 'function': {'name': name, 'arguments': args if isinstance(args, str) else json.dumps(args)}})
+            if name == 'task_completed':
+                self.completed = True
+        if _field(chunk, 'done'):
+            self.usage = usage(chunk)
+            self.eval_count = self.usage.get('eval_count')
+            self.eval_duration = self.usage.get('eval_duration')
+        return self.completed
+
+    def flush(self):
+        """Forward text received since the last flush."""
+        self._last_flush = time.monotonic()
+        if not self._pending:
+            return
+        agent = self.agent
+        agent.bus.send(agent.name, "manager", self._pending, kind='chunk')
+        if self.recipient and self.recipient != "manager":
+            agent.bus.send(agent.name, self.recipient, self._pending, kind='chunk')
+        if agent.verbose:
+            *lines, self._line = (self._line + self._pending).split('\n')
+            for line in lines:
+                agent.log(f"{agent.colors.OKCYAN}{line}{agent.colors.ENDC}")
+        self._pending = ''
+
+    def finish(self, call_info):
+        """
+        Flush what is left and return the assembled response, in the same
+        shape as a non-streamed one (with Ollama's usage counts if the
+        stream ran to the end). Records 'tokens_per_second' (and
+        'aborted' if stopped early, 'cancelled' if on the manager's command)
+        in `call_info`.
+        """
+        self.flush()
+        if self._line and self.agent.verbose:
+            self.agent.log(f"{self.agent.colors.OKCYAN}{self._line}{self.agent.colors.ENDC}")
+        self._line = ''
+        if self.eval_count and self.eval_duration:
+            # Server-side counts (nanoseconds), when the stream ran to the end
+            call_info['tokens_per_second'] = self.eval_count / (self.eval_duration / 1e9)
+        elif self.first_token_at is not None:
+            elapsed = time.monotonic() - self.first_token_at
+            call_info['tokens_per_second'] = self.chunks / elapsed if elapsed > 0 else None
+        if self.completed or self.cancelled:
+            call_info['aborted'] = True
+        if self.cancelled:
+            call_info['cancelled'] = True
+            self.agent.count('streams_aborted')
+        message = {'role': self.role, 'content': ''.join(self.parts)}
+        if self.tool_calls:
+            message['tool_calls'] = self.tool_calls
+        return dict(self.usage, message=message)
+
+    def _detect_directive(self):
+        # Same rule as Agent.relay_directive: '@recipient:' at the start
+        text = ''.join(self.parts).lstrip()
+        if not text:
+            return
+        if not text.startswith('@'):
+            self._prefix_done = True
+            return
+        colon = text.find(':')
+        if colon > 1:
+            self._prefix_done = True
+            self.recipient = text[1:colon].strip()
+            if self.agent.verbose:
+                self.agent.log(f"{self.agent.colors.OKGREEN}Streaming message to {self.recipient}...{self.agent.colors.ENDC}")
@@ -0,0 +1,150 @@
+# agents/tokens.py
+import collections, json, re, threading
+
+ENCODING_NAME = 'cl100k_base'
+
+_encoding = None
+_encoding_lock = threading.Lock()
+_encoding_failed = False
+_WORDS = re.compile(r"\w+|[^\w\s]")
+
+
+def _get_encoding():
+    global _encoding, _encoding_failed
+    if _encoding is None and not _encoding_failed:
+        with _encoding_lock:
+            if _encoding is None and not _encoding_failed:
+                try:
+                    import tiktoken
+                    _encoding = tiktoken.get_encoding(ENCODING_NAME)
+                except Exception:
+                    # Not installed, or the BPE file cannot be downloaded (offline)
+                    _encoding_failed = True
+    return _encoding
+
+
+def count_tokens(text):
+    """
+    Token count of `text` with tiktoken's cl100k_base. Ollama models use
+    their own tokenizers, so this is an estimate; without tiktoken it falls
+    back to counting words and punctuation.
+    """
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return len(_WORDS.findall(text))
+
+
+def count_message_tokens(message):
+    # Content (and any tool calls) plus a few tokens of per-message chat-template overhead
+    calls = message.get('tool_calls')
+    return count_tokens(message.get('content') or '') + (count_tokens(json.dumps(calls, default=str)) if calls else 0) + 4
+
+
+USAGE_FIELDS = ('prompt_eval_count', 'prompt_eval_duration', 'eval_count', 'eval_duration')
+
+
+def usage(response):
+    """Ollama's token counts and durations (ns) from a chat response, for the fields present."""
+    found = {}
+    for field in USAGE_FIELDS:
+        value = response.get(field) if isinstance(response, dict) else getattr(response, field, None)
+        if value is not None:
+            found[field] = value
+    return found
+
+
+def message_text(response):
+    """Assistant text of a chat response or stream chunk."""
+    message = response.get('message') if isinstance(response, dict) else getattr(response, 'message', None)
+    if message is None:
+        return ''
+    content = message.get('content') if isinstance(message, dict) else getattr(message, 'content', None)
+    return content or ''
+
+
+def account(messages, response, cached=False):
+    """
+    Token usage of one chat call, in the agent_iterations column names.
+
+    Uses Ollama's `prompt_eval_count` / `eval_count` and durations when the
+    response has them. Ollama counts only prompt tokens it actually
+    evaluated, so a reused prompt prefix is free. Otherwise the prompt and
+    reply are estimated with `count_tokens`. Cached responses cost nothing.
+    Durations are in seconds.
+    """
+    if cached:
+        return {'prompt_tokens': 0, 'completion_tokens': 0, 'prompt_eval_duration': 0.0, 'eval_duration': 0.0, 'token_source': 'cache'}
+    counts = usage(response)
+    if 'eval_count' in counts:
+        return {
+            # Missing when the whole prompt came from the server's cache
+            'prompt_tokens': counts.get('prompt_eval_count', 0),
+            'completion_tokens': counts['eval_count'],
+            'prompt_eval_duration': counts.get('prompt_eval_duration', 0) / 1e9,
+            'eval_duration': counts.get('eval_duration', 0) / 1e9,
+            'token_source': 'backend',
+        }
+    return {
+        'prompt_tokens': sum(count_message_tokens(m) for m in messages),
+        'completion_tokens': count_tokens(message_text(response)),
+        'prompt_eval_duration': None,
+        'eval_duration': None,
+        'token_source': 'estimate',
+    }
+
+
+class TokenLedger:
+    """Thread-safe running totals of `account` results, per client (agent) and overall."""
+
+    FIELDS = ('prompt_tokens', 'completion_tokens', 'prompt_eval_duration', 'eval_duration')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self._clients = {}  # client_id -> Counter
+
+    def add(self, client_id, usage_info):
+        with self.lock:
+            counter = self._clients.setdefault(client_id, collections.Counter())
+            counter['calls'] += 1
+            counter[usage_info['token_source']] += 1
+            for field in self.FIELDS:
+                counter[field] += usage_info.get(field) or 0
+            if usage_info['token_source'] == 'backend':
+                # Generation throughput only from calls with real eval timings
+                counter['timed_completion_tokens'] += usage_info['completion_tokens']
+
+    def export(self, prefix=''):
+        """Raw counters per client (whose id starts with `prefix`), for `merge` in another process."""
+        with self.lock:
+            return {client: dict(counter) for client, counter in self._clients.items() if str(client).startswith(prefix)}
+
+    def merge(self, exported):
+        """Add counters from another ledger's `export` (agents/worker_pool.py: workers' ledgers)."""
+        with self.lock:
+            for client_id, counts in exported.items():
+                self._clients.setdefault(client_id, collections.Counter()).update(counts)
+
+    def by_client(self):
+        with self.lock:
+            return {client: _summary(counter) for client, counter in self._clients.items()}
+
+    def totals(self, *others, prefix=''):
+        """Totals over every client (whose id starts with `prefix`), optionally merged with other ledgers."""
+        total = collections.Counter()
+        for ledger in (self,) + others:
+            with ledger.lock:
+                for client_id, counter in ledger._clients.items():
+                    if str(client_id).startswith(prefix):
+                        total.update(counter)
+        return _summary(total)
+
+
+def _summary(counter):
+    summary = {key: counter.get(key, 0) for key in ('calls', 'backend', 'estimate', 'cache') + TokenLedger.FIELDS}
+    summary['total_tokens'] = summary['prompt_tokens'] + summary['completion_tokens']
+    eval_seconds = counter.get('eval_duration', 0)
+    summary['tokens_per_second'] = counter.get('timed_completion_tokens', 0) / eval_seconds if eval_seconds else None
+    return summary
@@ -0,0 +1,369 @@
+# agents/tools.py
+from agents.config import TOOL_WORKERS, TOOL_TIMEOUT, TOOL_MEMORY_MB, TOOL_MAX_RESULT_CHARS, TOOL_MAX_ROUNDS
+import ast, asyncio, concurrent.futures, contextlib, io, json, multiprocessing, queue, threading, time
+
+# Handled by the agent itself: ends the task, nothing to execute
+TASK_COMPLETED = 'task_completed'
+# Adds a tool to the registry; runs in the agent's process, before the other calls of the same response
+CREATE_TOOL = 'create_or_update_tool'
+
+BUILTIN_TOOLS = {
+    TASK_COMPLETED: {
+        'description': "Call this when the task is fully done.",
+        'parameters': {'type': 'object', 'properties': {}},
+    },
+    CREATE_TOOL: {
+        'description': ("Create or update a tool: a Python function that later calls can use. `code` must define a "
+                        "function named `name`; its return value (or printed output) is the tool's result."),
+        'parameters': {
+            'type': 'object',
+            'properties': {
+                'name': {'type': 'string', 'description': "Function name"},
+                'code': {'type': 'string', 'description': "Python source defining the function"},
+                'description': {'type': 'string', 'description': "What the tool does"},
+                'parameters': {'type': 'object', 'description': "JSON schema of the function's keyword arguments"},
+            },
+            'required': ['name', 'code', 'description'],
+        },
+    },
+}
+
+
+def parse_arguments(arguments):
+    """Tool call arguments as a dict (backends give a dict or a JSON string)."""
+    if isinstance(arguments, str):
+        arguments = json.loads(arguments or '{}')
+    return dict(arguments or {})
+
+
+def conversation_calls(tool_calls, ids):
+    """
+    A response's tool calls as kept in the conversation: arguments as a
+    dict, and an 'id' (the next of `ids` when the backend gave none) that
+    the tool result messages refer to.
+    """
+    calls = []
+    for call in tool_calls:
+        function = call['function']
+        try:
+            arguments = parse_arguments(function.get('arguments'))
+        except ValueError:
+            arguments = {}
+        calls.append({'id': call.get('id') or f"call_{next(ids)}", 'function': {'name': function['name'], 'arguments': arguments}})
+    return calls
+
+
+def merge_call_info(call_info, followup):
+    """Add a follow-up LLM call's usage (tokens, queue wait, attempts) to the iteration's `call_info`."""
+    for key in ('prompt_tokens', 'completion_tokens', 'prompt_eval_duration', 'eval_duration', 'queue_wait', 'attempts'):
+        if followup.get(key) is not None:
+            call_info[key] = (call_info.get(key) or 0) + followup[key]
+    call_info['llm_calls'] = call_info.get('llm_calls', 1) + 1
+
+
+class ToolRegistry:
+    """
+    Tools the agents can call: the built-ins above plus Python functions
+    created at run time with `create_or_update_tool`, shared by every
+    agent using the registry.
+    """
+
+    def __init__(self):
+        self.tools = {}  # name -> {'description', 'parameters', 'code'}
+        self.lock = threading.Lock()
+
+    def register(self, name, code, description='', parameters=None):
+        """Add or replace a tool. Raises ValueError if `code` does not define a function `name`."""
+        if not name.isidentifier() or name in BUILTIN_TOOLS:
+            raise ValueError(f"invalid tool name {name!r}")
+        try:
+            tree = ast.parse(code)
+        except SyntaxError as e:
+            raise ValueError(f"syntax error in tool code: {e}") from None
+        if not any(isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)) and node.name == name for node in tree.body):
+            raise ValueError(f"tool code does not define a function named {name!r}")
+        with self.lock:
+            self.tools[name] = {'description': description, 'parameters': parameters or {'type': 'object', 'properties': {}}, 'code': code}
+
+    def get(self, name):
+        with self.lock:
+            return self.tools.get(name)
+
+    def schemas(self):
+        """Tool definitions for the chat request's `tools`."""
+        with self.lock:
+            tools = dict(BUILTIN_TOOLS, **{name: tool for name, tool in self.tools.items()})
+        return [{'type': 'function', 'function': {'name': name, 'description': tool['description'], 'parameters': tool['parameters']}}
+                for name, tool in tools.items()]
+
+
+def _worker(conn, memory_mb, max_result_chars):
+    # Runs in a tool process: receives (code, name, arguments), replies with a result dict
+    if memory_mb:
+        try:
+            import resource
+            limit = memory_mb * 1024 * 1024
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+        except (ImportError, ValueError, OSError):
+            pass
+    functions = {}  # code -> function, so a tool's module body runs once per process
+    while True:
+        try:
+            request = conn.recv()
+        except EOFError:
+            return
+        if request is None:
+            return
+        code, name, arguments = request
+        output = io.StringIO()
+        try:
+            function = functions.get(code)
+            if function is None:
+                namespace = {'__name__': f"tool_{name}"}
+                exec(compile(code, f"<tool {name}>", 'exec'), namespace)
+                function = functions[code] = namespace[name]
+            with contextlib.redirect_stdout(output):
+                result = function(**arguments)
+            if result is None:
+                result = output.getvalue()
+            elif not isinstance(result, str):
+                try:
+                    result = json.dumps(result, default=str)
+                except (TypeError, ValueError):
+                    result = repr(result)
+            reply = {'ok': True, 'content': result}
+        except BaseException as e:
+            reply = {'ok': False, 'content': f"{type(e).__name__}: {e}" if str(e) else type(e).__name__}
+        content = reply['content']
+        if len(content) > max_result_chars:
+            # Capped here, so a huge result is never pickled back
+            reply['truncated'] = len(content) - max_result_chars
+            reply['content'] = f"{content[:max_result_chars]}... [{reply['truncated']} more characters]"
+        try:
+            conn.send(reply)
+        except (BrokenPipeError, OSError):
+            return
+
+
+class _ToolProcess:
+    __slots__ = ('process', 'conn')
+
+    def __init__(self, context, memory_mb, max_result_chars):
+        self.conn, child = context.Pipe()
+        self.process = context.Process(target=_worker, args=(child, memory_mb, max_result_chars), name="tool-worker", daemon=True)
+        self.process.start()
+        child.close()
+
+    def kill(self):
+        self.process.kill()
+        self.process.join(timeout=5)
+        self.conn.close()
+
+
+class ToolPool:
+    """
+    Bounded set of processes that run tool code, isolated from the agents.
+
+    At most `workers` calls run at once; further calls wait for a free
+    process. Each call has a `timeout` in seconds: a call that overruns has
+    its process killed (and replaced on demand). Processes are capped at
+    `memory_mb` of address space where the OS supports it, and results
+    longer than `max_result_chars` are truncated in the tool process. This
+    contains hangs, crashes and runaway memory; it is not a security
+    boundary, since tool code runs with the user's permissions.
+    """
+
+    def __init__(self, workers=TOOL_WORKERS, timeout=TOOL_TIMEOUT, memory_mb=TOOL_MEMORY_MB, max_result_chars=TOOL_MAX_RESULT_CHARS):
+        self.workers = workers
+        self.timeout = timeout
+        self.memory_mb = memory_mb
+        self.max_result_chars = max_result_chars
+        # spawn: forking a process with live agent threads could copy held locks
+        self._context = multiprocessing.get_context('spawn')
+        self._idle = queue.SimpleQueue()
+        self._threads = concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix="tool-call")
+        self._all = set()
+        self._lock = threading.Lock()
+        self._closed = False
+        self._counts = {'calls': 0, 'errors': 0, 'timeouts': 0, 'crashes': 0, 'truncated': 0, 'spawned': 0}
+        self._durations = []
+
+    @property
+    def spec(self):
+        """Constructor arguments, for building the same pool in a worker process."""
+        return {'workers': self.workers, 'timeout': self.timeout, 'memory_mb': self.memory_mb, 'max_result_chars': self.max_result_chars}
+
+    def submit(self, code, name, arguments, timeout=None):
+        """Run `name(**arguments)` from `code` in a tool process. Returns a Future of the result dict."""
+        return self._threads.submit(self._run, code, name, arguments, timeout or self.timeout)
+
+    def run(self, code, name, arguments, timeout=None):
+        """
+        Blocking `submit`: {'name', 'ok', 'content', 'duration'} plus 'truncated'
+        (characters cut), 'timeout' or 'crashed' when they apply.
+        """
+        return self.submit(code, name, arguments, timeout).result()
+
+    def _run(self, code, name, arguments, timeout):
+        # One pool thread per process, so a free process is always at hand
+        proc = self._checkout()
+        t0 = time.perf_counter()
+        try:
+            proc.conn.send((code, name, arguments))
+            if proc.conn.poll(timeout):
+                reply = proc.conn.recv()
+                self._idle.put(proc)
+            else:
+                self._discard(proc)
+                reply = {'ok': False, 'content': f"tool {name} timed out after {timeout:g}s", 'timeout': True}
+        except (EOFError, OSError):
+            # Killed by the memory limit, a signal, or os._exit in the tool
+            self._discard(proc)
+            reply = {'ok': False, 'content': f"tool {name} crashed (exit code {proc.process.exitcode})", 'crashed': True}
+        reply['name'] = name
+        reply['duration'] = time.perf_counter() - t0
+        self._record(reply)
+        return reply
+
+    def _checkout(self):
+        try:
+            proc = self._idle.get_nowait()
+            if proc.process.is_alive():
+                return proc
+            self._discard(proc)
+        except queue.Empty:
+            pass
+        proc = _ToolProcess(self._context, self.memory_mb, self.max_result_chars)
+        with self._lock:
+            self._all.add(proc)
+            self._counts['spawned'] += 1
+        return proc
+
+    def _discard(self, proc):
+        proc.kill()
+        with self._lock:
+            self._all.discard(proc)
+
+    def _record(self, reply):
+        with self._lock:
+            self._counts['calls'] += 1
+            self._counts['errors'] += not reply['ok']
+            self._counts['timeouts'] += bool(reply.get('timeout'))
+            self._counts['crashes'] += bool(reply.get('crashed'))
+            self._counts['truncated'] += bool(reply.get('truncated'))
+            self._durations.append(reply['duration'])
+            if len(self._durations) > 10000:
+                del self._durations[:5000]
+
+    def stats(self):
+        """Call counts (calls, errors, timeouts, crashes, truncated, spawned) and duration p50 / p95 / max in seconds."""
+        with self._lock:
+            durations = sorted(self._durations)
+            stats = dict(self._counts)
+        for label, q in (('duration_p50', 0.5), ('duration_p95', 0.95)):
+            stats[label] = durations[min(len(durations) - 1, int(q * len(durations)))] if durations else 0.0
+        stats['duration_max'] = durations[-1] if durations else 0.0
+        return stats
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._threads.shutdown(wait=True, cancel_futures=True)
+        with self._lock:
+            procs, self._all = list(self._all), set()
+        for proc in procs:
+            try:
+                proc.conn.send(None)
+            except OSError:
+                pass
+            proc.process.join(timeout=1)
+            if proc.process.is_alive():
+                proc.kill()
+
+
+class ToolExecutor:
+    """
+    Executes the tool calls of one LLM response for an agent.
+
+    `create_or_update_tool` calls run first, in order, so the other calls
+    of the same response can use the tools they define. The remaining calls
+    are independent of each other and run concurrently on the ToolPool.
+    Unknown tools and bad arguments become error results rather than
+    exceptions, so the model sees what went wrong. Results come back in
+    call order as {'name', 'ok', 'content', 'duration', ...}.
+
+    `max_rounds` bounds the follow-up LLM calls an agent makes with tool
+    results within one iteration (see Agent.run_tools).
+    """
+
+    def __init__(self, pool=None, registry=None, max_rounds=TOOL_MAX_ROUNDS):
+        self.pool = pool if pool is not None else ToolPool()
+        self.registry = registry if registry is not None else ToolRegistry()
+        self.max_rounds = max_rounds
+
+    @property
+    def spec(self):
+        """Settings for `from_spec`, to build the same executor in a worker process (tools created so far are not included)."""
+        return {'pool': self.pool.spec, 'max_rounds': self.max_rounds}
+
+    @classmethod
+    def from_spec(cls, spec):
+        return cls(ToolPool(**spec['pool']), max_rounds=spec['max_rounds'])
+
+    def schemas(self):
+        return self.registry.schemas()
+
+    def execute(self, calls):
+        return [f.result() if isinstance(f, concurrent.futures.Future) else f for f in self._start(calls)]
+
+    async def aexecute(self, calls):
+        started = self._start(calls)
+        pending = [asyncio.wrap_future(f) for f in started if isinstance(f, concurrent.futures.Future)]
+        done = iter(await asyncio.gather(*pending))
+        return [next(done) if isinstance(f, concurrent.futures.Future) else f for f in started]
+
+    def _start(self, calls):
+        # Result dicts for calls settled here, Futures for calls sent to the pool; creations first
+        settled = {}
+        for i, call in enumerate(calls):
+            if call['function']['name'] == CREATE_TOOL:
+                settled[i] = self._create(call)
+        started = []
+        for i, call in enumerate(calls):
+            if i in settled:
+                started.append(settled[i])
+                continue
+            name = call['function']['name']
+            tool = self.registry.get(name)
+            try:
+                arguments = parse_arguments(call['function'].get('arguments'))
+            except ValueError as e:
+                started.append(self._error(name, f"arguments are not valid JSON: {e}"))
+                continue
+            if tool is None:
+                started.append(self._error(name, f"unknown tool {name!r}"))
+                continue
+            started.append(self.pool.submit(tool['code'], name, arguments))
+        return started
+
+    def _create(self, call):
+        t0 = time.perf_counter()
+        try:
+            arguments = parse_arguments(call['function'].get('arguments'))
+            self.registry.register(arguments.get('name', ''), arguments.get('code', ''), arguments.get('description', ''), arguments.get('parameters'))
+            result = {'name': CREATE_TOOL, 'ok': True, 'content': f"Tool {arguments['name']} created."}
+        except (ValueError, TypeError) as e:
+            result = self._error(CREATE_TOOL, str(e))
+        result['duration'] = time.perf_counter() - t0
+        return result
+
+    @staticmethod
+    def _error(name, message):
+        return {'name': name, 'ok': False, 'content': f"Error: {message}", 'duration': 0.0}
+
+    def stats(self):
+        return dict(self.pool.stats(), tools=len(self.registry.tools))
+
+    def close(self):
+        self.pool.close()
@@ -0,0 +1,232 @@
+# agents/worker.py
+from agents.socket_bus import SocketMessageBus, RemoteDBWriter, TOKEN_ENV
+from agents.agent_service import AgentService, AsyncAgentService
+from agents.llm_gateway import LLMGateway
+from agents.backends import BACKENDS, make_backend, async_backend
+from agents.tools import ToolExecutor
+from agents.control import AgentControls
+from agents.logging_utils import log_manager, configure_logging
+from agents.config import Colors, AGENT_COLORS, AGENT_EMOJIS, LLM_INITIAL_CONCURRENCY, LLM_BACKEND, LOG_LEVEL
+from agents import db
+import argparse, asyncio, json, os, socket, threading
+
+# Control messages between the WorkerPool and its workers travel on the bus as kind='control'
+CONTROL_KIND = 'control'
+# Recipient of worker -> manager control messages
+WORKERS = 'workers'
+
+
+def control_recipient(worker_id):
+    return f"worker:{worker_id}"
+
+
+class WorkerAgentService(AgentService):
+    """AgentService whose agents report their exit to the WorkerPool."""
+
+    def __init__(self, worker, **kwargs):
+        super().__init__(**kwargs)
+        self.worker = worker
+
+    def _run_agent(self, agent):
+        error = None
+        try:
+            super()._run_agent(agent)
+        except Exception as e:
+            error = str(e)
+            raise
+        finally:
+            self.worker.agent_exited(agent, error)
+
+
+class AsyncWorkerAgentService(AsyncAgentService):
+    def __init__(self, worker, **kwargs):
+        super().__init__(**kwargs)
+        self.worker = worker
+
+    async def _arun_agent(self, agent):
+        error = None
+        try:
+            await super()._arun_agent(agent)
+        except Exception as e:
+            error = str(e)
+            raise
+        finally:
+            self.worker.agent_exited(agent, error)
+
+
+class AgentWorker:
+    """
+    Hosts agents for a Manager in another process, or on another host.
+
+    Connects to the manager's BusBroker, announces itself on the 'workers'
+    channel and waits for commands on its own `worker:<id>` channel:
+    'start' runs the given agents (as threads, or asyncio tasks with
+    async_mode) against a SocketMessageBus, 'stop' asks them to stop after
+    their current iteration, 'control' passes an advance / stop / pause /
+    resume command to one agent's AgentControl, 'shutdown' exits. The agents talk to the LLM
+    through this process's own LLMGateway, and their DB rows are forwarded
+    to the manager's writer. Each agent's exit, and the end of the run with
+    the gateway's stats, are reported back on the 'workers' channel.
+    """
+
+    def __init__(self, address, worker_id=None, token=None, ollama=None):
+        self.bus = SocketMessageBus(address, token)
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        # Without a backend of its own, the worker builds the manager's (see _backend)
+        self.ollama = ollama
+        self._own_backend = ollama is not None
+        self._backend_spec = None
+        self.tools = None
+        self.stop_event = threading.Event()
+        self.controls = AgentControls()
+        self.gateway = None
+        self.run_id = None
+        self._run_thread = None
+
+    def serve(self):
+        db.set_writer(RemoteDBWriter(self.bus))
+        recipient = control_recipient(self.worker_id)
+        self._report('hello', host=socket.gethostname(), pid=os.getpid())
+        log_manager(f"Worker {self.worker_id} connected to {self.bus.address}", level="INFO", prefix="[WORKER] ")
+        try:
+            while True:
+                self.bus.wait(recipient)
+                for msg in self.bus.receive(recipient):
+                    # The channel also gets the agents' broadcasts; only the manager's commands matter here
+                    if msg.get('kind') != CONTROL_KIND:
+                        continue
+                    command = json.loads(msg['content'])
+                    if command['op'] == 'start':
+                        # Ready before the thread starts, so commands right after 'start' reach the agents
+                        self.stop_event = threading.Event()
+                        self.controls = AgentControls()
+                        self._run_thread = threading.Thread(target=self._run, args=(command,), name=f"run-{command['run']}", daemon=True)
+                        self._run_thread.start()
+                    elif command['op'] == 'stop':
+                        self.stop_event.set()
+                        self.controls.stop()
+                    elif command['op'] == 'control':
+                        self.controls.apply(command['agent'], command['action'], tasks=command.get('tasks'))
+                    elif command['op'] == 'shutdown':
+                        return
+        except (ConnectionError, OSError):
+            # Manager gone: stop the agents; their rows can no longer be saved anyway
+            self.stop_event.set()
+            self.controls.stop()
+        finally:
+            if self._run_thread is not None:
+                self._run_thread.join(timeout=30)
+            if self.tools is not None:
+                self.tools.close()
+            self.bus.close()
+
+    def _run(self, command):
+        try:
+            self._run_agents(command)
+        finally:
+            # The run's rows reach the manager's writer before it hears the run ended
+            self._flush_rows()
+            stats = self.gateway.stats() if self.gateway is not None else {}
+            tokens = self.gateway.tokens.export() if self.gateway is not None else {}
+            self._report('finished', run=self.run_id, gateway=stats, tokens=tokens, control=self.controls.stats())
+
+    def _run_agents(self, command):
+        config = command['config']
+        self.run_id = command['run']
+        self.gateway = None
+        kwargs = dict(
+            agent_colors=AGENT_COLORS,
+            agent_emojis=AGENT_EMOJIS,
+            model_name=config['model_name'],
+            colors=Colors,
+            bus=self.bus,
+            verbose=config['verbose'],
+            num_iterations=config['num_iterations'],
+            stop_event=self.stop_event,
+            db_agent_ids=command['db_agent_ids'],
+            stream=config['stream'],
+            context_budget=config['context_budget'],
+            client_prefix=config['client_prefix'],
+            resume=command['resume'],
+            tools=self._tools(config.get('tools')),
+            controls=self.controls,
+        )
+        tasks = [agent['tasks'] for agent in command['agents']]
+        indices = [agent['index'] for agent in command['agents']]
+        backend = self._backend(config.get('backend'))
+        if config['async_mode']:
+            asyncio.run(self._arun(backend, kwargs, config, tasks, indices))
+        else:
+            self.gateway = self._gateway(backend, config)
+            service = WorkerAgentService(self, ollama=backend, gateway=self.gateway, **kwargs)
+            _, threads = service.create_agents(tasks, indices)
+            for t in threads:
+                t.join()
+
+    async def _arun(self, backend, kwargs, config, tasks, indices):
+        client = async_backend(backend)
+        self.gateway = self._gateway(client, config)
+        service = AsyncWorkerAgentService(self, ollama=client, gateway=self.gateway, **kwargs)
+        _, agent_tasks = service.create_agents(tasks, indices)
+        await asyncio.gather(*agent_tasks, return_exceptions=True)
+
+    def _backend(self, spec):
+        # The manager's backend kind and hosts, kept across runs; a default Ollama client if it sent none
+        if self._own_backend or (self.ollama is not None and spec == self._backend_spec):
+            return self.ollama
+        self._backend_spec = spec
+        self.ollama = make_backend(**spec) if spec else make_backend()
+        return self.ollama
+
+    def _tools(self, spec):
+        # A tool pool with the manager's limits, kept across runs; tools created in one worker stay in it
+        if spec is None:
+            return None
+        if self.tools is None or self.tools.spec != spec:
+            if self.tools is not None:
+                self.tools.close()
+            self.tools = ToolExecutor.from_spec(spec)
+        return self.tools
+
+    @staticmethod
+    def _gateway(backend, config):
+        # Each worker has its own concurrency limit, up to the manager's --max-concurrency
+        return LLMGateway(backend, initial_limit=min(LLM_INITIAL_CONCURRENCY, config['max_concurrency']), max_limit=config['max_concurrency'])
+
+    @staticmethod
+    def _flush_rows():
+        # RemoteDBWriter buffers rows; send them and wait for the manager's commit
+        try:
+            db.get_writer().flush()
+        except (ConnectionError, OSError):
+            pass
+
+    def agent_exited(self, agent, error):
+        try:
+            self._flush_rows()
+            self._report('exited', run=self.run_id, agent=agent.name, error=error, tokens=self.gateway.tokens.export())
+            self.bus.wake()
+        except (ConnectionError, OSError):
+            pass
+
+    def _report(self, event, **fields):
+        self.bus.send(self.worker_id, WORKERS, json.dumps(dict(fields, event=event, worker=self.worker_id)), kind=CONTROL_KIND)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m agents.worker', description='Host agents for a manager started with --worker-procs or --remote-workers')
+    parser.add_argument('--connect', required=True, metavar='ADDRESS', help='The manager\'s bus: tcp://HOST:PORT or unix:PATH')
+    parser.add_argument('--id', default=None, help='Worker name (default: HOST-PID)')
+    parser.add_argument('--backend', default=None, choices=sorted(BACKENDS), help="LLM backend for this worker's agents (default: the manager's)")
+    parser.add_argument('--llm-host', action='append', default=None, metavar='URL', help='LLM server for this worker; repeat to balance across several (default: the manager\'s hosts)')
+    parser.add_argument('--log-level', default=LOG_LEVEL, choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'], type=str.upper)
+    args = parser.parse_args(argv)
+    if not os.environ.get(TOKEN_ENV):
+        parser.error(f"set {TOKEN_ENV} to the token the manager printed")
+    configure_logging(level=args.log_level)
+    backend = make_backend(args.backend or LLM_BACKEND, args.llm_host) if args.backend or args.llm_host else None
+    AgentWorker(args.connect, args.id, ollama=backend).serve()
+
+
+if __name__ == '__main__':
+    main()
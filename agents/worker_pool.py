@@ -0,0 +1,238 @@
+# agents/worker_pool.py
+from agents.socket_bus import BusBroker, TOKEN_ENV
+from agents.worker import CONTROL_KIND, WORKERS, control_recipient
+from agents.tokens import TokenLedger
+from agents.control import COUNTERS
+from agents.logging_utils import log_manager
+import atexit, json, os, secrets, subprocess, sys, tempfile, threading, time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class RemoteAgent:
+    """Stands in for the thread of an agent that runs in a worker process."""
+
+    def __init__(self, pool, name):
+        self.pool = pool
+        self.name = name
+
+    def is_alive(self):
+        return self.name not in self.pool.exited
+
+    def join(self, timeout=None):
+        with self.pool.cond:
+            self.pool.cond.wait_for(lambda: not self.is_alive(), timeout)
+
+
+class WorkerTokens:
+    """The workers' token ledgers as last reported, read like a TokenLedger."""
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    def totals(self, *others, prefix=''):
+        ledger = TokenLedger()
+        with self.pool.cond:
+            for exported in self.pool.token_snapshots.values():
+                ledger.merge(exported)
+        return ledger.totals(*others, prefix=prefix)
+
+
+class RemoteControls:
+    """
+    AgentControls for agents in worker processes: each command is sent to
+    the worker hosting the agent, which applies it to its own AgentControls.
+    `stats` sums the counters the workers reported at the end of the run.
+    """
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    def advance(self, name, tasks):
+        self._send(name, 'advance', tasks=tasks)
+
+    def stop(self, name=None):
+        self._send(name, 'stop')
+
+    def pause(self, name=None):
+        self._send(name, 'pause')
+
+    def resume(self, name=None):
+        self._send(name, 'resume')
+
+    def stats(self):
+        with self.pool.cond:
+            reported = list(self.pool.control_stats.values())
+        return {name: sum(counts.get(name, 0) for counts in reported) for name in COUNTERS}
+
+    def _send(self, name, action, **fields):
+        for worker in self.pool.hosting(name):
+            self.pool._command(worker, 'control', agent=name, action=action, **fields)
+
+
+def merge_gateway_stats(stats):
+    """One LLMGateway.stats()-shaped dict for several workers: counters summed, queue waits the worst worker's."""
+    merged = {'workers': len(stats)}
+    for key in ('limit', 'in_flight', 'queued', 'calls', 'retries', 'errors', 'queue_wait_total'):
+        merged[key] = sum(s.get(key, 0) for s in stats)
+    for key in ('queue_wait_p50', 'queue_wait_p95', 'queue_wait_max'):
+        merged[key] = max((s.get(key, 0.0) for s in stats), default=0.0)
+    return merged
+
+
+class WorkerPool:
+    """
+    Runs a Manager's agents in worker processes (agents/worker.py).
+
+    `start` serves the manager's MessageBus with a BusBroker on `address`
+    (a Unix socket in a temporary directory by default, or e.g.
+    tcp://0.0.0.0:7878 for workers on other hosts), spawns `procs` local
+    workers and waits until they and `remote` more have connected.
+    `start_run` spreads a run's agents round-robin over the workers and
+    returns RemoteAgent handles that the OrchestrationService watches like
+    threads. Workers report exits and token counts on the 'workers'
+    channel; `finish_run` waits for every worker to finish and returns
+    their merged gateway stats.
+    """
+
+    def __init__(self, bus, procs=0, remote=0, address=None, token=None, colors=None, connect_timeout=60):
+        self.bus = bus
+        self.procs = procs
+        self.remote = remote
+        self.address = address
+        self.token = token or os.environ.get(TOKEN_ENV) or secrets.token_hex(16)
+        self.colors = colors
+        self.connect_timeout = connect_timeout
+        self.broker = None
+        self.processes = {}  # worker id -> Popen, for the workers spawned here
+        self.workers = []    # worker ids, in connection order
+        self.cond = threading.Condition()
+        self.exited = set()  # agents of the current run that have exited
+        self.token_snapshots = {}  # worker id -> its TokenLedger.export() for the current run
+        self.tokens = WorkerTokens(self)
+        self.control_stats = {}  # worker id -> its AgentControls.stats() at the end of the current run
+        self.controls = RemoteControls(self)
+        self.run_id = None
+        self._run_workers = []
+        self._finished = {}  # worker id -> gateway stats at the end of the current run
+        self._hosted = {}    # worker id -> agent names of the current run
+        self._closed = False
+
+    def start(self):
+        address = self.address or f"unix:{os.path.join(tempfile.mkdtemp(prefix='babyagi-bus-'), 'bus.sock')}"
+        self.broker = BusBroker(self.bus, address, self.token).start()
+        threading.Thread(target=self._listen, name="worker-pool", daemon=True).start()
+        env = dict(os.environ, **{TOKEN_ENV: self.token})
+        env['PYTHONPATH'] = os.pathsep.join(p for p in (ROOT, env.get('PYTHONPATH')) if p)
+        for i in range(self.procs):
+            worker = f"worker_{i+1}"
+            self.processes[worker] = subprocess.Popen([sys.executable, '-m', 'agents.worker', '--connect', self.broker.address, '--id', worker], env=env)
+        if self.remote:
+            log_manager(f"Waiting for {self.remote} remote worker(s). On each host run:\n  {TOKEN_ENV}={self.token} python -m agents.worker --connect {self.broker.address}", colors=self.colors, level="BOLD")
+        atexit.register(self.close)
+        expected = self.procs + self.remote
+        with self.cond:
+            if not self.cond.wait_for(lambda: len(self.workers) >= expected, self.connect_timeout):
+                raise RuntimeError(f"Only {len(self.workers)} of {expected} workers connected to {self.broker.address} within {self.connect_timeout}s")
+        log_manager(f"{len(self.workers)} worker(s) connected on {self.broker.address}", colors=self.colors, level="INFO")
+        return self
+
+    def start_run(self, run_id, config, agent_subtasks, db_agent_ids, resume):
+        """Start the run's agents on the workers. Returns (agent names, RemoteAgent handles)."""
+        assignments = {worker: [] for worker in self.workers}
+        names = []
+        for idx, tasks in enumerate(agent_subtasks):
+            name = f"agent_{idx+1}"
+            if resume.get(name, {}).get('done'):
+                continue
+            assignments[self.workers[len(names) % len(self.workers)]].append({'index': idx, 'tasks': tasks})
+            names.append(name)
+        with self.cond:
+            self.run_id = run_id
+            self.exited = set()
+            self.token_snapshots = {}
+            self.control_stats = {}
+            self._finished = {}
+            self._run_workers = [worker for worker, agents in assignments.items() if agents]
+            self._hosted = {worker: [f"agent_{agent['index']+1}" for agent in assignments[worker]] for worker in self._run_workers}
+        for worker in self._run_workers:
+            agents, hosted = assignments[worker], self._hosted[worker]
+            self._command(worker, 'start', run=run_id, config=config, agents=agents,
+                          db_agent_ids={name: db_agent_ids.get(name) for name in hosted},
+                          resume={name: resume[name] for name in hosted if name in resume})
+        return names, [RemoteAgent(self, name) for name in names]
+
+    def stop(self):
+        """Ask the run's agents to stop after their current iteration."""
+        for worker in self._run_workers:
+            self._command(worker, 'stop')
+
+    def hosting(self, name=None):
+        """Workers of the current run hosting agent `name` (None: all of them)."""
+        with self.cond:
+            return [worker for worker in self._run_workers if name is None or name in self._hosted[worker]]
+
+    def finish_run(self, timeout=None):
+        """Wait for the run's workers to report their end. Returns their merged gateway stats."""
+        with self.cond:
+            self.cond.wait_for(lambda: all(worker in self._finished for worker in self._run_workers), timeout)
+            return merge_gateway_stats(list(self._finished.values()))
+
+    def close(self):
+        if self._closed or self.broker is None:
+            return
+        self._closed = True
+        for worker in self.workers:
+            self._command(worker, 'shutdown')
+        deadline = time.monotonic() + 10
+        for proc in self.processes.values():
+            try:
+                proc.wait(timeout=max(0.1, deadline - time.monotonic()))
+            except subprocess.TimeoutExpired:
+                proc.terminate()
+        self.broker.shutdown()
+
+    def _command(self, worker, op, **fields):
+        self.bus.send('manager', control_recipient(worker), json.dumps(dict(fields, op=op)), kind=CONTROL_KIND)
+
+    def _listen(self):
+        # Worker -> manager control messages: connections, agent exits, end of run
+        while not self._closed:
+            # The timeout is for noticing spawned workers that died without reporting
+            self.bus.wait(WORKERS, timeout=1.0, consumer='worker-pool')
+            exits = self._check_processes()
+            for msg in self.bus.receive(WORKERS, consumer='worker-pool'):
+                if msg.get('kind') != CONTROL_KIND:
+                    continue
+                event = json.loads(msg['content'])
+                with self.cond:
+                    if event['event'] == 'hello':
+                        if event['worker'] not in self.workers:
+                            self.workers.append(event['worker'])
+                    elif event.get('run') != self.run_id:
+                        continue
+                    elif event['event'] == 'exited':
+                        self.exited.add(event['agent'])
+                        self.token_snapshots[event['worker']] = event['tokens']
+                        exits = True
+                    elif event['event'] == 'finished':
+                        self._finished[event['worker']] = event['gateway']
+                        self.token_snapshots[event['worker']] = event['tokens']
+                        self.control_stats[event['worker']] = event.get('control', {})
+                    self.cond.notify_all()
+            if exits:
+                # Let the orchestration loop notice the exits
+                self.bus.wake()
+
+    def _check_processes(self):
+        # A spawned worker that exited mid-run takes its agents with it
+        with self.cond:
+            dead = [worker for worker in self._run_workers if worker not in self._finished
+                    and worker in self.processes and self.processes[worker].poll() is not None]
+            for worker in dead:
+                log_manager(f"Worker {worker} exited with code {self.processes[worker].returncode}; its agents are lost", colors=self.colors, level="ERROR")
+                self.exited.update(self._hosted[worker])
+                self._finished[worker] = {}
+            if dead:
+                self.cond.notify_all()
+        return bool(dead)
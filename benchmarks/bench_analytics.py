@@ -0,0 +1,115 @@
+# benchmarks/bench_analytics.py
+"""
+Run-history analytics at scale: ManagerAnalytics.query vs a Python loop.
+
+Builds a synthetic babyagi.db with --rows agent iterations (4 agents x 50
+iterations per run, 3 models, lognormal durations, 2% errors, plus one
+manager review row per agent) at schema version 0, i.e. without indexes,
+then times:
+
+    migrate       init_db bringing it to the current schema (builds indexes,
+                  moves the stored prompts to prompt_blobs)
+    python loop   fetch joined rows, group in dicts, sort each group
+    query --by    ManagerAnalytics.query for model, run and agent
+
+and checks that both give the same p95 per model. query imports numpy on
+first use; that one-time import is timed on its own line, not in the
+first query.
+
+Usage:
+    python benchmarks/bench_analytics.py [--rows 1000000] [--prompt-chars 300]
+"""
+import argparse
+import collections
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from agents import db
+from agents.manager_analytics import ManagerAnalytics
+
+MODELS = ['llama3', 'qwen3', 'gpt-oss']
+
+
+def build(path, num_rows, prompt_chars):
+    db.DB_PATH = path
+    db.init_db()
+    conn = sqlite3.connect(path)
+    # Back to an unindexed, unversioned database, like one written before migrations existed
+    for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND name LIKE 'idx_%'").fetchall():
+        conn.execute(f"DROP INDEX {name}")
+    conn.execute("PRAGMA user_version = 0")
+    rng = random.Random(0)
+    prompt = json.dumps([{"role": "system", "content": "x" * prompt_chars}])
+    agent_id = 0
+    for run_id in range(1, num_rows // 200 + 1):
+        conn.execute("INSERT INTO runs (id, task, model_name) VALUES (?, ?, ?)", (run_id, 'task', MODELS[run_id % len(MODELS)]))
+        rows = []
+        for a in range(4):
+            agent_id += 1
+            conn.execute("INSERT INTO agents (id, run_id, agent_name) VALUES (?, ?, ?)", (agent_id, run_id, f"agent_{a+1}"))
+            for iteration in range(50):
+                duration = rng.lognormvariate(0, 0.5)
+                error = 'server error' if rng.random() < 0.02 else None
+                rows.append((agent_id, iteration, prompt, 'response', duration, error, '{}', 100, 50, duration * 0.8, 'backend', 0))
+            rows.append((agent_id, 0, None, 'manager review', 0.01, None, None, None, None, None, None, None))
+        conn.executemany(
+            "INSERT INTO agent_iterations (agent_id, iteration, prompt, response, duration, error, tags, prompt_tokens, completion_tokens, eval_duration, token_source, task_index) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+    conn.commit()
+    conn.close()
+
+
+def python_loop(path):
+    # What the query would look like without SQL aggregation: every row through Python
+    conn = sqlite3.connect(path)
+    groups = collections.defaultdict(list)
+    for model, duration, error in conn.execute(
+            "SELECT r.model_name, i.duration, i.error FROM agent_iterations i JOIN agents a ON a.id = i.agent_id JOIN runs r ON r.id = a.run_id WHERE i.prompt_ids IS NOT NULL"):
+        groups[model].append((duration, error))
+    conn.close()
+    result = {}
+    for model, rows in groups.items():
+        durations = sorted(d for d, _ in rows)
+        result[model] = {'p95': durations[int(0.95 * (len(durations) - 1))], 'error_rate': sum(1 for _, e in rows if e) / len(rows)}
+    return result
+
+
+def timed(fn, *args, **kwargs):
+    t0 = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--prompt-chars', type=int, default=300, help='Size of each stored prompt')
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), 'history.db')
+    _, build_s = timed(build, path, args.rows, args.prompt_chars)
+    print(f"built {args.rows} rows in {build_s:.1f}s ({os.path.getsize(path) / 1e6:.0f} MB)")
+    _, migrate_s = timed(db.init_db)
+    print(f"{'migrate (build indexes)':<26} {migrate_s:>7.2f}s")
+    loop, loop_s = timed(python_loop, path)
+    print(f"{'python loop, by model':<26} {loop_s:>7.2f}s")
+    _, numpy_s = timed(__import__, 'numpy')
+    print(f"{'numpy import (first query)':<26} {numpy_s:>7.2f}s")
+    analytics = ManagerAnalytics(db.get_db, None)
+    for by in ('model', 'run', 'agent'):
+        results, query_s = timed(analytics.query, by=by)
+        print(f"{'query --by ' + by:<26} {query_s:>7.2f}s  ({len(results)} groups)")
+        if by == 'model':
+            same = all(abs(r['latency_p95'] - loop[r['model']]['p95']) < 1e-12 for r in results)
+    print(f"p95 per model matches the python loop: {same}")
+
+
+if __name__ == '__main__':
+    main()
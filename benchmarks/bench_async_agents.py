@@ -0,0 +1,114 @@
+# benchmarks/bench_async_agents.py
+"""
+Thread-per-agent vs asyncio agents against a local fake Ollama server.
+
+Starts benchmarks/fake_ollama.py in a subprocess, then runs each
+(mode, agent count) case in its own Python process so peak RSS and thread
+counts are not shared between cases. Every agent runs one task for
+ITERATIONS iterations; the fake server answers after LATENCY seconds.
+
+Usage:
+    python benchmarks/bench_async_agents.py [--agents 10 100 1000]
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+ITERATIONS = 2
+LATENCY = 0.05
+PORT = 11531
+
+
+def run_case(mode, num_agents, url):
+    import asyncio
+    import ollama
+    from agents import db
+    from agents.agent_service import AgentService, AsyncAgentService
+    from agents.config import Colors, AGENT_COLORS, AGENT_EMOJIS
+    from agents.message_bus import MessageBus
+    from agents.orchestration_service import OrchestrationService
+
+    db.DB_PATH = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    db.init_db()
+    bus = MessageBus()
+    stop_event = threading.Event()
+    subtasks = [[f"subtask {i}"] for i in range(num_agents)]
+    tasks_by_name = {f"agent_{i+1}": json.dumps(t) for i, t in enumerate(subtasks)}
+    peak_threads = [threading.active_count()]
+
+    def orchestration(names, handles):
+        return OrchestrationService(bus, names, 0, {n: i for i, n in enumerate(names)}, Colors, AGENT_EMOJIS, agent_threads=handles)
+
+    def args():
+        return (ITERATIONS, tasks_by_name.get, {n: None for n in tasks_by_name}, set(), db.get_db, [0])
+
+    t0 = time.perf_counter()
+    if mode == 'thread':
+        service = AgentService(AGENT_COLORS, AGENT_EMOJIS, 'fake', ollama.Client(host=url), Colors, bus, False, ITERATIONS, stop_event=stop_event)
+        names, threads = service.create_agents(subtasks)
+        peak_threads[0] = max(peak_threads[0], threading.active_count())
+        orchestration(names, threads).run_orchestration(*args())
+        for t in threads:
+            t.join()
+    else:
+        async def main():
+            service = AsyncAgentService(AGENT_COLORS, AGENT_EMOJIS, 'fake', ollama.AsyncClient(host=url), Colors, bus, False, ITERATIONS, stop_event=stop_event)
+            names, tasks = service.create_agents(subtasks)
+            peak_threads[0] = max(peak_threads[0], threading.active_count())
+            await orchestration(names, tasks).run_orchestration_async(*args())
+            await asyncio.gather(*tasks)
+        asyncio.run(main())
+    wall = time.perf_counter() - t0
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return {
+        'wall': wall,
+        'cpu': usage.ru_utime + usage.ru_stime,
+        'peak_rss_mb': usage.ru_maxrss / 1024,
+        'peak_threads': peak_threads[0],
+        'calls_per_s': num_agents * ITERATIONS / wall,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--agents', type=int, nargs='+', default=[10, 100, 1000])
+    parser.add_argument('--case', nargs=3, metavar=('MODE', 'AGENTS', 'URL'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.case:
+        mode, num_agents, url = args.case
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            result = run_case(mode, int(num_agents), url)
+        print(json.dumps(result))
+        return
+
+    server = subprocess.Popen([sys.executable, os.path.join(ROOT, 'benchmarks', 'fake_ollama.py'), '--port', str(PORT), '--latency', str(LATENCY)], stdout=subprocess.PIPE, text=True)
+    server.stdout.readline()
+    url = f"http://127.0.0.1:{PORT}"
+    try:
+        print(f"{'mode':<7} {'agents':>6} {'wall s':>8} {'cpu s':>7} {'calls/s':>8} {'peak RSS MB':>12} {'threads':>8}")
+        for num_agents in args.agents:
+            for mode in ('thread', 'async'):
+                out = subprocess.run([sys.executable, __file__, '--case', mode, str(num_agents), url], capture_output=True, text=True)
+                if out.returncode != 0:
+                    print(f"{mode:<7} {num_agents:>6} failed: {out.stderr.strip().splitlines()[-1:]}")
+                    continue
+                r = json.loads(out.stdout.strip().splitlines()[-1])
+                print(f"{mode:<7} {num_agents:>6} {r['wall']:>8.2f} {r['cpu']:>7.2f} {r['calls_per_s']:>8.1f} {r['peak_rss_mb']:>12.1f} {r['peak_threads']:>8}")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == '__main__':
+    main()
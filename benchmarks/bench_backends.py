@@ -0,0 +1,221 @@
+# benchmarks/bench_backends.py
+"""
+LLM backends (agents/backends.py) against benchmarks/fake_ollama.py servers.
+
+1. Normalized responses: the ollama module, OllamaBackend and
+   OpenAIBackend (the fake server's /v1 endpoint) must give the same
+   message, tool calls (apart from OpenAI's call ids) and token counts,
+   plain and streamed.
+2. Connection pooling: --threads threads make --calls calls each with a
+   new ollama.Client per call, one shared ollama.Client with httpx's
+   default pool, and OllamaBackend (idle pool sized to the concurrency).
+   Reported: calls/s and TCP connections the server accepted.
+3. Balancing: three hosts, one --slow-factor times slower. Round robin
+   (a plain rotation) vs BackendRouter's least outstanding requests.
+   Reported: wall time, call latency p50 / p95 and the slow host's share.
+4. Failing hosts: of three hosts one answers every request with a 500 and
+   one is down (connection refused). Round robin vs BackendRouter
+   (failover and ejection). Reported: calls that failed for the caller
+   and requests sent to the bad hosts.
+
+Usage:
+    python benchmarks/bench_backends.py [--threads 32] [--calls 50] [--latency 0.02] [--slow-factor 5]
+"""
+import argparse
+import itertools
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from fake_ollama import FakeOllamaServer
+from agents.backends import BackendRouter, OllamaBackend, OpenAIBackend, normalize_response
+
+MESSAGES = [{'role': 'user', 'content': 'Subtask 1: summarize the news'}]
+SCRIPT = {'rules': [{'match': 'Subtask', 'content': '@manager: summary ready', 'tool_calls': ['task_completed']}]}
+
+
+class RoundRobin:
+    """Baseline: each call to the next backend in turn, no health tracking."""
+
+    def __init__(self, backends):
+        self.backends = backends
+        self._next = itertools.count()
+        self._lock = threading.Lock()
+
+    def chat(self, model, messages, **kwargs):
+        with self._lock:
+            backend = self.backends[next(self._next) % len(self.backends)]
+        return backend.chat(model, messages, **kwargs)
+
+
+class Counted:
+    """A backend that counts the calls made to it."""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.host = backend.host
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def chat(self, model, messages, **kwargs):
+        with self._lock:
+            self.calls += 1
+        return self.backend.chat(model, messages, **kwargs)
+
+    def health(self, timeout=2.0):
+        return self.backend.health(timeout)
+
+
+def without_ids(calls):
+    # OpenAI servers give each tool call an id; Ollama does not
+    return [{k: v for k, v in call.items() if k != 'id'} for call in calls] if calls else calls
+
+
+def essentials(response):
+    message = response['message']
+    return message['content'], without_ids(message.get('tool_calls')), response.get('eval_count')
+
+
+def streamed(chunks):
+    chunks = [normalize_response(chunk) for chunk in chunks]
+    content = ''.join(chunk['message']['content'] for chunk in chunks)
+    calls = [call for chunk in chunks for call in chunk['message'].get('tool_calls') or ()]
+    return content, without_ids(calls), chunks[-1].get('eval_count')
+
+
+def equivalence():
+    import ollama
+    server = FakeOllamaServer(script=SCRIPT).start()
+    try:
+        client = ollama.Client(host=server.url)
+        backends = {'ollama module': lambda **kw: client.chat(model='fake', messages=MESSAGES, **kw),
+                    'OllamaBackend': lambda **kw: OllamaBackend(server.url).chat('fake', MESSAGES, **kw),
+                    'OpenAIBackend': lambda **kw: OpenAIBackend(server.url + '/v1').chat('fake', MESSAGES, **kw)}
+        plain = {name: essentials(normalize_response(call())) for name, call in backends.items()}
+        stream = {name: streamed(call(stream=True)) for name, call in backends.items()}
+    finally:
+        server.shutdown()
+    return plain, stream
+
+
+def hammer(chat, threads, calls):
+    """Run `calls` chat calls on each of `threads` threads. Returns (wall, sorted latencies, failures)."""
+    latencies, failures = [], [0]
+    lock = threading.Lock()
+
+    def worker():
+        mine, failed = [], 0
+        for _ in range(calls):
+            t0 = time.perf_counter()
+            try:
+                chat()
+            except Exception:
+                failed += 1
+            mine.append(time.perf_counter() - t0)
+        with lock:
+            latencies.extend(mine)
+            failures[0] += failed
+    pool = [threading.Thread(target=worker) for _ in range(threads)]
+    t0 = time.perf_counter()
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    return time.perf_counter() - t0, sorted(latencies), failures[0]
+
+
+def pct(values, q):
+    return values[min(len(values) - 1, int(q * len(values)))] if values else 0.0
+
+
+def pooling(args):
+    import ollama
+    rows = []
+    cases = (('new client per call', lambda url: (lambda: ollama.Client(host=url).chat(model='fake', messages=MESSAGES))),
+             ('shared ollama.Client', lambda url: (lambda c=ollama.Client(host=url): c.chat(model='fake', messages=MESSAGES))),
+             ('OllamaBackend', lambda url: (lambda b=OllamaBackend(url, max_connections=args.threads): b.chat('fake', MESSAGES))))
+    for label, make in cases:
+        server = FakeOllamaServer(latency=args.latency).start()
+        try:
+            wall, _, failed = hammer(make(server.url), args.threads, args.calls)
+            stats = server.stats()
+        finally:
+            server.shutdown()
+        rows.append((label, args.threads * args.calls / wall, stats.get('connections', 0), failed))
+    return rows
+
+
+def balancing(args):
+    rows = []
+    for label in ('round robin', 'least outstanding'):
+        latencies = [args.latency, args.latency, args.latency * args.slow_factor]
+        servers = [FakeOllamaServer(latency=latency).start() for latency in latencies]
+        backends = [OllamaBackend(s.url, max_connections=args.threads) for s in servers]
+        router = RoundRobin(backends) if label == 'round robin' else BackendRouter(backends, health_interval=0)
+        try:
+            wall, lats, failed = hammer(lambda: router.chat('fake', MESSAGES), args.threads, args.calls)
+            served = [s.stats().get('requests', 0) for s in servers]
+        finally:
+            for s in servers:
+                s.shutdown()
+        rows.append((label, wall, pct(lats, 0.5), pct(lats, 0.95), served[2] / sum(served), failed))
+    return rows
+
+
+def failing(args):
+    rows = []
+    for label in ('round robin', 'router'):
+        good = FakeOllamaServer(latency=args.latency).start()
+        erroring = FakeOllamaServer(latency=args.latency, error_rate=1.0).start()
+        down = FakeOllamaServer()
+        down_url = down.url
+        down.server_close()
+        backends = [Counted(OllamaBackend(url)) for url in (good.url, erroring.url, down_url)]
+        router = RoundRobin(backends) if label == 'round robin' else BackendRouter(backends, health_interval=1.0)
+        try:
+            wall, lats, failed = hammer(lambda: router.chat('fake', MESSAGES), args.threads, args.calls)
+            to_bad = backends[1].calls + backends[2].calls
+        finally:
+            good.shutdown()
+            erroring.shutdown()
+            if label == 'router':
+                router.close()
+        rows.append((label, wall, failed, args.threads * args.calls, to_bad))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--calls', type=int, default=50, help='Calls per thread')
+    parser.add_argument('--latency', type=float, default=0.02, help='Fake server latency per request (seconds)')
+    parser.add_argument('--slow-factor', type=float, default=5, help='How much slower the slow host is in the balancing case')
+    args = parser.parse_args()
+
+    plain, stream = equivalence()
+    print("normalized responses (content, tool calls, eval_count):")
+    for name in plain:
+        print(f"  {name:<14} plain {plain[name]}  streamed {stream[name]}")
+    print(f"  identical: plain {len(set(map(repr, plain.values()))) == 1}, streamed {len(set(map(repr, stream.values()))) == 1}")
+
+    print(f"\nconnection pooling, {args.threads} threads x {args.calls} calls, {args.latency}s latency")
+    print(f"{'client':<22} {'calls/s':>8} {'connections':>11} {'failed':>6}")
+    for label, rate, connections, failed in pooling(args):
+        print(f"{label:<22} {rate:>8.0f} {connections:>11} {failed:>6}")
+
+    print(f"\nbalancing over 3 hosts, one {args.slow_factor:g}x slower")
+    print(f"{'strategy':<18} {'wall s':>7} {'p50 ms':>7} {'p95 ms':>7} {'slow host share':>15}")
+    for label, wall, p50, p95, share, failed in balancing(args):
+        print(f"{label:<18} {wall:>7.2f} {p50 * 1000:>7.1f} {p95 * 1000:>7.1f} {share:>15.1%}")
+
+    print("\nfailing hosts: 1 good, 1 answering 500, 1 down")
+    print(f"{'strategy':<18} {'wall s':>7} {'failed calls':>12} {'requests to bad hosts':>21}")
+    for label, wall, failed, total, to_bad in failing(args):
+        print(f"{label:<18} {wall:>7.2f} {failed:>6} / {total:<5} {to_bad:>21}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+# benchmarks/bench_batch.py
+"""
+Batch mode throughput at different worker budgets against benchmarks/fake_ollama.py.
+
+Runs --tasks top-level tasks (each planned by the fake server into
+--agents subtasks, one per agent, for --iterations iterations) through
+agents.batch.BatchRunner. A budget of --agents workers runs one task at a
+time, like running main.py once per task; larger budgets run several
+tasks on the shared gateway and DB writer. Each budget runs in its own
+process with a fresh DB.
+
+Usage:
+    python benchmarks/bench_batch.py [--tasks 40] [--agents 2] [--iterations 2] [--workers 2 8 32] [--latency uniform:0.05,0.15]
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+from fake_ollama import FakeOllamaServer
+
+
+def script(num_agents, num_iterations):
+    plan = [f"Subtask {k+1} of the task" for k in range(num_agents)]
+    turns = ["@manager: progress ({n})"] * (num_iterations - 1) + ["@manager: task completed ({n})"]
+    return {
+        'rules': [
+            {'match': "expert project planner", 'content': json.dumps(plan)},
+            {'match': 'Subtask', 'turns': turns},
+        ],
+    }
+
+
+def run_case(workers, num_tasks, num_agents, num_iterations, url):
+    os.environ['OLLAMA_HOST'] = url
+    import ollama
+    from agents import db
+    from agents.batch import BatchRunner
+    from agents.config import Colors, AGENT_COLORS, AGENT_EMOJIS
+
+    db.DB_PATH = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    lines = [json.dumps({'task': f"Task {i}", 'agents': num_agents, 'iterations': num_iterations}) for i in range(num_tasks)]
+    runner = BatchRunner('fake', ollama, Colors, AGENT_COLORS, AGENT_EMOJIS, workers=workers, output=io.StringIO())
+    report = runner.run(lines)
+    report['peak_rss_mb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tasks', type=int, default=40)
+    parser.add_argument('--agents', type=int, default=2, help='Agents (and subtasks) per task')
+    parser.add_argument('--iterations', type=int, default=2)
+    parser.add_argument('--workers', type=int, nargs='+', default=[2, 8, 32])
+    parser.add_argument('--latency', default='uniform:0.05,0.15', help='Fake server latency (seconds or distribution)')
+    parser.add_argument('--case', nargs=5, metavar=('WORKERS', 'TASKS', 'AGENTS', 'ITERATIONS', 'URL'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.case:
+        workers, num_tasks, num_agents, num_iterations, url = args.case
+        with contextlib.redirect_stdout(io.StringIO()):
+            report = run_case(int(workers), int(num_tasks), int(num_agents), int(num_iterations), url)
+        print(json.dumps(report))
+        return
+
+    server = FakeOllamaServer(latency=args.latency, script=script(args.agents, args.iterations)).start()
+    try:
+        print(f"{'workers':>7} {'tasks':>5} {'done':>5} {'wall s':>7} {'tasks/hour':>11} {'p50 s':>7} {'p95 s':>7} {'LLM calls':>9} {'peak RSS MB':>12}")
+        for workers in args.workers:
+            out = subprocess.run([sys.executable, __file__, '--case', str(workers), str(args.tasks), str(args.agents), str(args.iterations), server.url],
+                                 capture_output=True, text=True)
+            if out.returncode != 0:
+                print(f"{workers:>7} failed: {out.stderr.strip().splitlines()[-1:]}")
+                continue
+            r = json.loads(out.stdout.strip().splitlines()[-1])
+            print(f"{workers:>7} {r['tasks']:>5} {r['completed']:>5} {r['wall']:>7.2f} {r['tasks_per_hour']:>11.0f} {r['latency_p50']:>7.2f} {r['latency_p95']:>7.2f} {r['llm_calls']:>9} {r['peak_rss_mb']:>12.1f}")
+    finally:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,158 @@
+# benchmarks/bench_bus_soak.py
+"""
+Soak test of MessageBus memory over a long run.
+
+--messages messages (1M by default) go through one bus: --agents agents
+report to the manager and to each other, the manager broadcasts every 50th
+message, and every 5th message is a streamed 'chunk'. The manager and the
+agents drain their messages every --drain-every messages. Each case runs in
+its own Python process, so RSS is the bus's alone:
+
+- unbounded: no pruning and no high-water mark (the bus before retention)
+- prune: messages every consumer has read are dropped from memory
+- prune + spill: the same, every message also written to SQLite through the
+  DB writer (the time includes flushing it)
+- slow consumer, drop: the manager drains only every --slow-every
+  messages; past --high-water the chunks sent to it are dropped
+- slow consumer, block: the manager drains from a thread every 20 ms;
+  past --high-water senders wait for it
+
+Reported: wall s, messages/s, RSS MB every 1/4 of the run, messages still in
+memory and the bus counters. Then bytes per message held, for a plain dict
+vs Message, measured with tracemalloc.
+
+Usage:
+    python benchmarks/bench_bus_soak.py [--messages 1000000] [--agents 8] [--drain-every 1000] [--high-water 10000]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from agents.message_bus import Message, MessageBus
+
+CASES = ('unbounded', 'prune', 'spill', 'slow-drop', 'slow-block')
+LABELS = {'unbounded': 'unbounded', 'prune': 'prune', 'spill': 'prune + spill',
+          'slow-drop': 'slow consumer, drop', 'slow-block': 'slow consumer, block'}
+BROADCAST_EVERY = 50
+CHUNK_EVERY = 5
+CHECKPOINTS = 4
+FILLER = "progress on the subtask, nothing blocking so far"
+
+
+def rss_mb():
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def drain(bus, names):
+    for name in names:
+        bus.receive(name)
+
+
+def run_case(case, num_messages, num_agents, drain_every, slow_every, high_water):
+    if case == 'spill':
+        from agents import db
+        db.DB_PATH = os.path.join(tempfile.mkdtemp(), 'soak.db')
+        db.init_db()
+    bus = MessageBus(prune=case != 'unbounded', spill=case == 'spill',
+                     high_water=float('inf') if case == 'unbounded' else high_water,
+                     overflow='block' if case == 'slow-block' else 'drop', block_timeout=60)
+    agents = [f"agent_{i+1}" for i in range(num_agents)]
+    slow = 'manager' if case.startswith('slow') else None
+    consumers = [name for name in ['manager'] + agents if name != slow]
+    for name in ['manager'] + agents:
+        bus.register(name)
+    stop = threading.Event()
+    if case == 'slow-block':
+        def slow_reader():
+            while not stop.wait(0.02):
+                bus.receive(slow)
+        reader = threading.Thread(target=slow_reader, daemon=True)
+        reader.start()
+    start_rss = rss_mb()
+    series = []
+    t0 = time.perf_counter()
+    for i in range(num_messages):
+        sender = agents[i % num_agents]
+        if i % BROADCAST_EVERY == 0:
+            bus.send('manager', 'all', f"Status check {i}")
+        elif i % CHUNK_EVERY == 0:
+            bus.send(sender, 'manager', f"{FILLER} ({i})", kind='chunk')
+        elif i % 4 == 0:
+            bus.send(sender, agents[(i + 1) % num_agents], f"@{agents[(i + 1) % num_agents]}: {FILLER} ({i})", task=0)
+        else:
+            bus.send(sender, 'manager', f"{FILLER} ({i})", task=0)
+        if (i + 1) % drain_every == 0:
+            drain(bus, consumers)
+        if slow and case == 'slow-drop' and (i + 1) % slow_every == 0:
+            bus.receive(slow)
+        if (i + 1) % (num_messages // CHECKPOINTS) == 0:
+            series.append(rss_mb())
+    if case == 'spill':
+        from agents.db import get_writer
+        get_writer().flush()
+    wall = time.perf_counter() - t0
+    stop.set()
+    return {'wall': wall, 'rate': num_messages / wall, 'start_rss': start_rss, 'rss': series, **bus.stats()}
+
+
+def bytes_per_message(count=100_000):
+    """Memory held per message: the dict the bus used to keep vs a Message."""
+    results = {}
+    for label, make in (('dict', lambda i: {'seq': i, 'sender': 'agent_1', 'recipient': 'manager', 'content': f"{FILLER} ({i})",
+                                            'kind': 'message', 'timestamp': time.time(), 'task': 0}),
+                        ('Message', lambda i: Message(i, 'agent_1', 'manager', f"{FILLER} ({i})", 'message', time.time(), 0))):
+        tracemalloc.start()
+        held = [make(i) for i in range(count)]
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        results[label] = size / len(held)
+        del held
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--messages', type=int, default=1_000_000)
+    parser.add_argument('--agents', type=int, default=8)
+    parser.add_argument('--drain-every', type=int, default=1000, help='Messages between drains by the manager and agents')
+    parser.add_argument('--slow-every', type=int, default=50_000, help='Messages between drains by the slow manager (drop case)')
+    parser.add_argument('--high-water', type=int, default=10_000, help='Messages held per recipient before chunks are dropped / senders block')
+    parser.add_argument('--cases', nargs='+', default=list(CASES), choices=CASES)
+    parser.add_argument('--case', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.case:
+        print(json.dumps(run_case(args.case, args.messages, args.agents, args.drain_every, args.slow_every, args.high_water)))
+        return
+
+    print(f"{args.messages} messages, {args.agents} agents, drained every {args.drain_every}, high-water {args.high_water}")
+    marks = ' '.join(f"{f'RSS@{(k + 1) * 100 // CHECKPOINTS}%':>9}" for k in range(CHECKPOINTS))
+    print(f"{'case':<22} {'wall s':>7} {'msgs/s':>9} {'RSS@0':>7} {marks} {'retained':>9} {'pruned':>8} {'dropped':>8} {'blocked':>8}")
+    for case in args.cases:
+        out = subprocess.run([sys.executable, __file__, '--case', case, '--messages', str(args.messages), '--agents', str(args.agents),
+                              '--drain-every', str(args.drain_every), '--slow-every', str(args.slow_every), '--high-water', str(args.high_water)],
+                             capture_output=True, text=True)
+        if out.returncode != 0:
+            print(f"{LABELS[case]:<22} failed: {out.stderr.strip().splitlines()[-1:]}")
+            continue
+        r = json.loads(out.stdout.strip().splitlines()[-1])
+        series = ' '.join(f"{mb:>9.1f}" for mb in r['rss'])
+        print(f"{LABELS[case]:<22} {r['wall']:>7.2f} {r['rate']:>9.0f} {r['start_rss']:>7.1f} {series} {r['retained']:>9} {r['pruned']:>8} {r['dropped']:>8} {r['blocked']:>8}")
+
+    sizes = bytes_per_message()
+    print("\nbytes held per message (content included): " + ', '.join(f"{label} {size:.0f}" for label, size in sizes.items()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+# benchmarks/bench_context.py
+"""
+Prompt evaluation cost per iteration: rebuilt prompts vs ConversationContext.
+
+Against benchmarks/fake_ollama.py with simulated prefix (KV) caching, one
+agent runs ITERATIONS iterations of a task while another agent sends it a
+bus message every other iteration. Every reply is different.
+
+- rebuilt (old): the old Agent.start_iteration. System prompt, task,
+  "Previous result: ...", then new bus messages. Only the last reply is
+  kept, and everything after the task changes every time.
+- history, unstable order: full history, but bus messages are kept right
+  after the task (where the old code put them), so each new message
+  shifts everything after it.
+- context (append-only): the current Agent with ConversationContext.
+
+Reported: prompt words evaluated by the server (not covered by a cached
+prefix), simulated prompt-eval time, and the prompt size sent, all summed
+over the iterations.
+
+Usage:
+    python benchmarks/bench_context.py [--iterations 20] [--reply-words 150] [--budget 8192]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import ollama
+from fake_ollama import FakeOllamaServer
+from agents.agent import Agent, SYSTEM_PROMPT
+from agents.config import Colors
+from agents.llm_gateway import LLMGateway
+from agents.message_bus import MessageBus
+from agents.tokens import count_message_tokens
+
+TASK = "Scrape techmeme.com and summarize the top headlines."
+
+
+def note(i):
+    return f"Found {i} more headlines about model releases; please include them in the summary with links."
+
+
+def rebuilt(agent, bus, iterations):
+    prev_result = None
+    for i in range(iterations):
+        if i % 2:
+            bus.send("agent_2", "agent_1", note(i))
+        messages = [{"role": "system", "content": SYSTEM_PROMPT}, {"role": "user", "content": TASK}]
+        if prev_result:
+            messages.append({"role": "user", "content": f"Previous result: {prev_result}"})
+        for msg in bus.receive("agent_1"):
+            messages.append({"role": "user", "content": f"[Message from {msg['sender']}]: {msg['content']}"})
+        response = agent.gateway.chat(agent.model_name, messages)
+        prev_result = response.message.content
+        yield messages, response
+
+
+def unstable_history(agent, bus, iterations):
+    notes, turns = [], []
+    for i in range(iterations):
+        if i % 2:
+            bus.send("agent_2", "agent_1", note(i))
+        for msg in bus.receive("agent_1"):
+            notes.append({"role": "user", "content": f"[Message from {msg['sender']}]: {msg['content']}"})
+        messages = [{"role": "system", "content": SYSTEM_PROMPT}, {"role": "user", "content": TASK}] + notes + turns
+        response = agent.gateway.chat(agent.model_name, messages)
+        turns += [{"role": "assistant", "content": response.message.content}, {"role": "user", "content": "Continue."}]
+        yield messages, response
+
+
+def with_context(agent, bus, iterations):
+    for i in range(iterations):
+        if i % 2:
+            bus.send("agent_2", "agent_1", note(i))
+        messages = agent.start_iteration(0, TASK, i)
+        response = agent.gateway.chat(agent.model_name, messages)
+        agent.handle_response(response, messages, [])
+        yield messages, response
+
+
+def run(layout, server, iterations, budget):
+    client = ollama.Client(host=server.url)
+    bus = MessageBus()
+    agent = Agent('agent_1', [TASK], Colors.OKBLUE, '*', 'fake', client, Colors, bus, False, iterations, gateway=LLMGateway(client), context_budget=budget)
+    # Silence the per-iteration banner
+    agent.log = lambda *args, **kwargs: None
+    evaluated = eval_ns = prompt_tokens = 0
+    t0 = time.monotonic()
+    for messages, response in layout(agent, bus, iterations):
+        evaluated += response.prompt_eval_count
+        eval_ns += response.prompt_eval_duration
+        prompt_tokens += sum(count_message_tokens(m) for m in messages)
+    return evaluated, eval_ns / 1e9, prompt_tokens, time.monotonic() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--reply-words', type=int, default=150)
+    parser.add_argument('--budget', type=int, default=8192, help='ConversationContext token budget')
+    parser.add_argument('--prompt-token-latency', type=float, default=0.0005, help='Simulated seconds per evaluated prompt word')
+    args = parser.parse_args()
+    # {n} is filled in by the server, so no two replies share words
+    reply = "Summary so far: " + " ".join(f"headline{i}-{{n}}" for i in range(args.reply_words))
+
+    print(f"{'layout':<24} {'words evaluated':>16} {'prompt eval s':>14} {'prompt tokens sent':>19} {'wall s':>8}")
+    for label, layout in (('rebuilt (old)', rebuilt), ('history, unstable order', unstable_history), ('context (append-only)', with_context)):
+        # Fresh server per layout so the prefix cache starts empty
+        server = FakeOllamaServer(content=reply, prompt_token_latency=args.prompt_token_latency).start()
+        evaluated, eval_s, sent, wall = run(layout, server, args.iterations, args.budget)
+        server.shutdown()
+        print(f"{label:<24} {evaluated:>16} {eval_s:>14.3f} {sent:>19} {wall:>8.3f}")
+
+
+if __name__ == '__main__':
+    main()
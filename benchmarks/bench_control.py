@@ -0,0 +1,106 @@
+# benchmarks/bench_control.py
+"""
+Manager -> agent control (agents/control.py) against benchmarks/fake_ollama.py.
+
+1. Approved tasks: --agents agents with --tasks tasks each and
+   --iterations iterations per task. The first response to every task says
+   "task completed", which the manager approves; later responses only add
+   more text. Compared: agents that keep iterating until they run out of
+   iterations (--no-cancel-approved) vs agents that move on once approved,
+   plain and streamed. Reported: wall time until the run ends (every task
+   approved) and until the last agent exits, LLM calls, completion tokens
+   and the control counters from the run summary.
+2. Stop while streaming: one agent streams a long response; the manager is
+   stopped part way. Reported: time from the stop to the end of the run,
+   against the time the whole response takes.
+
+Usage:
+    python benchmarks/bench_control.py [--agents 4] [--tasks 2] [--iterations 10] [--latency 0.05]
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from fake_ollama import FakeOllamaServer
+from agents.metrics import get_metrics
+from agents.backends import OllamaBackend
+
+FILLER = ' '.join(f"detail{i}" for i in range(40))
+# Done on the first turn; anything later is work the manager no longer needs
+APPROVED_TURNS = ["@manager: task completed", f"@manager: polishing ({{n}}) {FILLER}"]
+
+
+def script(turns):
+    return {'rules': [{'match': 'Subtask', 'turns': turns}], 'default': "@manager: progress"}
+
+
+def run(url, agents, tasks, iterations, cancel_approved, stream=False, stop_after=None):
+    from agents import db
+    from agents.config import Colors, AGENT_COLORS, AGENT_EMOJIS
+    from agents.manager import Manager
+    db.DB_PATH = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    plan = [f"Subtask {i}" for i in range(agents * tasks)]
+    before = get_metrics().snapshot()
+    stopped_at = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        manager = Manager('fake', OllamaBackend(url), Colors, AGENT_COLORS, AGENT_EMOJIS, stream=stream, cancel_approved=cancel_approved)
+        if stop_after is not None:
+            def stop():
+                stopped_at.append(time.perf_counter())
+                manager.request_stop()
+            threading.Timer(stop_after, stop).start()
+        t0 = time.perf_counter()
+        manager.run_task("Control benchmark", agents, iterations, agent_list=plan)
+        t1 = time.perf_counter()
+        # The run ends once every task is approved; agents still iterating keep calling the LLM until they exit
+        for agent in manager.agents:
+            agent.join()
+        t2 = time.perf_counter()
+    after = get_metrics().snapshot()
+    calls = after.get('llm_request', {}).get('count', 0) - before.get('llm_request', {}).get('count', 0)
+    return {'wall': t1 - t0, 'agents_done': t2 - t0, 'llm_calls': calls, 'completion_tokens': manager.agent_gateway.tokens.totals()['completion_tokens'],
+            'control': manager.controls.stats(), 'stop_to_end': t1 - stopped_at[0] if stopped_at else None}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--agents', type=int, default=4)
+    parser.add_argument('--tasks', type=int, default=2, help='Tasks per agent')
+    parser.add_argument('--iterations', type=int, default=10, help='Iterations per task')
+    parser.add_argument('--latency', default='0.05', help='Fake server latency per request')
+    parser.add_argument('--token-latency', type=float, default=0.002, help='Seconds per streamed word')
+    parser.add_argument('--stream-words', type=int, default=400, help='Words in the long streamed response of the stop case')
+    args = parser.parse_args()
+
+    server = FakeOllamaServer(latency=args.latency, token_latency=args.token_latency, script=script(APPROVED_TURNS)).start()
+    print(f"approved tasks: {args.agents} agents x {args.tasks} tasks, {args.iterations} iterations per task, {args.latency}s LLM latency")
+    print(f"{'mode':<32} {'run s':>6} {'agents s':>8} {'LLM calls':>9} {'compl. tokens':>13} {'advanced':>8} {'iters skipped':>13} {'streams aborted':>15}")
+    try:
+        for label, cancel, stream in (('keep iterating', False, False), ('move on when approved', True, False),
+                                      ('keep iterating, --stream', False, True), ('move on when approved, --stream', True, True)):
+            r = run(server.url, args.agents, args.tasks, args.iterations, cancel, stream)
+            c = r['control']
+            print(f"{label:<32} {r['wall']:>6.2f} {r['agents_done']:>8.2f} {r['llm_calls']:>9} {r['completion_tokens']:>13} {c['tasks_advanced']:>8} {c['iterations_skipped']:>13} {c['streams_aborted']:>15}")
+    finally:
+        server.shutdown()
+
+    word_latency = args.token_latency * 10
+    long_reply = "@manager: " + ' '.join(f"word{i}" for i in range(args.stream_words))
+    server = FakeOllamaServer(latency=args.latency, token_latency=word_latency, script=script([long_reply])).start()
+    print(f"\nstop while streaming: 1 agent, a {args.stream_words}-word response at {word_latency * 1000:g} ms/word ({args.stream_words * word_latency:.1f}s), stop requested after 0.5s")
+    try:
+        r = run(server.url, 1, 1, 1, True, stream=True, stop_after=0.5)
+        print(f"stop to end of run: {r['stop_to_end']:.2f}s, streams aborted: {r['control']['streams_aborted']}, completion tokens: {r['completion_tokens']}")
+    finally:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+# benchmarks/bench_dag.py
+"""
+Round-robin subtask assignment vs the SubtaskScheduler (--dag) on a skewed workload.
+
+Against benchmarks/fake_ollama.py, --agents agents run --subtasks subtasks
+for --iterations iterations each. Every --agents-th subtask is slow (its
+LLM calls take --slow extra seconds), so round-robin hands all the slow
+ones to agent_1 while the others go idle; with the scheduler, idle agents
+pull the next ready subtask. Reported: makespan (run_task wall time,
+planning skipped) and how many subtasks each agent ran.
+
+A third case checks dependencies: --subtasks independent subtasks feed
+one merge subtask, whose prompt must carry every predecessor's result.
+
+Usage:
+    python benchmarks/bench_dag.py [--agents 4] [--subtasks 16] [--iterations 2] [--slow 0.4]
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import ollama
+from fake_ollama import FakeOllamaServer
+from agents import db
+from agents.config import Colors, AGENT_COLORS, AGENT_EMOJIS
+from agents.manager import Manager
+
+
+def run(server, plan, num_agents, num_iterations, dag):
+    db.DB_PATH = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    with contextlib.redirect_stdout(io.StringIO()):
+        manager = Manager('fake', ollama.Client(host=server.url), Colors, AGENT_COLORS, AGENT_EMOJIS, dag=dag)
+        t0 = time.perf_counter()
+        run_id = manager.run_task("Benchmark task", num_agents, num_iterations, agent_list=plan)
+        makespan = time.perf_counter() - t0
+    with db.get_db() as conn:
+        per_agent = [len(json.loads(row[0])) for row in conn.execute("SELECT assigned_subtask FROM agents WHERE run_id=? ORDER BY id", (run_id,))]
+    return manager, run_id, makespan, per_agent
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--agents', type=int, default=4)
+    parser.add_argument('--subtasks', type=int, default=16)
+    parser.add_argument('--iterations', type=int, default=2)
+    parser.add_argument('--latency', default='uniform:0.03,0.07', help='Fake server latency for every call')
+    parser.add_argument('--slow', type=float, default=0.4, help='Extra seconds per call of a slow subtask')
+    args = parser.parse_args()
+
+    server = FakeOllamaServer(latency=args.latency, script={
+        'rules': [{'match': 'SLOW', 'latency': args.slow, 'content': "@manager: slow part ({n})"}],
+        'default': "@manager: result {n}",
+    }).start()
+    skewed = [f"Subtask {i}" + (" SLOW" if i % args.agents == 0 else "") for i in range(args.subtasks)]
+
+    print(f"{'case':<28} {'makespan s':>10}  subtasks per agent")
+    for label, dag in (('skewed, round-robin', False), ('skewed, scheduler', True)):
+        _, _, makespan, per_agent = run(server, skewed, args.agents, args.iterations, dag)
+        print(f"{label:<28} {makespan:>10.2f}  {per_agent}")
+
+    fan_in = [f"Collect part {i}" for i in range(args.subtasks)]
+    fan_in.append({'task': "Merge all parts", 'depends_on': list(range(args.subtasks))})
+    manager, run_id, makespan, per_agent = run(server, fan_in, args.agents, args.iterations, True)
+    results = [manager.scheduler.results[i] for i in range(args.subtasks)]
+    with db.get_db() as conn:
+        prompts = db.load_prompts(conn, [row[0] for row in conn.execute(
+            "SELECT i.prompt_ids FROM agent_iterations i JOIN agents a ON i.agent_id = a.id WHERE a.run_id=? AND i.prompt_ids IS NOT NULL", (run_id,))], as_text=True)
+        merge_prompts = [prompt for prompt in prompts if 'Merge all parts' in prompt]
+    seen = sum(1 for r in results if merge_prompts and r in merge_prompts[0])
+    print(f"{'fan-in, scheduler':<28} {makespan:>10.2f}  {per_agent}  (merge prompt carries {seen}/{len(results)} predecessor results)")
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+# benchmarks/bench_db_writer.py
+"""
+Iteration-row persistence: per-row connect/insert/commit vs the DBWriter.
+
+Every "agent" is a thread inserting ROWS_PER_AGENT agent_iterations rows
+as fast as it can. The legacy path mirrors the old Agent.run code: a fresh
+connection, one INSERT and one commit per row, rollback-journal mode, and
+failures (e.g. "database is locked") silently dropped. The writer path
+submits rows to agents.db.DBWriter and flushes once at the end.
+
+Usage:
+    python benchmarks/bench_db_writer.py [--agents 8 64 256] [--rows 50]
+"""
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from agents import db
+
+INSERT = "INSERT INTO agent_iterations (agent_id, iteration, prompt, response, duration, tokens_used, error, tags, parent_iteration_id) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
+PROMPT = json.dumps([{"role": "system", "content": "You are an AI assistant. " * 20}, {"role": "user", "content": "Do the task."}])
+
+
+def row(agent_id, i):
+    return (agent_id, i, PROMPT, f"response {i} from agent {agent_id}", 0.5, 42, None, '{}', None)
+
+
+def legacy_agent(path, agent_id, rows, failures):
+    for i in range(rows):
+        try:
+            conn = sqlite3.connect(path)
+            try:
+                conn.execute(INSERT, row(agent_id, i))
+                conn.commit()
+            finally:
+                conn.close()
+        except Exception:
+            failures.append(1)
+
+
+def writer_agent(writer, agent_id, rows, failures):
+    for i in range(rows):
+        writer.submit(INSERT, row(agent_id, i))
+
+
+def run(mode, num_agents, rows):
+    path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    db.DB_PATH = path
+    db.init_db()
+    if mode == 'legacy':
+        conn = sqlite3.connect(path)
+        conn.execute("PRAGMA journal_mode=DELETE")
+        conn.close()
+    failures = []
+    writer = db.DBWriter(path) if mode == 'writer' else None
+    target = legacy_agent if mode == 'legacy' else writer_agent
+    first_arg = path if mode == 'legacy' else writer
+    threads = [threading.Thread(target=target, args=(first_arg, a, rows, failures)) for a in range(num_agents)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    if writer:
+        writer.close()
+    elapsed = time.perf_counter() - t0
+    conn = sqlite3.connect(path)
+    stored = conn.execute("SELECT COUNT(*) FROM agent_iterations").fetchone()[0]
+    conn.close()
+    return elapsed, stored, len(failures)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="DBWriter vs per-row commits")
+    parser.add_argument('--agents', type=int, nargs='+', default=[8, 64, 256])
+    parser.add_argument('--rows', type=int, default=50, help='Rows per agent')
+    args = parser.parse_args()
+    print(f"{'agents':>6} {'mode':<7} {'seconds':>8} {'rows/s':>10} {'stored':>8} {'lost':>6}")
+    for num_agents in args.agents:
+        for mode in ('legacy', 'writer'):
+            elapsed, stored, lost = run(mode, num_agents, args.rows)
+            print(f"{num_agents:>6} {mode:<7} {elapsed:>8.2f} {stored / elapsed:>10.0f} {stored:>8} {lost:>6}")
+
+
+if __name__ == '__main__':
+    main()
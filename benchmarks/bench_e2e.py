@@ -0,0 +1,126 @@
+# benchmarks/bench_e2e.py
+"""
+End-to-end orchestration throughput against a scripted fake Ollama server.
+
+Runs the whole non-interactive pipeline, Manager.run_task -> AgentService
+-> OrchestrationService -> DB, for each (mode, agents, iterations) case.
+The fake server (benchmarks/fake_ollama.py, in this process) answers the
+planning prompt with a JSON plan of AGENTS x --tasks subtasks. Agents
+report "@manager: progress ..." until their last iteration, which reports
+"task completed". Latency is sampled from a seeded distribution, so runs
+repeat. Each case runs in its own Python process with a fresh SQLite DB,
+so peak RSS is per case.
+
+Reported per case:
+- wall s: run_task from planning to the saved run summary
+- LLM calls/s: planning and agent calls (token ledger count) / wall
+- reaction p50/p95: seconds from an agent's bus message to the manager's review
+- DB rows/s: agent_iterations rows saved for the run / wall
+- peak RSS MB of the case's process
+
+Usage:
+    python benchmarks/bench_e2e.py [--agents 1 10 50] [--iterations 1 5] [--tasks 2] [--latency uniform:0.02,0.08] [--error-rate 0]
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+from fake_ollama import FakeOllamaServer
+
+TASK = "Benchmark task: build and summarize a report."
+PLANNER_MATCH = "expert project planner"
+
+
+def script(num_agents, num_tasks, num_iterations):
+    plan = [f"Subtask {k+1}: part {k+1} of the report" for k in range(num_agents * num_tasks)]
+    turns = ["@manager: progress on my subtask ({n})"] * (num_iterations - 1) + ["@manager: subtask finished, task completed ({n})"]
+    return {
+        'rules': [
+            {'match': PLANNER_MATCH, 'content': json.dumps(plan)},
+            {'match': 'Subtask', 'turns': turns},
+        ],
+        'default': "@manager: task completed",
+    }
+
+
+def run_case(mode, num_agents, num_iterations, url, timeout):
+    os.environ['OLLAMA_HOST'] = url
+    import ollama
+    from agents import db
+    from agents.config import Colors, AGENT_COLORS, AGENT_EMOJIS
+    from agents.manager import Manager
+
+    db.DB_PATH = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    manager = Manager('fake', ollama, Colors, AGENT_COLORS, AGENT_EMOJIS, run_timeout=timeout, async_mode=(mode == 'async'))
+    t0 = time.perf_counter()
+    run_id = manager.run_task(TASK, num_agents, num_iterations)
+    wall = time.perf_counter() - t0
+    with db.get_db() as conn:
+        rows = conn.execute("SELECT COUNT(*) FROM agent_iterations JOIN agents ON agents.id = agent_iterations.agent_id WHERE agents.run_id=?", (run_id,)).fetchone()[0]
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    reaction = manager.orchestration.reaction_stats()
+    calls = manager._token_usage()['calls']
+    return {
+        'wall': wall,
+        'calls': calls,
+        'calls_per_s': calls / wall,
+        'reaction_p50': reaction['reaction_p50'],
+        'reaction_p95': reaction['reaction_p95'],
+        'rows': rows,
+        'rows_per_s': rows / wall,
+        'peak_rss_mb': usage.ru_maxrss / 1024,
+        'completed': len(manager.completed),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--agents', type=int, nargs='+', default=[1, 10, 50])
+    parser.add_argument('--iterations', type=int, nargs='+', default=[1, 5])
+    parser.add_argument('--tasks', type=int, default=2, help='Subtasks per agent')
+    parser.add_argument('--modes', nargs='+', default=['thread', 'async'], choices=['thread', 'async'])
+    parser.add_argument('--latency', default='uniform:0.02,0.08', help='Fake server latency (seconds or distribution)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of LLM calls that fail with a 500')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--timeout', type=float, default=300, help='Per-run orchestration timeout in seconds')
+    parser.add_argument('--case', nargs=4, metavar=('MODE', 'AGENTS', 'ITERATIONS', 'URL'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.case:
+        mode, num_agents, num_iterations, url = args.case
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            result = run_case(mode, int(num_agents), int(num_iterations), url, args.timeout)
+        print(json.dumps(result))
+        return
+
+    server = FakeOllamaServer(latency=args.latency, error_rate=args.error_rate, seed=args.seed).start()
+    try:
+        print(f"{'mode':<7} {'agents':>6} {'iters':>5} {'wall s':>7} {'LLM calls':>9} {'calls/s':>8} {'react p50':>10} {'react p95':>10} {'rows/s':>8} {'peak RSS MB':>12}")
+        for num_agents in args.agents:
+            for num_iterations in args.iterations:
+                for mode in args.modes:
+                    server.script = script(num_agents, args.tasks, num_iterations)
+                    out = subprocess.run([sys.executable, __file__, '--case', mode, str(num_agents), str(num_iterations), server.url, '--timeout', str(args.timeout)],
+                                         capture_output=True, text=True)
+                    if out.returncode != 0:
+                        print(f"{mode:<7} {num_agents:>6} {num_iterations:>5} failed: {out.stderr.strip().splitlines()[-1:]}")
+                        continue
+                    r = json.loads(out.stdout.strip().splitlines()[-1])
+                    print(f"{mode:<7} {num_agents:>6} {num_iterations:>5} {r['wall']:>7.2f} {r['calls']:>9} {r['calls_per_s']:>8.1f} "
+                          f"{r['reaction_p50']:>9.4f}s {r['reaction_p95']:>9.4f}s {r['rows_per_s']:>8.1f} {r['peak_rss_mb']:>12.1f}")
+        print(f"fake server: {server.stats()}")
+    finally:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+# benchmarks/bench_logging.py
+"""
+Cost of log_manager for the agents: synchronous print vs the queued LogWriter.
+
+--agents threads each log --iterations iterations' worth of lines, like
+Agent.run with --verbose: the "Iteration N of M" banner, a multi-line LLM
+response, and the "Completed iteration" line. Output goes to a pipe read
+by a child process that consumes at most --sink-mbps MB/s, standing in for
+a terminal (0: as fast as it can read). Cases:
+
+    print             the previous log_manager: print(..., flush=True) per line
+    queued            LogWriter, no sampling
+    queued + sampled  LogWriter, banners rate limited to --rate lines/s per key
+
+Reported: wall time until every agent finished logging, p99 time of one
+log call in the agent thread, time until the output is drained, and the
+lines written.
+
+Usage:
+    python benchmarks/bench_logging.py [--agents 64] [--iterations 50] [--sink-mbps 5] [--rate 10]
+"""
+import argparse
+import os
+import subprocess
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from agents.config import Colors
+from agents.logging_utils import LogWriter, format_line
+
+RESPONSE = "\n".join(f"Step {i}: analysed the headline and drafted two sentences of the summary." for i in range(4))
+
+SINK = """
+import sys, time
+rate = float(sys.argv[1]) * 1e6
+start, total = time.perf_counter(), 0
+while True:
+    data = sys.stdin.buffer.read1(65536)
+    if not data:
+        break
+    total += len(data)
+    if rate:
+        ahead = total / rate - (time.perf_counter() - start)
+        if ahead > 0:
+            time.sleep(ahead)
+"""
+
+
+def agent(log, name, iterations, call_times):
+    prefix = f"[AGENT] {Colors.OKCYAN}🤖 {name}{Colors.ENDC} "
+    for i in range(iterations):
+        for message, level, sample in (
+                (f"{Colors.HEADER}Iteration {i + 1} of {iterations} for task 1{Colors.ENDC}", "BOLD", "iteration"),
+                (f"{Colors.OKCYAN}LLM Response:{Colors.ENDC}\n{RESPONSE}\n", "INFO", None),
+                (f"{Colors.OKGREEN}Completed iteration {i + 1} for task 1{Colors.ENDC}", "SUCCESS", "iteration_done")):
+            t0 = time.perf_counter()
+            log(message, level, prefix, sample)
+            call_times.append(time.perf_counter() - t0)
+
+
+def run_case(args, make_log):
+    sink = subprocess.Popen([sys.executable, '-c', SINK, str(args.sink_mbps)], stdin=subprocess.PIPE)
+    stdout = sys.stdout
+    sys.stdout = open(sink.stdin.fileno(), 'w', encoding='utf-8', closefd=False)
+    try:
+        log, finish = make_log()
+        call_times = []
+        threads = [threading.Thread(target=agent, args=(log, f"agent_{i + 1}", args.iterations, call_times)) for i in range(args.agents)]
+        t0 = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        wall = time.perf_counter() - t0
+        lines = finish()
+        sys.stdout.flush()
+        sink.stdin.close()
+        sink.wait()
+        drained = time.perf_counter() - t0
+    finally:
+        sys.stdout = stdout
+    call_times.sort()
+    return wall, call_times[int(0.99 * (len(call_times) - 1))], drained, lines
+
+
+def sync_print():
+    count = [0]
+    def log(message, level, prefix, sample):
+        print(format_line(message, Colors, level, prefix), end="", flush=True)
+        count[0] += 1
+    return log, lambda: count[0]
+
+
+def queued(rate):
+    def make():
+        writer = LogWriter(rate_limit=rate)
+        def log(message, level, prefix, sample):
+            writer.submit(message, Colors, level, prefix, sample=sample)
+        def finish():
+            writer.close()
+            return writer.stats['lines']
+        return log, finish
+    return make
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--agents', type=int, default=64)
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--sink-mbps', type=float, default=5, help='Output consumer speed in MB/s (0: unthrottled)')
+    parser.add_argument('--rate', type=float, default=10, help='Sampled lines per second per key')
+    args = parser.parse_args()
+
+    print(f"{'case':<18} {'agents s':>8} {'call p99 ms':>11} {'drained s':>9} {'lines':>7}")
+    for label, make in (('print', sync_print), ('queued', queued(0)), ('queued + sampled', queued(args.rate))):
+        wall, p99, drained, lines = run_case(args, make)
+        print(f"{label:<18} {wall:>8.3f} {p99 * 1000:>11.3f} {drained:>9.3f} {lines:>7}")
+
+
+if __name__ == '__main__':
+    main()
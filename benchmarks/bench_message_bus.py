@@ -0,0 +1,85 @@
+# benchmarks/bench_message_bus.py
+"""
+Microbenchmark for MessageBus.receive.
+
+Compares the indexed, cursor-based bus against the previous full-scan
+implementation. For every (messages, recipients) pair the bus is filled, then
+every recipient polls twice: once to drain its backlog and once more with
+nothing new (the steady-state cost of the manager's polling loop).
+
+Usage:
+    python benchmarks/bench_message_bus.py
+"""
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from agents.message_bus import MessageBus
+
+MESSAGE_COUNTS = [1_000, 10_000, 100_000]
+RECIPIENT_COUNTS = [8, 64, 512]
+BROADCAST_EVERY = 50
+
+
+class ScanMessageBus:
+    """The pre-index bus: one list, scanned on every receive."""
+
+    def __init__(self):
+        self.messages = []
+        self.lock = threading.Lock()
+
+    def send(self, sender, recipient, content):
+        with self.lock:
+            self.messages.append({'sender': sender, 'recipient': recipient, 'content': content, 'timestamp': time.time()})
+
+    def receive(self, recipient, since=0):
+        with self.lock:
+            return [msg for msg in self.messages if (msg['recipient'] == recipient or msg['recipient'] == 'all') and msg['timestamp'] > since]
+
+
+def fill(bus, num_messages, recipients):
+    for i in range(num_messages):
+        recipient = 'all' if i % BROADCAST_EVERY == 0 else recipients[i % len(recipients)]
+        bus.send('bench', recipient, f"message {i}")
+
+
+def run_case(bus_cls, num_messages, num_recipients):
+    recipients = [f"agent_{i+1}" for i in range(num_recipients)]
+    bus = bus_cls()
+    if bus_cls is MessageBus:
+        # As the manager does for its agents, so no broadcast is pruned before every recipient reads it
+        for name in recipients:
+            bus.register(name)
+    t0 = time.perf_counter()
+    fill(bus, num_messages, recipients)
+    t1 = time.perf_counter()
+    received = 0
+    last_seen = {}
+    for name in recipients:
+        msgs = bus.receive(name) if bus_cls is MessageBus else bus.receive(name, since=0)
+        received += len(msgs)
+        last_seen[name] = msgs[-1]['timestamp'] if msgs else 0
+    t2 = time.perf_counter()
+    for name in recipients:
+        if bus_cls is MessageBus:
+            bus.receive(name)
+        else:
+            bus.receive(name, since=last_seen[name])
+    t3 = time.perf_counter()
+    return {'send': t1 - t0, 'drain': t2 - t1, 'idle_poll': t3 - t2, 'received': received}
+
+
+def main():
+    print(f"{'messages':>9} {'recips':>6} | {'bus':<7} {'send ms':>9} {'drain ms':>9} {'idle poll ms':>13} {'received':>9}")
+    for num_messages in MESSAGE_COUNTS:
+        for num_recipients in RECIPIENT_COUNTS:
+            for label, bus_cls in (('scan', ScanMessageBus), ('indexed', MessageBus)):
+                r = run_case(bus_cls, num_messages, num_recipients)
+                print(f"{num_messages:>9} {num_recipients:>6} | {label:<7} {r['send']*1000:>9.2f} {r['drain']*1000:>9.2f} {r['idle_poll']*1000:>13.3f} {r['received']:>9}")
+
+
+if __name__ == '__main__':
+    main()
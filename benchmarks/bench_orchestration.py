@@ -0,0 +1,76 @@
+# benchmarks/bench_orchestration.py
+"""
+End-to-end orchestration benchmark against a stub LLM.
+
+Runs AgentService + OrchestrationService with a stub `ollama` whose chat()
+answers instantly with "@manager: task completed", so every iteration is a
+manager hand-off and the measured time is pure orchestration overhead.
+A second case uses a slow stub to measure how much CPU the manager burns
+while it is only waiting.
+
+Usage:
+    python benchmarks/bench_orchestration.py
+"""
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from agents import db
+from agents.agent_service import AgentService
+from agents.config import Colors, AGENT_COLORS, AGENT_EMOJIS
+from agents.message_bus import MessageBus
+from agents.orchestration_service import OrchestrationService
+
+
+class StubOllama:
+    def __init__(self, delay=0.0, content="@manager: task completed"):
+        self.delay = delay
+        self.content = content
+
+    def chat(self, model, messages, **kwargs):
+        if self.delay:
+            time.sleep(self.delay)
+        return {'message': {'role': 'assistant', 'content': self.content}}
+
+
+def run_once(num_agents, tasks_per_agent, llm):
+    bus = MessageBus()
+    agent_subtasks = [[f"subtask {a}.{t}" for t in range(tasks_per_agent)] for a in range(num_agents)]
+    stop_event = threading.Event()
+    service = AgentService(AGENT_COLORS, AGENT_EMOJIS, 'stub', llm, Colors, bus, False, 1, stop_event=stop_event)
+    tasks_by_name = {f"agent_{i+1}": json.dumps(t) for i, t in enumerate(agent_subtasks)}
+    wall0, cpu0 = time.perf_counter(), time.process_time()
+    names, threads = service.create_agents(agent_subtasks)
+    orchestration = OrchestrationService(bus, names, 0, {n: i for i, n in enumerate(names)}, Colors, AGENT_EMOJIS, agent_threads=threads)
+    orchestration.run_orchestration(1, tasks_by_name.get, {n: None for n in names}, set(), db.get_db, [0], timeout=60, stop_event=stop_event)
+    for t in threads:
+        t.join()
+    return time.perf_counter() - wall0, time.process_time() - cpu0
+
+
+def main():
+    tmpdir = tempfile.mkdtemp()
+    db.DB_PATH = os.path.join(tmpdir, 'bench.db')
+    db.init_db()
+    print(f"{'case':<28} {'wall s':>8} {'cpu s':>8} {'cpu/wall':>9}")
+    cases = [
+        ('instant, 1 agent x 20', 1, 20, StubOllama()),
+        ('instant, 8 agents x 10', 8, 10, StubOllama()),
+        ('instant, 32 agents x 5', 32, 5, StubOllama()),
+        ('idle, 4 agents, 3 s LLM', 4, 1, StubOllama(delay=3.0)),
+    ]
+    for label, num_agents, tasks, llm in cases:
+        with contextlib.redirect_stdout(io.StringIO()):
+            wall, cpu = run_once(num_agents, tasks, llm)
+        print(f"{label:<28} {wall:>8.3f} {cpu:>8.3f} {cpu / wall:>9.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+# benchmarks/bench_plan.py
+"""
+Planning latency of Manager.estimate_agents against benchmarks/fake_ollama.py.
+
+The fake planner answers with a valid JSON plan when the request carries a
+`format` (structured output). Without one, it wraps the plan in prose
+--unformatted-rate of the time, like a model that ignores "output ONLY
+JSON". Reply latency is drawn from --latency. Cases:
+
+    unstructured      no `format`; invalid replies cost a retry round-trip
+    structured        the plan's JSON schema as `format`, one request
+    structured xN     N candidate plans streamed at once, first valid wins
+
+Each case plans --trials times. Reported: plan latency p50/p95, first
+token p50 (streamed candidates only), mean attempts and requests per plan,
+and how many plans fell back to scraping the reply.
+
+Usage:
+    python benchmarks/bench_plan.py [--trials 40] [--latency lognormal:0.3,0.6] [--unformatted-rate 0.5] [--candidates 3]
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import ollama
+from fake_ollama import FakeOllamaServer
+from agents import db
+from agents.config import Colors, AGENT_COLORS, AGENT_EMOJIS
+from agents.manager import Manager
+
+PLAN = ["Collect the headlines", "Summarize each headline", "Write the digest"]
+
+
+def run_case(url, trials, structured, candidates):
+    stats = []
+    for _ in range(trials):
+        with contextlib.redirect_stdout(io.StringIO()):
+            manager = Manager('fake', ollama.Client(host=url), Colors, AGENT_COLORS, AGENT_EMOJIS, plan_candidates=candidates)
+            manager.plan_structured = structured
+            manager.estimate_agents("Summarize today's tech news")
+        stats.append(manager.plan_stats)
+    return stats
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else float('nan')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--trials', type=int, default=40)
+    parser.add_argument('--latency', default='lognormal:0.3,0.6', help='Fake server latency per planning request')
+    parser.add_argument('--unformatted-rate', type=float, default=0.5, help='Fraction of unstructured replies that are not valid JSON')
+    parser.add_argument('--candidates', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    db.DB_PATH = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    server = FakeOllamaServer(latency=args.latency, seed=args.seed, script={'rules': [{
+        'match': 'expert project planner',
+        'content': json.dumps(PLAN),
+        'unformatted': "Sure! Here is a plan for the task:\n" + "\n".join(f"{i+1}. {t}" for i, t in enumerate(PLAN)),
+        'unformatted_rate': args.unformatted_rate,
+    }]}).start()
+    cases = [('unstructured', False, 1), ('structured', True, 1), (f'structured x{args.candidates}', True, args.candidates)]
+    print(f"{'case':<16} {'p50 s':>7} {'p95 s':>7} {'1st tok p50':>11} {'attempts':>8} {'requests':>8} {'fallbacks':>9}")
+    try:
+        for label, structured, candidates in cases:
+            stats = run_case(server.url, args.trials, structured, candidates)
+            latencies = [s['latency'] for s in stats]
+            first = [s['first_token'] for s in stats if s['first_token'] is not None]
+            first_p50 = f"{percentile(first, 0.5):>11.3f}" if first else f"{'-':>11}"
+            attempts = sum(s['attempts'] for s in stats) / len(stats)
+            requests = sum(s['requests'] for s in stats) / len(stats)
+            fallbacks = sum(1 for s in stats if s['fallback'])
+            print(f"{label:<16} {percentile(latencies, 0.5):>7.3f} {percentile(latencies, 0.95):>7.3f} {first_p50} {attempts:>8.2f} {requests:>8.2f} {fallbacks:>9}")
+    finally:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,191 @@
+# benchmarks/bench_prompt_store.py
+"""
+Prompt storage in agent_iterations: the JSON text of every prompt in
+`prompt` vs content-addressed messages (agents/db.py `save_prompt`: each
+distinct message once in prompt_blobs, zlib-compressed, and `prompt_ids`
+listing their keys).
+
+Builds a synthetic history of --rows iterations: tasks of --iterations
+iterations each, whose prompts come from a ConversationContext like the
+agents' (a --system-chars system prompt, the task, then a --reply-chars
+reply and a bus message per iteration, trimmed at the default token
+budget). Both layouts are written through a DBWriter, as agents do.
+
+Reported per layout:
+- submit s: the agents' side, serializing and queueing each row
+- write s: submitting every row, then flushing the writer (the prompts are
+  generated beforehand)
+- DB MB: database file size
+- read all s: every prompt back as a list of messages (json.loads of
+  `prompt` vs db.load_prompts, 1000 rows at a time)
+- 1000 rows ms: the prompts of 1000 random rows, one query each (resume)
+- 100 tasks ms: every prompt of 100 random tasks, one query per task
+  (inspecting what an agent saw)
+- scan s: an aggregate over every agent_iterations row without an index
+
+Then the migration of the text layout (init_db from schema 3), and the
+file size after VACUUM.
+
+Usage:
+    python benchmarks/bench_prompt_store.py [--rows 100000] [--iterations 20] [--system-chars 1500] [--reply-chars 400]
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from agents import db
+from agents.context import ConversationContext
+
+WORDS = ("agent plan result data review task report check update module test value error retry cache queue "
+         "stream token model server request response summary detail section draft final output input").split()
+INSERT = "INSERT INTO agent_iterations (agent_id, iteration, {column}, response, duration, task_index) VALUES (?, ?, ?, ?, ?, ?)"
+
+
+def text(rng, chars):
+    words, length = [], 0
+    while length < chars:
+        word = rng.choice(WORDS)
+        words.append(word)
+        length += len(word) + 1
+    return ' '.join(words)
+
+
+def prompts(num_rows, iterations, system_chars, reply_chars):
+    """(agent_id, iteration, messages, reply) for every row, as the agents would save them."""
+    rng = random.Random(0)
+    system_prompt = text(rng, system_chars)
+    row = 0
+    task = 0
+    while row < num_rows:
+        task += 1
+        context = ConversationContext(system_prompt, f"Subtask {task}: {text(rng, 200)}")
+        for iteration in range(iterations):
+            if row >= num_rows:
+                return
+            reply = text(rng, reply_chars)
+            yield task, iteration, context.messages(), reply
+            context.add("assistant", reply)
+            context.add("user", f"[Message from manager]: {text(rng, 80)}")
+            row += 1
+
+
+def write(path, layout, args):
+    db.DB_PATH = path
+    db.init_db()
+    rows = list(prompts(args.rows, args.iterations, args.system_chars, args.reply_chars))
+    writer = db.DBWriter(path)
+    submit_s = 0.0
+    t0 = time.perf_counter()
+    for agent_id, iteration, messages, reply in rows:
+        t1 = time.perf_counter()
+        if layout == 'text':
+            writer.submit(INSERT.format(column='prompt'), (agent_id, iteration, json.dumps(messages), reply, 1.0, 0))
+        else:
+            writer.submit(INSERT.format(column='prompt_ids'), (agent_id, iteration, db.save_prompt(messages, writer), reply, 1.0, 0))
+        submit_s += time.perf_counter() - t1
+    writer.close()
+    return submit_s, time.perf_counter() - t0
+
+
+def read_all(path, layout):
+    conn = sqlite3.connect(path)
+    count = 0
+    if layout == 'text':
+        for (prompt,) in conn.execute("SELECT prompt FROM agent_iterations WHERE prompt IS NOT NULL"):
+            count += len(json.loads(prompt))
+    else:
+        cursor = conn.execute("SELECT prompt_ids FROM agent_iterations WHERE prompt_ids IS NOT NULL")
+        while True:
+            rows = cursor.fetchmany(1000)
+            if not rows:
+                break
+            count += sum(len(messages) for messages in db.load_prompts(conn, [ids for (ids,) in rows]))
+    conn.close()
+    return count
+
+
+def lookups(path, layout, num_rows, n=1000):
+    rng = random.Random(1)
+    conn = sqlite3.connect(path)
+    for _ in range(n):
+        row_id = rng.randint(1, num_rows)
+        if layout == 'text':
+            json.loads(conn.execute("SELECT prompt FROM agent_iterations WHERE id=?", (row_id,)).fetchone()[0])
+        else:
+            db.load_prompt(conn, conn.execute("SELECT prompt_ids FROM agent_iterations WHERE id=?", (row_id,)).fetchone()[0])
+    conn.close()
+
+
+def task_reads(path, layout, num_tasks, n=100):
+    # The synthetic history stores each task under its own agent_id
+    rng = random.Random(2)
+    conn = sqlite3.connect(path)
+    for _ in range(n):
+        task = rng.randint(1, num_tasks)
+        column = 'prompt' if layout == 'text' else 'prompt_ids'
+        values = [value for (value,) in conn.execute(f"SELECT {column} FROM agent_iterations WHERE agent_id=? ORDER BY iteration", (task,))]
+        if layout == 'text':
+            [json.loads(value) for value in values]
+        else:
+            db.load_prompts(conn, values)
+    conn.close()
+
+
+def scan(path):
+    conn = sqlite3.connect(path)
+    result = conn.execute("SELECT COUNT(*), SUM(duration), SUM(LENGTH(response)) FROM agent_iterations NOT INDEXED").fetchone()
+    conn.close()
+    return result
+
+
+def timed(fn, *args):
+    t0 = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--iterations', type=int, default=20, help='Iterations per task; the prompt grows with each')
+    parser.add_argument('--system-chars', type=int, default=1500)
+    parser.add_argument('--reply-chars', type=int, default=400)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    paths = {layout: os.path.join(tmp, f"{layout}.db") for layout in ('text', 'blobs')}
+    print(f"{args.rows} iterations, {args.iterations} per task, {args.system_chars}-char system prompt, {args.reply_chars}-char replies")
+    print(f"{'layout':<22} {'submit s':>8} {'write s':>8} {'DB MB':>8} {'read all s':>10} {'1000 rows ms':>12} {'100 tasks ms':>12} {'scan s':>7}")
+    for layout, label in (('text', 'prompt (JSON text)'), ('blobs', 'prompt_ids + blobs')):
+        path = paths[layout]
+        submit_s, write_s = write(path, layout, args)
+        size = os.path.getsize(path) / 1e6
+        read_s = timed(read_all, path, layout)
+        lookup_s = timed(lookups, path, layout, args.rows)
+        task_s = timed(task_reads, path, layout, args.rows // args.iterations)
+        scan_s = timed(scan, path)
+        print(f"{label:<22} {submit_s:>8.2f} {write_s:>8.2f} {size:>8.1f} {read_s:>10.2f} {lookup_s * 1000:>12.1f} {task_s * 1000:>12.1f} {scan_s:>7.3f}")
+
+    # The text layout as an existing database: back to schema 3, then migrated by init_db
+    path = paths['text']
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA user_version = 3")
+    conn.close()
+    db.DB_PATH = path
+    migrate_s = timed(db.init_db)
+    conn = sqlite3.connect(path)
+    vacuum_s = timed(conn.execute, "VACUUM")
+    conn.close()
+    migrated, written = read_all(path, "blobs"), read_all(paths["blobs"], "blobs")
+    print(f"\nmigrate text -> blobs: {migrate_s:.2f}s, VACUUM {vacuum_s:.2f}s, {os.path.getsize(path) / 1e6:.1f} MB after; {migrated} messages read back (blobs layout: {written})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+# benchmarks/bench_replay.py
+"""
+Record and replay (agents/replay.py): a run recorded against
+benchmarks/fake_ollama.py, then re-run from babyagi.db without a server.
+
+The recorded run plans --agents x --tasks subtasks; agents report
+"@manager: progress ..." until their last iteration, which reports "task
+completed". Latency is sampled from a seeded distribution (--latency), so
+recorded calls take different times. The run is then replayed through the
+same Manager code paths with the recorded timing and at zero latency, in
+the recorded mode and with --stream and --async.
+
+Reported per run:
+- wall s: run_task from planning to the saved run summary
+- LLM calls: planning and agent calls (token ledger count)
+- replayed / misses / unused: calls answered from the recording, calls
+  past its end, recorded calls never asked for
+- same replies: the replay's saved iterations whose (agent, task,
+  iteration, response) match a recorded one
+- overhead ms/call: at zero latency, wall / LLM calls (the bus, DB writes
+  and scheduling around each call)
+
+Usage:
+    python benchmarks/bench_replay.py [--agents 8] [--tasks 2] [--iterations 10] [--latency lognormal:0.05,0.5]
+"""
+import argparse
+import collections
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from fake_ollama import FakeOllamaServer
+from bench_e2e import TASK, script
+from agents import db
+from agents.backends import OllamaBackend
+from agents.config import Colors, AGENT_COLORS, AGENT_EMOJIS
+from agents.manager import Manager
+from agents.replay import replay_run
+
+
+def replies(run_id):
+    """Count of saved (agent, task, iteration, response) rows of a run."""
+    with db.get_db() as conn:
+        return collections.Counter(conn.execute(
+            "SELECT a.agent_name, i.task_index, i.iteration, i.response FROM agent_iterations i JOIN agents a ON i.agent_id = a.id "
+            "WHERE a.run_id=? AND i.prompt_ids IS NOT NULL", (run_id,)).fetchall())
+
+
+def record(url, agents, tasks, iterations):
+    with contextlib.redirect_stdout(io.StringIO()):
+        manager = Manager('fake', OllamaBackend(url), Colors, AGENT_COLORS, AGENT_EMOJIS)
+        t0 = time.perf_counter()
+        run_id = manager.run_task(TASK, agents, iterations)
+        wall = time.perf_counter() - t0
+    return run_id, {'wall': wall, 'calls': manager._token_usage()['calls']}
+
+
+def replay(run_id, timing, **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return replay_run(run_id, Colors, AGENT_COLORS, AGENT_EMOJIS, timing=timing, **kwargs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--agents', type=int, default=8)
+    parser.add_argument('--tasks', type=int, default=2, help='Subtasks per agent')
+    parser.add_argument('--iterations', type=int, default=10, help='Iterations per subtask')
+    parser.add_argument('--latency', default='lognormal:0.05,0.5', help='Fake server latency per request when recording')
+    args = parser.parse_args()
+
+    db.DB_PATH = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    server = FakeOllamaServer(latency=args.latency, script=script(args.agents, args.tasks, args.iterations)).start()
+    try:
+        run_id, recorded = record(server.url, args.agents, args.tasks, args.iterations)
+    finally:
+        server.shutdown()
+    recorded_replies = replies(run_id)
+    print(f"recorded run {run_id}: {args.agents} agents x {args.tasks} subtasks, {args.iterations} iterations, latency {args.latency}")
+    print(f"{'run':<26} {'wall s':>7} {'LLM calls':>9} {'replayed':>8} {'misses':>6} {'unused':>6} {'same replies':>12} {'overhead ms/call':>16}")
+    print(f"{'recorded (fake server)':<26} {recorded['wall']:>7.2f} {recorded['calls']:>9} {'':>8} {'':>6} {'':>6} {'':>12} {'':>16}")
+    for label, timing, kwargs in (('replay, original timing', 'original', {}), ('replay, zero latency', 'zero', {}),
+                                  ('replay, zero, --stream', 'zero', {'stream': True}), ('replay, zero, --async', 'zero', {'async_mode': True})):
+        new_run_id, r = replay(run_id, timing, **kwargs)
+        same = sum((replies(new_run_id) & recorded_replies).values())
+        overhead = f"{r['wall'] / r['calls'] * 1000:.2f}" if timing == 'zero' else ''
+        print(f"{label:<26} {r['wall']:>7.2f} {r['calls']:>9} {r['replayed']:>8} {r['misses']:>6} {r['unused']:>6} {f'{same}/{sum(recorded_replies.values())}':>12} {overhead:>16}")
+
+
+if __name__ == '__main__':
+    main()
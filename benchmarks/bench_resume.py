@@ -0,0 +1,112 @@
+# benchmarks/bench_resume.py
+"""
+Cost of recovering from a crash: --resume vs starting the run over.
+
+Against benchmarks/fake_ollama.py, a run of --agents agents x --subtasks
+subtasks x --iterations iterations is started in a child process and
+SIGKILLed after --kill-after seconds. The run is then continued with
+Manager.resume_run in a fresh process, and compared with running the
+whole task again from scratch. Reported: LLM requests and wall time of
+each step, and the agent iterations per (agent, task) in the DB after
+resuming (each should be --iterations; a few more means iterations that
+were in flight or not yet committed at the kill were redone).
+
+Usage:
+    python benchmarks/bench_resume.py [--agents 4] [--subtasks 8] [--iterations 10] [--latency 0.1] [--kill-after 2.0] [--dag]
+"""
+import argparse
+import collections
+import contextlib
+import io
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+from fake_ollama import FakeOllamaServer
+
+
+def child(mode, db_path, url, num_agents, num_subtasks, num_iterations, dag):
+    import ollama
+    from agents import db
+    from agents.config import Colors, AGENT_COLORS, AGENT_EMOJIS
+    from agents.manager import Manager
+
+    db.DB_PATH = db_path
+    plan = [f"Subtask {i+1} of the task" for i in range(num_subtasks)]
+    with contextlib.redirect_stdout(io.StringIO()):
+        manager = Manager('fake', ollama.Client(host=url), Colors, AGENT_COLORS, AGENT_EMOJIS, dag=dag)
+        if mode == 'resume':
+            run_id = manager.resume_run(1)
+        else:
+            run_id = manager.run_task("Benchmark task", num_agents, num_iterations, agent_list=plan)
+    print(json.dumps({'run_id': run_id}))
+
+
+def step(args, mode, db_path, server, kill_after=None):
+    before = server.stats().get('requests', 0)
+    cmd = [sys.executable, __file__, '--child', mode, db_path, server.url, str(args.agents), str(args.subtasks), str(args.iterations)] + (['--dag'] if args.dag else [])
+    t0 = time.perf_counter()
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    try:
+        proc.wait(timeout=kill_after)
+    except subprocess.TimeoutExpired:
+        proc.send_signal(signal.SIGKILL)
+        proc.wait()
+    wall = time.perf_counter() - t0
+    if kill_after is None and proc.returncode != 0:
+        raise RuntimeError(proc.stderr.read())
+    return server.stats().get('requests', 0) - before, wall
+
+
+def iterations_per_task(db_path):
+    import sqlite3
+    conn = sqlite3.connect(db_path)
+    rows = conn.execute("SELECT a.agent_name, i.task_index, COUNT(*) FROM agent_iterations i JOIN agents a ON i.agent_id = a.id "
+                        "WHERE a.run_id = 1 AND i.prompt_ids IS NOT NULL GROUP BY a.agent_name, i.task_index").fetchall()
+    statuses = collections.Counter(row[0] for row in conn.execute("SELECT status FROM agents WHERE run_id = 1"))
+    conn.close()
+    return collections.Counter(count for _, _, count in rows), dict(statuses)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--agents', type=int, default=4)
+    parser.add_argument('--subtasks', type=int, default=8)
+    parser.add_argument('--iterations', type=int, default=10)
+    parser.add_argument('--latency', default='0.1', help='Fake server latency per request')
+    parser.add_argument('--kill-after', type=float, default=2.0, help='Seconds before the first run is killed')
+    parser.add_argument('--dag', action='store_true', help='Use the subtask scheduler')
+    parser.add_argument('--child', nargs=6, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        mode, db_path, url, num_agents, num_subtasks, num_iterations = args.child
+        child(mode, db_path, url, int(num_agents), int(num_subtasks), int(num_iterations), args.dag)
+        return
+
+    server = FakeOllamaServer(latency=args.latency, script={'default': "@manager: progress on the subtask ({n})"}).start()
+    try:
+        tmp = tempfile.mkdtemp()
+        crashed_db = os.path.join(tmp, 'crashed.db')
+        killed_requests, killed_wall = step(args, 'run', crashed_db, server, kill_after=args.kill_after)
+        resume_requests, resume_wall = step(args, 'resume', crashed_db, server)
+        rerun_requests, rerun_wall = step(args, 'run', os.path.join(tmp, 'rerun.db'), server)
+        counts, statuses = iterations_per_task(crashed_db)
+        print(f"{'step':<26} {'LLM requests':>12} {'wall s':>7}")
+        print(f"{'run, killed':<26} {killed_requests:>12} {killed_wall:>7.2f}")
+        print(f"{'--resume':<26} {resume_requests:>12} {resume_wall:>7.2f}")
+        print(f"{'start over':<26} {rerun_requests:>12} {rerun_wall:>7.2f}")
+        print(f"saved by resuming: {rerun_requests - resume_requests} requests ({1 - resume_requests / rerun_requests:.0%}), {rerun_wall - resume_wall:.2f}s")
+        print(f"iterations per (agent, task) after resume: {dict(sorted(counts.items()))}; agent status: {statuses}")
+    finally:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
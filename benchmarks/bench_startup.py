@@ -0,0 +1,117 @@
+# benchmarks/bench_startup.py
+"""
+Time to first agent response of an interactive `python main.py` session,
+with model prewarming (agents/prewarm.py) and with --no-prewarm.
+
+main.py runs in a subprocess, in a temporary directory (so its
+babyagi.db), against benchmarks/fake_ollama.py with a cold model load of
+--load-latency seconds: the first request for the model waits for it. A
+simulated user answers the first prompt after --think-time seconds (reading
+the examples and typing a task), then 1 agent and 1 iteration at once, and
+no feedback. The run's startup timeline comes from llm_stats in
+babyagi.db; all times are seconds from process start:
+
+- prompt: the first prompt on screen (mostly imports)
+- task: the task entered
+- plan: the plan back from the model
+- agents: agents started (with prewarming, after the model is loaded)
+- 1st response: the first agent reply handled
+- wait after task: 1st response - task, the wait the user sees
+
+Then the import cost main.py no longer pays before its first prompt, each
+module timed in a fresh interpreter: agents.manager as imported now, and
+the modules it used to import eagerly.
+
+Usage:
+    python benchmarks/bench_startup.py [--load-latency 3] [--think-time 2] [--repeat 3]
+"""
+import argparse
+import json
+import os
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+from fake_ollama import FakeOllamaServer
+from bench_e2e import TASK, script
+
+# Prompt text -> (answer, wait before answering is the think time)
+ANSWERS = (("Select 1, 2", TASK, True), ("How many agents", "1", False), ("How many iterations", "1", False), ("Enter your feedback", "", False))
+COLUMNS = ('prompt', 'task_entered', 'plan', 'agents_started', 'first_response')
+MODULES = ('agents.manager', 'ollama', 'numpy', 'http.server')
+
+
+def answer(proc, think_time):
+    """Answer main.py's prompts as they appear on its stdout."""
+    seen, pending = b'', list(ANSWERS)
+    while pending:
+        data = proc.stdout.read1(4096)
+        if not data:
+            return
+        seen += data
+        while pending and pending[0][0].encode() in seen:
+            prompt, reply, think = pending.pop(0)
+            seen = seen[seen.index(prompt.encode()) + len(prompt):]
+            if think:
+                time.sleep(think_time)
+            proc.stdin.write(reply.encode() + b'\n')
+            proc.stdin.flush()
+
+
+def session(url, prewarm, think_time):
+    cwd = tempfile.mkdtemp()
+    args = [sys.executable, os.path.join(ROOT, 'main.py')] + ([] if prewarm else ['--no-prewarm'])
+    env = dict(os.environ, OLLAMA_HOST=url, PYTHONPATH=ROOT)
+    proc = subprocess.Popen(args, cwd=cwd, env=env, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    reader = threading.Thread(target=answer, args=(proc, think_time), daemon=True)
+    reader.start()
+    proc.wait(timeout=120)
+    with sqlite3.connect(os.path.join(cwd, 'babyagi.db')) as conn:
+        llm_stats, = conn.execute("SELECT llm_stats FROM runs ORDER BY id DESC LIMIT 1").fetchone()
+    return json.loads(llm_stats)['startup']['milestones']
+
+
+def import_seconds(module):
+    code = f"import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)"
+    out = subprocess.run([sys.executable, '-c', code], cwd=ROOT, env=dict(os.environ, PYTHONPATH=ROOT), capture_output=True, text=True)
+    return float(out.stdout.strip()) if out.returncode == 0 else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--load-latency', type=float, default=3.0, help='Seconds the fake server takes to load the model cold')
+    parser.add_argument('--think-time', type=float, default=2.0, help='Seconds the simulated user takes to enter the task')
+    parser.add_argument('--repeat', type=int, default=3, help='Sessions per case; the median of each column is shown')
+    args = parser.parse_args()
+
+    print(f"cold model load {args.load_latency:g}s, task entered {args.think_time:g}s after the first prompt, median of {args.repeat} sessions")
+    print(f"{'case':<14} {'prompt':>7} {'task':>7} {'plan':>7} {'agents':>7} {'1st response':>12} {'wait after task':>15}")
+    for label, prewarm in (('--no-prewarm', False), ('prewarm', True)):
+        runs = []
+        for _ in range(args.repeat):
+            # A fresh server per session, so every session starts with the model unloaded
+            server = FakeOllamaServer(load_latency=args.load_latency, script=script(1, 1, 1)).start()
+            try:
+                runs.append(session(server.url, prewarm, args.think_time))
+            finally:
+                server.shutdown()
+        median = {name: statistics.median(run[name] for run in runs) for name in COLUMNS}
+        wait = statistics.median(run['first_response'] - run['task_entered'] for run in runs)
+        print(f"{label:<14} {median['prompt']:>7.2f} {median['task_entered']:>7.2f} {median['plan']:>7.2f} {median['agents_started']:>7.2f} "
+              f"{median['first_response']:>12.2f} {wait:>15.2f}")
+
+    print("\nimport time in a fresh interpreter (median of 5):")
+    for module in MODULES:
+        times = [t for t in (import_seconds(module) for _ in range(5)) if t is not None]
+        print(f"  {module:<16} {statistics.median(times) * 1000:>6.0f} ms" if times else f"  {module:<16} not installed")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+# benchmarks/bench_streaming.py
+"""
+Streaming vs non-streaming agent LLM calls against benchmarks/fake_ollama.py.
+
+The fake server generates WORDS words at --token-latency seconds each.
+For each mode this reports the time until the manager first sees anything
+from the agent on the bus, the full call time, and (streaming) the TTFT and
+tokens/s recorded for agent_iterations. A third case streams a
+task_completed tool call after --tool-call-after words and shows the
+early abort.
+
+Usage:
+    python benchmarks/bench_streaming.py [--words 200] [--token-latency 0.01] [--tool-call-after 20]
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import ollama
+from fake_ollama import FakeOllamaServer
+from agents.agent import Agent
+from agents.config import Colors
+from agents.llm_gateway import LLMGateway
+from agents.message_bus import MessageBus
+
+
+def run_case(server, stream):
+    client = ollama.Client(host=server.url)
+    bus = MessageBus()
+    agent = Agent('agent_1', ['task'], Colors.OKBLUE, '*', 'fake', client, Colors, bus, False, 1, gateway=LLMGateway(client), stream=stream)
+    first_seen = []
+
+    def watch():
+        # What the manager's loop does: sleep on the bus until something arrives
+        if bus.wait("manager", timeout=30):
+            first_seen.append(time.monotonic())
+
+    watcher = threading.Thread(target=watch)
+    watcher.start()
+    info = {}
+    t0 = time.monotonic()
+    response = agent.chat_with_retries([{'role': 'user', 'content': 'go'}], info)
+    total = time.monotonic() - t0
+    if not stream:
+        # Non-streaming: the manager only hears from the agent once the response is relayed
+        agent.relay_directive(response.message.content)
+    watcher.join()
+    return first_seen[0] - t0, total, info
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--words', type=int, default=200)
+    parser.add_argument('--token-latency', type=float, default=0.01)
+    parser.add_argument('--tool-call-after', type=int, default=20)
+    args = parser.parse_args()
+    content = "@manager: " + " ".join(f"word{i}" for i in range(args.words)) + " task completed"
+    server = FakeOllamaServer(content=content, token_latency=args.token_latency).start()
+
+    print(f"{'mode':<22} {'first visible':>14} {'call total':>11} {'ttft':>8} {'tok/s':>8}")
+    for label, stream, tool_call_after in (('non-streaming', False, None), ('streaming', True, None), ('streaming + abort', True, args.tool_call_after)):
+        server.tool_call_after = tool_call_after
+        first, total, info = run_case(server, stream)
+        ttft = f"{info['ttft']:.3f}s" if 'ttft' in info else '-'
+        tps = f"{info['tokens_per_second']:.1f}" if 'tokens_per_second' in info else '-'
+        print(f"{label:<22} {first:>13.3f}s {total:>10.3f}s {ttft:>8} {tps:>8}")
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
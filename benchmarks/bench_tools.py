@@ -0,0 +1,155 @@
+# benchmarks/bench_tools.py
+"""
+Tool call execution (agents/tools.py).
+
+1. Sandbox: tools that hang, allocate past the memory cap, print a huge
+   result, exit their process and raise run on a ToolPool with a short
+   timeout. Reported: what each call returned and how long it took; the
+   pool keeps serving calls afterwards.
+2. Fan-out: --calls independent calls of one response, each sleeping
+   --tool-ms (I/O-bound, like an HTTP fetch), on pools of 1 (one call at a
+   time) to --calls processes. Reported: wall time for the batch.
+3. End to end: --agents agents against benchmarks/fake_ollama.py. Each
+   agent's first response creates a tool and calls it --calls times; the
+   next response completes the task. Compared: tool results fed back in the
+   same iteration (max_rounds 3) vs only at the next iteration (max_rounds
+   0), and 1 vs --calls tool processes. Reported: wall time, iterations,
+   LLM calls, and the tool latency recorded in the iterations' tags.
+
+Usage:
+    python benchmarks/bench_tools.py [--calls 4] [--tool-ms 200] [--agents 4] [--latency 0.05]
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from fake_ollama import FakeOllamaServer
+from agents.tools import ToolExecutor, ToolPool
+from agents.metrics import get_metrics
+from agents.backends import OllamaBackend
+
+SANDBOX_TOOLS = {
+    'hang': "def hang():\n    while True:\n        pass\n",
+    'hog': "def hog():\n    blocks = []\n    while True:\n        blocks.append(bytearray(64 * 1024 * 1024))\n",
+    'flood': "def flood():\n    print('x' * 10_000_000)\n",
+    'exit': "import os\ndef exit():\n    os._exit(7)\n",
+    'fail': "def fail():\n    raise ValueError('bad input')\n",
+    'ok': "def ok():\n    return {'status': 'fine'}\n",
+}
+SLEEP_TOOL = "import time\ndef fetch(i, ms):\n    time.sleep(ms / 1000)\n    return f'page {i}'\n"
+
+
+def call(tool, **arguments):
+    return {'function': {'name': tool, 'arguments': arguments}}
+
+
+def sandbox():
+    executor = ToolExecutor(ToolPool(workers=2, timeout=1.0, memory_mb=256, max_result_chars=2000))
+    try:
+        for name, code in SANDBOX_TOOLS.items():
+            executor.registry.register(name, code)
+        rows = [(name, executor.execute([call(name)])[0]) for name in SANDBOX_TOOLS]
+        rows.append(('ok (after)', executor.execute([call('ok')])[0]))
+        return rows, executor.stats()
+    finally:
+        executor.close()
+
+
+def fanout(calls, tool_ms, workers):
+    executor = ToolExecutor(ToolPool(workers=workers, timeout=30))
+    try:
+        executor.registry.register('fetch', SLEEP_TOOL)
+        batch = [call('fetch', i=i, ms=tool_ms) for i in range(calls)]
+        executor.execute(batch)  # start the processes
+        t0 = time.perf_counter()
+        results = executor.execute(batch)
+        return time.perf_counter() - t0, all(r['ok'] for r in results)
+    finally:
+        executor.close()
+
+
+def script(calls, tool_ms):
+    first = {'content': "@manager: fetching pages",
+             'tool_calls': [{'name': 'create_or_update_tool', 'arguments': {'name': 'fetch', 'code': SLEEP_TOOL, 'description': 'Fetch page i'}}]
+             + [{'name': 'fetch', 'arguments': {'i': i, 'ms': tool_ms}} for i in range(calls)]}
+    done = {'content': "@manager: all pages fetched", 'tool_calls': ['task_completed']}
+    return {'rules': [{'match': 'Subtask', 'turns': [first, done]}], 'default': "@manager: progress"}
+
+
+def e2e(url, agents, calls, workers, max_rounds, async_mode=False):
+    from agents import db
+    from agents.db import get_db
+    from agents.config import Colors, AGENT_COLORS, AGENT_EMOJIS
+    from agents.manager import Manager
+    db.DB_PATH = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    tools = ToolExecutor(ToolPool(workers=workers, timeout=30), max_rounds=max_rounds)
+    tools.execute([call('create_or_update_tool', name='warm', code="def warm():\n    return 1\n", description='')] + [call('warm')] * workers)
+    plan = [f"Subtask {i}" for i in range(agents)]
+    before = get_metrics().snapshot()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            manager = Manager('fake', OllamaBackend(url), Colors, AGENT_COLORS, AGENT_EMOJIS, async_mode=async_mode, tools=tools)
+            t0 = time.perf_counter()
+            run_id = manager.run_task("Tool benchmark", agents, 5, agent_list=plan)
+            wall = time.perf_counter() - t0
+        with get_db() as conn:
+            rows = conn.execute("SELECT i.tags FROM agent_iterations i JOIN agents a ON i.agent_id = a.id WHERE a.run_id=?", (run_id,)).fetchall()
+    finally:
+        tools.close()
+    tags = [json.loads(row[0]) for row in rows if row[0]]
+    after = get_metrics().snapshot()
+    # Iterations started and LLM calls made, from the span counts
+    started = lambda span: after.get(span, {}).get('count', 0) - before.get(span, {}).get('count', 0)
+    tool_calls = [c for t in tags for c in t.get('tools', ())]
+    durations = sorted(c['duration'] for c in tool_calls)
+    tool_spans = sorted(t['spans'].get('tools', 0.0) for t in tags if 'tools' in t['spans'])
+    return {'wall': wall, 'iterations': started('bus_receive'), 'llm_calls': started('llm_request'), 'tool_calls': len(tool_calls),
+            'call_p50': durations[len(durations) // 2] if durations else 0.0,
+            'batch_p50': tool_spans[len(tool_spans) // 2] if tool_spans else 0.0}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--calls', type=int, default=4, help='Independent tool calls per response')
+    parser.add_argument('--tool-ms', type=float, default=200, help='Duration of each tool call (sleep)')
+    parser.add_argument('--agents', type=int, default=4)
+    parser.add_argument('--latency', default='0.05', help='Fake server latency per request')
+    args = parser.parse_args()
+
+    rows, stats = sandbox()
+    print("sandbox: 1.0s timeout, 256 MB address space, 2000-character results")
+    print(f"{'tool':<11} {'ok':>5} {'ms':>7}  result")
+    for name, result in rows:
+        flags = ', '.join(flag for flag in ('timeout', 'crashed', 'truncated') if result.get(flag))
+        print(f"{name:<11} {str(result['ok']):>5} {result['duration'] * 1000:>7.1f}  {result['content'][:60]!r}{f' ({flags})' if flags else ''}")
+    print(f"pool: {stats['calls']} calls, {stats['timeouts']} timed out, {stats['crashes']} crashed, {stats['truncated']} truncated, {stats['spawned']} processes started")
+
+    print(f"\nfan-out: {args.calls} calls of {args.tool_ms:g} ms, {os.cpu_count()} CPU(s)")
+    print(f"{'processes':>9} {'wall s':>7}")
+    for workers in sorted({1, 2, args.calls}):
+        wall, ok = fanout(args.calls, args.tool_ms, workers)
+        print(f"{workers:>9} {wall:>7.3f}{'' if ok else '  (errors)'}")
+
+    server = FakeOllamaServer(latency=args.latency, script=script(args.calls, args.tool_ms)).start()
+    print(f"\nend to end: {args.agents} agents, {args.calls} tool calls of {args.tool_ms:g} ms each, {args.latency}s LLM latency")
+    print(f"{'mode':<34} {'wall s':>7} {'iterations':>10} {'LLM calls':>9} {'tool calls':>10} {'call p50 ms':>11} {'batch p50 ms':>12}")
+    try:
+        for label, workers, max_rounds, async_mode in (('results next iteration, 1 proc', 1, 0, False),
+                                                        ('same iteration, 1 proc', 1, 3, False),
+                                                        (f"same iteration, {args.calls} procs", args.calls, 3, False),
+                                                        (f"same iteration, {args.calls} procs, --async", args.calls, 3, True)):
+            r = e2e(server.url, args.agents, args.calls, workers, max_rounds, async_mode)
+            print(f"{label:<34} {r['wall']:>7.2f} {r['iterations']:>10} {r['llm_calls']:>9} {r['tool_calls']:>10} {r['call_p50'] * 1000:>11.1f} {r['batch_p50'] * 1000:>12.1f}")
+    finally:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+# benchmarks/bench_workers.py
+"""
+Agents in worker processes over the socket-backed MessageBus.
+
+1. Semantics: the same script of sends, broadcasts and cursor / `since`
+   receives by several consumers runs against the in-process MessageBus
+   and against SocketMessageBus clients of a BusBroker (Unix and TCP); the
+   results must be identical apart from timestamps.
+2. Bus round trip: send + receive pairs per second, in-process vs socket.
+3. End to end: Manager.run_task with --agents agents x --iterations
+   iterations against benchmarks/fake_ollama.py, with agents as threads of
+   the manager process and in 1, 2 and 4 worker processes. Worker startup
+   (spawn, import, connect) is reported separately; the run itself is
+   timed after a warm-up run on the same pool. --cpu-ms adds that much
+   CPU-bound post-processing per response (hashing), which the threads
+   of one interpreter serialize on the GIL and worker processes can run
+   on separate cores.
+
+Usage:
+    python benchmarks/bench_workers.py [--agents 32] [--iterations 5] [--latency 0.02] [--cpu-ms 5] [--procs 1 2 4]
+"""
+import argparse
+import contextlib
+import hashlib
+import io
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from fake_ollama import FakeOllamaServer
+from agents.message_bus import MessageBus
+from agents.socket_bus import BusBroker, SocketMessageBus
+
+TOKEN = 'bench'
+
+
+def bus_script(bus):
+    # Direct, broadcast and chunk messages; cursor and `since` receives by several consumers
+    out = []
+    for i in range(50):
+        bus.send(f"agent_{i % 4}", "manager" if i % 3 else bus.BROADCAST, f"message {i}", kind='chunk' if i % 7 == 0 else 'message')
+        if i % 5 == 0:
+            out.append(bus.receive("manager"))
+            out.append(bus.receive(f"agent_{i % 4}"))
+        if i % 11 == 0:
+            out.append(bus.receive("manager", since=i // 2))
+            out.append(bus.receive("agent_1", consumer="observer"))
+    out.append(bus.wait("manager", timeout=0))
+    bus.send("agent_2", "manager", "last")
+    out.append(bus.wait("manager", timeout=0))
+    out.append(bus.receive("manager"))
+    out.append(bus.messages)
+    return [[{k: v for k, v in msg.items() if k != 'timestamp'} for msg in item] if isinstance(item, list) else item for item in out]
+
+
+def semantics(address):
+    broker = BusBroker(MessageBus(), address, TOKEN).start()
+    client = SocketMessageBus(broker.address, TOKEN)
+    try:
+        return bus_script(MessageBus()) == bus_script(client)
+    finally:
+        client.close()
+        broker.shutdown()
+
+
+def round_trips(bus, n):
+    t0 = time.perf_counter()
+    for i in range(n):
+        bus.send("agent_1", "manager", "progress")
+        bus.receive("manager")
+    return n / (time.perf_counter() - t0)
+
+
+def socket_round_trips(address, n):
+    broker = BusBroker(MessageBus(), address, TOKEN).start()
+    client = SocketMessageBus(broker.address, TOKEN)
+    try:
+        return round_trips(client, n)
+    finally:
+        client.close()
+        broker.shutdown()
+
+
+def e2e(url, num_agents, num_iterations, procs):
+    import ollama
+    from agents import db
+    from agents.config import Colors, AGENT_COLORS, AGENT_EMOJIS
+    from agents.manager import Manager
+    from agents.worker_pool import WorkerPool
+    db.DB_PATH = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    plan = [f"Subtask {i}" for i in range(num_agents)]
+    with contextlib.redirect_stdout(io.StringIO()):
+        manager = Manager('fake', ollama, Colors, AGENT_COLORS, AGENT_EMOJIS, worker_procs=procs)
+        t0 = time.perf_counter()
+        if procs:
+            manager.worker_pool = WorkerPool(manager.bus, procs=procs).start()
+        startup = time.perf_counter() - t0
+        manager.run_task("Warm-up", num_agents, 1, agent_list=plan)
+        t0 = time.perf_counter()
+        manager.run_task("Benchmark task", num_agents, num_iterations, agent_list=plan)
+        wall = time.perf_counter() - t0
+        if manager.worker_pool is not None:
+            manager.worker_pool.close()
+    return wall, startup
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--agents', type=int, default=32)
+    parser.add_argument('--iterations', type=int, default=5)
+    parser.add_argument('--latency', default='0.02', help='Fake server latency per request')
+    parser.add_argument('--cpu-ms', type=float, default=5, help='CPU-bound post-processing per response, in the agent process')
+    parser.add_argument('--procs', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--round-trips', type=int, default=20000)
+    args = parser.parse_args()
+
+    unix = f"unix:{os.path.join(tempfile.mkdtemp(), 'bus.sock')}"
+    tcp = "tcp://127.0.0.1:0"
+    print(f"semantics match in-process bus: unix {semantics(unix)}, tcp {semantics(tcp)}")
+    print(f"{'bus':<12} {'send+receive/s':>14} {'us each':>8}")
+    for label, rate in (('in-process', round_trips(MessageBus(), args.round_trips)),
+                        ('unix socket', socket_round_trips(unix, args.round_trips)),
+                        ('tcp socket', socket_round_trips(tcp, args.round_trips))):
+        print(f"{label:<12} {rate:>14.0f} {1e6 / rate:>8.1f}")
+
+    server = FakeOllamaServer(latency=args.latency, script={'default': "@manager: progress ({n})"}).start()
+    os.environ['OLLAMA_HOST'] = server.url
+    if args.cpu_ms:
+        # The same post-processing load in the worker processes, installed at their startup
+        site = tempfile.mkdtemp()
+        with open(os.path.join(site, 'sitecustomize.py'), 'w') as f:
+            f.write(f"import sys\nsys.path.insert(0, {os.path.dirname(os.path.abspath(__file__))!r})\n"
+                    f"from bench_workers import install_cpu_load\ninstall_cpu_load({args.cpu_ms})\n")
+        os.environ['PYTHONPATH'] = os.pathsep.join(p for p in (site, os.environ.get('PYTHONPATH')) if p)
+        install_cpu_load(args.cpu_ms)
+    print(f"\n{args.agents} agents x {args.iterations} iterations, {args.cpu_ms} ms CPU per response, {os.cpu_count()} CPU(s)")
+    print(f"{'agents in':<18} {'wall s':>7} {'iter/s':>7} {'startup s':>9}")
+    try:
+        for procs in [0] + args.procs:
+            wall, startup = e2e(server.url, args.agents, args.iterations, procs)
+            label = 'manager threads' if procs == 0 else f"{procs} worker proc(s)"
+            print(f"{label:<18} {wall:>7.2f} {args.agents * args.iterations / wall:>7.1f} {startup:>9.2f}")
+    finally:
+        server.shutdown()
+
+
+def install_cpu_load(cpu_ms):
+    """Make Agent.handle_response burn `cpu_ms` of CPU per response, in this process."""
+    if not cpu_ms:
+        return
+    from agents.agent import Agent
+    handle_response = Agent.handle_response
+
+    def loaded(self, response, *args, **kwargs):
+        deadline = time.thread_time() + cpu_ms / 1000
+        data = repr(response).encode()
+        while time.thread_time() < deadline:
+            data = hashlib.sha256(data).digest()
+        return handle_response(self, response, *args, **kwargs)
+    Agent.handle_response = loaded
+
+
+if __name__ == '__main__':
+    main()
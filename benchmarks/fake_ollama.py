@@ -0,0 +1,456 @@
+# benchmarks/fake_ollama.py
+"""
+Minimal stand-in for an Ollama server, for benchmarks that need real HTTP.
+
+Answers POST /api/chat after `latency` seconds with a canned assistant
+message, and POST /v1/chat/completions with the same reply in OpenAI's
+format (server-sent events when streamed), like Ollama's OpenAI-compatible
+endpoint. Streaming requests get the message one word per chunk, with
+`token_latency` seconds between chunks, as newline-delimited JSON like
+Ollama. With `tool_call_after=N`, a `task_completed` tool call is streamed
+after the Nth word (and the rest of the message still follows).
+
+Prompt evaluation is simulated too: prompts are split into words, and the
+words after the longest prefix shared with one of `cache_slots` recently
+seen conversations (prompt plus reply, like Ollama's per-slot KV cache)
+cost `prompt_token_latency` seconds each. Responses report
+`prompt_eval_count`, `prompt_eval_duration`, `eval_count` and
+`eval_duration` like Ollama. Any `{n}` in the content is replaced with a
+request counter, so consecutive replies can differ.
+
+`latency` is seconds, or a distribution sampled from a seeded RNG so runs
+repeat: "uniform:LOW,HIGH", "exp:MEAN" or "lognormal:MEDIAN,SIGMA".
+With `error_rate`, that fraction of requests fails with `error_status`
+(an Ollama-style {"error": ...} body) after the latency.
+
+With `load_latency`, the first request for each model pays a cold model
+load of that many seconds (requests arriving meanwhile wait for the same
+load) and reports it as `load_duration`. POST /api/generate with an empty
+prompt only loads the model, like Ollama's preload.
+
+A script picks the reply by prompt instead of the fixed content:
+
+    {"rules": [
+        {"match": "project planner", "content": "[\"Subtask 1\", \"Subtask 2\"]"},
+        {"match": "Subtask", "turns": ["@manager: working on it ({n})",
+                                       "@manager: task completed"],
+         "tool_calls": ["task_completed"]}
+     ],
+     "default": "@manager: task completed"}
+
+The first rule whose `match` occurs in any prompt message wins. `turns`
+are picked by how many assistant messages the prompt already has (the
+last turn repeats); `tool_calls` names tools to call in the reply, or
+gives {"name": ..., "arguments": {...}}. A turn can be
+{"content": ..., "tool_calls": [...]} with its own tool calls. An
+optional `latency` (same forms as above) is added to the server's.
+A rule's `unformatted` reply (with probability `unformatted_rate`,
+default 1) replaces its content when the request has no `format`, like
+a model that wraps its JSON in prose unless output is constrained.
+
+Usage:
+    python benchmarks/fake_ollama.py --port 11500 --latency 0.05
+    python benchmarks/fake_ollama.py --latency lognormal:0.2,0.5 --error-rate 0.05 --seed 1
+    python benchmarks/fake_ollama.py --token-latency 0.01 --tool-call-after 20
+    python benchmarks/fake_ollama.py --prompt-token-latency 0.0005
+    python benchmarks/fake_ollama.py --load-latency 5
+    python benchmarks/fake_ollama.py --script plan.json
+"""
+import argparse
+import collections
+import itertools
+import json
+import math
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_CONTENT = "@manager: task completed"
+
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path == '/api/version':
+            self._send_json({'version': 'fake'})
+        elif self.path == '/api/tags':
+            self._send_json({'models': []})
+        elif self.path == '/v1/models':
+            self._send_json({'object': 'list', 'data': []})
+        else:
+            self._send_json({'error': 'not found'}, status=404)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)) or 0)
+        if self.path not in ('/api/chat', '/api/generate', '/v1/chat/completions'):
+            self._send_json({'error': 'not found'}, status=404)
+            return
+        openai = self.path == '/v1/chat/completions'
+        request = json.loads(body or b'{}')
+        load_duration = self.server.load(request.get('model', 'fake'))
+        if self.path == '/api/generate':
+            self._generate(request, load_duration)
+            return
+        messages = request.get('messages', [])
+        time.sleep(self.server.sample_latency(messages))
+        if self.server.should_fail():
+            self._send_json({'error': {'message': 'injected failure'} if openai else 'injected failure'}, status=self.server.error_status)
+            return
+        reply, tool_calls = self.server.reply(messages, structured=bool(request.get('response_format' if openai else 'format')))
+        prompt_eval = self.server.prompt_eval(messages, reply)
+        if openai:
+            self._openai(request, reply, tool_calls, prompt_eval)
+            return
+        prompt_eval['load_duration'] = int(load_duration * 1e9)
+        if request.get('stream', True):
+            self._stream(request, reply, tool_calls, prompt_eval)
+            return
+        # Same generation time as the streamed version
+        words = reply.split(' ')
+        started = time.monotonic()
+        time.sleep(self.server.token_latency * max(0, len(words) - 1))
+        message = {'role': 'assistant', 'content': reply}
+        if tool_calls:
+            message['tool_calls'] = tool_calls
+        self._send_json({
+            'model': request.get('model', 'fake'),
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'message': message,
+            'done': True,
+            'done_reason': 'stop',
+            'eval_count': len(words),
+            'eval_duration': int((time.monotonic() - started) * 1e9),
+            **prompt_eval,
+        })
+
+    def _generate(self, request, load_duration):
+        # Only the preload form (an empty prompt) is used by the backends; other prompts get the canned reply
+        prompt = request.get('prompt') or ''
+        if prompt:
+            self.server.should_fail()
+        reply = self.server.reply([{'role': 'user', 'content': prompt}])[0] if prompt else ''
+        self._send_json({
+            'model': request.get('model', 'fake'),
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'response': reply,
+            'done': True,
+            'done_reason': 'stop' if prompt else 'load',
+            'load_duration': int(load_duration * 1e9),
+        })
+
+    def _stream(self, request, reply, tool_calls, prompt_eval):
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        model = request.get('model', 'fake')
+        words = reply.split(' ')
+        started = time.monotonic()
+        try:
+            for i, word in enumerate(words):
+                if i:
+                    time.sleep(self.server.token_latency)
+                self._send_chunk({'model': model, 'message': {'role': 'assistant', 'content': word if i == 0 else ' ' + word}, 'done': False})
+                if i + 1 == self.server.tool_call_after:
+                    call = {'function': {'name': 'task_completed', 'arguments': {}}}
+                    self._send_chunk({'model': model, 'message': {'role': 'assistant', 'content': '', 'tool_calls': [call]}, 'done': False})
+            if tool_calls:
+                self._send_chunk({'model': model, 'message': {'role': 'assistant', 'content': '', 'tool_calls': tool_calls}, 'done': False})
+            self._send_chunk({
+                'model': model,
+                'message': {'role': 'assistant', 'content': ''},
+                'done': True,
+                'done_reason': 'stop',
+                'eval_count': len(words),
+                'eval_duration': int((time.monotonic() - started) * 1e9),
+                **prompt_eval,
+            })
+            self.wfile.write(b'0\r\n\r\n')
+        except (BrokenPipeError, ConnectionResetError):
+            # Client closed the stream early
+            self.close_connection = True
+
+    def _openai(self, request, reply, tool_calls, prompt_eval):
+        # The same reply in OpenAI's chat completion format; streamed as server-sent events
+        model = request.get('model', 'fake')
+        words = reply.split(' ')
+        calls = [{'index': i, 'id': f"call_{next(self.server.call_ids)}", 'type': 'function',
+                  'function': {'name': call['function']['name'], 'arguments': json.dumps(call['function']['arguments'])}}
+                 for i, call in enumerate(tool_calls)]
+        usage = {'prompt_tokens': prompt_eval['prompt_eval_count'], 'completion_tokens': len(words),
+                 'total_tokens': prompt_eval['prompt_eval_count'] + len(words)}
+        finish = 'tool_calls' if calls else 'stop'
+        if not request.get('stream'):
+            time.sleep(self.server.token_latency * max(0, len(words) - 1))
+            message = {'role': 'assistant', 'content': reply}
+            if calls:
+                message['tool_calls'] = [{k: v for k, v in call.items() if k != 'index'} for call in calls]
+            self._send_json({'id': 'chatcmpl-fake', 'object': 'chat.completion', 'created': int(time.time()), 'model': model,
+                             'choices': [{'index': 0, 'message': message, 'finish_reason': finish}], 'usage': usage})
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+        def event(choices, **fields):
+            payload = {'id': 'chatcmpl-fake', 'object': 'chat.completion.chunk', 'model': model, 'choices': choices, **fields}
+            data = f"data: {json.dumps(payload)}\n\n".encode()
+            self.wfile.write(f"{len(data):x}\r\n".encode() + data + b'\r\n')
+            self.wfile.flush()
+        try:
+            for i, word in enumerate(words):
+                if i:
+                    time.sleep(self.server.token_latency)
+                event([{'index': 0, 'delta': {'role': 'assistant', 'content': word if i == 0 else ' ' + word}, 'finish_reason': None}])
+            if calls:
+                event([{'index': 0, 'delta': {'tool_calls': calls}, 'finish_reason': None}])
+            event([{'index': 0, 'delta': {}, 'finish_reason': finish}])
+            if (request.get('stream_options') or {}).get('include_usage'):
+                event([], usage=usage)
+            data = b"data: [DONE]\n\n"
+            self.wfile.write(f"{len(data):x}\r\n".encode() + data + b'\r\n0\r\n\r\n')
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+
+    def _send_chunk(self, payload):
+        data = json.dumps(payload).encode() + b'\n'
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b'\r\n')
+        self.wfile.flush()
+
+    def _send_json(self, payload, status=200):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        try:
+            self.wfile.write(data)
+        except (BrokenPipeError, ConnectionResetError):
+            # Client went away (timed out or was killed)
+            self.close_connection = True
+
+
+class FakeOllamaServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 2048
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, content=DEFAULT_CONTENT, token_latency=0.0, tool_call_after=None,
+                 prompt_token_latency=0.0, cache_slots=4, error_rate=0.0, error_status=500, script=None, seed=0, load_latency=0.0):
+        super().__init__((host, port), FakeOllamaHandler)
+        self.load_latency = load_latency
+        self._loads = {}  # model -> Event set once it is loaded
+        self._loads_lock = threading.Lock()
+        self.content = content
+        self.token_latency = token_latency
+        self.tool_call_after = tool_call_after
+        self.prompt_token_latency = prompt_token_latency
+        self.cache_slots = cache_slots
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.script = load_script(script)
+        self._random = random.Random(seed)
+        self._random_lock = threading.Lock()
+        self.latency = latency
+        self._requests = itertools.count(1)
+        self.call_ids = itertools.count()
+        self.counts = collections.Counter()
+        self._slots = collections.deque()  # word lists of recent prompt + reply, most recent last
+        self._slots_lock = threading.Lock()
+
+    @property
+    def latency(self):
+        return self._latency_spec
+
+    @latency.setter
+    def latency(self, spec):
+        self._latency_spec = spec
+        self._sample = parse_latency(spec)
+
+    def sample_latency(self, messages=()):
+        """Seconds to wait before answering the next request, plus the matching script rule's `latency`."""
+        rule = self._match(messages)
+        extra = parse_latency(rule['latency']) if rule is not None and 'latency' in rule else None
+        with self._random_lock:
+            return self._sample(self._random) + (extra(self._random) if extra else 0.0)
+
+    def process_request(self, request, client_address):
+        # One call per accepted connection; with keep-alive, many requests share one
+        with self._random_lock:
+            self.counts['connections'] += 1
+        super().process_request(request, client_address)
+
+    def load(self, model):
+        """Seconds this request spent waiting for `model` to load: `load_latency` for the first request, the rest of the load for those arriving during it, then 0."""
+        with self._loads_lock:
+            loaded = self._loads.get(model)
+            if loaded is None:
+                loaded = self._loads[model] = threading.Event()
+                self.counts['loads'] += 1
+                first = True
+            else:
+                first = False
+        if loaded.is_set():
+            return 0.0
+        t0 = time.monotonic()
+        if first:
+            time.sleep(self.load_latency)
+            loaded.set()
+        else:
+            loaded.wait()
+        return time.monotonic() - t0
+
+    def should_fail(self):
+        """Count the request and decide whether to inject an error."""
+        with self._random_lock:
+            failed = self.error_rate > 0 and self._random.random() < self.error_rate
+            self.counts['requests'] += 1
+            if failed:
+                self.counts['errors'] += 1
+        return failed
+
+    def reply(self, messages=(), structured=False):
+        """Assistant content and tool calls for the next request (`structured`: it asked for a `format`)."""
+        n = next(self._requests)
+        content, tools = self.content, ()
+        rule = self._match(messages)
+        if rule is not None:
+            if 'unformatted' in rule and not structured and self._chance(rule.get('unformatted_rate', 1.0)):
+                content = rule['unformatted']
+            elif 'turns' in rule:
+                assistant_turns = sum(1 for m in messages if m.get('role') == 'assistant')
+                content = rule['turns'][min(assistant_turns, len(rule['turns']) - 1)]
+            else:
+                content = rule.get('content', '')
+            tools = rule.get('tool_calls', ())
+            if isinstance(content, dict):
+                # A turn with its own tool calls
+                content, tools = content.get('content', ''), content.get('tool_calls', ())
+        elif self.script is not None and 'default' in self.script:
+            content = self.script['default']
+        tool_calls = [{'function': {'name': tool, 'arguments': {}}} if isinstance(tool, str)
+                      else {'function': {'name': tool['name'], 'arguments': tool.get('arguments', {})}} for tool in tools]
+        return content.replace('{n}', str(n)), tool_calls
+
+    def _chance(self, p):
+        with self._random_lock:
+            return self._random.random() < p
+
+    def _match(self, messages):
+        if self.script is None:
+            return None
+        for rule in self.script.get('rules', ()):
+            if any(rule.get('match', '') in (m.get('content') or '') for m in messages):
+                return rule
+        return None
+
+    def stats(self):
+        """Requests served, errors injected, TCP connections accepted and models loaded."""
+        with self._random_lock:
+            return dict(self.counts)
+
+    def prompt_eval(self, messages, reply):
+        """Simulate prompt evaluation with prefix reuse; sleeps and returns Ollama's prompt_eval_* fields."""
+        prompt = []
+        for message in messages:
+            prompt.append(f"<{message.get('role')}>")
+            prompt.extend((message.get('content') or '').split())
+        with self._slots_lock:
+            best, best_len = None, 0
+            for slot in self._slots:
+                n = _common_prefix(slot, prompt)
+                if n > best_len:
+                    best, best_len = slot, n
+            if best is not None:
+                self._slots.remove(best)
+            elif len(self._slots) >= self.cache_slots:
+                self._slots.popleft()
+            self._slots.append(prompt + ['<assistant>'] + reply.split())
+        evaluated = max(1, len(prompt) - best_len)
+        duration = evaluated * self.prompt_token_latency
+        time.sleep(duration)
+        return {'prompt_eval_count': evaluated, 'prompt_eval_duration': int(duration * 1e9)}
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        """Serve from a daemon thread; returns self for chaining."""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+def parse_latency(spec):
+    """A sampler `f(rng) -> seconds` for a number or "uniform:a,b" / "exp:mean" / "lognormal:median,sigma"."""
+    if isinstance(spec, (int, float)):
+        return lambda rng: spec
+    kind, _, params = str(spec).partition(':')
+    if not params:
+        seconds = float(kind)
+        return lambda rng: seconds
+    values = [float(v) for v in params.split(',')]
+    if kind == 'uniform':
+        low, high = values
+        return lambda rng: rng.uniform(low, high)
+    if kind == 'exp':
+        mean, = values
+        return lambda rng: rng.expovariate(1 / mean) if mean else 0.0
+    if kind == 'lognormal':
+        median, sigma = values
+        return lambda rng: median * math.exp(rng.gauss(0, sigma))
+    raise ValueError(f"Unknown latency distribution: {spec!r}")
+
+
+def load_script(script):
+    """A script dict, or the path of a JSON file with one."""
+    if script is None or isinstance(script, dict):
+        return script
+    with open(script) as f:
+        return json.load(f)
+
+
+def _common_prefix(a, b):
+    n = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        n += 1
+    return n
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake Ollama /api/chat server")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=11500)
+    parser.add_argument('--latency', default='0', help='Seconds to wait before answering, or uniform:a,b / exp:mean / lognormal:median,sigma')
+    parser.add_argument('--content', default=DEFAULT_CONTENT, help='Assistant message content to return; {n} is replaced with a request counter')
+    parser.add_argument('--token-latency', type=float, default=0.0, help='Seconds between streamed chunks')
+    parser.add_argument('--tool-call-after', type=int, default=None, help='Stream a task_completed tool call after this many words')
+    parser.add_argument('--prompt-token-latency', type=float, default=0.0, help='Seconds per prompt word not covered by a cached prefix')
+    parser.add_argument('--cache-slots', type=int, default=4, help='Conversations kept for prefix reuse (like OLLAMA_NUM_PARALLEL)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests that fail')
+    parser.add_argument('--error-status', type=int, default=500, help='HTTP status of injected failures')
+    parser.add_argument('--script', default=None, help='JSON file of scripted replies (see module docstring)')
+    parser.add_argument('--seed', type=int, default=0, help='Seed for latency sampling and error injection')
+    parser.add_argument('--load-latency', type=float, default=0.0, help='Seconds the first request for each model waits for it to load')
+    args = parser.parse_args()
+    server = FakeOllamaServer(args.host, args.port, args.latency, args.content, args.token_latency, args.tool_call_after,
+                              args.prompt_token_latency, args.cache_slots, args.error_rate, args.error_status, args.script, args.seed,
+                              args.load_latency)
+    print(f"Fake Ollama listening on {server.url}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
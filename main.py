@@ -1,21 +1,148 @@
 # main.py
-from agents.logging_utils import log_manager
+# First, so the startup timeline (agents/prewarm.py) counts the imports below
+from agents.prewarm import get_timeline
+from agents.logging_utils import log_manager, configure_logging
 from agents.manager import Manager
-from agents.config import Colors, AGENT_COLORS, AGENT_EMOJIS, MODEL_NAME
-import argparse, ollama
+from agents.config import Colors, AGENT_COLORS, AGENT_EMOJIS, MODEL_NAME, LLM_MAX_CONCURRENCY, CONTEXT_TOKEN_BUDGET, PLAN_CANDIDATES, LLM_BACKEND, LLM_HOSTS, LOG_LEVEL, LOG_JSON_PATH, LOG_RATE_LIMIT, TOOL_WORKERS, TOOL_TIMEOUT, REPLAY_TIMING, BATCH_WORKERS
+from agents.backends import BACKENDS, make_backend
+from agents.tools import ToolExecutor, ToolPool
+import argparse, sys
+
+get_timeline().mark('imports')
 
 # Entry point
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Manager/Agent Orchestration System")
     parser.add_argument('--verbose', action='store_true', help='Show agent output (default: False)')
+    parser.add_argument('--async', dest='async_mode', action='store_true', help='Run all agents as asyncio tasks on one event loop instead of one thread each')
+    parser.add_argument('--backend', default=LLM_BACKEND, choices=sorted(BACKENDS), help=f'LLM server type: ollama, openai (any OpenAI-compatible server) or mlx (in-process, Apple silicon) (default: {LLM_BACKEND})')
+    parser.add_argument('--llm-host', action='append', default=None, metavar='URL', help='LLM server URL; repeat to balance requests across several hosts (default: OLLAMA_HOST / OPENAI_BASE_URL); see docs/backends.md')
+    parser.add_argument('--max-concurrency', type=int, default=LLM_MAX_CONCURRENCY, help=f'Upper bound for concurrent LLM requests; the actual limit adapts to latency and errors (default: {LLM_MAX_CONCURRENCY})')
+    parser.add_argument('--timeout', type=float, default=None, help='Stop the run after this many seconds (default: no limit)')
+    parser.add_argument('--cache', action='store_true', help='Reuse LLM responses for identical requests (in memory and in babyagi.db)')
+    parser.add_argument('--stream', action='store_true', help='Stream agent responses token by token to the log and the manager')
+    parser.add_argument('--context-budget', type=int, default=CONTEXT_TOKEN_BUDGET, help=f'Tokens of conversation history kept per agent task before the oldest turns are summarized (default: {CONTEXT_TOKEN_BUDGET})')
+    parser.add_argument('--metrics-port', type=int, default=None, help='Serve per-phase timing histograms in Prometheus format on http://127.0.0.1:PORT/metrics')
+    parser.add_argument('--metrics-json', default=None, help='Write per-phase timing histograms as JSON to this file at the end of the run')
+    parser.add_argument('--dag', action='store_true', help='Plan subtasks with dependencies; idle agents pull the next ready subtask instead of a fixed round-robin share')
+    parser.add_argument('--plan-candidates', type=int, default=PLAN_CANDIDATES, help=f'Candidate plans requested at once when planning; the first valid one is used and the rest cancelled (default: {PLAN_CANDIDATES})')
+    parser.add_argument('--resume', type=int, default=None, metavar='RUN_ID', help='Continue an interrupted run from babyagi.db, skipping the work it already saved')
+    parser.add_argument('--replay', type=int, default=None, metavar='RUN_ID', help='Re-run a recorded run from babyagi.db with its saved LLM replies instead of a model; see docs/replay.md')
+    parser.add_argument('--replay-timing', default=REPLAY_TIMING, choices=['original', 'zero'], help=f'With --replay: wait as long as each recorded LLM call took, or answer at once (default: {REPLAY_TIMING})')
+    parser.add_argument('--worker-procs', type=int, default=0, metavar='N', help='Run the agents in N local worker processes instead of threads of this one; see docs/workers.md')
+    parser.add_argument('--remote-workers', type=int, default=0, metavar='N', help='Also wait for N workers started on other hosts with "python -m agents.worker --connect ADDRESS"')
+    parser.add_argument('--bus-listen', default=None, metavar='ADDRESS', help='Where worker processes reach the message bus, e.g. tcp://0.0.0.0:7878 for remote workers (default: a local Unix socket)')
+    parser.add_argument('--tools', action='store_true', help='Let agents create and call Python tools; calls run in parallel in sandboxed worker processes (see docs/tools.md)')
+    parser.add_argument('--tool-workers', type=int, default=TOOL_WORKERS, metavar='N', help=f'With --tools: tool calls running at once, one process each (default: {TOOL_WORKERS})')
+    parser.add_argument('--tool-timeout', type=float, default=TOOL_TIMEOUT, metavar='SECONDS', help=f'With --tools: a tool call running longer is killed (default: {TOOL_TIMEOUT:g})')
+    parser.add_argument('--bus-spill', action='store_true', help='Also write every bus message to the bus_messages table, so transcripts outlive pruning (see docs/message_bus.md)')
+    parser.add_argument('--no-cancel-approved', dest='cancel_approved', action='store_false', help='Let agents use up their iterations on tasks the manager already approved (default: they move on at once; see docs/control.md)')
+    parser.add_argument('--no-prewarm', dest='prewarm', action='store_false', help='Do not load the model on the LLM server in the background while the task is typed and before agents start (see docs/prewarm.md)')
+    parser.add_argument('--log-level', default=LOG_LEVEL, choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'], type=str.upper, help=f'Lowest level of log lines shown and written (default: {LOG_LEVEL})')
+    parser.add_argument('--log-json', default=LOG_JSON_PATH, metavar='FILE', help='Also append every log line to FILE as JSON lines (level, source, agent, message)')
+    parser.add_argument('--log-rate', type=float, default=LOG_RATE_LIMIT, metavar='N', help=f'Show at most N repetitive lines (e.g. iteration banners) per second on the console, 0 for all (default: {LOG_RATE_LIMIT})')
+    parser.add_argument('--batch', default=None, metavar='FILE', help='Run the tasks in this JSONL file ("-" for stdin) without prompting; see docs/batch.md')
+    parser.add_argument('--batch-output', default='batch_results.jsonl', metavar='FILE', help='Where --batch writes one JSON result per task ("-" for stdout; default: batch_results.jsonl)')
+    parser.add_argument('--workers', type=int, default=BATCH_WORKERS, help=f'With --batch: agents running at once across all tasks (default: {BATCH_WORKERS})')
     args = parser.parse_args()
+    configure_logging(level=args.log_level, json_path=args.log_json, rate_limit=args.log_rate)
+    if (args.worker_procs or args.remote_workers) and (args.batch or args.dag or args.cache):
+        parser.error("worker processes cannot be combined with --batch, --dag or --cache, which share in-process state between agents")
+    if args.remote_workers and not args.bus_listen:
+        parser.error("--remote-workers needs --bus-listen tcp://HOST:PORT that the other hosts can reach")
+    if args.batch and args.resume is not None:
+        parser.error("--resume continues a single run; it cannot be combined with --batch")
+    if args.replay is not None and (args.batch or args.resume is not None):
+        parser.error("--replay re-runs a single recorded run; it cannot be combined with --batch or --resume")
+    tools = ToolExecutor(ToolPool(workers=args.tool_workers, timeout=args.tool_timeout)) if args.tools else None
+    if args.replay is not None:
+        from agents.replay import replay_run
+        replay_run(
+            args.replay,
+            colors=Colors,
+            agent_colors=AGENT_COLORS,
+            agent_emojis=AGENT_EMOJIS,
+            timing=args.replay_timing,
+            stream=args.stream or None,
+            verbose=args.verbose,
+            run_timeout=args.timeout,
+            async_mode=args.async_mode,
+            max_concurrency=args.max_concurrency,
+            context_budget=args.context_budget,
+            metrics_port=args.metrics_port,
+            metrics_json=args.metrics_json,
+            plan_candidates=args.plan_candidates,
+            worker_procs=args.worker_procs,
+            remote_workers=args.remote_workers,
+            bus_address=args.bus_listen,
+            tools=tools,
+            cancel_approved=args.cancel_approved,
+            bus_spill=args.bus_spill,
+            prewarm=args.prewarm
+        )
+        sys.exit(0)
+    backend = make_backend(args.backend, args.llm_host or LLM_HOSTS, max_connections=args.max_concurrency)
+    if args.batch:
+        if args.async_mode:
+            parser.error("--batch runs each task's agents as threads on one shared gateway; --async is not supported")
+        from agents.batch import BatchRunner
+        tasks = sys.stdin if args.batch == '-' else open(args.batch)
+        output = sys.stdout if args.batch_output == '-' else open(args.batch_output, 'a')
+        runner = BatchRunner(
+            model_name=MODEL_NAME,
+            ollama=backend,
+            colors=Colors,
+            agent_colors=AGENT_COLORS,
+            agent_emojis=AGENT_EMOJIS,
+            workers=args.workers,
+            output=output,
+            max_concurrency=args.max_concurrency,
+            use_cache=args.cache,
+            metrics_port=args.metrics_port,
+            metrics_json=args.metrics_json,
+            verbose=args.verbose,
+            run_timeout=args.timeout,
+            stream=args.stream,
+            context_budget=args.context_budget,
+            dag=args.dag,
+            plan_candidates=args.plan_candidates,
+            tools=tools,
+            prewarm=args.prewarm
+        )
+        try:
+            runner.run(tasks)
+        finally:
+            for f in (tasks, output):
+                if f not in (sys.stdin, sys.stdout):
+                    f.close()
+        sys.exit(0)
     log_manager(f"{Colors.BOLD}Welcome to the Manager/Agent Orchestration System!{Colors.ENDC}", colors=Colors, level="BOLD")
     manager = Manager(
         model_name=MODEL_NAME,
-        ollama=ollama,
+        ollama=backend,
         colors=Colors,
         agent_colors=AGENT_COLORS,
         agent_emojis=AGENT_EMOJIS,
-        verbose=args.verbose
+        verbose=args.verbose,
+        run_timeout=args.timeout,
+        async_mode=args.async_mode,
+        max_concurrency=args.max_concurrency,
+        use_cache=args.cache,
+        stream=args.stream,
+        context_budget=args.context_budget,
+        metrics_port=args.metrics_port,
+        metrics_json=args.metrics_json,
+        dag=args.dag,
+        plan_candidates=args.plan_candidates,
+        worker_procs=args.worker_procs,
+        remote_workers=args.remote_workers,
+        bus_address=args.bus_listen,
+        tools=tools,
+        cancel_approved=args.cancel_approved,
+        bus_spill=args.bus_spill,
+        prewarm=args.prewarm
     )
-    manager.orchestrate()
+    if args.resume is not None:
+        manager.resume_run(args.resume)
+    else:
+        manager.orchestrate()
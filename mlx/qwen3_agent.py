@@ -3,7 +3,7 @@
 Agent using mlx-lm and Qwen3-Coder-30B-A3B-Instruct-4bit model.
 See: https://huggingface.co/mlx-community/Qwen3-Coder-30B-A3B-Instruct-4bit
 """
-from mlx_lm import load, generate
+from mlx_lm import load, generate, stream_generate
 
 MODEL_NAME = "mlx-community/Qwen3-Coder-30B-A3B-Instruct-4bit"
 # model, tokenizer = load(MODEL_NAME)
@@ -22,6 +22,25 @@ class Qwen3Agent:
         response = generate(self.model, self.tokenizer, full_prompt, **kwargs)
         return response
 
+    # Chat-style calls, used by agents/backends.MLXBackend
+
+    def render(self, messages):
+        """The model's chat template applied to a list of {'role', 'content'} messages."""
+        messages = [{'role': m['role'], 'content': m.get('content') or ''} for m in messages]
+        return self.tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
+
+    def chat_messages(self, messages, **kwargs):
+        return generate(self.model, self.tokenizer, self.render(messages), **kwargs)
+
+    def stream_messages(self, messages, **kwargs):
+        """Yields the reply's text as it is generated."""
+        for response in stream_generate(self.model, self.tokenizer, self.render(messages), **kwargs):
+            yield response.text
+
+    def count_tokens(self, text_or_messages):
+        text = text_or_messages if isinstance(text_or_messages, str) else self.render(text_or_messages)
+        return len(self.tokenizer.encode(text))
+
 if __name__ == "__main__":
     agent = Qwen3Agent()
     system_prompt = "You are a helpful coding assistant."
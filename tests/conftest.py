@@ -0,0 +1,22 @@
+# tests/conftest.py
+import os, sys
+
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+# The agents package, and benchmarks/fake_ollama.py as the benchmarks import it
+sys.path[:0] = [ROOT, os.path.join(ROOT, 'benchmarks')]
+
+from agents import db
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    """A fresh babyagi.db in a temporary directory, with its own process-wide DBWriter."""
+    path = str(tmp_path / 'babyagi.db')
+    monkeypatch.setattr(db, 'DB_PATH', path)
+    db.close_writer()
+    db._blob_cache.clear()
+    db.init_db()
+    yield path
+    db.close_writer()
@@ -0,0 +1,255 @@
+# tests/test_invariants.py
+"""
+Invariants the orchestration relies on, checked against a temporary
+babyagi.db and, end to end, benchmarks/fake_ollama.py.
+
+Usage:
+    python -m pytest -q tests
+"""
+import threading
+
+import ollama
+import pytest
+
+from fake_ollama import FakeOllamaServer
+from agents import db
+from agents.agent import Agent
+from agents.config import Colors, AGENT_COLORS, AGENT_EMOJIS
+from agents.llm_cache import LLMCache
+from agents.llm_gateway import LLMGateway, LLMRetriesExhausted
+from agents.manager import Manager
+from agents.message_bus import MessageBus
+from agents.scheduler import SubtaskScheduler
+
+PLAN = ["Subtask 1 of the task", "Subtask 2 of the task"]
+
+
+def iterations(run_id):
+    # agent name -> (iteration row ids, iteration numbers), agent iterations only
+    with db.get_db() as conn:
+        rows = conn.execute("SELECT a.agent_name, i.id, i.iteration FROM agent_iterations i JOIN agents a ON a.id = i.agent_id "
+                            "WHERE a.run_id=? AND i.prompt_ids IS NOT NULL ORDER BY i.id", (run_id,)).fetchall()
+    result = {}
+    for name, row_id, iteration in rows:
+        ids, numbers = result.setdefault(name, ([], []))
+        ids.append(row_id)
+        numbers.append(iteration)
+    return result
+
+
+def test_resume_skips_saved_work(db_path):
+    server = FakeOllamaServer(script={'default': "@manager: progress on the subtask ({n})"}).start()
+    try:
+        manager = Manager('fake', ollama.Client(host=server.url), Colors, AGENT_COLORS, AGENT_EMOJIS)
+        run_id = manager.run_task("Test task", num_agents=2, num_iterations=3, agent_list=PLAN)
+        db.get_writer().flush()
+        before = iterations(run_id)
+        assert {name: numbers for name, (_, numbers) in before.items()} == {'agent_1': [0, 1, 2], 'agent_2': [0, 1, 2]}
+
+        # agent_1 "crashed" before its last iteration was saved
+        with db.get_db() as conn:
+            conn.execute("DELETE FROM agent_iterations WHERE id=?", (before['agent_1'][0][-1],))
+            conn.execute("UPDATE agents SET status='running', finished_at=NULL, exit_reason=NULL, task_index=0 WHERE run_id=? AND agent_name='agent_1'", (run_id,))
+            conn.commit()
+        requests = server.stats().get('requests', 0)
+        Manager('fake', ollama.Client(host=server.url), Colors, AGENT_COLORS, AGENT_EMOJIS).resume_run(run_id)
+        db.get_writer().flush()
+    finally:
+        server.shutdown()
+
+    after = iterations(run_id)
+    # Only the missing iteration was redone; the finished agent was not restarted
+    assert server.stats()['requests'] - requests == 1
+    assert after['agent_1'][1] == [0, 1, 2]
+    assert after['agent_1'][0][:2] == before['agent_1'][0][:2]
+    assert after['agent_2'] == before['agent_2']
+    with db.get_db() as conn:
+        assert {status for (status,) in conn.execute("SELECT status FROM agents WHERE run_id=?", (run_id,))} == {'completed'}
+
+
+def test_dropped_blob_row_does_not_break_reads(db_path):
+    messages = [{'role': 'system', 'content': 'You are a test agent.'}, {'role': 'user', 'content': 'poison pill'}]
+    with db.get_db() as conn:
+        conn.execute("CREATE TRIGGER reject_blob BEFORE INSERT ON prompt_blobs WHEN NEW.data LIKE '%poison%' BEGIN SELECT RAISE(ABORT, 'rejected'); END")
+        conn.commit()
+    writer = db.get_writer()
+    prompt_ids = db.save_prompt(messages, writer)
+    writer.flush()
+
+    # The batch failed, was retried row by row, and only the rejected row was dropped
+    with db.get_db() as conn:
+        assert db.load_prompt(conn, prompt_ids) == [messages[0], db.MISSING_MESSAGE]
+        conn.execute("DROP TRIGGER reject_blob")
+        conn.commit()
+
+    # The dropped key was forgotten, so the next prompt with the message stores it
+    assert db.save_prompt(messages, writer) == prompt_ids
+    writer.flush()
+    with db.get_db() as conn:
+        assert db.load_prompt(conn, prompt_ids) == messages
+
+
+def test_scheduler_releases_dependents_only_on_completion():
+    scheduler = SubtaskScheduler(["Collect data", {'task': "Summarize the data", 'depends_on': [0]}])
+    first = scheduler.take('agent_1')
+    assert first['id'] == 0
+
+    # Stopped part way: the subtask goes back to the queue and its dependent stays blocked
+    scheduler.release(first['id'])
+    again = scheduler.take('agent_2')
+    assert again['id'] == 0
+    assert 0 not in scheduler.results
+
+    scheduler.complete(again['id'], "the data")
+    dependent = scheduler.take('agent_2')
+    assert dependent['id'] == 1
+    assert "the data" in scheduler.prompt_for(dependent)
+    scheduler.complete(dependent['id'], "summary")
+    assert scheduler.take('agent_1') is None
+    assert scheduler.finished
+
+
+def test_stopped_agent_puts_its_subtask_back():
+    scheduler = SubtaskScheduler(["Collect data", {'task': "Summarize the data", 'depends_on': [0]}])
+    stop_event = threading.Event()
+    agent = Agent('agent_1', [], AGENT_COLORS[0], AGENT_EMOJIS[0], 'fake', None, Colors, MessageBus(), False, 1,
+                  stop_event=stop_event, scheduler=scheduler)
+    agent.next_task(0)
+    stop_event.set()
+    assert agent.finish_task(0, "partial result") is True
+    assert scheduler.results == {}
+    stop_event.clear()
+    assert scheduler.take('agent_2')['id'] == 0
+
+
+class FlakyBackend:
+    # Fails the first `failures` calls with `error`, then answers
+    def __init__(self, failures, error):
+        self.failures = failures
+        self.error = error
+        self.calls = 0
+
+    def chat(self, model, messages, **kwargs):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise self.error
+        return {'message': {'role': 'assistant', 'content': 'ok'}, 'done': True}
+
+
+def test_gateway_retries_transient_errors():
+    backend = FlakyBackend(1, ConnectionError("connection reset"))
+    gateway = LLMGateway(backend, base_delay=0.01)
+    call_info = {}
+    response = gateway.chat('fake', [{'role': 'user', 'content': 'hi'}], call_info=call_info)
+    assert response['message']['content'] == 'ok'
+    assert call_info['attempts'] == 2
+    assert gateway.stats()['retries'] == 1
+
+    with pytest.raises(LLMRetriesExhausted):
+        LLMGateway(FlakyBackend(3, ConnectionError("down")), base_delay=0.01, max_attempts=3).chat('fake', [{'role': 'user', 'content': 'hi'}])
+    backend = FlakyBackend(1, ValueError("bad request"))
+    with pytest.raises(ValueError):
+        LLMGateway(backend, base_delay=0.01).chat('fake', [{'role': 'user', 'content': 'hi'}])
+    assert backend.calls == 1
+
+
+class VaryingBackend:
+    # Answers in 1, 5 or 20 ms whatever the load, reporting the whole time as generation like Ollama
+    def __init__(self):
+        self.calls = 0
+
+    def chat(self, model, messages, **kwargs):
+        self.calls += 1
+        seconds = (0.001, 0.005, 0.02)[self.calls % 3]
+        threading.Event().wait(seconds)
+        return {'message': {'role': 'assistant', 'content': 'ok'}, 'done': True, 'eval_count': 10, 'eval_duration': int(seconds * 1e9)}
+
+
+def test_gateway_limit_ignores_reply_length():
+    gateway = LLMGateway(VaryingBackend(), max_limit=16)
+
+    def client(i):
+        for _ in range(10):
+            gateway.chat('fake', [{'role': 'user', 'content': 'hi'}], client_id=f"agent_{i}")
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert gateway.stats()['limit'] == 16
+
+    # A bad request is not a call and leaves the limit alone
+    gateway.backend = FlakyBackend(1, ValueError("bad request"))
+    with pytest.raises(ValueError):
+        gateway.chat('fake', [{'role': 'user', 'content': 'hi'}])
+    assert gateway.stats()['calls'] == 80
+    assert gateway.stats()['limit'] == 16
+
+
+def test_cache_single_flight():
+    cache = LLMCache(persistent=False)
+    calls = []
+    started = threading.Barrier(5)
+
+    def call():
+        calls.append(1)
+        threading.Event().wait(0.2)
+        return {'message': {'role': 'assistant', 'content': 'cached'}, 'done': True}
+
+    def request(results):
+        started.wait()
+        results.append(cache.get_or_call('fake', [{'role': 'user', 'content': 'same prompt'}], {}, call))
+
+    results = []
+    threads = [threading.Thread(target=request, args=(results,)) for _ in range(5)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(calls) == 1
+    assert [r['message']['content'] for r in results] == ['cached'] * 5
+
+
+def test_bus_cursor_per_consumer_and_recipient():
+    bus = MessageBus()
+    bus.register('agent_1')  # read later, so its messages are kept for it
+    for i in range(3):
+        bus.send('manager', 'agent_1', f"to agent_1 #{i}")
+    bus.send('manager', 'agent_2', "to agent_2")
+    bus.send('manager', bus.BROADCAST, "to everyone")
+
+    # One consumer reading two recipients must not share a position between their logs
+    assert [m['content'] for m in bus.receive('agent_1', consumer='observer')] == ["to agent_1 #0", "to agent_1 #1", "to agent_1 #2", "to everyone"]
+    assert [m['content'] for m in bus.receive('agent_2', consumer='observer')] == ["to agent_2", "to everyone"]
+    assert bus.receive('agent_1', consumer='observer') == []
+
+    # Other consumers of the same recipient keep their own cursors
+    assert len(bus.receive('agent_1')) == 4
+    bus.send('manager', 'agent_2', "again")
+    assert not bus.wait('agent_1', timeout=0, consumer='observer')
+    assert bus.wait('agent_2', timeout=0, consumer='observer')
+    assert [m['content'] for m in bus.receive('agent_2', consumer='observer')] == ["again"]
+
+
+def test_writer_survives_unbindable_rows_and_fails_fast(db_path):
+    writer = db.DBWriter(db_path, max_pending=4)
+    writer.submit("INSERT INTO runs (task) VALUES (?)", ("good 1",))
+    writer.submit("INSERT INTO runs (task) VALUES (?)", ("\ud800",))  # lone surrogate: UnicodeEncodeError
+    writer.submit("INSERT INTO runs (task) VALUES (?)", (2 ** 64,))  # OverflowError
+    writer.submit("INSERT INTO runs (task) VALUES (?)", ("good 2",))
+    assert writer.flush(timeout=5)
+    with db.get_db() as conn:
+        assert [task for (task,) in conn.execute("SELECT task FROM runs ORDER BY id")] == ["good 1", "good 2"]
+
+    # A writer thread that stopped makes flush and a full queue's submit raise instead of hanging
+    def broken(conn, batch):
+        raise RuntimeError("disk gone")
+    writer._write = broken
+    writer.submit("INSERT INTO runs (task) VALUES (?)", ("lost",))
+    with pytest.raises(RuntimeError):
+        writer.flush()
+    with pytest.raises(RuntimeError):
+        for _ in range(10):
+            writer.submit("INSERT INTO runs (task) VALUES (?)", ("lost",))
+    writer.close()